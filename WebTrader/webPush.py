@@ -0,0 +1,260 @@
+# encoding: UTF-8
+
+"""
+WebTrader的Websocket推送
+
+事件引擎线程只把事件数据放入待推送缓存后立即返回，由推送线程按固定间隔统一发送，
+网页客户端接收缓慢时不会阻塞事件处理：
+1. 每个客户端可以按事件类型订阅，行情还可以按合约代码订阅，只接收自己需要的数据
+2. 行情、委托、持仓、账户、合约、策略状态等快照类数据在一个推送间隔内按主键合并，
+   只推送最新状态；成交、日志、错误等流水类数据按顺序逐条推送
+3. 开启增量推送的客户端对快照类数据只接收主键和发生变化的字段，由前端合并到已有数据
+
+客户端通过socketio消息订阅：
+socket.emit('subscribe', {types: [...], symbols: [...], delta: true})
+socket.emit('unsubscribe', {types: [...], symbols: [...]})
+没有订阅过事件类型的客户端接收全部类型的事件，第一次订阅事件类型后只接收订阅的类型；
+没有订阅过合约代码的客户端接收全部已订阅合约的行情
+"""
+
+from __future__ import print_function
+
+import threading
+import traceback
+from collections import OrderedDict
+from datetime import date, datetime
+
+from vnpy.trader.vtEvent import (EVENT_TICK, EVENT_ORDER, EVENT_TRADE,
+                                 EVENT_ACCOUNT, EVENT_POSITION, EVENT_LOG,
+                                 EVENT_ERROR, EVENT_CONTRACT)
+from vnpy.trader.vtConstant import STATUS_FINISHED
+from vnpy.trader.app.ctaStrategy.ctaBase import EVENT_CTA_LOG, EVENT_CTA_STRATEGY
+
+
+# 推送的事件类型
+PUSH_TYPES = [EVENT_TICK, EVENT_ORDER, EVENT_TRADE, EVENT_ACCOUNT, EVENT_POSITION,
+              EVENT_CONTRACT, EVENT_LOG, EVENT_ERROR, EVENT_CTA_LOG, EVENT_CTA_STRATEGY]
+
+# 快照类事件的主键字段，其他事件为流水类
+KEY_FIELDS = {
+    EVENT_TICK: 'vtSymbol',
+    EVENT_ORDER: 'vtOrderID',
+    EVENT_POSITION: 'vtPositionName',
+    EVENT_ACCOUNT: 'vtAccountID',
+    EVENT_CONTRACT: 'vtSymbol',
+    EVENT_CTA_STRATEGY: 'name'
+}
+
+
+#----------------------------------------------------------------------
+def getField(data, name):
+    """读取事件数据（数据对象或者字典）的字段"""
+    if isinstance(data, dict):
+        return data.get(name, None)
+    return getattr(data, name, None)
+
+
+#----------------------------------------------------------------------
+def toJson(data):
+    """事件数据转换为可以json序列化的字典，时间对象转换为字符串，不包含原始数据"""
+    if not isinstance(data, dict):
+        if hasattr(data, 'fillTime'):
+            data.fillTime()
+        data = data.__dict__
+
+    d = {}
+    for k, v in data.items():
+        if k == 'rawData':
+            continue
+        if isinstance(v, (datetime, date)):
+            v = str(v)
+        d[k] = v
+    return d
+
+
+########################################################################
+class PushClient(object):
+    """网页客户端的订阅和推送状态"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, sid):
+        """Constructor"""
+        self.sid = sid                      # socketio的会话编号
+        self.typeSet = set(PUSH_TYPES)      # 订阅的事件类型
+        self.typeSubscribed = False         # 是否订阅过事件类型，没有订阅过时接收全部类型
+        self.symbolSet = None               # 订阅行情的合约代码，None表示全部
+        self.delta = False                  # 是否增量推送
+        self.lastDict = {}                  # (事件类型, 主键)：上次推送的数据，已结束的委托不保存
+
+    #----------------------------------------------------------------------
+    def subscribe(self, types=None, symbols=None, delta=None):
+        """订阅，第一次订阅事件类型时替换默认的全部类型"""
+        if types:
+            if not self.typeSubscribed:
+                self.typeSet = set()
+                self.typeSubscribed = True
+            self.typeSet = self.typeSet | set(types)
+        if symbols:
+            self.symbolSet = (self.symbolSet or set()) | set(symbols)
+        if delta is not None:
+            self.delta = bool(delta)
+            self.lastDict = {}
+
+    #----------------------------------------------------------------------
+    def unsubscribe(self, types=None, symbols=None):
+        """取消订阅，清除对应的推送状态，重新订阅后首先推送完整数据"""
+        if types:
+            self.typeSet = self.typeSet - set(types)
+            for key in list(self.lastDict.keys()):
+                if key[0] in types:
+                    self.lastDict.pop(key, None)
+        if symbols and self.symbolSet is not None:
+            self.symbolSet = self.symbolSet - set(symbols)
+            for vtSymbol in symbols:
+                self.lastDict.pop((EVENT_TICK, vtSymbol), None)
+
+    #----------------------------------------------------------------------
+    def encode(self, eventType, key, d):
+        """生成推送给该客户端的数据，不需要推送时返回None"""
+        if eventType not in self.typeSet:
+            return None
+        if eventType == EVENT_TICK and self.symbolSet is not None and key not in self.symbolSet:
+            return None
+        if key is None or not self.delta:
+            return d
+
+        lastKey = (eventType, key)
+        last = self.lastDict.get(lastKey, None)
+        # 已结束的委托不会再更新，不保存推送状态，避免lastDict随委托数量无限增长
+        if eventType == EVENT_ORDER and d.get('status', None) in STATUS_FINISHED:
+            self.lastDict.pop(lastKey, None)
+        else:
+            self.lastDict[lastKey] = d
+        if last is None:
+            return d
+
+        delta = dict([(k, v) for k, v in d.items() if k not in last or last[k] != v])
+        if not delta:
+            return None
+        delta[KEY_FIELDS[eventType]] = key
+        return delta
+
+
+########################################################################
+class WebPushEngine(object):
+    """Websocket推送引擎"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, socketio, interval=0.5, maxPending=10000):
+        """Constructor"""
+        self.socketio = socketio
+        self.interval = interval            # 推送间隔，秒
+        self.maxPending = maxPending        # 待推送数据的数量上限，超过时丢弃最早的数据
+
+        self.pendingDict = OrderedDict()    # (事件类型, 主键或序号)：事件数据
+        self.count = 0                      # 流水类数据的序号
+        self.dropCount = 0                  # 因超过上限丢弃的数据数量
+
+        self.clientDict = {}                # sid：PushClient
+        self.lock = threading.Lock()
+        self.active = False
+
+    #----------------------------------------------------------------------
+    def start(self):
+        """启动推送线程"""
+        self.active = True
+        self.socketio.start_background_task(self.run)
+
+    #----------------------------------------------------------------------
+    def stop(self):
+        """停止推送线程"""
+        self.active = False
+
+    #----------------------------------------------------------------------
+    def addClient(self, sid):
+        """客户端连接"""
+        with self.lock:
+            self.clientDict[sid] = PushClient(sid)
+
+    #----------------------------------------------------------------------
+    def removeClient(self, sid):
+        """客户端断开"""
+        with self.lock:
+            self.clientDict.pop(sid, None)
+
+    #----------------------------------------------------------------------
+    def subscribe(self, sid, types=None, symbols=None, delta=None):
+        """客户端订阅"""
+        with self.lock:
+            client = self.clientDict.get(sid, None)
+            if client:
+                client.subscribe(types, symbols, delta)
+
+    #----------------------------------------------------------------------
+    def unsubscribe(self, sid, types=None, symbols=None):
+        """客户端取消订阅"""
+        with self.lock:
+            client = self.clientDict.get(sid, None)
+            if client:
+                client.unsubscribe(types, symbols)
+
+    #----------------------------------------------------------------------
+    def put(self, event):
+        """放入事件，在事件引擎线程中调用，只做合并不做转换"""
+        eventType = event.type_
+        if eventType.startswith(EVENT_TICK):
+            eventType = EVENT_TICK
+        data = event.dict_['data']
+
+        keyField = KEY_FIELDS.get(eventType, None)
+
+        with self.lock:
+            # 没有客户端时直接丢弃
+            if not self.clientDict:
+                return
+
+            if keyField:
+                key = (eventType, getField(data, keyField))
+                self.pendingDict.pop(key, None)     # 合并后移到末尾，保持和流水类数据的先后顺序
+            else:
+                self.count += 1
+                key = (eventType, self.count)
+            self.pendingDict[key] = data
+
+            if len(self.pendingDict) > self.maxPending:
+                self.pendingDict.popitem(last=False)
+                self.dropCount += 1
+
+    #----------------------------------------------------------------------
+    def run(self):
+        """推送线程"""
+        while self.active:
+            self.socketio.sleep(self.interval)
+            try:
+                self.push()
+            except Exception:
+                traceback.print_exc()
+
+    #----------------------------------------------------------------------
+    def push(self):
+        """推送一个间隔内的数据"""
+        with self.lock:
+            pendingDict = self.pendingDict
+            self.pendingDict = OrderedDict()
+            clientList = list(self.clientDict.values())
+
+        if not pendingDict or not clientList:
+            return
+
+        # 每个事件只转换一次，所有客户端共用
+        messageList = []
+        for (eventType, key), data in pendingDict.items():
+            if eventType not in KEY_FIELDS:
+                key = None
+            messageList.append((eventType, key, toJson(data)))
+
+        for client in clientList:
+            for eventType, key, d in messageList:
+                payload = client.encode(eventType, key, d)
+                if payload is not None:
+                    self.socketio.emit(eventType, payload, room=client.sid)
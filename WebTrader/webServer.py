@@ -23,7 +23,11 @@ subAddress = 'tcp://localhost:8866'
 
 ee = EventEngine2()
 me = MainEngineProxy(ee)
-me.init(reqAddress, subAddress)
+
+# 行情只在网页订阅合约后才接收，其他事件全部订阅
+topics = [EVENT_ORDER, EVENT_TRADE, EVENT_ACCOUNT, EVENT_POSITION, EVENT_CONTRACT,
+          EVENT_LOG, EVENT_ERROR, EVENT_CTA_LOG, EVENT_CTA_STRATEGY]
+me.init(reqAddress, subAddress, topics)
 
 #----------------------------------------------------------------------
 def printLog(event):
@@ -45,11 +49,13 @@ with open("WEB_setting.json") as f:
     setting = json.load(f)
     USERNAME = setting['username']
     PASSWORD = setting['password']
+    PUSH_INTERVAL = setting.get('pushInterval', 0.5)        # Websocket推送间隔，秒
+    PUSH_MAX_PENDING = setting.get('pushMaxPending', 10000) # 待推送数据的数量上限
     TOKEN = base64.encodestring((TODAY+PASSWORD).encode()).decode().replace('\n','')
 
 
 # 创建Flask对象
-from flask import Flask, send_file
+from flask import Flask, send_file, request
 from flask_restful import Api, Resource, reqparse
 from flask_socketio import SocketIO
 from flask_cors import *
@@ -59,6 +65,9 @@ CORS(app, supports_credentials=True)
 api = Api(app)
 socketio = SocketIO(app)
 
+from webPush import WebPushEngine
+pushEngine = WebPushEngine(socketio, PUSH_INTERVAL, PUSH_MAX_PENDING)
+
 # 创建资源
 ########################################################################
 class Token(Resource):
@@ -418,6 +427,7 @@ class Tick(Resource):
         req.vtSymbol = contract.vtSymbol
         
         me.subscribe(req, contract.gatewayName)
+        me.subscribeEvent(EVENT_TICK + vtSymbol)
         return {'result_code':'success','data':''}
     
 
@@ -640,6 +650,91 @@ class CtaStrategyVar(Resource):
         l = engine.getStrategyVar(name)
         return {'result_code':'success','data':l}
 
+
+
+########################################################################
+class CtaStrategyPerf(Resource):
+    """策略耗时统计"""
+    
+    #----------------------------------------------------------------------
+    def __init__(self):
+        """初始化"""
+        self.parser = reqparse.RequestParser()
+        self.parser.add_argument('name')
+        self.parser.add_argument('active')
+        self.parser.add_argument('token')
+        super(CtaStrategyPerf, self).__init__()    
+
+    #----------------------------------------------------------------------
+    def get(self):
+        """查询，不指定策略时返回全部策略"""
+        args = self.parser.parse_args()
+        token = args['token']
+        if token != TOKEN:
+            return {'result_code':'error','message':'token error'}
+        
+        name = args['name']
+        
+        engine = me.getApp('CtaStrategy')
+        l = engine.getStrategyPerf(name)
+        return {'result_code':'success','data':l}
+
+    #----------------------------------------------------------------------
+    def post(self):
+        """开关统计，active为1开启，0关闭"""
+        args = self.parser.parse_args()
+        token = args['token']
+        if token != TOKEN:
+            return {'result_code':'error','message':'token error'}
+        
+        active = args['active'] in ('1', 'true', 'True')
+        
+        engine = me.getApp('CtaStrategy')
+        engine.setStrategyPerf(active)
+        return {'result_code':'success','data':''}
+
+
+########################################################################
+class CtaStrategyProfile(Resource):
+    """策略调用栈抽样分析"""
+    
+    #----------------------------------------------------------------------
+    def __init__(self):
+        """初始化"""
+        self.parser = reqparse.RequestParser()
+        self.parser.add_argument('name')
+        self.parser.add_argument('token')
+        super(CtaStrategyProfile, self).__init__()    
+
+    #----------------------------------------------------------------------
+    def post(self):
+        """开始分析"""
+        args = self.parser.parse_args()
+        token = args['token']
+        if token != TOKEN:
+            return {'result_code':'error','message':'token error'}
+        
+        name = args['name']
+        
+        engine = me.getApp('CtaStrategy')
+        if not engine.startStrategyProfile(name):
+            return {'result_code':'error','message':'strategy error'}
+        return {'result_code':'success','data':''}
+
+    #----------------------------------------------------------------------
+    def delete(self):
+        """停止分析，返回折叠栈文件路径"""
+        args = self.parser.parse_args()
+        token = args['token']
+        if token != TOKEN:
+            return {'result_code':'error','message':'token error'}
+        
+        name = args['name']
+        
+        engine = me.getApp('CtaStrategy')
+        path = engine.stopStrategyProfile(name)
+        return {'result_code':'success','data':path}
+
       
 ########################################################################
 @app.route('/')
@@ -668,23 +763,43 @@ api.add_resource(CtaStrategyRestore, '/ctastrategy/restore')
 api.add_resource(CtaStrategyParam, '/ctastrategy/param')
 api.add_resource(CtaStrategyVar, '/ctastrategy/var')
 api.add_resource(CtaStrategyName, '/ctastrategy/name')
+api.add_resource(CtaStrategyPerf, '/ctastrategy/perf')
+api.add_resource(CtaStrategyProfile, '/ctastrategy/profile')
 
 
 # SocketIO
 #----------------------------------------------------------------------
 def handleEvent(event):
-    """处理事件"""
-    eventType = event.type_
+    """处理事件，放入推送引擎后立即返回"""
+    pushEngine.put(event)
+
 
-    eventData = event.dict_['data']
+#----------------------------------------------------------------------
+@socketio.on('connect')
+def handleConnect():
+    """客户端连接"""
+    pushEngine.addClient(request.sid)
 
-    if not isinstance(eventData, dict):
-        eventData = eventData.__dict__
 
-    if eventType == 'eTick.':
-        del eventData['datetime']
+#----------------------------------------------------------------------
+@socketio.on('disconnect')
+def handleDisconnect():
+    """客户端断开"""
+    pushEngine.removeClient(request.sid)
+
 
-    socketio.emit(eventType, eventData)
+#----------------------------------------------------------------------
+@socketio.on('subscribe')
+def handleSubscribe(data):
+    """客户端订阅，data包含types、symbols、delta"""
+    pushEngine.subscribe(request.sid, data.get('types'), data.get('symbols'), data.get('delta'))
+
+
+#----------------------------------------------------------------------
+@socketio.on('unsubscribe')
+def handleUnsubscribe(data):
+    """客户端取消订阅，data包含types、symbols"""
+    pushEngine.unsubscribe(request.sid, data.get('types'), data.get('symbols'))
 
 
 ee.register(EVENT_TICK, handleEvent)
@@ -702,6 +817,7 @@ ee.register(EVENT_CTA_STRATEGY, handleEvent)
 #----------------------------------------------------------------------
 def run():
     """启动Web服务"""
+    pushEngine.start()
     socketio.run(app, 
                  debug=True,
                 #  host='0.0.0.0',
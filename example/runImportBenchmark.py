@@ -0,0 +1,90 @@
+# encoding: UTF-8
+
+"""
+导入耗时基准测试
+
+在全新的Python进程中导入回测和优化用到的模块，统计导入耗时，
+并检查是否意外加载了图形界面、绘图和数据库相关的模块。
+回测和并行优化的每个子进程都要付出这部分时间，修改导入结构后请运行本脚本确认。
+
+用法：python runImportBenchmark.py [重复次数] [耗时上限（秒）]
+存在违规导入或耗时超过上限时返回非0退出码。
+"""
+
+from __future__ import print_function
+
+import sys
+import json
+import subprocess
+
+
+# 需要测试的导入语句
+TARGET_LIST = [
+    'vnpy.event',
+    'vnpy.trader.app.ctaStrategy.ctaBacktesting',
+    'vnpy.trader.app.ctaStrategy',
+]
+
+# Python 3.7以上htmlplot才能延迟导入bokeh
+if sys.version_info >= (3, 7):
+    TARGET_LIST.append('vnpy.trader.utils.htmlplot')
+
+# 无界面运行时不应加载的模块
+FORBIDDEN_LIST = [
+    'qtpy', 'PyQt4', 'PyQt5', 'PySide',
+    'matplotlib', 'seaborn', 'bokeh', 'pymongo',
+]
+
+CODE = """
+import sys, json, time
+start = time.time()
+import %s
+cost = time.time() - start
+loaded = [m for m in %r if m in sys.modules]
+print(json.dumps({'cost': cost, 'loaded': loaded}))
+"""
+
+
+#----------------------------------------------------------------------
+def measure(target):
+    """在子进程中导入模块，返回(耗时, 违规加载的模块列表)"""
+    code = CODE % (target, FORBIDDEN_LIST)
+    output = subprocess.check_output([sys.executable, '-c', code])
+    d = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+    return d['cost'], d['loaded']
+
+
+#----------------------------------------------------------------------
+def main():
+    """主程序入口"""
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    limit = float(sys.argv[2]) if len(sys.argv) > 2 else 0
+
+    failed = False
+    for target in TARGET_LIST:
+        try:
+            results = [measure(target) for i in range(repeat)]
+        except subprocess.CalledProcessError:
+            print(u'%s\t导入失败' % target)
+            failed = True
+            continue
+
+        costList = sorted([r[0] for r in results])
+        median = costList[len(costList) // 2]
+        loaded = results[0][1]
+
+        print(u'%s\t中位数%.3f秒\t最小%.3f秒\t最大%.3f秒' % (target, median, costList[0], costList[-1]))
+
+        if loaded:
+            print(u'\t违规加载：%s' % ','.join(loaded))
+            failed = True
+
+        if limit and median > limit:
+            print(u'\t超过耗时上限%.3f秒' % limit)
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
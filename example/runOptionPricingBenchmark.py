@@ -0,0 +1,107 @@
+# encoding: UTF-8
+
+"""
+期权链定价基准测试
+
+生成合成的期权链，比较逐个期权调用标量公式和OmChainPricer整链向量化计算
+隐含波动率、理论价和希腊值的耗时，并检查两者结果一致。
+热启动一行模拟标的价格小幅变动后，以上一次的解作为初值重新求解。
+
+用法：python runOptionPricingBenchmark.py [行权价数量] [重复次数]
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from vnpy.trader.app.optionMaster.omPricing import (BlackScholes, Black76, CALL, PUT,
+                                                    OmChainPricer)
+
+
+SyntheticOption = namedtuple('SyntheticOption', ['symbol', 'k', 'cp', 't', 'size',
+                                                 'bidPrice1', 'askPrice1',
+                                                 'longPos', 'shortPos', 'pricingImpv'])
+
+UNDERLYING_PRICE = 3000.0
+R = 0.03
+
+
+#----------------------------------------------------------------------
+def createChain(model, count):
+    """生成合成期权链，波动率带有微笑"""
+    strikes = np.linspace(UNDERLYING_PRICE * 0.7, UNDERLYING_PRICE * 1.3, count)
+    optionList = []
+    for n, k in enumerate(strikes):
+        m = np.log(k / UNDERLYING_PRICE)
+        v = 0.2 + 0.5 * m * m
+        for cp in (CALL, PUT):
+            t = 0.25
+            price = float(model.calculatePrice(UNDERLYING_PRICE, k, R, t, v, cp))
+            option = SyntheticOption('%s%d' % ('C' if cp == CALL else 'P', n), float(k), cp, t, 10,
+                                     price * 0.99, price * 1.01, n % 3, n % 2, v)
+            optionList.append(option)
+    return optionList
+
+
+#----------------------------------------------------------------------
+def runScalar(model, optionList, s):
+    """逐个期权计算"""
+    result = []
+    for o in optionList:
+        bid = model.calculateImpv(o.bidPrice1, s, o.k, R, o.t, o.cp)
+        ask = model.calculateImpv(o.askPrice1, s, o.k, R, o.t, o.cp)
+        greeks = model.calculateGreeks(s, o.k, R, o.t, o.pricingImpv, o.cp)
+        result.append((bid, ask, float(greeks[1]) * o.size))
+    return result
+
+
+#----------------------------------------------------------------------
+def timeit(func, repeat):
+    """返回中位数耗时（毫秒）"""
+    costList = []
+    for i in range(repeat):
+        start = time.time()
+        func()
+        costList.append(time.time() - start)
+    costList.sort()
+    return costList[len(costList) // 2] * 1000
+
+
+#----------------------------------------------------------------------
+def main():
+    """主程序入口"""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    for model in (BlackScholes, Black76):
+        optionList = createChain(model, count)
+        pricer = OmChainPricer(optionList, model, R)
+
+        # 结果一致性检查
+        scalar = runScalar(model, optionList, UNDERLYING_PRICE)
+        pricer.calculate(UNDERLYING_PRICE)
+        error = max(max(abs(bid - pricer.bidImpv[n]), abs(ask - pricer.askImpv[n]),
+                        abs(delta - pricer.theoDelta[n]))
+                    for n, (bid, ask, delta) in enumerate(scalar))
+
+        costScalar = timeit(lambda: runScalar(model, optionList, UNDERLYING_PRICE), repeat)
+
+        def cold():
+            pricer.bidImpv[:] = 0
+            pricer.askImpv[:] = 0
+            pricer.calculate(UNDERLYING_PRICE)
+        costCold = timeit(cold, repeat)
+
+        prices = iter(UNDERLYING_PRICE * (1 + np.random.normal(0, 0.0005, repeat)))
+        costWarm = timeit(lambda: pricer.calculate(next(prices)), repeat)
+
+        print(u'%s\t期权数量%d\t最大误差%.2e' % (model.__name__, len(optionList), error))
+        print(u'\t逐个计算%.2f毫秒\t整链冷启动%.2f毫秒\t整链热启动%.2f毫秒' % (costScalar, costCold, costWarm))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# encoding: UTF-8
+
+"""
+pandas_talib指标基准测试
+
+生成合成的分钟K线DataFrame，逐个计算pandas_talib中的指标并输出耗时。
+
+用法：python runPandasTalibBenchmark.py [K线数量]
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from vnpy.trader.app.ctaStrategy import pandas_talib as pt
+
+
+INDICATOR_LIST = [
+    ('ACCDIST', (5,)),
+    ('ADX', (14, 6)),
+    ('ATR', (14,)),
+    ('BBANDS', (20,)),
+    ('CCI', (20,)),
+    ('CHAIKIN', ()),
+    ('DONCH', (20,)),
+    ('EMA', (10,)),
+    ('KST4', (9, 13, 18, 24)),
+    ('MACD', (12, 26)),
+    ('MFI', (14,)),
+    ('MASS', ()),
+    ('OBV', (10,)),
+    ('RSI', (14,)),
+    ('STOD', (9,)),
+    ('TRIX', (9,)),
+    ('TSI', (25, 13)),
+    ('ULTOSC', ()),
+    ('VORTEX', (14,)),
+]
+
+
+#----------------------------------------------------------------------
+def createBarFrame(count):
+    """生成合成的分钟K线数据"""
+    close = 3000 + np.cumsum(np.random.normal(0, 1, count)).round()
+    high = close + np.abs(np.random.normal(0, 2, count)).round()
+    low = close - np.abs(np.random.normal(0, 2, count)).round()
+    volume = np.random.randint(1, 1000, count).astype(float)
+    index = pd.date_range('2018-01-01', periods=count, freq='min')
+    return pd.DataFrame({'open': close, 'high': high, 'low': low,
+                         'close': close, 'volume': volume}, index=index)
+
+
+#----------------------------------------------------------------------
+def main():
+    """主程序入口"""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    df = createBarFrame(count)
+
+    total = 0
+    for name, args in INDICATOR_LIST:
+        func = getattr(pt, name)
+        start = time.time()
+        func(df.copy(), *args)
+        cost = time.time() - start
+        total += cost
+        print(u'%s\t%.1f毫秒' % (name, cost * 1000))
+
+    print(u'K线数量%d\t合计%.1f毫秒' % (count, total * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -15,6 +15,8 @@ import json
 import zlib
 from websocket import create_connection, _exceptions
 
+from vnpy.api.websocket import SubscribeManager
+
 
 # 常量定义
 TIMEOUT = 5
@@ -247,6 +249,22 @@ class TradeApi(object):
         
         return self.addReq(path, params, func, callback)   
     
+    #----------------------------------------------------------------------
+    def publicGet(self, path, params):
+        """公共行情接口GET，无需签名"""
+        url = self.hosturl + path
+        return self.httpGet(url, params)
+    
+    #----------------------------------------------------------------------
+    def getTickers(self):
+        """查询所有交易对的行情快照"""
+        path = '/market/tickers'
+        params = {}
+        func = self.publicGet
+        callback = self.onGetTickers
+        
+        return self.addReq(path, params, func, callback)
+    
     #----------------------------------------------------------------------
     def getTimestamp(self):
         """查询系统时间"""
@@ -432,6 +450,11 @@ class TradeApi(object):
         # print (reqid, data)    
         pass    
     
+    #----------------------------------------------------------------------
+    def onGetTickers(self, data, reqid):
+        """查询行情快照回调"""
+        print (reqid, data)
+        
     #----------------------------------------------------------------------
     def onGetTimestamp(self, data, reqid):
         """查询时间回调"""
@@ -529,6 +552,10 @@ class DataApi(object):
         
         self.subDict = {}
         
+        # 火币不支持单帧多主题，由订阅管理器限速逐个发送并跟踪确认状态
+        self.subscribeManager = SubscribeManager(self.sendTopics, batchSize=10, interval=0.2)
+        self.subscribeManager.onFailed = self.onSubscribeFailed
+        
         self.url = ''
         self.proxyHost = ''
         self.proxyPort = 0        
@@ -546,6 +573,7 @@ class DataApi(object):
                 self.onError(u'数据解压出错：%s' %stream)
             except:
                 self.onError('行情服务器连接断开')
+                self.subscribeManager.onDisconnected()
                 result = self.reconnect()
                 if not result:
                     self.onError(u'等待3秒后再次重连')
@@ -573,10 +601,7 @@ class DataApi(object):
     #----------------------------------------------------------------------
     def resubscribe(self):
         """重新订阅"""
-        d = self.subDict
-        self.subDict = {}
-        for topic in d.keys():
-            self.subTopic(topic)
+        self.subscribeManager.onConnected()
         
     #----------------------------------------------------------------------
     def connect(self, url, proxyHost='', proxyPort=0):
@@ -596,6 +621,9 @@ class DataApi(object):
             self.active = True
             self.thread.start()
             
+            self.subscribeManager.start()
+            self.subscribeManager.onConnected()
+            
             return True
         except:
             msg = traceback.format_exc()
@@ -607,6 +635,7 @@ class DataApi(object):
         """停止"""
         if self.active:
             self.active = False
+            self.subscribeManager.stop()
             self.thread.join()
             self.ws.close()
         
@@ -624,18 +653,21 @@ class DataApi(object):
     
     #----------------------------------------------------------------------
     def subTopic(self, topic):
-        """订阅主题"""
-        if topic in self.subDict:
-            return
-        
-        self.reqid += 1
-        req = {
-            'sub': topic,
-            'id': str(self.reqid)
-        }
-        self.sendReq(req)
-        
-        self.subDict[topic] = str(self.reqid)
+        """订阅主题（由订阅管理器在后台发送）"""
+        self.subscribeManager.subscribe([topic])
+    
+    #----------------------------------------------------------------------
+    def sendTopics(self, topics):
+        """发送订阅请求，每个主题一帧"""
+        for topic in topics:
+            self.reqid += 1
+            req = {
+                'sub': topic,
+                'id': str(self.reqid)
+            }
+            self.sendReq(req)
+            
+            self.subDict[topic] = str(self.reqid)
     
     #----------------------------------------------------------------------
     def unsubTopic(self, topic):
@@ -649,6 +681,7 @@ class DataApi(object):
         self.sendReq(req)
         
         del self.subDict[topic]
+        self.subscribeManager.unsubscribe([topic])
     
     #----------------------------------------------------------------------
     def subscribeMarketDepth(self, symbol):
@@ -672,12 +705,19 @@ class DataApi(object):
     def onError(self, msg):
         """错误推送"""
         print (msg)
+    
+    #----------------------------------------------------------------------
+    def onSubscribeFailed(self, topics):
+        """订阅多次重试后仍未确认"""
+        self.onError(u'订阅主题未收到确认：%s' %','.join(topics))
         
     #----------------------------------------------------------------------
     def onData(self, data):
         """数据推送"""
         if 'ping' in data:
             self.pong(data)
+        elif 'subbed' in data:
+            self.subscribeManager.onAck(data['subbed'])
         elif 'ch' in data:
             if 'depth.step' in data['ch']:
                 self.onMarketDepth(data)
@@ -12,6 +12,8 @@ import requests
 from enum import Enum
 from typing import Any, Callable, Optional
 
+from vnpy.event.eventTrace import tracer, STAGE_DELIVER, STAGE_RESPONSE
+
 
 ########################################################################
 class RequestStatus(Enum):
@@ -39,6 +41,7 @@ class Request(object):
         self.onFailed = None  # type: callable
         self.onError = None  # type: callable
         self.extra = None  # type: Any
+        self.trace = None  # type: Trace
 
         self.response = None  # type: requests.Response
         self.status = RequestStatus.ready # type: RequestStatus
@@ -159,6 +162,7 @@ class RestClient(object):
         request.createDatetime = datetime.now()
         request.deliverDatetime = None
         request.responseDatetime = None
+        request.trace = tracer.current()    # 抽样追踪中的委托请求
         self._queue.put(request)
         return request
     
@@ -243,6 +247,8 @@ class RestClient(object):
 
             request.deliverDatetime = datetime.now()
             self._queueing_times.append((request.deliverDatetime - request.createDatetime).total_seconds())
+            if request.trace is not None:
+                request.trace.stamp(STAGE_DELIVER)
 
             response = session.request(request.method,
                                        url,
@@ -251,6 +257,8 @@ class RestClient(object):
                                        data=request.data)
             request.response = response
             request.responseDatetime = datetime.now()
+            if request.trace is not None:
+                request.trace.stamp(STAGE_RESPONSE)
             
             self._response_times.append((request.responseDatetime - request.deliverDatetime).total_seconds())
 
@@ -0,0 +1,235 @@
+# encoding: UTF-8
+
+import sys
+import time
+from collections import OrderedDict
+from threading import Event, Lock, Thread
+
+
+########################################################################
+class SubscribeManager(object):
+    """
+    行情订阅管理器
+
+    负责把零散的频道订阅请求合并成批量数据帧，按限速规则后台发送，
+    并跟踪每个频道的确认（ack）状态：
+    1. subscribe()只是登记频道，真正的发送由后台线程完成，不会阻塞调用方
+    2. 每个数据帧最多包含batchSize个频道，两帧之间至少间隔interval秒
+    3. 发送后超过ackTimeout秒仍未确认的频道会被重新发送，最多maxRetry次
+    4. 连接（或重连）成功后调用onConnected()，所有频道重新进入待发送状态
+
+    sendFunc接收一个频道列表，负责将其打包成交易所要求的格式发出，
+    对于不支持多频道数据帧的交易所，在sendFunc内部逐个发送即可。
+    """
+
+    STATUS_PENDING = 'pending'      # 等待发送
+    STATUS_SENT = 'sent'            # 已发送，等待确认
+    STATUS_ACKED = 'acked'          # 已确认
+    STATUS_FAILED = 'failed'        # 多次重试后仍未确认
+
+    #----------------------------------------------------------------------
+    def __init__(self, sendFunc, batchSize=20, interval=0.2, ackTimeout=10, maxRetry=3):
+        """Constructor"""
+        self.sendFunc = sendFunc        # 发送函数，输入为频道列表
+        self.batchSize = batchSize      # 每帧最大频道数
+        self.interval = interval        # 两帧之间的最小间隔（秒）
+        self.ackTimeout = ackTimeout    # 确认超时时间（秒）
+        self.maxRetry = maxRetry        # 超时重发次数上限
+
+        self._lock = Lock()
+        self._event = Event()
+        self._thread = None
+        self._active = False
+        self._connected = False
+
+        self._statusDict = OrderedDict()    # channel:status
+        self._sentTimeDict = {}             # channel:上次发送时间
+        self._retryDict = {}                # channel:重发次数
+        self._lastSendTime = 0
+
+    #----------------------------------------------------------------------
+    def start(self):
+        """启动后台发送线程"""
+        if self._active:
+            return
+        self._active = True
+        self._thread = Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    #----------------------------------------------------------------------
+    def stop(self):
+        """停止后台发送线程"""
+        self._active = False
+        self._event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    #----------------------------------------------------------------------
+    def subscribe(self, channels):
+        """登记需要订阅的频道，已登记的频道会被忽略"""
+        with self._lock:
+            for channel in channels:
+                if channel not in self._statusDict:
+                    self._statusDict[channel] = self.STATUS_PENDING
+                    self._retryDict[channel] = 0
+        self._event.set()
+
+    #----------------------------------------------------------------------
+    def unsubscribe(self, channels):
+        """移除频道，之后重连时不再订阅"""
+        with self._lock:
+            for channel in channels:
+                self._statusDict.pop(channel, None)
+                self._sentTimeDict.pop(channel, None)
+                self._retryDict.pop(channel, None)
+
+    #----------------------------------------------------------------------
+    def onConnected(self):
+        """连接成功（包括重连）后调用，所有频道重新进入待发送状态"""
+        with self._lock:
+            for channel in self._statusDict:
+                self._statusDict[channel] = self.STATUS_PENDING
+                self._retryDict[channel] = 0
+            self._sentTimeDict.clear()
+            self._connected = True
+        self._event.set()
+
+    #----------------------------------------------------------------------
+    def onDisconnected(self):
+        """连接断开后调用，暂停发送"""
+        self._connected = False
+
+    #----------------------------------------------------------------------
+    def onAck(self, channel):
+        """收到订阅确认（或该频道的数据）"""
+        # 绝大多数情况下频道已确认，无锁快速返回
+        status = self._statusDict.get(channel, None)
+        if status is None or status == self.STATUS_ACKED:
+            return
+        with self._lock:
+            if channel in self._statusDict:
+                self._statusDict[channel] = self.STATUS_ACKED
+                self._sentTimeDict.pop(channel, None)
+
+    #----------------------------------------------------------------------
+    def getChannels(self, status=None):
+        """查询频道列表，status为None时返回全部频道"""
+        with self._lock:
+            if status is None:
+                return list(self._statusDict.keys())
+            return [k for k, v in self._statusDict.items() if v == status]
+
+    #----------------------------------------------------------------------
+    def isAllAcked(self):
+        """是否所有频道都已确认"""
+        with self._lock:
+            return all(v == self.STATUS_ACKED for v in self._statusDict.values())
+
+    #----------------------------------------------------------------------
+    def getStatus(self):
+        """获取各状态的频道数量"""
+        d = {
+            self.STATUS_PENDING: 0,
+            self.STATUS_SENT: 0,
+            self.STATUS_ACKED: 0,
+            self.STATUS_FAILED: 0
+        }
+        with self._lock:
+            for status in self._statusDict.values():
+                d[status] += 1
+        return d
+
+    #----------------------------------------------------------------------
+    def _run(self):
+        """后台线程：发送待订阅频道并检查确认超时"""
+        while self._active:
+            self._event.wait(1)
+            self._event.clear()
+
+            if not self._active or not self._connected:
+                continue
+
+            self._checkTimeout()
+
+            while self._active and self._connected:
+                batch = self._nextBatch()
+                if not batch:
+                    break
+
+                # 限速：两帧之间至少间隔interval秒
+                wait = self._lastSendTime + self.interval - time.time()
+                if wait > 0:
+                    time.sleep(wait)
+
+                try:
+                    self.sendFunc(batch)
+                except:
+                    # 发送失败（通常是连接已断开），退回待发送状态等待重连
+                    self._resetBatch(batch)
+                    et, ev, tb = sys.exc_info()
+                    self.onError(et, ev, tb)
+                    break
+                finally:
+                    self._lastSendTime = time.time()
+
+    #----------------------------------------------------------------------
+    def _nextBatch(self):
+        """取出下一批待发送的频道，并标记为已发送"""
+        now = time.time()
+        batch = []
+        with self._lock:
+            for channel, status in self._statusDict.items():
+                if status == self.STATUS_PENDING:
+                    batch.append(channel)
+                    if len(batch) >= self.batchSize:
+                        break
+            for channel in batch:
+                self._statusDict[channel] = self.STATUS_SENT
+                self._sentTimeDict[channel] = now
+        return batch
+
+    #----------------------------------------------------------------------
+    def _resetBatch(self, batch):
+        """发送失败的频道退回待发送状态"""
+        with self._lock:
+            for channel in batch:
+                if channel in self._statusDict:
+                    self._statusDict[channel] = self.STATUS_PENDING
+                    self._sentTimeDict.pop(channel, None)
+
+    #----------------------------------------------------------------------
+    def _checkTimeout(self):
+        """确认超时的频道重新发送，超过重试次数则标记为失败"""
+        now = time.time()
+        failed = []
+        with self._lock:
+            for channel, sentTime in list(self._sentTimeDict.items()):
+                if now - sentTime < self.ackTimeout:
+                    continue
+                del self._sentTimeDict[channel]
+                if self._retryDict[channel] >= self.maxRetry:
+                    self._statusDict[channel] = self.STATUS_FAILED
+                    failed.append(channel)
+                else:
+                    self._retryDict[channel] += 1
+                    self._statusDict[channel] = self.STATUS_PENDING
+        if failed:
+            self.onFailed(failed)
+
+    #----------------------------------------------------------------------
+    def onFailed(self, channels):
+        """
+        频道多次重试后仍未确认的回调
+        默认行为是打印到stderr
+        """
+        sys.stderr.write('subscribe failed: %s\n' % ','.join(channels))
+
+    #----------------------------------------------------------------------
+    def onError(self, exceptionType, exceptionValue, tb):
+        """
+        发送时的Python错误回调
+        默认行为是打印到stderr
+        """
+        sys.stderr.write('subscribe error: %s %s\n' % (exceptionType, exceptionValue))
@@ -12,6 +12,8 @@ from threading import Lock, Thread
 
 import websocket
 
+from vnpy.event.eventTrace import tracer, perf_counter_ns
+
 
 class WebsocketClient(object):
     """
@@ -153,12 +155,18 @@ class WebsocketClient(object):
                         if not text:  # recv在阻塞的时候ws被关闭
                             self._reconnect()
                             continue
+                        # 开启延迟追踪时记录收到和解码完成的时间，供接口的onTick抽样使用
+                        traceActive = tracer.active
+                        if traceActive:
+                            receiveTime = perf_counter_ns()
                         self._recordLastReceivedText(text)
                         try:
                             data = self.unpackData(text)
                         except ValueError as e:
                             print('websocket unable to parse data: ' + text)
                             raise e
+                        if traceActive:
+                            tracer.markPacket(receiveTime, perf_counter_ns())
                         self.onPacket(data)
                 except websocket.WebSocketConnectionClosedException:  # 在调用recv之前ws就被关闭了
                     self._reconnect()
@@ -1 +1,2 @@
 from .WebsocketClient import WebsocketClient
+from .SubscribeManager import SubscribeManager
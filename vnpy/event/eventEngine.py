@@ -6,11 +6,9 @@ from threading import Thread
 from time import sleep
 from collections import defaultdict
 
-# 第三方模块
-from qtpy.QtCore import QTimer
-
 # 自己开发的模块
 from .eventType import *
+from .eventTrace import tracer, STAGE_PUT, STAGE_DISPATCH
 
 
 ########################################################################
@@ -63,6 +61,8 @@ class EventEngine(object):
         self.__thread = Thread(target = self.__run)
         
         # 计时器，用于触发计时器事件
+        # Qt在这里才导入，只使用EventEngine2的无界面程序不需要加载Qt
+        from qtpy.QtCore import QTimer
         self.__timer = QTimer()
         self.__timer.timeout.connect(self.__onTimer)
         
@@ -86,6 +86,12 @@ class EventEngine(object):
     #----------------------------------------------------------------------
     def __process(self, event):
         """处理事件"""
+        # 抽样追踪的事件，处理期间设为当前线程的追踪记录
+        trace = event.trace
+        if trace is not None:
+            trace.stamp(STAGE_DISPATCH)
+            tracer.attach(trace)
+
         # 检查是否存在对该事件进行监听的处理函数
         if event.type_ in self.__handlers:
             # 若存在，则按顺序将事件传递给处理函数执行
@@ -98,6 +104,9 @@ class EventEngine(object):
         # 调用通用处理函数进行处理
         if self.__generalHandlers:
             [handler(event) for handler in self.__generalHandlers]
+
+        if trace is not None:
+            tracer.detach()
                
     #----------------------------------------------------------------------
     def __onTimer(self):
@@ -163,6 +172,8 @@ class EventEngine(object):
     #----------------------------------------------------------------------
     def put(self, event):
         """向事件队列中存入事件"""
+        if event.trace is not None:
+            event.trace.stamp(STAGE_PUT)
         self.__queue.put(event)
         
     #----------------------------------------------------------------------
@@ -222,6 +233,12 @@ class EventEngine2(object):
     #----------------------------------------------------------------------
     def __process(self, event):
         """处理事件"""
+        # 抽样追踪的事件，处理期间设为当前线程的追踪记录
+        trace = event.trace
+        if trace is not None:
+            trace.stamp(STAGE_DISPATCH)
+            tracer.attach(trace)
+
         # 检查是否存在对该事件进行监听的处理函数
         if event.type_ in self.__handlers:
             # 若存在，则按顺序将事件传递给处理函数执行
@@ -234,6 +251,9 @@ class EventEngine2(object):
         # 调用通用处理函数进行处理
         if self.__generalHandlers:
             [handler(event) for handler in self.__generalHandlers]        
+
+        if trace is not None:
+            tracer.detach()
                
     #----------------------------------------------------------------------
     def __runTimer(self):
@@ -305,6 +325,8 @@ class EventEngine2(object):
     #----------------------------------------------------------------------
     def put(self, event):
         """向事件队列中存入事件"""
+        if event.trace is not None:
+            event.trace.stamp(STAGE_PUT)
         self.__queue.put(event)
 
     #----------------------------------------------------------------------
@@ -324,6 +346,10 @@ class EventEngine2(object):
 class Event:
     """事件对象"""
 
+    # 延迟追踪记录，只有抽样追踪的行情事件才在实例上设置，
+    # 定义为类属性以免进入RPC序列化的字段表
+    trace = None
+
     #----------------------------------------------------------------------
     def __init__(self, type_=None):
         """Constructor"""
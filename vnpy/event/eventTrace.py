@@ -0,0 +1,339 @@
+# encoding: UTF-8
+
+"""
+行情到委托的全链路延迟追踪
+
+按照抽样间隔，每N个行情选出一个进行追踪，在各个环节打上时间戳：
+    receive     接口收到数据（websocket收到数据帧，或者CTP等API的行情回调）
+    decode      数据解码完成
+    put         行情事件存入事件引擎队列
+    dispatch    事件引擎线程取出事件开始处理
+    strategy    CtaEngine调用策略函数
+    sendOrder   策略发出委托，通过风控检查后由MainEngine发往接口
+    deliver     RestClient工作线程取出请求开始发送
+    response    RestClient收到HTTP回报
+    ack         接口推送该委托的第一个有效状态
+
+每个环节记录的是距离上一个已到达环节的耗时，另外记录tickToOrder（receive到sendOrder）
+和tickToAck（receive到ack）两个总耗时，分别存入对数分桶的直方图（HDR风格，相对误差约3%）。
+
+跨线程的传递方式：
+1. websocket线程记录数据包的收到和解码时间（markPacket），接口onTick时抽样生成追踪记录（begin）
+2. 同一线程内通过线程局部变量保存当前追踪记录（attach/detach/current）
+3. 行情事件通过Event.trace字段带入事件引擎线程
+4. RestClient请求通过Request.trace字段带入工作线程
+5. 委托回报通过vtOrderID查找追踪记录
+
+未开启抽样时（默认）各环节只有一次属性检查的开销。
+"""
+
+from __future__ import division
+
+import threading
+from time import perf_counter
+
+try:
+    from time import perf_counter_ns
+except ImportError:
+    def perf_counter_ns():
+        """Python3.7之前没有perf_counter_ns"""
+        return int(perf_counter() * 1000000000)
+
+
+# 追踪环节
+STAGE_RECEIVE = 'receive'
+STAGE_DECODE = 'decode'
+STAGE_PUT = 'put'
+STAGE_DISPATCH = 'dispatch'
+STAGE_STRATEGY = 'strategy'
+STAGE_SEND_ORDER = 'sendOrder'
+STAGE_DELIVER = 'deliver'
+STAGE_RESPONSE = 'response'
+STAGE_ACK = 'ack'
+
+STAGE_LIST = [STAGE_RECEIVE, STAGE_DECODE, STAGE_PUT, STAGE_DISPATCH, STAGE_STRATEGY,
+              STAGE_SEND_ORDER, STAGE_DELIVER, STAGE_RESPONSE, STAGE_ACK]
+
+# 总耗时
+TOTAL_TICK_TO_ORDER = 'tickToOrder'
+TOTAL_TICK_TO_ACK = 'tickToAck'
+
+TOTAL_DICT = {
+    STAGE_SEND_ORDER: TOTAL_TICK_TO_ORDER,
+    STAGE_ACK: TOTAL_TICK_TO_ACK
+}
+
+# 每个环节之前的环节（倒序），用于查找最近一个已到达的环节
+_prevDict = dict([(stage, STAGE_LIST[n-1::-1] if n else [])
+                  for n, stage in enumerate(STAGE_LIST)])
+
+# 直方图精度设置
+SUB_BUCKET_BITS = 5                             # 每个数量级内的分桶数为2^5
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+MAX_SHIFT = 36                                  # 最大记录值约为2^41纳秒（约36分钟）
+MAX_VALUE = ((2 * SUB_BUCKET_COUNT) << MAX_SHIFT) - 1
+BUCKET_COUNT = SUB_BUCKET_COUNT * (MAX_SHIFT + 2)
+
+PERCENTILE_LIST = [50, 90, 99, 99.9]
+
+
+#----------------------------------------------------------------------
+def getBucketIndex(value):
+    """数值对应的分桶序号"""
+    if value < 2 * SUB_BUCKET_COUNT:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return SUB_BUCKET_COUNT * shift + (value >> shift)
+
+
+#----------------------------------------------------------------------
+def getBucketValue(index):
+    """分桶序号对应的数值（取桶内的中间值）"""
+    if index < 2 * SUB_BUCKET_COUNT:
+        return index
+    shift = index // SUB_BUCKET_COUNT - 1
+    sub = index - SUB_BUCKET_COUNT * shift
+    return (sub << shift) + (1 << shift) // 2
+
+
+########################################################################
+class LatencyHistogram(object):
+    """
+    对数分桶的延迟直方图
+
+    小于64的数值精确记录，更大的数值在每个2的幂次区间内等分为32个桶，
+    记录和查询的开销固定，和样本数量无关。
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        """Constructor"""
+        self.countList = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0
+        self.minValue = 0
+        self.maxValue = 0
+
+    #----------------------------------------------------------------------
+    def record(self, value):
+        """记录一个数值"""
+        value = min(max(int(value), 0), MAX_VALUE)
+        self.countList[getBucketIndex(value)] += 1
+
+        if not self.count or value < self.minValue:
+            self.minValue = value
+        if value > self.maxValue:
+            self.maxValue = value
+        self.count += 1
+        self.total += value
+
+    #----------------------------------------------------------------------
+    def merge(self, other):
+        """合并另一个直方图的数据"""
+        if not other.count:
+            return
+
+        self.countList = [a + b for a, b in zip(self.countList, other.countList)]
+        if not self.count or other.minValue < self.minValue:
+            self.minValue = other.minValue
+        self.maxValue = max(self.maxValue, other.maxValue)
+        self.count += other.count
+        self.total += other.total
+
+    #----------------------------------------------------------------------
+    def getValueAtPercentile(self, percentile):
+        """查询分位数"""
+        if not self.count:
+            return 0
+
+        target = max(1, int(self.count * percentile / 100 + 0.5))
+        cumulative = 0
+        for index, n in enumerate(self.countList):
+            if not n:
+                continue
+            cumulative += n
+            if cumulative >= target:
+                return min(max(getBucketValue(index), self.minValue), self.maxValue)
+        return self.maxValue
+
+    #----------------------------------------------------------------------
+    def getMean(self):
+        """平均值"""
+        if not self.count:
+            return 0
+        return self.total / self.count
+
+    #----------------------------------------------------------------------
+    def getSummary(self):
+        """统计摘要"""
+        d = {
+            'count': self.count,
+            'min': self.minValue,
+            'mean': self.getMean(),
+            'max': self.maxValue
+        }
+        for percentile in PERCENTILE_LIST:
+            d['p%s' % str(percentile).replace('.', '')] = self.getValueAtPercentile(percentile)
+        return d
+
+    #----------------------------------------------------------------------
+    def reset(self):
+        """清空"""
+        self.__init__()
+
+
+########################################################################
+class Trace(object):
+    """单个行情的追踪记录"""
+    __slots__ = ('stampDict',)
+
+    #----------------------------------------------------------------------
+    def __init__(self, stampDict=None):
+        """Constructor"""
+        self.stampDict = stampDict or {}        # 环节：时间戳（纳秒）
+
+    #----------------------------------------------------------------------
+    def stamp(self, stage, now=None):
+        """在环节上打时间戳，每个环节只记录第一次"""
+        d = self.stampDict
+        if stage in d:
+            return
+
+        if now is None:
+            now = perf_counter_ns()
+        d[stage] = now
+
+        for prev in _prevDict[stage]:
+            if prev in d:
+                tracer.record(stage, now - d[prev])
+                break
+
+        if stage in TOTAL_DICT and STAGE_RECEIVE in d:
+            tracer.record(TOTAL_DICT[stage], now - d[STAGE_RECEIVE])
+
+    #----------------------------------------------------------------------
+    def fork(self):
+        """复制一份追踪记录，用于同一行情触发的多个策略或者多笔委托"""
+        return Trace(dict(self.stampDict))
+
+    #----------------------------------------------------------------------
+    def getStage(self, stage):
+        """获取环节的时间戳"""
+        return self.stampDict.get(stage, None)
+
+
+########################################################################
+class LatencyTracer(object):
+    """延迟追踪器，全局使用模块中的tracer对象"""
+
+    ORDER_LIMIT = 1000      # 等待回报的委托数量上限，防止收不到回报的委托一直占用内存
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        """Constructor"""
+        self.active = False         # 是否开启追踪
+        self.sampleInterval = 0     # 抽样间隔，每N个行情追踪一个
+        self.sampleCount = 0
+
+        self.histDict = {}          # 环节：直方图
+        self.orderDict = {}         # vtOrderID：等待回报的追踪记录
+
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    #----------------------------------------------------------------------
+    def setSampleInterval(self, interval):
+        """设置抽样间隔，0表示关闭追踪"""
+        self.sampleInterval = max(int(interval), 0)
+        self.sampleCount = 0
+        self.active = bool(self.sampleInterval)
+
+    #----------------------------------------------------------------------
+    def markPacket(self, receiveTime, decodeTime):
+        """记录当前线程正在处理的数据包的收到和解码完成时间"""
+        self.local.packet = (receiveTime, decodeTime)
+
+    #----------------------------------------------------------------------
+    def begin(self):
+        """
+        接口推送行情时调用，抽中则返回追踪记录，否则返回None
+        当前线程有markPacket记录的数据包时间则以此作为receive和decode环节，
+        否则（CTP等API的行情回调）以调用时间作为receive环节
+        """
+        if not self.active:
+            return None
+
+        self.sampleCount += 1
+        if self.sampleCount < self.sampleInterval:
+            return None
+        self.sampleCount = 0
+
+        trace = Trace()
+        packet = getattr(self.local, 'packet', None)
+        if packet:
+            trace.stamp(STAGE_RECEIVE, packet[0])
+            trace.stamp(STAGE_DECODE, packet[1])
+        else:
+            trace.stamp(STAGE_RECEIVE)
+        return trace
+
+    #----------------------------------------------------------------------
+    def current(self):
+        """当前线程正在处理的追踪记录"""
+        return getattr(self.local, 'trace', None)
+
+    #----------------------------------------------------------------------
+    def attach(self, trace):
+        """设置当前线程正在处理的追踪记录"""
+        self.local.trace = trace
+
+    #----------------------------------------------------------------------
+    def detach(self):
+        """取出并清除当前线程正在处理的追踪记录"""
+        trace = getattr(self.local, 'trace', None)
+        self.local.trace = None
+        return trace
+
+    #----------------------------------------------------------------------
+    def bindOrder(self, vtOrderID, trace):
+        """绑定委托号和追踪记录，等待委托回报"""
+        with self.lock:
+            if len(self.orderDict) >= self.ORDER_LIMIT:
+                # 丢弃最早的记录（字典保持插入顺序）
+                del self.orderDict[next(iter(self.orderDict))]
+            self.orderDict[vtOrderID] = trace
+
+    #----------------------------------------------------------------------
+    def popOrder(self, vtOrderID):
+        """取出委托号对应的追踪记录"""
+        with self.lock:
+            return self.orderDict.pop(vtOrderID, None)
+
+    #----------------------------------------------------------------------
+    def record(self, name, value):
+        """记录耗时（纳秒）"""
+        with self.lock:
+            try:
+                hist = self.histDict[name]
+            except KeyError:
+                hist = LatencyHistogram()
+                self.histDict[name] = hist
+            hist.record(value)
+
+    #----------------------------------------------------------------------
+    def getSnapshot(self, reset=False):
+        """
+        获取各环节和总耗时的统计摘要（单位纳秒），返回{名称：摘要字典}
+        reset为True时清空直方图，用于按周期推送监控指标
+        """
+        with self.lock:
+            d = dict([(name, hist.getSummary()) for name, hist in self.histDict.items()
+                      if hist.count])
+            if reset:
+                for hist in self.histDict.values():
+                    hist.reset()
+        return d
+
+
+# 全局追踪器
+tracer = LatencyTracer()
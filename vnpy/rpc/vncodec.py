@@ -0,0 +1,195 @@
+# encoding: UTF-8
+
+import struct
+from datetime import datetime, date
+
+from msgpack import packb, unpackb, ExtType
+
+try:
+    import cPickle
+    pDumps = cPickle.dumps
+    pLoads = cPickle.loads
+except ImportError:
+    # for python 3
+    import pickle
+    pDumps = pickle.dumps
+    pLoads = pickle.loads
+
+
+# msgpack扩展类型编号
+EXT_OBJECT = 1          # 已注册数据结构的对象
+EXT_DATETIME = 2        # 不带时区的datetime
+EXT_DATE = 3            # date
+EXT_PICKLE = 4          # 未注册的Python对象，回退使用pickle
+
+DATETIME_STRUCT = struct.Struct('!HBBBBBI')
+DATE_STRUCT = struct.Struct('!HBB')
+
+
+########################################################################
+class ObjectSchema(object):
+    """
+    对象数据结构定义
+
+    对象的属性按照固定的字段表（fields）顺序打包为数值列表，传输时不再包含属性名，
+    exclude中的字段不参与传输，解包时恢复为默认值。
+    optional中的字段不一定存在于对象的属性中（例如按需生成的时间字段），同样按固定位置传输，
+    对象上不存在时打包为None，解包时值为None的字段不设置。
+    字段表以外的动态属性（例如策略临时添加的属性）作为附加字典一并传输。
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, code, cls, fields=None, exclude=None, optional=None):
+        """Constructor"""
+        self.code = code
+        self.cls = cls
+
+        default = cls().__dict__
+        exclude = exclude or []
+        optional = optional or []
+
+        if fields is None:
+            fields = sorted([k for k in default.keys() if k not in exclude and k not in optional])
+
+        self.fields = list(fields) + [k for k in optional if k not in fields]
+        self.fieldSet = set(self.fields)
+        self.optional = [k for k in optional if k not in default]
+        self.defaults = dict([(k, default.get(k, None)) for k in exclude])
+        self.keySet = self.fieldSet | set(self.defaults)
+
+        # 兼容Python2中的旧式类（如Event）
+        self.newStyle = isinstance(cls, type)
+
+    #----------------------------------------------------------------------
+    def encode(self, obj):
+        """对象转换为[编号, 数值列表, 附加字典]"""
+        d = obj.__dict__
+        values = [d.get(k, None) for k in self.fields]
+
+        extras = None
+        if not self.keySet.issuperset(d):
+            extras = dict([(k, v) for k, v in d.items() if k not in self.keySet])
+
+        return [self.code, values, extras]
+
+    #----------------------------------------------------------------------
+    def decode(self, values, extras):
+        """根据数值列表还原对象"""
+        if len(values) != len(self.fields):
+            raise ValueError(u'%s数据结构不一致，本地字段数%s，收到字段数%s'
+                             %(self.cls.__name__, len(self.fields), len(values)))
+
+        if self.newStyle:
+            obj = self.cls.__new__(self.cls)
+        else:
+            obj = self.cls()
+
+        d = obj.__dict__
+        d.update(self.defaults)
+        d.update(zip(self.fields, values))
+        for k in self.optional:
+            if d[k] is None:
+                del d[k]
+        if extras:
+            d.update(extras)
+        return obj
+
+
+########################################################################
+class ObjectCodec(object):
+    """
+    基于数据结构定义的序列化工具
+
+    底层使用msgpack，对以下类型使用扩展类型编码：
+    1. 通过register注册过的类，按字段表打包为紧凑的数值列表
+    2. datetime和date，打包为定长二进制
+    3. 其他无法直接用msgpack表示的Python对象，回退使用pickle
+
+    通讯双方需要注册相同的编号和类，注册顺序无关。
+    pack和unpack可以直接作为RpcObject的序列化函数使用（见RpcObject.useCodec）。
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        """Constructor"""
+        self.classDict = {}         # class:schema
+        self.codeDict = {}          # code:schema
+
+        self.unpackKwargs = self.initUnpackKwargs()
+
+    #----------------------------------------------------------------------
+    def register(self, code, cls, fields=None, exclude=None, optional=None):
+        """注册数据结构"""
+        if code in self.codeDict:
+            raise ValueError(u'数据结构编号%s重复' %code)
+
+        schema = ObjectSchema(code, cls, fields, exclude, optional)
+        self.classDict[cls] = schema
+        self.codeDict[code] = schema
+        return schema
+
+    #----------------------------------------------------------------------
+    def getSchemaTable(self):
+        """获取字段表，用于通讯双方核对数据结构"""
+        return dict([(code, [schema.cls.__name__, schema.fields])
+                     for code, schema in self.codeDict.items()])
+
+    #----------------------------------------------------------------------
+    def pack(self, data):
+        """打包"""
+        return packb(data, use_bin_type=True, default=self.default)
+
+    #----------------------------------------------------------------------
+    def unpack(self, data):
+        """解包"""
+        return unpackb(data, **self.unpackKwargs)
+
+    #----------------------------------------------------------------------
+    def default(self, obj):
+        """msgpack无法直接打包的对象"""
+        schema = self.classDict.get(obj.__class__, None)
+        if schema:
+            return ExtType(EXT_OBJECT, self.pack(schema.encode(obj)))
+
+        if isinstance(obj, datetime):
+            if obj.tzinfo is None:
+                return ExtType(EXT_DATETIME, DATETIME_STRUCT.pack(obj.year, obj.month, obj.day,
+                                                                  obj.hour, obj.minute, obj.second,
+                                                                  obj.microsecond))
+        elif isinstance(obj, date):
+            return ExtType(EXT_DATE, DATE_STRUCT.pack(obj.year, obj.month, obj.day))
+
+        return ExtType(EXT_PICKLE, pDumps(obj, 2))
+
+    #----------------------------------------------------------------------
+    def extHook(self, code, data):
+        """还原扩展类型"""
+        if code == EXT_OBJECT:
+            schemaCode, values, extras = self.unpack(data)
+            return self.codeDict[schemaCode].decode(values, extras)
+        elif code == EXT_DATETIME:
+            return datetime(*DATETIME_STRUCT.unpack(data))
+        elif code == EXT_DATE:
+            return date(*DATE_STRUCT.unpack(data))
+        elif code == EXT_PICKLE:
+            return pLoads(data)
+        return ExtType(code, data)
+
+    #----------------------------------------------------------------------
+    def initUnpackKwargs(self):
+        """兼容不同版本msgpack的解包参数"""
+        candidates = [
+            {'raw': False, 'strict_map_key': False},    # msgpack >= 1.0
+            {'raw': False},                             # msgpack >= 0.5.2
+            {'encoding': 'utf-8'}                       # 更早的版本
+        ]
+
+        testData = packb({1: u'test'}, use_bin_type=True)
+        for kwargs in candidates:
+            kwargs['ext_hook'] = self.extHook
+            try:
+                unpackb(testData, **kwargs)
+                return kwargs
+            except TypeError:
+                continue
+        return {'ext_hook': self.extHook}
@@ -2,7 +2,10 @@
 
 import threading
 import traceback
+import logging
 import signal
+from time import time
+from queue import Queue
 
 import zmq
 from msgpack import packb, unpackb
@@ -27,14 +30,16 @@ class RpcObject(object):
     """
     RPC对象
 
-    提供对数据的序列化打包和解包接口，目前提供了json、msgpack、cPickle三种工具。
+    提供对数据的序列化打包和解包接口，目前提供了json、msgpack、cPickle三种工具，
+    以及基于数据结构定义的ObjectCodec（见vncodec.py）。
 
     msgpack：性能更高，但通常需要安装msgpack相关工具；
     json：性能略低但通用性更好，大部分编程语言都内置了相关的库。
     cPickle：性能一般且仅能用于Python，但是可以直接传送Python对象，非常方便。
 
     因此建议尽量使用msgpack，如果要和某些语言通讯没有提供msgpack时再使用json，
-    当传送的数据包含很多自定义的Python对象时建议使用cPickle。
+    当传送的数据包含很多自定义的Python对象时建议使用ObjectCodec，
+    只对少数无法预先定义结构的对象使用cPickle。
 
     如果希望使用其他的序列化工具也可以在这里添加。
     """
@@ -108,13 +113,30 @@ class RpcObject(object):
         self.pack = self.__picklePack
         self.unpack = self.__pickleUnpack
 
+    #----------------------------------------------------------------------
+    def useCodec(self, codec):
+        """使用基于数据结构定义的ObjectCodec作为序列化工具"""
+        self.pack = codec.pack
+        self.unpack = codec.unpack
+
 
 ########################################################################
 class RpcServer(RpcObject):
-    """RPC服务器"""
+    """
+    RPC服务器
+
+    请求回应使用ROUTER socket，同时兼容REQ和DEALER类型的客户端：
+    1. 请求为[name, args, kwargs]时（旧版REQ客户端），回应为[ok, result]
+    2. 请求为[name, args, kwargs, reqid]时，回应为[ok, result, reqid]，
+       客户端据此匹配并发的多个请求
+
+    workerCount为0时在服务器线程中逐个执行请求（与旧版行为一致，
+    适用于功能函数不是线程安全的场景）；大于0时由工作线程池并发执行，
+    一个耗时的调用不会阻塞其他客户端的请求。
+    """
 
     #----------------------------------------------------------------------
-    def __init__(self, repAddress, pubAddress):
+    def __init__(self, repAddress, pubAddress, workerCount=0):
         """Constructor"""
         super(RpcServer, self).__init__()
 
@@ -124,16 +146,25 @@ class RpcServer(RpcObject):
         # zmq端口相关
         self.__context = zmq.Context()
 
-        self.__socketREP = self.__context.socket(zmq.REP)   # 请求回应socket
+        self.__socketREP = self.__context.socket(zmq.ROUTER)    # 请求回应socket
         self.__socketREP.bind(repAddress)
 
-        self.__socketPUB = self.__context.socket(zmq.PUB)   # 数据广播socket
+        self.__socketPUB = self.__context.socket(zmq.PUB)       # 数据广播socket
         self.__socketPUB.bind(pubAddress)
 
+        # 工作线程池返回结果使用的socket，由服务器线程统一发出回应
+        self.__replyAddress = 'inproc://vnrpc-reply-%s' % id(self)
+        self.__socketReply = self.__context.socket(zmq.PULL)
+        self.__socketReply.bind(self.__replyAddress)
+
         # 工作线程相关
         self.__active = False                             # 服务器的工作状态
         self.__thread = threading.Thread(target=self.run) # 服务器的工作线程
 
+        self.__workerCount = workerCount                  # 工作线程数量
+        self.__workerQueue = Queue()                      # 等待执行的请求队列
+        self.__workers = []                               # 工作线程列表
+
     #----------------------------------------------------------------------
     def start(self):
         """启动服务器"""
@@ -141,49 +172,110 @@ class RpcServer(RpcObject):
         self.__active = True
 
         # 启动工作线程
-        if not self.__thread.isAlive():
+        if not self.__thread.is_alive():
             self.__thread.start()
 
+        # 启动工作线程池
+        if not self.__workers:
+            for i in range(self.__workerCount):
+                worker = threading.Thread(target=self.runWorker)
+                worker.daemon = True
+                worker.start()
+                self.__workers.append(worker)
+
     #----------------------------------------------------------------------
     def stop(self, join=False):
         """停止服务器"""
         # 将服务器设为停止
         self.__active = False
 
+        # 通知工作线程池退出
+        for worker in self.__workers:
+            self.__workerQueue.put(None)
+
         # 等待工作线程退出
-        if join and self.__thread.isAlive():
+        if join and self.__thread.is_alive():
             self.__thread.join()
 
+            for worker in self.__workers:
+                worker.join()
+
+        self.__workers = []
+
     #----------------------------------------------------------------------
     def run(self):
         """服务器运行函数"""
+        poller = zmq.Poller()
+        poller.register(self.__socketREP, zmq.POLLIN)
+        poller.register(self.__socketReply, zmq.POLLIN)
+
         while self.__active:
             # 使用poll来等待事件到达，等待1秒（1000毫秒）
-            if not self.__socketREP.poll(1000):
+            events = dict(poller.poll(1000))
+
+            # 发出工作线程池完成的回应
+            if self.__socketReply in events:
+                while True:
+                    try:
+                        frames = self.__socketReply.recv_multipart(zmq.NOBLOCK)
+                    except zmq.Again:
+                        break
+                    self.__socketREP.send_multipart(frames)
+
+            if self.__socketREP not in events:
                 continue
 
-            # 从请求响应socket收取请求数据
-            reqb = self.__socketREP.recv()
+            # 从请求响应socket收取请求数据，最后一帧为请求内容，之前为路由信息
+            while True:
+                try:
+                    frames = self.__socketREP.recv_multipart(zmq.NOBLOCK)
+                except zmq.Again:
+                    break
 
-            # 序列化解包
-            req = self.unpack(reqb)
+                if self.__workerCount:
+                    self.__workerQueue.put(frames)
+                else:
+                    self.__socketREP.send_multipart(self.process(frames))
+
+    #----------------------------------------------------------------------
+    def runWorker(self):
+        """工作线程运行函数"""
+        # zmq的socket不是线程安全的，每个工作线程使用自己的socket返回结果
+        socket = self.__context.socket(zmq.PUSH)
+        socket.setsockopt(zmq.LINGER, 0)
+        socket.connect(self.__replyAddress)
+
+        while True:
+            frames = self.__workerQueue.get()
+            if frames is None:
+                break
+            socket.send_multipart(self.process(frames))
+
+        socket.close()
 
-            # 获取函数名和参数
-            name, args, kwargs = req
+    #----------------------------------------------------------------------
+    def process(self, frames):
+        """执行请求，返回回应的数据帧"""
+        # 序列化解包
+        req = self.unpack(frames[-1])
+
+        # 获取函数名和参数，新版客户端会附带请求编号
+        name, args, kwargs = req[:3]
 
-            # 获取引擎中对应的函数对象，并执行调用，如果有异常则捕捉后返回
-            try:
-                func = self.__functions[name]
-                r = func(*args, **kwargs)
-                rep = [True, r]
-            except Exception as e:
-                rep = [False, traceback.format_exc()]
+        # 获取引擎中对应的函数对象，并执行调用，如果有异常则捕捉后返回
+        try:
+            func = self.__functions[name]
+            r = func(*args, **kwargs)
+            rep = [True, r]
+        except Exception as e:
+            rep = [False, traceback.format_exc()]
 
-            # 序列化打包
-            repb = self.pack(rep)
+        if len(req) > 3:
+            rep.append(req[3])
 
-            # 通过请求响应socket返回调用结果
-            self.__socketREP.send(repb)
+        # 序列化打包，并附上原有的路由信息
+        repb = self.pack(rep)
+        return frames[:-1] + [repb]
 
     #----------------------------------------------------------------------
     def publish(self, topic, data):
@@ -204,9 +296,64 @@ class RpcServer(RpcObject):
         self.__functions[func.__name__] = func
 
 
+########################################################################
+class RpcFuture(object):
+    """RPC调用的异步结果"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, name):
+        """Constructor"""
+        self.name = name            # 调用的函数名
+        self.ok = False             # 是否调用成功
+        self.value = None           # 返回值或者远程错误信息
+        self.abandoned = False      # 调用方是否已经超时放弃
+
+        self.__event = threading.Event()
+
+    #----------------------------------------------------------------------
+    def done(self):
+        """是否已经收到回应"""
+        return self.__event.is_set()
+
+    #----------------------------------------------------------------------
+    def setResult(self, ok, value):
+        """设置回应结果"""
+        self.ok = ok
+        self.value = value
+        self.__event.set()
+
+    #----------------------------------------------------------------------
+    def result(self, timeout=None):
+        """
+        等待并获取结果
+        调用失败时抛出RemoteException，超时抛出RemoteTimeout
+        """
+        if not self.__event.wait(timeout):
+            self.abandoned = True
+            raise RemoteTimeout(u'调用%s超时（%s秒）' % (self.name, timeout))
+
+        if self.ok:
+            return self.value
+        else:
+            raise RemoteException(self.value)
+
+
 ########################################################################
 class RpcClient(RpcObject):
-    """RPC客户端"""
+    """
+    RPC客户端
+
+    请求回应使用DEALER socket，每个请求带有编号，多个请求可以同时在途，
+    由客户端的请求线程统一收发并按编号匹配回应，因此可以在多个线程中同时调用。
+
+    调用方式：
+    1. client.func(*args, **kwargs)：同步调用，等待时间由setTimeout设置
+    2. client.asyncCall(name, *args, **kwargs)：异步调用，立即返回RpcFuture
+
+    注意asyncCall、setTimeout等客户端自身的函数名不能再用作远程函数名。
+    """
+
+    DEFAULT_TIMEOUT = None                  # 同步调用的默认等待时间（秒），None表示一直等待，需要时通过setTimeout设置
 
     #----------------------------------------------------------------------
     def __init__(self, reqAddress, subAddress):
@@ -218,38 +365,76 @@ class RpcClient(RpcObject):
         self.__subAddress = subAddress
 
         self.__context = zmq.Context()
-        self.__socketREQ = self.__context.socket(zmq.REQ)   # 请求发出socket
-        self.__socketSUB = self.__context.socket(zmq.SUB)   # 广播订阅socket
+        self.__socketREQ = self.__context.socket(zmq.DEALER)    # 请求发出socket
+        self.__socketSUB = self.__context.socket(zmq.SUB)       # 广播订阅socket
+
+        # 调用线程通过各自的socket把请求交给请求线程发出
+        self.__requestAddress = 'inproc://vnrpc-request-%s' % id(self)
+        self.__socketRequest = self.__context.socket(zmq.PULL)
+        self.__socketRequest.bind(self.__requestAddress)
+        self.__local = threading.local()
+
+        # 在途请求相关
+        self.__reqid = 0                    # 请求编号
+        self.__futureDict = {}              # reqid:RpcFuture
+        self.__futureLock = threading.Lock()
+        self.__timeout = self.DEFAULT_TIMEOUT   # 同步调用的等待时间，None表示一直等待
+        self.__cleanTime = 0                # 上次清理超时请求的时间
 
         # 工作线程相关，用于处理服务器推送的数据
         self.__active = False                                   # 客户端的工作状态
         self.__thread = threading.Thread(target=self.run)       # 客户端的工作线程
+        self.__reqThread = threading.Thread(target=self.runReq) # 客户端的请求线程
+
+        # zmq的socket不是线程安全的，工作线程启动后的订阅变化缓存在这里由工作线程执行
+        self.__topicLock = threading.Lock()
+        self.__topicList = []                                   # (option, topic)
 
     #----------------------------------------------------------------------
     def __getattr__(self, name):
         """实现远程调用功能"""
         # 执行远程调用任务
         def dorpc(*args, **kwargs):
-            # 生成请求
-            req = [name, args, kwargs]
-
-            # 序列化打包请求
-            reqb = self.pack(req)
+            # 发送请求并等待回应，调用失败则触发异常
+            future = self.__sendRequest(name, args, kwargs)
+            return future.result(self.__timeout)
 
-            # 发送请求并等待回应
-            self.__socketREQ.send(reqb)
-            repb = self.__socketREQ.recv()
+        return dorpc
 
-            # 序列化解包回应
-            rep = self.unpack(repb)
+    #----------------------------------------------------------------------
+    def asyncCall(self, name, *args, **kwargs):
+        """异步调用远程函数，返回RpcFuture"""
+        return self.__sendRequest(name, args, kwargs)
 
-            # 若正常则返回结果，调用失败则触发异常
-            if rep[0]:
-                return rep[1]
-            else:
-                raise RemoteException(rep[1])
+    #----------------------------------------------------------------------
+    def setTimeout(self, timeout):
+        """设置同步调用的等待时间（秒），None表示一直等待"""
+        self.__timeout = timeout
 
-        return dorpc
+    #----------------------------------------------------------------------
+    def __sendRequest(self, name, args, kwargs):
+        """生成请求编号并交给请求线程发出"""
+        future = RpcFuture(name)
+
+        with self.__futureLock:
+            self.__reqid += 1
+            reqid = self.__reqid
+            self.__futureDict[reqid] = future
+
+        # 生成请求并序列化打包
+        req = [name, args, kwargs, reqid]
+        reqb = self.pack(req)
+
+        # 每个调用线程使用自己的socket
+        socket = getattr(self.__local, 'socket', None)
+        if socket is None:
+            socket = self.__context.socket(zmq.PUSH)
+            socket.setsockopt(zmq.LINGER, 0)
+            socket.connect(self.__requestAddress)
+            self.__local.socket = socket
+
+        socket.send(reqb)
+        return future
 
     #----------------------------------------------------------------------
     def start(self):
@@ -262,9 +447,12 @@ class RpcClient(RpcObject):
         self.__active = True
 
         # 启动工作线程
-        if not self.__thread.isAlive():
+        if not self.__thread.is_alive():
             self.__thread.start()
 
+        if not self.__reqThread.is_alive():
+            self.__reqThread.start()
+
     #----------------------------------------------------------------------
     def stop(self):
         """停止客户端"""
@@ -272,13 +460,20 @@ class RpcClient(RpcObject):
         self.__active = False
 
         # 等待工作线程退出
-        if self.__thread.isAlive():
+        if self.__thread.is_alive():
             self.__thread.join()
 
+        if self.__reqThread.is_alive():
+            self.__reqThread.join()
+
     #----------------------------------------------------------------------
     def run(self):
         """客户端运行函数"""
         while self.__active:
+            # 执行缓存的订阅变化
+            if self.__topicList:
+                self.__processTopic()
+
             # 使用poll来等待事件到达，等待1秒（1000毫秒）
             if not self.__socketSUB.poll(1000):
                 continue
@@ -292,6 +487,62 @@ class RpcClient(RpcObject):
             # 调用回调函数处理
             self.callback(topic, data)
 
+    #----------------------------------------------------------------------
+    def runReq(self):
+        """请求线程运行函数，负责发出请求和分发回应"""
+        poller = zmq.Poller()
+        poller.register(self.__socketREQ, zmq.POLLIN)
+        poller.register(self.__socketRequest, zmq.POLLIN)
+
+        while self.__active:
+            events = dict(poller.poll(1000))
+
+            # 发出调用线程提交的请求，空帧用于兼容服务器的路由格式
+            if self.__socketRequest in events:
+                while True:
+                    try:
+                        reqb = self.__socketRequest.recv(zmq.NOBLOCK)
+                    except zmq.Again:
+                        break
+                    self.__socketREQ.send_multipart([b'', reqb])
+
+            # 按请求编号分发回应
+            if self.__socketREQ in events:
+                while True:
+                    try:
+                        frames = self.__socketREQ.recv_multipart(zmq.NOBLOCK)
+                    except zmq.Again:
+                        break
+
+                    # 无法解析的回应（例如旧版本服务器的格式）记录后丢弃，不影响请求线程
+                    try:
+                        ok, value, reqid = self.unpack(frames[-1])
+                    except Exception:
+                        logging.getLogger(__name__).exception(u'RPC回应解析失败，已丢弃')
+                        continue
+
+                    with self.__futureLock:
+                        future = self.__futureDict.pop(reqid, None)
+
+                    # 已经超时放弃的请求直接忽略
+                    if future:
+                        future.setResult(ok, value)
+
+            # 清理已经超时放弃的请求
+            self.__cleanFuture()
+
+    #----------------------------------------------------------------------
+    def __cleanFuture(self):
+        """移除调用方已经放弃等待的请求，每秒执行一次"""
+        now = time()
+        if not self.__futureDict or now - self.__cleanTime < 1:
+            return
+        self.__cleanTime = now
+
+        with self.__futureLock:
+            for reqid in [k for k, f in self.__futureDict.items() if f.abandoned]:
+                del self.__futureDict[reqid]
+
     #----------------------------------------------------------------------
     def callback(self, topic, data):
         """回调函数，必须由用户实现"""
@@ -302,11 +553,38 @@ class RpcClient(RpcObject):
         """
         订阅特定主题的广播数据
 
-        可以使用topic=''来订阅所有的主题
+        可以使用topic=''来订阅所有的主题，主题按前缀匹配
 
         注意topic必须是ascii编码
         """
-        self.__socketSUB.setsockopt(zmq.SUBSCRIBE, topic)
+        self.__setTopic(zmq.SUBSCRIBE, topic)
+
+    #----------------------------------------------------------------------
+    def unsubscribeTopic(self, topic):
+        """取消订阅特定主题的广播数据"""
+        self.__setTopic(zmq.UNSUBSCRIBE, topic)
+
+    #----------------------------------------------------------------------
+    def __setTopic(self, option, topic):
+        """设置订阅，工作线程运行中时交由工作线程执行"""
+        if not isinstance(topic, bytes):
+            topic = topic.encode('ascii')
+
+        if self.__thread.is_alive():
+            with self.__topicLock:
+                self.__topicList.append((option, topic))
+        else:
+            self.__socketSUB.setsockopt(option, topic)
+
+    #----------------------------------------------------------------------
+    def __processTopic(self):
+        """在工作线程中执行缓存的订阅变化"""
+        with self.__topicLock:
+            l = self.__topicList
+            self.__topicList = []
+
+        for option, topic in l:
+            self.__socketSUB.setsockopt(option, topic)
 
 
 ########################################################################
@@ -322,3 +600,9 @@ class RemoteException(Exception):
     def __str__(self):
         """输出错误信息"""
         return self.__value
+
+
+########################################################################
+class RemoteTimeout(RemoteException):
+    """RPC调用超时"""
+    pass
@@ -3,7 +3,14 @@
 import os
 
 from .algoEngine import AlgoEngine
-from .uiAlgoManager import AlgoManager
+
+
+#----------------------------------------------------------------------
+def AlgoManager(*args, **kwargs):
+    """创建算法交易界面，在这里才导入Qt，回测等无界面程序不需要加载"""
+    from .uiAlgoManager import AlgoManager
+    return AlgoManager(*args, **kwargs)
+
 
 appName = 'AlgoTrading'
 appDisplayName = u'算法交易'
@@ -7,10 +7,9 @@ from vnpy.trader.vtConstant import (DIRECTION_LONG, DIRECTION_SHORT,
                                     OFFSET_OPEN, OFFSET_CLOSE,
                                     STATUS_ALLTRADED, STATUS_CANCELLED,
                                     STATUS_REJECTED)
-from vnpy.trader.uiQt import QtGui
 
 from vnpy.trader.app.algoTrading.algoTemplate import AlgoTemplate
-from vnpy.trader.app.algoTrading.uiAlgoWidget import AlgoWidget, QtWidgets
+from vnpy.trader.app.algoTrading.uiAlgoWidget import AlgoWidget, QtWidgets, QtGui
 
 
 STATUS_FINISHED = set([STATUS_ALLTRADED, STATUS_CANCELLED, STATUS_REJECTED])
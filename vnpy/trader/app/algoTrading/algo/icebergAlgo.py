@@ -8,9 +8,8 @@ from six import text_type
 from vnpy.trader.vtConstant import (DIRECTION_LONG, DIRECTION_SHORT,
                                     OFFSET_OPEN, OFFSET_CLOSE,
                                     STATUS_ALLTRADED, STATUS_CANCELLED, STATUS_REJECTED)
-from vnpy.trader.uiQt import QtWidgets, QtGui
 from vnpy.trader.app.algoTrading.algoTemplate import AlgoTemplate
-from vnpy.trader.app.algoTrading.uiAlgoWidget import AlgoWidget
+from vnpy.trader.app.algoTrading.uiAlgoWidget import AlgoWidget, QtWidgets, QtGui
 
 
 
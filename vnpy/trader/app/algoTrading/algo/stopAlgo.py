@@ -8,9 +8,8 @@ from six import text_type
 from vnpy.trader.vtConstant import (DIRECTION_LONG, DIRECTION_SHORT,
                                     OFFSET_OPEN, OFFSET_CLOSE,
                                     STATUS_ALLTRADED, STATUS_CANCELLED, STATUS_REJECTED)
-from vnpy.trader.uiQt import QtWidgets
 from vnpy.trader.app.algoTrading.algoTemplate import AlgoTemplate
-from vnpy.trader.app.algoTrading.uiAlgoWidget import AlgoWidget, QtWidgets
+from vnpy.trader.app.algoTrading.uiAlgoWidget import AlgoWidget, QtWidgets, QtGui
 
 
 
@@ -62,15 +61,18 @@ class StopAlgo(AlgoTemplate):
                 price = min(price, tick.upperLimit)
                 
             func = self.buy
-        else:
+        elif (self.direction == DIRECTION_SHORT and
+              tick.lastPrice <= self.stopPrice):
             price = self.stopPrice - self.priceAdd
             
             if tick.lowerLimit:
                 price = max(price, tick.lowerLimit)
                 
             func = self.sell
+        else:
+            return
             
-        self.vtOrderID = func(self.vtSymbol, price, self.volume, offset=self.offset)
+        self.vtOrderID = func(self.vtSymbol, price, self.totalVolume, offset=self.offset)
         
         msg = u'停止单已触发，代码：%s，方向：%s, 价格：%s，数量：%s，开平：%s' %(self.vtSymbol,
                                                                                 self.direction,
@@ -6,9 +6,8 @@ from collections import OrderedDict
 from six import text_type
 
 from vnpy.trader.vtConstant import (DIRECTION_LONG, DIRECTION_SHORT)
-from vnpy.trader.uiQt import QtWidgets
 from vnpy.trader.app.algoTrading.algoTemplate import AlgoTemplate
-from vnpy.trader.app.algoTrading.uiAlgoWidget import AlgoWidget, QtWidgets
+from vnpy.trader.app.algoTrading.uiAlgoWidget import AlgoWidget, QtWidgets, QtGui
 
 
 ########################################################################
@@ -0,0 +1,582 @@
+# encoding: UTF-8
+
+'''
+算法交易模拟引擎
+
+1. 实现和AlgoEngine相同的算法接口（subscribe、buy/sell、cancelOrder、getTick、getContract等），
+   算法代码不需要修改即可用历史Tick数据离线运行
+2. 定时器按Tick时间每秒触发一次，和实盘的EVENT_TIMER保持一致
+3. 委托回报在算法函数返回后才推送，模拟事件引擎的异步处理
+4. 撮合使用排队位置模型：
+   新委托在下一个Tick先按对手盘五档吃单，剩余的限价部分排在同价位已有挂单之后，
+   之后只有在该价位的成交量消耗完前方排队量、或者价格穿越委托价时才成交，
+   前方挂单撤单（盘口挂单量减少）时排队位置相应前移
+5. 统计成交均价相对到达价格（启动时的中间价）和执行期间市场VWAP的滑点
+6. 多组算法参数可以通过多进程并行模拟
+'''
+
+from __future__ import division
+from __future__ import print_function
+
+import multiprocessing
+from collections import deque, OrderedDict
+from datetime import datetime, timedelta
+from copy import copy
+
+import pandas as pd
+
+from vnpy.trader.vtGlobal import globalSetting
+from vnpy.trader.vtObject import (VtTickData, VtContractData, VtOrderData,
+                                  VtTradeData, VtLogData)
+from vnpy.trader.vtConstant import (DIRECTION_LONG, DIRECTION_SHORT,
+                                    OFFSET_OPEN, PRICETYPE_LIMITPRICE,
+                                    PRICETYPE_MARKETPRICE,
+                                    STATUS_NOTTRADED, STATUS_PARTTRADED,
+                                    STATUS_ALLTRADED, STATUS_CANCELLED)
+
+
+# 盘口档位
+DEPTH_LEVELS = range(1, 6)
+
+
+########################################################################
+class SimOrder(object):
+    """模拟撮合中的委托状态"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, order):
+        """Constructor"""
+        self.order = order          # VtOrderData
+        self.fresh = True           # 尚未经过第一次撮合
+        self.queueAhead = 0         # 前方排队量
+
+
+########################################################################
+class AlgoSimulator(object):
+    """
+    算法交易模拟引擎
+    函数接口和AlgoEngine保持一样，
+    从而实现同一套算法代码从模拟到实盘。
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        """Constructor"""
+        self.tickDict = OrderedDict()       # vtSymbol:按时间排序的VtTickData列表
+        self.contractDict = {}              # vtSymbol:VtContractData
+
+        self.startTime = None               # 算法启动时间，为空则从第一个Tick开始
+        self.endTime = None                 # 模拟结束时间，为空则到数据结束
+        self.logActive = False              # 是否记录算法日志
+
+        self.clearSimulationResult()
+
+    #----------------------------------------------------------------------
+    def output(self, content):
+        """输出内容"""
+        print(str(datetime.now()) + "\t" + content)
+
+    #----------------------------------------------------------------------
+    def clearSimulationResult(self):
+        """清空模拟状态和结果"""
+        self.algo = None
+        self.subscribed = set()             # 算法订阅的合约
+        self.lastTickDict = {}              # vtSymbol:当前Tick
+        self.dt = None                      # 当前模拟时间
+
+        self.orderCount = 0
+        self.orderDict = OrderedDict()      # vtOrderID:VtOrderData
+        self.workingDict = OrderedDict()    # vtOrderID:SimOrder
+        self.cancelCount = 0
+        self.tradeCount = 0
+        self.tradeList = []
+
+        self.eventQueue = deque()           # 待推送的回调
+        self.logList = []
+        self.varDict = {}                   # 算法最新的变量
+        self.paramDict = {}                 # 算法参数
+
+        self.algoStartTime = None
+        self.algoEndTime = None
+
+    #----------------------------------------------------------------------
+    # 模拟设置
+    #----------------------------------------------------------------------
+    def setContract(self, vtSymbol, priceTick, size=1, minVolume=1):
+        """设置合约信息"""
+        contract = VtContractData()
+        contract.vtSymbol = vtSymbol
+        contract.symbol = vtSymbol.split(':')[0]
+        contract.priceTick = priceTick
+        contract.size = size
+        contract.minVolume = minVolume
+        self.contractDict[vtSymbol] = contract
+
+    #----------------------------------------------------------------------
+    def setTickData(self, vtSymbol, data):
+        """设置Tick数据，VtTickData列表或者字段和VtTickData相同的DataFrame"""
+        if isinstance(data, pd.DataFrame):
+            tickList = []
+            for d in data.to_dict('records'):
+                tick = VtTickData()
+                tick.__dict__.update(d)
+                tick.vtSymbol = vtSymbol
+                tickList.append(tick)
+        else:
+            tickList = list(data)
+
+        tickList.sort(key=lambda tick: tick.datetime)
+        self.tickDict[vtSymbol] = tickList
+
+    #----------------------------------------------------------------------
+    def loadHistoryData(self, dbName, vtSymbol, startDate, endDate):
+        """从MongoDB载入Tick数据，数据范围[start:end)"""
+        import pymongo
+        client = pymongo.MongoClient(globalSetting['mongoHost'], globalSetting['mongoPort'])
+        collection = client[dbName][vtSymbol]
+        flt = {'datetime': {'$gte': startDate, '$lt': endDate}}
+        cursor = collection.find(flt, {'_id': 0}).sort('datetime')
+        data = pd.DataFrame(list(cursor))
+        client.close()
+
+        self.setTickData(vtSymbol, data)
+        self.output(u'%s数据载入完成，数据量：%s' % (vtSymbol, len(data)))
+
+    #----------------------------------------------------------------------
+    def setStartTime(self, startTime=None, endTime=None):
+        """设置算法启动时间和模拟结束时间"""
+        self.startTime = startTime
+        self.endTime = endTime
+
+    #----------------------------------------------------------------------
+    def setLog(self, active=False):
+        """设置是否记录算法日志"""
+        self.logActive = active
+
+    #----------------------------------------------------------------------
+    # 模拟运行
+    #----------------------------------------------------------------------
+    def runSimulation(self, algoSetting, algoClass=None):
+        """
+        运行一次模拟，返回统计结果
+        algoClass为空时根据algoSetting中的templateName查找算法类
+        """
+        if not algoClass:
+            from .algo import ALGO_DICT
+            algoClass = ALGO_DICT[algoSetting['templateName']]
+
+        self.clearSimulationResult()
+
+        # 归并所有合约的Tick
+        stream = []
+        for ticks in self.tickDict.values():
+            stream.extend(ticks)
+        stream.sort(key=lambda tick: tick.datetime)
+
+        if self.endTime:
+            stream = [tick for tick in stream if tick.datetime < self.endTime]
+
+        # 算法启动前的Tick只用于更新盘口
+        n = 0
+        if self.startTime:
+            while n < len(stream) and stream[n].datetime < self.startTime:
+                self.lastTickDict[stream[n].vtSymbol] = stream[n]
+                n += 1
+        if n >= len(stream):
+            self.output(u'启动时间之后没有行情数据')
+            return self.calculateResult(algoSetting)
+
+        self.dt = stream[n].datetime
+        self.algoStartTime = self.dt
+        self.algo = algoClass.new(self, algoSetting)
+        self.processEvents()
+
+        lastSecond = self.dt.replace(microsecond=0)
+
+        for tick in stream[n:]:
+            if not self.algo.active:
+                break
+
+            # 定时器，补齐两个Tick之间经过的每一秒
+            second = tick.datetime.replace(microsecond=0)
+            while lastSecond < second and self.algo.active:
+                lastSecond += timedelta(seconds=1)
+                self.dt = lastSecond
+                self.algo.updateTimer()
+                self.processEvents()
+
+            self.dt = tick.datetime
+            prevTick = self.lastTickDict.get(tick.vtSymbol, None)
+            self.lastTickDict[tick.vtSymbol] = tick
+
+            # 先撮合之前发出的委托，再推送行情
+            self.crossOrder(tick, prevTick)
+            self.processEvents()
+
+            if tick.vtSymbol in self.subscribed and self.algo.active:
+                self.algo.updateTick(tick)
+                self.processEvents()
+
+        if self.algo.active:
+            self.algo.stop()
+            self.processEvents()
+
+        self.algoEndTime = self.dt
+        return self.calculateResult(algoSetting)
+
+    #----------------------------------------------------------------------
+    def processEvents(self):
+        """处理回调队列"""
+        queue = self.eventQueue
+        while queue:
+            func, data = queue.popleft()
+            func(data)
+
+    #----------------------------------------------------------------------
+    def crossOrder(self, tick, prevTick):
+        """用最新Tick撮合该合约的委托"""
+        if not self.workingDict:
+            return
+
+        # 本Tick内的成交量，用于消耗排队
+        tradedVolume = 0
+        if prevTick:
+            tradedVolume = max(tick.volume - prevTick.volume, 0)
+
+        # 盘口剩余量，多个委托吃单时依次消耗
+        askDepth = [[getattr(tick, 'askPrice%s' % i), getattr(tick, 'askVolume%s' % i)]
+                    for i in DEPTH_LEVELS]
+        bidDepth = [[getattr(tick, 'bidPrice%s' % i), getattr(tick, 'bidVolume%s' % i)]
+                    for i in DEPTH_LEVELS]
+
+        for vtOrderID, so in list(self.workingDict.items()):
+            order = so.order
+            if order.vtSymbol != tick.vtSymbol:
+                continue
+
+            isLong = order.direction == DIRECTION_LONG
+            isMarket = order.priceType == PRICETYPE_MARKETPRICE
+
+            if so.fresh:
+                so.fresh = False
+
+                # 吃对手盘
+                depth = askDepth if isLong else bidDepth
+                for level in depth:
+                    price, volume = level
+                    remaining = order.totalVolume - order.tradedVolume
+                    if not price or not volume or remaining <= 0:
+                        continue
+                    if not isMarket and ((isLong and price > order.price) or
+                                         (not isLong and price < order.price)):
+                        break
+                    volume = min(volume, remaining)
+                    level[1] -= volume
+                    self.newTrade(so, price, volume)
+
+                if vtOrderID not in self.workingDict:
+                    continue
+
+                # 市价单剩余部分撤销
+                if isMarket:
+                    self.removeOrder(so, STATUS_CANCELLED)
+                    continue
+
+                # 剩余部分排在同价位已有挂单之后
+                so.queueAhead = self.getQueueVolume(tick, order)
+                continue
+
+            # 已挂出的委托
+            remaining = order.totalVolume - order.tradedVolume
+            if isLong:
+                crossed = tick.askPrice1 and tick.askPrice1 <= order.price
+                through = tick.lastPrice < order.price
+            else:
+                crossed = tick.bidPrice1 and tick.bidPrice1 >= order.price
+                through = tick.lastPrice > order.price
+
+            if crossed:
+                self.newTrade(so, order.price, remaining)
+            elif tradedVolume and through:
+                self.newTrade(so, order.price, min(remaining, tradedVolume))
+            elif tradedVolume and tick.lastPrice == order.price:
+                if tradedVolume > so.queueAhead:
+                    volume = min(remaining, tradedVolume - so.queueAhead)
+                    so.queueAhead = 0
+                    self.newTrade(so, order.price, volume)
+                else:
+                    so.queueAhead -= tradedVolume
+
+            # 前方挂单撤单时排队位置前移
+            if vtOrderID in self.workingDict:
+                so.queueAhead = min(so.queueAhead, self.getQueueVolume(tick, order))
+
+    #----------------------------------------------------------------------
+    def getQueueVolume(self, tick, order):
+        """委托价位上的己方挂单量，委托价优于盘口时为0，差于显示的五档时为五档总量"""
+        if order.direction == DIRECTION_LONG:
+            prefix = 'bid'
+            better = lambda price: order.price > price
+        else:
+            prefix = 'ask'
+            better = lambda price: order.price < price
+
+        total = 0
+        for i in DEPTH_LEVELS:
+            price = getattr(tick, '%sPrice%s' % (prefix, i))
+            volume = getattr(tick, '%sVolume%s' % (prefix, i))
+            if not price:
+                break
+            if price == order.price:
+                return volume
+            if better(price):
+                return 0
+            total += volume
+        return total
+
+    #----------------------------------------------------------------------
+    def newTrade(self, so, price, volume):
+        """生成成交"""
+        if volume <= 0:
+            return
+
+        order = so.order
+
+        self.tradeCount += 1
+        trade = VtTradeData()
+        trade.vtSymbol = order.vtSymbol
+        trade.symbol = order.symbol
+        trade.tradeID = str(self.tradeCount)
+        trade.vtTradeID = trade.tradeID
+        trade.orderID = order.orderID
+        trade.vtOrderID = order.vtOrderID
+        trade.direction = order.direction
+        trade.offset = order.offset
+        trade.price = price
+        trade.volume = volume
+        trade.tradeDatetime = self.dt
+        trade.tradeTime = self.dt.strftime('%H:%M:%S')
+        self.tradeList.append(trade)
+
+        order.tradedVolume += volume
+        order.thisTradedVolume = volume
+
+        # 和实盘一样，先推送成交再推送委托
+        self.eventQueue.append((self.algo.updateTrade, trade))
+
+        if order.tradedVolume >= order.totalVolume:
+            self.removeOrder(so, STATUS_ALLTRADED)
+        else:
+            order.status = STATUS_PARTTRADED
+            self.eventQueue.append((self.algo.updateOrder, copy(order)))
+
+    #----------------------------------------------------------------------
+    def removeOrder(self, so, status):
+        """委托结束"""
+        order = so.order
+        order.status = status
+        del self.workingDict[order.vtOrderID]
+        self.eventQueue.append((self.algo.updateOrder, copy(order)))
+
+    #----------------------------------------------------------------------
+    # 算法接口，和AlgoEngine相同
+    #----------------------------------------------------------------------
+    def subscribe(self, algo, vtSymbol):
+        """订阅行情"""
+        if vtSymbol not in self.tickDict:
+            self.writeLog(u'%s订阅行情失败，没有合约%s的数据' % (algo.algoName, vtSymbol))
+            return
+        self.subscribed.add(vtSymbol)
+
+    #----------------------------------------------------------------------
+    def sendOrder(self, algo, vtSymbol, direction, price, volume,
+                  priceType=None, offset=None):
+        """发单"""
+        contract = self.contractDict.get(vtSymbol, None)
+        if not contract:
+            self.writeLog(u'%s委托下单失败，找不到合约：%s' % (algo.algoName, vtSymbol))
+            return ''
+
+        self.orderCount += 1
+        order = VtOrderData()
+        order.vtSymbol = vtSymbol
+        order.symbol = contract.symbol
+        order.orderID = str(self.orderCount)
+        order.vtOrderID = order.orderID
+        order.direction = direction
+        order.offset = offset or OFFSET_OPEN
+        order.priceType = priceType or PRICETYPE_LIMITPRICE
+        order.price = price
+        order.totalVolume = volume
+        order.status = STATUS_NOTTRADED
+        order.orderDatetime = self.dt
+
+        self.orderDict[order.vtOrderID] = order
+        self.workingDict[order.vtOrderID] = SimOrder(order)
+        self.eventQueue.append((algo.updateOrder, copy(order)))
+
+        return order.vtOrderID
+
+    #----------------------------------------------------------------------
+    def buy(self, algo, vtSymbol, price, volume, priceType=None, offset=None):
+        """买入"""
+        return self.sendOrder(algo, vtSymbol, DIRECTION_LONG, price, volume, priceType, offset)
+
+    #----------------------------------------------------------------------
+    def sell(self, algo, vtSymbol, price, volume, priceType=None, offset=None):
+        """卖出"""
+        return self.sendOrder(algo, vtSymbol, DIRECTION_SHORT, price, volume, priceType, offset)
+
+    #----------------------------------------------------------------------
+    def cancelOrder(self, algo, vtOrderID):
+        """撤单，撤单回报在算法函数返回后推送"""
+        so = self.workingDict.get(vtOrderID, None)
+        if not so:
+            return
+
+        so.order.cancelDatetime = self.dt
+        self.cancelCount += 1
+        self.removeOrder(so, STATUS_CANCELLED)
+
+    #----------------------------------------------------------------------
+    def getTick(self, algo, vtSymbol):
+        """查询行情"""
+        tick = self.lastTickDict.get(vtSymbol, None)
+        if not tick:
+            self.writeLog(u'%s查询行情失败，找不到报价：%s' % (algo.algoName, vtSymbol))
+        return tick
+
+    #----------------------------------------------------------------------
+    def getContract(self, algo, vtSymbol):
+        """查询合约"""
+        contract = self.contractDict.get(vtSymbol, None)
+        if not contract:
+            self.writeLog(u'%s查询合约失败，找不到报价：%s' % (algo.algoName, vtSymbol))
+        return contract
+
+    #----------------------------------------------------------------------
+    def writeLog(self, content, algo=None):
+        """记录日志"""
+        if not self.logActive:
+            return
+
+        log = VtLogData()
+        log.logContent = content
+        if algo:
+            log.gatewayName = algo.algoName
+        if self.dt:
+            log.logTime = self.dt.strftime('%Y-%m-%d %H:%M:%S')
+        self.logList.append(log)
+
+    #----------------------------------------------------------------------
+    def putVarEvent(self, algo, d):
+        """更新变量，只保存最新值"""
+        self.varDict = d
+
+    #----------------------------------------------------------------------
+    def putParamEvent(self, algo, d):
+        """更新参数"""
+        self.paramDict = d
+
+    #----------------------------------------------------------------------
+    # 模拟结果
+    #----------------------------------------------------------------------
+    def calculateResult(self, algoSetting):
+        """计算执行结果和滑点"""
+        vtSymbol = algoSetting.get('vtSymbol', algoSetting.get('activeVtSymbol', ''))
+        direction = algoSetting.get('direction', DIRECTION_LONG)
+        targetVolume = algoSetting.get('totalVolume', algoSetting.get('volume', 0))
+        sign = 1 if direction == DIRECTION_LONG else -1
+
+        d = OrderedDict()
+        d['orderCount'] = len(self.orderDict)
+        d['cancelCount'] = self.cancelCount
+        d['tradeCount'] = len(self.tradeList)
+
+        # 成交均价
+        trades = [trade for trade in self.tradeList if trade.vtSymbol == vtSymbol]
+        tradedVolume = sum(trade.volume for trade in trades)
+        d['tradedVolume'] = tradedVolume
+        d['fillRate'] = tradedVolume / targetVolume if targetVolume else 0
+        d['avgPrice'] = (sum(trade.price * trade.volume for trade in trades) / tradedVolume
+                         if tradedVolume else 0)
+
+        # 到达价格和执行期间的市场VWAP
+        d['arrivalPrice'] = 0
+        d['marketVwap'] = 0
+        d['duration'] = 0
+
+        ticks = self.tickDict.get(vtSymbol, [])
+        if ticks and self.algoStartTime:
+            end = self.algoEndTime or self.algoStartTime
+            d['duration'] = (end - self.algoStartTime).total_seconds()
+
+            before = [tick for tick in ticks if tick.datetime <= self.algoStartTime]
+            window = [tick for tick in ticks if self.algoStartTime < tick.datetime <= end]
+
+            arrival = before[-1] if before else (window[0] if window else None)
+            if arrival:
+                if arrival.bidPrice1 and arrival.askPrice1:
+                    d['arrivalPrice'] = (arrival.bidPrice1 + arrival.askPrice1) / 2
+                else:
+                    d['arrivalPrice'] = arrival.lastPrice
+
+            volume = 0
+            turnover = 0
+            prevVolume = arrival.volume if arrival else 0
+            for tick in window:
+                delta = max(tick.volume - prevVolume, 0)
+                volume += delta
+                turnover += delta * tick.lastPrice
+                prevVolume = tick.volume
+            if volume:
+                d['marketVwap'] = turnover / volume
+
+        # 滑点为正表示执行成本
+        for name, benchmark in [('Arrival', d['arrivalPrice']), ('Vwap', d['marketVwap'])]:
+            if tradedVolume and benchmark:
+                slippage = sign * (d['avgPrice'] - benchmark)
+                d['slippage' + name] = slippage
+                d['slippage' + name + 'Bps'] = slippage / benchmark * 10000
+            else:
+                d['slippage' + name] = 0
+                d['slippage' + name + 'Bps'] = 0
+
+        return d
+
+    #----------------------------------------------------------------------
+    def runParallelSimulation(self, settingList, algoClass=None, processes=None):
+        """
+        多进程并行模拟多组算法参数，返回[(algoSetting, 结果字典)]
+        行情和合约数据在每个工作进程中只传递一次
+        """
+        processes = processes or multiprocessing.cpu_count()
+        pool = multiprocessing.Pool(processes, initializer=initSimulationWorker,
+                                    initargs=(self.__class__, self.tickDict, self.contractDict,
+                                              self.startTime, self.endTime))
+        l = [pool.apply_async(runSimulationWorker, (setting, algoClass))
+             for setting in settingList]
+        pool.close()
+        pool.join()
+
+        return [(setting, res.get()) for setting, res in zip(settingList, l)]
+
+
+# 工作进程中的模拟引擎
+_workerSimulator = None
+
+
+#----------------------------------------------------------------------
+def initSimulationWorker(simulatorClass, tickDict, contractDict, startTime, endTime):
+    """初始化工作进程"""
+    global _workerSimulator
+    _workerSimulator = simulatorClass()
+    _workerSimulator.tickDict = tickDict
+    _workerSimulator.contractDict = contractDict
+    _workerSimulator.setStartTime(startTime, endTime)
+
+
+#----------------------------------------------------------------------
+def runSimulationWorker(algoSetting, algoClass):
+    """在工作进程中运行一次模拟"""
+    return _workerSimulator.runSimulation(algoSetting, algoClass)
@@ -2,11 +2,22 @@
 
 from six import text_type
 
-from vnpy.trader.uiQt import QtWidgets
+try:
+    from vnpy.trader.uiQt import QtWidgets, QtGui
+    QFrame = QtWidgets.QFrame
+except ImportError:
+    # 无界面环境（例如算法回测及其进程池）中只使用算法类，
+    # 算法文件中的控件类仍然可以定义，但不能创建
+    QtWidgets = QtGui = None
+
+    class QFrame(object):
+        """没有Qt时控件的基类"""
+        def __init__(self, *args, **kwargs):
+            raise ImportError(u'没有可用的Qt，无法创建算法控件')
 
 
 ########################################################################
-class AlgoWidget(QtWidgets.QFrame):
+class AlgoWidget(QFrame):
     """算法启动组件"""
     
     #----------------------------------------------------------------------
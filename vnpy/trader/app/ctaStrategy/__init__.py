@@ -1,6 +1,13 @@
 # encoding: UTF-8
 from .plugins import CtaEngine, CtaTemplate, BacktestingEngine
-from .uiCtaWidget import CtaEngineManager
+
+
+#----------------------------------------------------------------------
+def CtaEngineManager(*args, **kwargs):
+    """创建CTA策略界面，在这里才导入Qt，回测和优化等无界面程序不需要加载"""
+    from .uiCtaWidget import CtaEngineManager
+    return CtaEngineManager(*args, **kwargs)
+
 
 appName = 'CtaStrategy'
 appDisplayName = 'CTA策略'
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+'''
+    pandas_talib向量化改写的等价性测试
+
+    本文件保留了改写前逐行循环的实现（只把已删除的pd.ewma、pd.rolling_*换成
+    对应的ewm、rolling方法），在随机生成的K线数据上逐个对比改写后的指标，
+    输出列的数值误差需要在容差之内，NaN的位置也需要一致。
+
+    用法：python -m vnpy.trader.app.ctaStrategy._test_pandas_talib [K线数量]
+'''
+from __future__ import print_function
+
+import sys
+
+import numpy as np
+import pandas as pd
+
+from vnpy.trader.app.ctaStrategy import pandas_talib as pt
+
+
+#=========================================
+# 改写前的逐行循环实现，作为对比基准
+
+def _ewma(s, span, min_periods):
+    return s.ewm(span=span, min_periods=min_periods).mean()
+
+
+def ADX(df, n, n_ADX,ksgn='close'):
+    i = 0
+    UpI = []
+    DoI = []
+    xnam='adx_{n}_{n2}'.format(n=n,n2=n_ADX)
+    while i + 1 <= len(df) - 1:
+        UpMove = df['high'].iloc[i+1] - df['high'].iloc[i]
+        DoMove = df['low'].iloc[i] - df['low'].iloc[i+1]
+        if UpMove > DoMove and UpMove > 0:
+            UpD = UpMove
+        else:
+            UpD = 0
+        UpI.append(UpD)
+        if DoMove > UpMove and DoMove > 0:
+            DoD = DoMove
+        else:
+            DoD = 0
+        DoI.append(DoD)
+        i = i + 1
+    i = 0
+    TR_l = [0]
+    while i < len(df) - 1:
+        TR = max(df['high'].iloc[i+1], df[ksgn].iloc[i]) - min(df['low'].iloc[i+1], df[ksgn].iloc[i])
+        TR_l.append(TR)
+        i = i + 1
+    TR_s = pd.Series(TR_l)
+    ATR = pd.Series(_ewma(TR_s, span=n, min_periods=n))
+    UpI = pd.Series(UpI)
+    DoI = pd.Series(DoI)
+    PosDI = pd.Series(_ewma(UpI, span=n, min_periods=n - 1) / ATR)
+    NegDI = pd.Series(_ewma(DoI, span=n, min_periods=n - 1) / ATR)
+    ds = pd.Series(_ewma(abs(PosDI - NegDI) / (PosDI + NegDI), span=n_ADX, min_periods=n_ADX - 1), name=xnam)
+    ds.index=df.index;df[xnam]=ds
+    return df
+
+
+def ATR(df, n,ksgn='close'):
+    xnam='atr_{n}'.format(n=n)
+    i = 0
+    TR_l = [0]
+    while i < len(df) - 1:
+        TR = max(df['high'].iloc[i + 1], df[ksgn].iloc[i] - min(df['low'].iloc[i + 1], df[ksgn].iloc[i]))
+        TR_l.append(TR)
+        i = i + 1
+    TR_s = pd.Series(TR_l)
+    ds = pd.Series(_ewma(TR_s, span=n, min_periods=n), name=xnam)
+    ds.index=df.index;df[xnam]=ds
+    return df
+
+
+def DONCH(df, n):
+    xnam='donch_{d}'.format(d=n)
+    i = 0
+    DC_l = []
+    while i < n - 1:
+        DC_l.append(0)
+        i = i + 1
+    i = 0
+    while (i + n - 1) <=(len(df) - 1):
+        DC = max(df['high'].iloc[i:i + n - 1]) - min(df['low'].iloc[i:i + n - 1])
+        DC_l.append(DC)
+        i = i + 1
+    DonCh = pd.Series(DC_l, name = xnam)
+    DonCh.index=df.index;
+    df[xnam+'_sr']=DonCh
+    df[xnam]=df[xnam+'_sr'].shift(n - 1)
+    return df
+
+
+def MFI(df, n,ksgn='close'):
+    xnam='mfi_{d}'.format(d=n)
+    PP = (df['high'] + df['low'] + df[ksgn]) / 3
+    i = 0
+    PosMF = [0]
+    while i <(len(df) - 1):
+        if PP.iloc[i + 1] > PP.iloc[i]:
+            PosMF.append(PP.iloc[i + 1] * df['volume'].iloc[i + 1])
+        else:
+            PosMF.append(0)
+        i = i + 1
+    PosMF = pd.Series(PosMF)
+    TotMF = PP * df['volume']
+    PosMF.index=TotMF.index
+    MFR =PosMF / TotMF
+    MFI = pd.Series(MFR.rolling(n).mean(), name = xnam)
+    df[xnam]=MFI
+    return df
+
+
+def OBV(df, n,ksgn='close'):
+    xnam='obv_{d}'.format(d=n)
+    i = 0
+    OBV = [0]
+    while i <  len(df) - 1:
+        if df[ksgn].iloc[i+1]-df[ksgn].iloc[i] > 0:
+            OBV.append(df['volume'].iloc[i + 1])
+        if (df[ksgn].iloc[i+1]-df[ksgn].iloc[i]) == 0:
+            OBV.append(0)
+        if (df[ksgn].iloc[i+1]-df[ksgn].iloc[i]) < 0:
+            OBV.append(-df['volume'].iloc[i + 1])
+        i = i + 1
+    OBV = pd.Series(OBV)
+    OBV_ma = pd.Series(OBV.rolling(n).mean(), name = xnam)
+    OBV_ma.index=df.index;
+    df[xnam]=OBV_ma
+    df['obv_x']=df[xnam]/10e6
+    return df
+
+
+def _rsiDI(df, n):
+    i = 0
+    UpI = [0]
+    DoI = [0]
+    while i + 1 <= len(df) - 1:
+        UpMove=df['high'].iloc[i+1]-df['high'].iloc[i]
+        DoMove=df['low'].iloc[i]-df['low'].iloc[i+1]
+        if UpMove > DoMove and UpMove > 0:
+            UpD = UpMove
+        else:
+            UpD = 0
+        UpI.append(UpD)
+        if DoMove > UpMove and DoMove > 0:
+            DoD = DoMove
+        else:
+            DoD = 0
+        DoI.append(DoD)
+        i = i + 1
+    UpI = pd.Series(UpI)
+    DoI = pd.Series(DoI)
+    PosDI = pd.Series(_ewma(UpI, span=n, min_periods=n - 1))
+    NegDI = pd.Series(_ewma(DoI, span=n, min_periods=n - 1))
+    return PosDI, NegDI
+
+
+def RSI(df, n):
+    xnam='rsi_{n}'.format(n=n)
+    PosDI, NegDI = _rsiDI(df, n)
+    ds = pd.Series(PosDI / (PosDI + NegDI), name=xnam)
+    ds.index=df.index
+    df[xnam]=ds*100
+    return df
+
+
+def RSI100(df, n):
+    xnam='rsi_{n}'.format(n=n)
+    PosDI, NegDI = _rsiDI(df, n)
+    ds = pd.Series(PosDI / (PosDI + NegDI))
+    ds.index=df.index
+    df['rsi_k']=ds;
+    df[xnam]=100-100/(1+df['rsi_k']);
+    return df
+
+
+def TRIX(df, n,ksgn='close'):
+    xnam='trix_{n}'.format(n=n)
+    EX1 = _ewma(df[ksgn], span=n, min_periods=n - 1)
+    EX2 = _ewma(EX1, span=n, min_periods=n - 1)
+    EX3 = _ewma(EX2, span=n, min_periods=n - 1)
+    i = 0
+    ROC_l = [0]
+    while i + 1 <= len(df) - 1:
+        ROC = (EX3.iloc[i + 1] - EX3.iloc[i]) / EX3.iloc[i]
+        ROC_l.append(ROC)
+        i = i + 1
+    trix  = pd.Series(ROC_l, name=xnam)
+    trix.index=df.index;
+    df[xnam]=trix
+    return df
+
+
+def ULTOSC(df,ksgn='close'):
+    i = 0
+    TR_l = [0]
+    BP_l = [0]
+    xnam='uos'
+    while i <  len(df) - 1:
+        TR = max(df['high'].iloc[i+1],df[ksgn].iloc[i])-min(df['low'].iloc[i+1],df[ksgn].iloc[i])
+        TR_l.append(TR)
+        BP =df[ksgn].iloc[i+1]-min(df['low'].iloc[i+1], df[ksgn].iloc[i])
+        BP_l.append(BP)
+        i = i + 1
+    BP_s = pd.Series(BP_l)
+    TR_s = pd.Series(TR_l)
+    UltO = pd.Series((4 * BP_s.rolling(7).sum() / TR_s.rolling(7).sum()) + (2 * BP_s.rolling(14).sum() / TR_s.rolling(14).sum()) + (BP_s.rolling(28).sum() / TR_s.rolling(28).sum()), name =xnam)
+    UltO.index=df.index;
+    df[xnam]=UltO
+    return df
+
+
+def VORTEX(df, n):
+    xnam='vortex_{n}'.format(n=n)
+    i = 0
+    TR = [0]
+    while i < len(df) - 1:
+        Range=max(df['high'].iloc[i+1],df['close'].iloc[i])-min(df['low'].iloc[i+1],df['close'].iloc[i])
+        TR.append(Range)
+        i = i + 1
+    i = 0
+    VM = [0]
+    while i < len(df) - 1:
+        Range=abs(df['high'].iloc[i+1]-df['low'].iloc[i])-abs(df['low'].iloc[i+1]-df['high'].iloc[i])
+        VM.append(Range)
+        i = i + 1
+    ds = pd.Series(pd.Series(VM).rolling(n).sum() / pd.Series(TR).rolling(n).sum(), name=xnam)
+    ds.index=df.index;
+    df[xnam]=ds
+    return df
+
+
+#=========================================
+
+# (函数名, 参数, 需要对比的输出列)
+CASE_LIST = [
+    ('ADX', (14, 6), ['adx_14_6']),
+    ('ATR', (14,), ['atr_14']),
+    ('DONCH', (20,), ['donch_20_sr', 'donch_20']),
+    ('MFI', (14,), ['mfi_14']),
+    ('OBV', (10,), ['obv_10', 'obv_x']),
+    ('RSI', (14,), ['rsi_14']),
+    ('RSI100', (14,), ['rsi_k', 'rsi_14']),
+    ('TRIX', (9,), ['trix_9']),
+    ('ULTOSC', (), ['uos']),
+    ('VORTEX', (14,), ['vortex_14']),
+]
+
+
+def make_frame(count, seed=0):
+    '''生成随机K线数据，价格取整使得涨跌持平、高低点相等的情况都会出现'''
+    rng = np.random.RandomState(seed)
+    close = 3000 + np.cumsum(rng.normal(0, 1, count)).round()
+    high = close + np.abs(rng.normal(0, 2, count)).round()
+    low = close - np.abs(rng.normal(0, 2, count)).round()
+    volume = rng.randint(1, 1000, count).astype(float)
+    index = pd.date_range('2018-01-01', periods=count, freq='min')
+    return pd.DataFrame({'open': close, 'high': high, 'low': low,
+                         'close': close, 'volume': volume}, index=index)
+
+
+def assert_same(name, column, expect, result, rtol=1e-9, atol=1e-9):
+    expect = expect.values.astype(float)
+    result = result.values.astype(float)
+    assert len(expect) == len(result), (name, column, len(expect), len(result))
+    assert (np.isnan(expect) == np.isnan(result)).all(), (name, column, "nan mismatch")
+    assert np.allclose(expect, result, rtol=rtol, atol=atol, equal_nan=True), \
+        (name, column, np.nanmax(np.abs(expect - result)))
+
+
+def test(count=2000):
+    for seed in range(3):
+        df = make_frame(count, seed)
+        for name, args, columns in CASE_LIST:
+            expect = globals()[name](df.copy(), *args)
+            result = getattr(pt, name)(df.copy(), *args)
+            for column in columns:
+                assert_same(name, column, expect[column], result[column])
+    print("pandas_talib test passed: %d functions, %d bars" % (len(CASE_LIST), count))
+
+
+if __name__ == '__main__':
+    test(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
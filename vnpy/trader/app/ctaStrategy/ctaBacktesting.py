@@ -16,20 +16,9 @@ import os
 import warnings
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-from vnpy.rpc import RpcClient, RpcServer, RemoteException
+from vnpy.rpc import RpcClient, RpcServer, RemoteException, ObjectCodec
 
-# 如果安装了seaborn则设置为白色风格
-try:
-    import seaborn as sns
-    sns.set_style('whitegrid')
-except ImportError:
-    pass
-
-try:
-    import pymongo
-except ImportError:
-    pass
+# matplotlib、seaborn和pymongo在使用时才导入，回测和优化的子进程无需为绘图和数据库付出导入时间
 
 from vnpy.trader.vtGlobal import globalSetting
 from vnpy.trader.vtObject import VtTickData, VtBarData, VtLogData
@@ -37,6 +26,7 @@ from vnpy.trader.vtConstant import *
 from vnpy.trader.vtGateway import VtOrderData, VtTradeData
 
 from vnpy.trader.app.ctaStrategy.ctaBase import *
+from vnpy.trader.app.ctaStrategy.ctaHistoryCache import HistoryCache, encodeChunk, decodeChunk
 
 
 ########################################################################
@@ -79,7 +69,8 @@ class BacktestingEngine(object):
 
         self.dbClient = None  # 数据库客户端
         self.dbCursor = None  # 数据库指针
-        self.hdsClient = None  # 历史数据服务器客户端
+        self.hdsClient = None  # 历史数据服务器客户端，初始化后通过历史数据服务器加载数据
+        self.hdsChunkSize = 100000  # 从历史数据服务器分块加载的行数
 
         self.initData = []  # 初始化用的数据
         self.dbName = ''  # 回测数据库名
@@ -219,14 +210,50 @@ class BacktestingEngine(object):
         """
 
     # ----------------------------------------------------------------------
-    def initHdsClient(self):
-        """初始化历史数据服务器客户端"""
-        reqAddress = 'tcp://localhost:5555'
-        subAddress = 'tcp://localhost:7777'
-
+    def initHdsClient(self, reqAddress='tcp://localhost:5555', subAddress='tcp://localhost:7777',
+                      chunkSize=100000, timeout=None):
+        """
+        初始化历史数据服务器客户端
+        初始化后loadHistoryData通过历史数据服务器加载数据，不再直接读取本地缓存和数据库，
+        同一台机器上的多个回测进程共享服务器的内存缓存
+        timeout为每块数据的等待时间（秒），None表示一直等待；首块请求会触发服务器从数据库
+        加载全部数据，设置时需要留出足够的时间
+        """
         self.hdsClient = RpcClient(reqAddress, subAddress)
+        self.hdsClient.useCodec(ObjectCodec())
+        self.hdsClient.setTimeout(timeout)
         self.hdsClient.start()
-        # -------------------------------------------------
+        self.hdsChunkSize = chunkSize
+        self.hdsTimeout = timeout
+
+    # ----------------------------------------------------------------------
+    def loadHdsData(self, dataClass, symbol, startDate, endDate):
+        """从历史数据服务器分块加载数据，首块返回总行数后其余各块并发请求"""
+        args = (self.dbName, symbol, startDate, endDate)
+        size = self.hdsChunkSize
+
+        d = self.hdsClient.loadHistoryChunk(*(args + (0, size)))
+        count = d['count']
+        futures = [self.hdsClient.asyncCall('loadHistoryChunk', *(args + (offset, size)))
+                   for offset in range(size, count, size)]
+
+        dataList = self.parseChunk(dataClass, d['chunk'])
+        for future in futures:
+            dataList += self.parseChunk(dataClass, future.result(self.hdsTimeout)['chunk'])
+        return dataList
+
+    # ----------------------------------------------------------------------
+    def parseChunk(self, dataClass, chunk):
+        """将历史数据服务器返回的数据块转换为数据对象"""
+        n, names, values = decodeChunk(chunk)
+        dataList = []
+        for row in zip(*values):
+            data = dataClass()
+            data.__dict__.update(zip(names, row))
+            dataList.append(data)
+        return dataList
+
+    # ----------------------------------------------------------------------
 
     def setCachePath(self, path):
         self.cachePath = path
@@ -246,6 +273,15 @@ class BacktestingEngine(object):
         start = startDate.strftime("%Y%m%d %H:%M")
         end = endDate.strftime("%Y%m%d %H:%M")
 
+        # 使用历史数据服务器
+        if self.hdsClient:
+            dataList = []
+            for symbol in symbolList:
+                dataList += self.loadHdsData(dataClass, symbol, startDate, endDate)
+            dataList.sort(key=lambda x: x.datetime)
+            self.output(u'从历史数据服务器载入完成, 时间段:[%s,%s);数据量:%s' % (start, end, len(dataList)))
+            return dataList
+
         datetime_list = get_time_list(start=startDate, end=endDate)
         datetime_list = [d.strftime("%Y%m%d %H:%M") for d in datetime_list]
 
@@ -279,6 +315,7 @@ class BacktestingEngine(object):
         # 如果没有完全从本地文件加载完数据,则尝试从指定的mongodb下载数据，并缓存到本地
         if len(self.dbName) > 0 and no_data_days > 0:
             try:
+                import pymongo
                 self.dbClient = pymongo.MongoClient(globalSetting['mongoHost'], globalSetting['mongoPort'])
                 for symbol in symbolList:
                     if len(symbols_no_data[symbol]) > 0:  # 需要从数据库取数据
@@ -663,6 +700,12 @@ class BacktestingEngine(object):
 
         return [orderID]
 
+    # ----------------------------------------------------------------------
+    def sendOrders(self, orderList, strategy):
+        """批量发单，回测中逐笔撮合，与实盘返回格式一致"""
+        return [self.sendOrder(vtSymbol, orderType, price, volume, priceType, strategy)
+                for orderType, vtSymbol, price, volume, priceType in orderList]
+
     # ----------------------------------------------------------------------
     def cancelOrder(self, vtOrderID):
         """撤单"""
@@ -1063,6 +1106,7 @@ class BacktestingEngine(object):
         self.output(u'盈亏比：\t%s' % formatNumber(d['profitLossRatio']))
 
         # 绘图
+        plt = importPyplot()
         fig = plt.figure(figsize=(10, 12))
 
         pCapital = plt.subplot(4, 1, 1)
@@ -1365,6 +1409,7 @@ class BacktestingEngine(object):
         self.output(u'Sharpe Ratio：\t%s' % formatNumber(result['sharpeRatio']))
 
         # 绘图
+        plt = importPyplot()
         fig = plt.figure(figsize=(10, 16))
 
         pBalance = plt.subplot(4, 1, 1)
@@ -1554,44 +1599,67 @@ class OptimizationSetting(object):
 
 ########################################################################
 class HistoryDataServer(RpcServer):
-    """历史数据缓存服务器"""
+    """
+    历史数据缓存服务器
+    按合约保存列式缓存，任意子区间的请求只从数据库补充缺失部分，
+    内存超出预算时按LRU淘汰，结果按块以紧凑的二进制格式返回
+    """
 
     # ----------------------------------------------------------------------
-    def __init__(self, repAddress, pubAddress):
+    def __init__(self, repAddress, pubAddress, workerCount=4, memoryLimit=2*1024**3):
         """Constructor"""
-        super(HistoryDataServer, self).__init__(repAddress, pubAddress)
+        # 使用工作线程池并发处理多个优化进程的数据请求
+        super(HistoryDataServer, self).__init__(repAddress, pubAddress, workerCount)
+        self.useCodec(ObjectCodec())
 
+        import pymongo
         self.dbClient = pymongo.MongoClient(globalSetting['mongoHost'],
                                             globalSetting['mongoPort'])
 
-        self.historyDict = {}
+        self.cache = HistoryCache(self.loadFromDb, memoryLimit)
 
+        self.register(self.loadHistoryChunk)
         self.register(self.loadHistoryData)
+        self.register(self.getCacheStatus)
 
     # ----------------------------------------------------------------------
-    def loadHistoryData(self, dbName, symbol, start, end):
-        """"""
-        # 首先检查是否有缓存，如果有则直接返回
-        history = self.historyDict.get((dbName, symbol, start, end), None)
-        if history:
-            print(u'找到内存缓存：%s %s %s %s' % (dbName, symbol, start, end))
-            return history
-
-        # 否则从数据库加载
+    def loadFromDb(self, dbName, symbol, start, end):
+        """从数据库加载[start, end)的数据"""
         collection = self.dbClient[dbName][symbol]
-
-        if end:
-            flt = {'datetime': {'$gte': start, '$lt': end}}
-        else:
-            flt = {'datetime': {'$gte': start}}
-
-        cx = collection.find(flt).sort('datetime')
+        flt = {'datetime': {'$gte': start, '$lt': end}}
+        cx = collection.find(flt, {'_id': 0}).sort('datetime')
         history = [d for d in cx]
 
-        self.historyDict[(dbName, symbol, start, end)] = history
-        print(u'从数据库加载：%s %s %s %s' % (dbName, symbol, start, end))
+        print(u'从数据库加载：%s %s %s %s，数据量%s' % (dbName, symbol, start, end, len(history)))
         return history
 
+    # ----------------------------------------------------------------------
+    def loadHistoryChunk(self, dbName, symbol, start, end, offset, limit):
+        """
+        分块查询[start, end)的数据
+        返回{'count': 总行数, 'chunk': 第offset行起最多limit行的数据块}
+        """
+        columns, begin, stop = self.cache.query(dbName, symbol, start, end)
+        chunkBegin = min(begin + offset, stop)
+        chunkEnd = min(chunkBegin + limit, stop)
+
+        return {
+            'count': stop - begin,
+            'chunk': encodeChunk(columns, chunkBegin, chunkEnd)
+        }
+
+    # ----------------------------------------------------------------------
+    def loadHistoryData(self, dbName, symbol, start, end):
+        """查询[start, end)的数据，返回字典列表"""
+        columns, begin, stop = self.cache.query(dbName, symbol, start, end)
+        n, names, values = decodeChunk(encodeChunk(columns, begin, stop))
+        return [dict(zip(names, row)) for row in zip(*values)]
+
+    # ----------------------------------------------------------------------
+    def getCacheStatus(self):
+        """查询缓存状态，返回[(dbName, symbol, 行数, 内存占用)]"""
+        return self.cache.getStatus()
+
 
 # ----------------------------------------------------------------------
 def runHistoryDataServer():
@@ -1602,9 +1670,26 @@ def runHistoryDataServer():
     hds = HistoryDataServer(repAddress, pubAddress)
     hds.start()
 
-    print(u'按任意键退出')
+    print(u'按回车键退出')
+    try:
+        raw_input()
+    except NameError:
+        input()
     hds.stop()
-    raw_input()
+
+
+# ----------------------------------------------------------------------
+def importPyplot():
+    """导入matplotlib，如果安装了seaborn则设置为白色风格"""
+    import matplotlib.pyplot as plt
+
+    try:
+        import seaborn as sns
+        sns.set_style('whitegrid')
+    except ImportError:
+        pass
+
+    return plt
 
 
 # ----------------------------------------------------------------------
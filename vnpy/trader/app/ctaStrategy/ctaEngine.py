@@ -26,15 +26,22 @@ from collections import OrderedDict, defaultdict
 from datetime import datetime, timedelta
 from copy import copy
 from vnpy.event import Event
+from vnpy.event.eventTrace import tracer, perf_counter_ns, STAGE_STRATEGY
 from vnpy.trader.vtEvent import *
 from vnpy.trader.vtConstant import *
 from vnpy.trader.vtObject import VtTickData, VtBarData
-from vnpy.trader.vtGateway import VtSubscribeReq, VtOrderReq, VtCancelOrderReq, VtLogData
+from vnpy.trader.vtGateway import VtSubscribeReq, VtOrderReq, VtCancelOrderReq
 from vnpy.trader.vtFunction import todayDate, getJsonPath
+from vnpy.trader.vtTime import parseDateTime
+from vnpy.trader.vtGlobal import globalSetting
+from vnpy.trader.vtLog import createLogEvent
 from vnpy.trader.utils.email import mail
 from decimal import *
 
 from .ctaBase import *
+from .ctaOrderBook import ExpiringDict, StopOrderBook, tradingDay
+from .ctaProfiler import StrategyPerf, StrategySampler, thread_time_ns
+from .ctaHistory import HistoryLoader, frameToArrays
 from .strategy import STRATEGY_CLASS
 
 ########################################################################
@@ -42,6 +49,7 @@ class CtaEngine(object):
     """CTA策略引擎"""
     settingFileName = 'CTA_setting.json'
     settingfilePath = getJsonPath(settingFileName, __file__)
+    bookFileName = 'ctaOrderBook.json'
 
     #----------------------------------------------------------------------
     def __init__(self, mainEngine, eventEngine):
@@ -51,7 +59,6 @@ class CtaEngine(object):
 
         # 当前日期
         self.today = todayDate()
-        self.minute_temp = 0
 
         # 保存策略实例的字典
         # key为策略名称，value为策略实例，注意策略名称不允许重复
@@ -62,9 +69,14 @@ class CtaEngine(object):
         # value为包含所有相关strategy对象的list
         self.tickStrategyDict = {}
 
+        # 委托和成交记录的保存期限（秒）和已完成记录的数量上限
+        # 委托完成后仍可能收到延迟的成交推送，因此在保存期限内保留映射关系
+        ttl = globalSetting.get('ctaOrderTtl', 24*3600)
+        maxSize = globalSetting.get('ctaOrderMaxSize', 100000)
+
         # 保存vtOrderID和strategy对象映射的字典（用于推送order和trade数据）
-        # key为vtOrderID，value为strategy对象
-        self.orderStrategyDict = {}
+        # key为vtOrderID，value为strategy对象，委托完成后超过保存期限会被清理
+        self.orderStrategyDict = ExpiringDict(ttl, maxSize)
 
         # 本地停止单编号计数
         self.stopOrderCount = 0
@@ -72,14 +84,31 @@ class CtaEngine(object):
 
         # 本地停止单字典
         # key为stopOrderID，value为stopOrder对象
-        self.stopOrderDict = {}             # 停止单撤销后不会从本字典中删除
+        self.stopOrderDict = ExpiringDict(ttl, maxSize)     # 停止单撤销或触发后超过保存期限才删除
         self.workingStopOrderDict = {}      # 停止单撤销后会从本字典中删除
+        self.stopOrderBook = StopOrderBook()    # 活动停止单按合约和触发价排序的索引
 
         # 保存策略名称和委托号列表的字典
         # key为name，value为保存orderID（限价+本地停止）的集合
         self.strategyOrderDict = {}
-        # 成交号集合，用来过滤已经收到过的成交推送
-        self.tradeSet = set()
+        # 成交号集合，用来过滤已经收到过的成交推送，超过保存期限会被清理
+        self.tradeSet = ExpiringDict(ttl, maxSize)
+        # 委托号和成交号每个交易日重新编号的接口（CTP的OrderRef、成交编号），
+        # 这些接口的记录只在同一交易日内重启时恢复
+        self.sessionGateways = [g.upper() for g in globalSetting.get('ctaSessionGateways', ['CTP'])]
+
+        # 定时清理过期记录的计数
+        self.purgeCount = 0
+        self.purgeTrigger = globalSetting.get('ctaOrderPurgeInterval', 60)
+
+        # 策略函数的耗时统计（默认关闭）和调用栈抽样分析
+        self.perfActive = globalSetting.get('ctaPerfActive', False)
+        self.strategyPerf = StrategyPerf()
+        self.strategySampler = StrategySampler()
+
+        # 历史数据请求按接口限制并发数并合并相同请求，initAll时并发初始化策略的线程数
+        self.historyLoader = HistoryLoader(globalSetting.get('historyGatewayLimit', 2))
+        self.initWorkers = globalSetting.get('ctaInitWorkers', 8)
 
         # 引擎类型为实盘
         self.engineType = ENGINETYPE_TRADING
@@ -93,13 +122,79 @@ class CtaEngine(object):
         self.path = os.path.join(os.getcwd(), u"reports" )
         if not os.path.isdir(self.path):
             os.makedirs(self.path)
+
+        # 从上次运行保存的记录中恢复，委托和策略的映射在策略载入时恢复
+        self.restoredOrderList = []
+        self.loadOrderBook()
         
         # 上期所昨持仓缓存
         self.ydPositionDict = {}  
     #----------------------------------------------------------------------
     def sendOrder(self, vtSymbol, orderType, price, volume, priceType, strategy):
         """发单"""
-        
+        contract, reqList = self.createOrderReq(vtSymbol, orderType, price, volume, priceType, strategy)
+
+        vtOrderIDList = []
+        for convertedReq in reqList:
+            vtOrderID = self.mainEngine.sendOrder(convertedReq, contract.gatewayName)    # 发单
+            self.orderStrategyDict[vtOrderID] = strategy                                 # 保存vtOrderID和策略的映射关系
+            self.strategyOrderDict[strategy.name].add(vtOrderID)                         # 添加到策略委托号集合中
+            vtOrderIDList.append(vtOrderID)
+            self.writeCtaLog('策略%s: 发送%s委托%s, 交易：%s，%s，数量：%s @ %s',
+                             strategy.name, priceType, vtOrderID, vtSymbol, orderType, volume, price)
+
+        return vtOrderIDList
+
+    #----------------------------------------------------------------------
+    def sendOrders(self, orderList, strategy):
+        """
+        批量发单
+        orderList中每个元素为(orderType, vtSymbol, price, volume, priceType)，
+        返回与orderList一一对应的委托号列表的列表，校验或风控未通过的委托对应空列表。
+        整批委托先统一校验和转换，再按接口分组一次性发出，只记录一条汇总日志。
+        """
+        resultList = [[] for order in orderList]
+        gatewayDict = OrderedDict()     # gatewayName:[(序号, 委托请求)]
+        errorList = []
+
+        for n, (orderType, vtSymbol, price, volume, priceType) in enumerate(orderList):
+            if orderType not in (CTAORDER_BUY, CTAORDER_SELL, CTAORDER_SHORT, CTAORDER_COVER):
+                errorList.append(u'%s委托类型%s错误' %(vtSymbol, orderType))
+                continue
+            if volume <= 0:
+                errorList.append(u'%s委托数量%s错误' %(vtSymbol, volume))
+                continue
+            if not self.mainEngine.getContract(vtSymbol):
+                errorList.append(u'%s找不到合约' %vtSymbol)
+                continue
+
+            contract, reqList = self.createOrderReq(vtSymbol, orderType, price, volume, priceType, strategy)
+            l = gatewayDict.setdefault(contract.gatewayName, [])
+            for req in reqList:
+                l.append((n, req))
+
+        sentCount = 0
+        for gatewayName, l in gatewayDict.items():
+            vtOrderIDList = self.mainEngine.sendOrders([req for n, req in l], gatewayName)
+
+            for (n, req), vtOrderID in zip(l, vtOrderIDList):
+                if not vtOrderID:
+                    continue
+                self.orderStrategyDict[vtOrderID] = strategy
+                self.strategyOrderDict[strategy.name].add(vtOrderID)
+                resultList[n].append(vtOrderID)
+                sentCount += 1
+
+        content = u'策略%s: 批量发送委托%s笔，实际发出%s笔' %(strategy.name, len(orderList), sentCount)
+        if errorList:
+            content += u'，校验失败：%s' %u'；'.join(errorList)
+        self.writeCtaLog(content)
+
+        return resultList
+
+    #----------------------------------------------------------------------
+    def createOrderReq(self, vtSymbol, orderType, price, volume, priceType, strategy):
+        """生成委托请求，返回(合约, 委托请求列表)，上期所平仓可能拆分为平昨和平今两笔"""
         contract = self.mainEngine.getContract(vtSymbol)
         req = VtOrderReq()
         reqcount = 1 
@@ -197,18 +292,7 @@ class CtaEngine(object):
         else:
             reqList = [req,req2]
 
-        vtOrderIDList = []
-        # if not reqList:
-        #     return vtOrderIDList
-        for convertedReq in reqList:
-            vtOrderID = self.mainEngine.sendOrder(convertedReq, contract.gatewayName)    # 发单
-            self.orderStrategyDict[vtOrderID] = strategy                                 # 保存vtOrderID和策略的映射关系
-            self.strategyOrderDict[strategy.name].add(vtOrderID)                         # 添加到策略委托号集合中
-            vtOrderIDList.append(vtOrderID)
-            self.writeCtaLog('策略%s: 发送%s委托%s, 交易：%s，%s，数量：%s @ %s'
-                         %(strategy.name, priceType, vtOrderID, vtSymbol, orderType, volume, price ))
-
-        return vtOrderIDList
+        return contract, reqList
 
     #----------------------------------------------------------------------
     def cancelOrder(self, vtOrderID):
@@ -301,6 +385,7 @@ class CtaEngine(object):
         # 保存stopOrder对象到字典中
         self.stopOrderDict[stopOrderID] = so
         self.workingStopOrderDict[stopOrderID] = so
+        self.stopOrderBook.add(so)
 
         # 保存stopOrderID到策略委托号集合中
         self.strategyOrderDict[strategy.name].add(stopOrderID)
@@ -323,6 +408,8 @@ class CtaEngine(object):
 
             # 从活动停止单字典中移除
             del self.workingStopOrderDict[stopOrderID]
+            self.stopOrderBook.remove(so)
+            self.stopOrderDict.expire(stopOrderID)
 
             # 从策略委托号集合中移除
             s = self.strategyOrderDict[strategy.name]
@@ -339,43 +426,45 @@ class CtaEngine(object):
 
         # 首先检查是否有策略交易该合约
         if vtSymbol in self.tickStrategyDict:
-            # 遍历等待中的停止单，检查是否会被触发
-            for so in list(self.workingStopOrderDict.values()):
-                if so.vtSymbol == vtSymbol:
-                    longTriggered = so.direction==DIRECTION_LONG and tick.lastPrice>=so.price        # 多头停止单被触发
-                    shortTriggered = so.direction==DIRECTION_SHORT and tick.lastPrice<=so.price     # 空头停止单被触发
-
-                    if longTriggered or shortTriggered:
-                        # 买入和卖出分别以涨停跌停价发单（模拟市价单）
-                        # 对于没有涨跌停价格的市场则使用5档报价
-                        if so.direction==DIRECTION_LONG:
-                            if tick.upperLimit:
-                                price = tick.upperLimit
-                            else:
-                                price = tick.askPrice5
-                        else:
-                            if tick.lowerLimit:
-                                price = tick.lowerLimit
-                            else:
-                                price = tick.bidPrice5
-                        
-                        # 发出市价委托
-                        vtOrderID = self.sendOrder(so.vtSymbol, so.orderType, 
-                                                   price, so.volume, so.strategy)
-                        
-                        # 检查因为风控流控等原因导致的委托失败（无委托号）
-                        if vtOrderID:
-                            # 从活动停止单字典中移除该停止单
-                            del self.workingStopOrderDict[so.stopOrderID]
-                            
-                            # 从策略委托号集合中移除
-                            s = self.strategyOrderDict[so.strategy.name]
-                            if so.stopOrderID in s:
-                                s.remove(so.stopOrderID)
-                            
-                            # 更新停止单状态，并通知策略
-                            so.status = STOPORDER_TRIGGERED
-                            so.strategy.onStopOrder(so)
+            # 从索引中取出会被触发的停止单，不需要遍历全部停止单
+            for stopOrderID in self.stopOrderBook.getTriggered(vtSymbol, tick.lastPrice):
+                # 之前触发的停止单回调中可能已经撤销了该停止单
+                so = self.workingStopOrderDict.get(stopOrderID, None)
+                if not so:
+                    continue
+
+                # 买入和卖出分别以涨停跌停价发单（模拟市价单）
+                # 对于没有涨跌停价格的市场则使用5档报价
+                if so.direction==DIRECTION_LONG:
+                    if tick.upperLimit:
+                        price = tick.upperLimit
+                    else:
+                        price = tick.askPrice5
+                else:
+                    if tick.lowerLimit:
+                        price = tick.lowerLimit
+                    else:
+                        price = tick.bidPrice5
+
+                # 发出市价委托
+                vtOrderID = self.sendOrder(so.vtSymbol, so.orderType,
+                                           price, so.volume, so.priceType, so.strategy)
+
+                # 检查因为风控流控等原因导致的委托失败（无委托号）
+                if vtOrderID:
+                    # 从活动停止单字典中移除该停止单
+                    del self.workingStopOrderDict[so.stopOrderID]
+                    self.stopOrderBook.remove(so)
+                    self.stopOrderDict.expire(so.stopOrderID)
+
+                    # 从策略委托号集合中移除
+                    s = self.strategyOrderDict[so.strategy.name]
+                    if so.stopOrderID in s:
+                        s.remove(so.stopOrderID)
+
+                    # 更新停止单状态，并通知策略
+                    so.status = STOPORDER_TRIGGERED
+                    so.strategy.onStopOrder(so)
 
     #----------------------------------------------------------------------
     def processTickEvent(self, event):
@@ -390,7 +479,7 @@ class CtaEngine(object):
             try:
                 # 添加datetime字段
                 if not tick.datetime:
-                    tick.datetime = datetime.strptime(' '.join([tick.date, tick.time]), '%Y%m%d %H:%M:%S.%f')
+                    tick.datetime = parseDateTime(tick.date, tick.time)
             except ValueError:
                 self.writeCtaLog(traceback.format_exc())
                 return
@@ -400,9 +489,6 @@ class CtaEngine(object):
             for strategy in l:
                 if strategy.trading:
                     self.callStrategyFunc(strategy, strategy.onTick, tick)
-                    if tick.datetime.second == 36 and tick.datetime.minute != self.minute_temp:
-                        self.minute_temp = tick.datetime.minute
-                        self.qryAllOrders(strategy.name)
                     
     #----------------------------------------------------------------------
     def processOrderEvent(self, event):
@@ -444,6 +530,9 @@ class CtaEngine(object):
                 if vtOrderID in s:
                     s.remove(vtOrderID)
 
+                # 委托和策略的映射保留到保存期限之后，用于匹配延迟到达的成交
+                self.orderStrategyDict.expire(vtOrderID)
+
             self.callStrategyFunc(strategy, strategy.onOrder, order)
             # self.saveOrderDetail(strategy,order)
 
@@ -454,7 +543,8 @@ class CtaEngine(object):
         # 过滤已经收到过的成交回报
         if trade.vtTradeID in self.tradeSet:
             return
-        self.tradeSet.add(trade.vtTradeID)
+        self.tradeSet[trade.vtTradeID] = trade.vtOrderID
+        self.tradeSet.expire(trade.vtTradeID)
         # 将成交推送到策略对象中
         if trade.vtOrderID in self.orderStrategyDict:
             strategy = self.orderStrategyDict[trade.vtOrderID]
@@ -529,6 +619,76 @@ class CtaEngine(object):
         self.eventEngine.register(EVENT_TRADE, self.processTradeEvent)
         self.eventEngine.register(EVENT_ACCOUNT, self.processAccountEvent)
         self.eventEngine.register(EVENT_ERROR, self.processErrorEvent)
+        self.eventEngine.register(EVENT_TIMER, self.processTimerEvent)
+
+    #----------------------------------------------------------------------
+    def processTimerEvent(self, event):
+        """定时清理过期的委托和成交记录，并保存到硬盘"""
+        self.purgeCount += 1
+        if self.purgeCount < self.purgeTrigger:
+            return
+        self.purgeCount = 0
+
+        self.orderStrategyDict.purge()
+        self.stopOrderDict.purge()
+        self.tradeSet.purge()
+        self.saveOrderBook()
+
+    #----------------------------------------------------------------------
+    def saveOrderBook(self):
+        """保存成交号和委托策略映射，用于重启后过滤重复成交和匹配延迟成交"""
+        d = {
+            'tradingDay': tradingDay(),
+            'trades': self.tradeSet.dump(),
+            'orders': self.orderStrategyDict.dump(lambda strategy: strategy.name)
+        }
+
+        fileName = os.path.join(self.path, self.bookFileName)
+        try:
+            with open(fileName, 'w') as f:
+                json.dump(d, f)
+        except (IOError, OSError, TypeError, ValueError):
+            self.writeCtaLog(u'保存委托记录失败：%s' %traceback.format_exc())
+
+    #----------------------------------------------------------------------
+    def loadOrderBook(self):
+        """读取上次运行保存的委托记录"""
+        fileName = os.path.join(self.path, self.bookFileName)
+        if not os.path.exists(fileName):
+            return
+
+        try:
+            with open(fileName) as f:
+                d = json.load(f)
+        except (IOError, OSError, ValueError):
+            self.writeCtaLog(u'读取委托记录失败：%s' %traceback.format_exc())
+            return
+
+        trades = d.get('trades', [])
+        orders = d.get('orders', [])
+
+        # 跨交易日重启时，丢弃每个交易日重新编号的接口的记录，避免新的编号被误判为重复成交或者匹配到旧策略
+        if d.get('tradingDay', None) != tradingDay():
+            trades = [l for l in trades if not self.isSessionID(l[0])]
+            orders = [l for l in orders if not self.isSessionID(l[0])]
+
+        self.tradeSet.load(trades)
+        self.restoredOrderList = orders
+
+    #----------------------------------------------------------------------
+    def isSessionID(self, vtID):
+        """委托号或成交号是否只在一个交易日内有效"""
+        gatewayName = vtID.split(VN_SEPARATOR)[0].upper()
+        for g in self.sessionGateways:
+            if gatewayName.startswith(g):
+                return True
+        return False
+
+    #----------------------------------------------------------------------
+    def restoreOrderStrategy(self, strategy):
+        """恢复上次运行保存的委托和策略映射"""
+        self.orderStrategyDict.load(self.restoredOrderList,
+                                    lambda name: strategy if name == strategy.name else None)
 
     #----------------------------------------------------------------------
     def insertData(self, dbName, collectionName, data):
@@ -573,14 +733,11 @@ class CtaEngine(object):
         #     return l
 
     #----------------------------------------------------------------------
-    def writeCtaLog(self, content):
-        """快速发出CTA模块日志事件"""
-        log = VtLogData()
-        log.logContent = content
-        log.gatewayName = 'CTA_STRATEGY'
-        event = Event(type_=EVENT_CTA_LOG)
-        event.dict_['data'] = log
-        self.eventEngine.put(event)
+    def writeCtaLog(self, content, *args):
+        """快速发出CTA模块日志事件，args不为空时在通过流控后才格式化content % args"""
+        event = createLogEvent(EVENT_CTA_LOG, 'CTA_STRATEGY', content, args)
+        if event:
+            self.eventEngine.put(event)
 
     #----------------------------------------------------------------------
     def loadStrategy(self, setting):
@@ -633,6 +790,7 @@ class CtaEngine(object):
 
             # 创建委托号列表
             self.strategyOrderDict[name] = set()
+            self.restoreOrderStrategy(strategy)
             for vtSymbol in vtSymbolset :
                 # 保存Tick映射关系
                 if vtSymbol in self.tickStrategyDict:
@@ -663,8 +821,8 @@ class CtaEngine(object):
                 self.writeCtaLog(u'策略%s的交易合约%s无法找到' %(strategy.name, vtSymbol))
 
     #----------------------------------------------------------------------
-    def initStrategy(self, name):
-        """初始化策略"""
+    def initStrategy(self, name, subscribe=True):
+        """初始化策略，subscribe为False时由调用方订阅行情"""
         if name in self.strategyDict:
             strategy = self.strategyDict[name]
 
@@ -672,7 +830,8 @@ class CtaEngine(object):
                 strategy.inited = True
                 self.initPosition(strategy)
                 self.callStrategyFunc(strategy, strategy.onInit)
-                self.subscribeMarketData(strategy)                      # 加载同步数据后再订阅行情
+                if subscribe:
+                    self.subscribeMarketData(strategy)                  # 加载同步数据后再订阅行情
                 
                 self.writeCtaLog(u'策略%s： 初始化' %name)
 
@@ -706,15 +865,9 @@ class CtaEngine(object):
                 strategy.trading = False
                 self.callStrategyFunc(strategy, strategy.onStop)
 
-                # 对该策略发出的所有限价单进行撤单
-                for vtOrderID, s in list(self.orderStrategyDict.items()):
-                    if s is strategy:
-                        self.cancelOrder(vtOrderID)
-
-                # 对该策略发出的所有本地停止单撤单
-                for stopOrderID, so in list(self.workingStopOrderDict.items()):
-                    if so.strategy is strategy:
-                        self.cancelStopOrder(stopOrderID)
+                # 对该策略的所有活动限价单和本地停止单撤单
+                self.cancelAll(name)
+                self.cancelAllStopOrder(name)
 
             strategy.inited = False  ## 取消注释使策略在停止后可以再次初始化
             self.writeCtaLog(u'策略%s： 停止工作' %name)
@@ -724,9 +877,21 @@ class CtaEngine(object):
 
     #----------------------------------------------------------------------
     def initAll(self):
-        """全部初始化"""
-        for name in list(self.strategyDict.keys()):
-            self.initStrategy(name)
+        """
+        全部初始化
+        策略的初始化在线程池中并发进行，期间相同的历史数据请求只发送一次，
+        全部完成后再按顺序订阅行情
+        """
+        nameList = list(self.strategyDict.keys())
+        pendingList = [name for name in nameList if not self.strategyDict[name].inited]
+
+        try:
+            with self.historyLoader.session():
+                self.historyLoader.map(lambda name: self.initStrategy(name, subscribe=False),
+                                       nameList, self.initWorkers)
+        finally:
+            for name in pendingList:
+                self.subscribeMarketData(self.strategyDict[name])
 
     #----------------------------------------------------------------------
     def startAll(self):
@@ -792,6 +957,13 @@ class CtaEngine(object):
             for key in strategy.varList:
                 varDict[key] = strategy.__getattribute__(key)
 
+            # 开启耗时统计时附加策略所有函数的汇总数据
+            if self.perfActive:
+                total = self.strategyPerf.getTotal(name).getSummary()
+                varDict['perfCount'] = total['count']
+                varDict['perfCpuMs'] = round(total['cpuMs'], 3)
+                varDict['perfWallP99Us'] = round(total['wallP99Us'], 1)
+
             return varDict
         else:
             self.writeCtaLog(u'策略实例不存在：' + name)
@@ -834,6 +1006,23 @@ class CtaEngine(object):
     #----------------------------------------------------------------------
     def callStrategyFunc(self, strategy, func, params=None):
         """调用策略的函数，若触发异常则捕捉"""
+        # 抽样追踪中的行情，每个策略使用单独的追踪记录
+        trace = tracer.current()
+        if trace is not None:
+            strategyTrace = trace.fork()
+            strategyTrace.stamp(STAGE_STRATEGY)
+            tracer.attach(strategyTrace)
+
+        # 调用栈抽样分析需要知道当前正在执行的策略
+        sampling = self.strategySampler.active
+        if sampling:
+            self.strategySampler.enter(strategy.name)
+
+        perfActive = self.perfActive
+        if perfActive:
+            startWall = perf_counter_ns()
+            startCpu = thread_time_ns()
+
         try:
             if params:
                 func(params)
@@ -848,6 +1037,56 @@ class CtaEngine(object):
             mail(content,strategy)
             self.writeCtaLog(content)
 
+        if sampling:
+            self.strategySampler.leave()
+
+        if perfActive:
+            self.strategyPerf.record(strategy.name, getattr(func, '__name__', str(func)),
+                                     perf_counter_ns() - startWall, thread_time_ns() - startCpu)
+
+        if trace is not None:
+            tracer.attach(trace)
+
+    #----------------------------------------------------------------------
+    def setStrategyPerf(self, active):
+        """开关策略函数的耗时统计"""
+        self.perfActive = bool(active)
+        self.writeCtaLog(u'策略耗时统计已%s' %(u'开启' if self.perfActive else u'关闭'))
+
+    #----------------------------------------------------------------------
+    def getStrategyPerf(self, name=None):
+        """
+        获取策略的耗时统计，返回{函数名：摘要字典}，汇总数据的函数名为total
+        不指定策略时返回所有策略的统计{策略名：{函数名：摘要字典}}
+        """
+        if name:
+            return self.strategyPerf.getSummary(name)
+        return dict([(n, self.strategyPerf.getSummary(n)) for n in self.strategyPerf.getNames()])
+
+    #----------------------------------------------------------------------
+    def clearStrategyPerf(self, name=None):
+        """清空策略的耗时统计，不指定策略时清空全部"""
+        self.strategyPerf.clear(name)
+
+    #----------------------------------------------------------------------
+    def startStrategyProfile(self, name):
+        """开始对策略进行调用栈抽样分析"""
+        if name not in self.strategyDict:
+            self.writeCtaLog(u'策略实例不存在：%s' %name)
+            return False
+
+        self.strategySampler.start(name)
+        self.writeCtaLog(u'策略%s开始抽样分析' %name)
+        return True
+
+    #----------------------------------------------------------------------
+    def stopStrategyProfile(self, name):
+        """停止策略的抽样分析，返回折叠栈文件路径"""
+        path = self.strategySampler.stop(name)
+        if path:
+            self.writeCtaLog(u'策略%s抽样分析结果已保存：%s' %(name, path))
+        return path
+
     #----------------------------------------------------------------------------------------
     def saveSyncData(self, strategy):    #改为posDict
         """保存策略的持仓情况到数据库"""
@@ -982,7 +1221,7 @@ class CtaEngine(object):
     #----------------------------------------------------------------------
     def stop(self):
         """停止"""
-        pass
+        self.saveOrderBook()
 
     #----------------------------------------------------------------------
     def cancelAll(self, name):
@@ -1013,19 +1252,34 @@ class CtaEngine(object):
             return 0
 
     #--------------------------------------------------------------
+    def loadHistoryFrame(self, vtSymbol, type_, size=None, since=None):
+        """读取历史数据DataFrame，按接口限制并发数，相同的请求只发送一次，返回的DataFrame不要修改"""
+        contract = self.mainEngine.getContract(vtSymbol)
+        gatewayName = contract.gatewayName if contract else vtSymbol.split(VN_SEPARATOR)[-1]
+        return self.historyLoader.load((vtSymbol, type_, size, since), gatewayName,
+                                       self.mainEngine.loadHistoryBar, vtSymbol, type_, size, since)
+
+    #----------------------------------------------------------------------
     def loadHistoryBar(self,vtSymbol,type_,size = None,since = None):
         """读取历史数据"""
-        data = self.mainEngine.loadHistoryBar(vtSymbol, type_, size, since)
+        data = self.loadHistoryFrame(vtSymbol, type_, size, since)
+        datetimeList, arrayDict = frameToArrays(data)
+
         histbar = []
-        for index, row in data.iterrows():
+        for dt, open_, high, low, close, volume in zip(datetimeList,
+                                                       arrayDict['open'].tolist(),
+                                                       arrayDict['high'].tolist(),
+                                                       arrayDict['low'].tolist(),
+                                                       arrayDict['close'].tolist(),
+                                                       arrayDict['volume'].tolist()):
             bar = VtBarData()
-            bar.open = row.open
-            bar.close = row.close
-            bar.high = row.high
-            bar.low = row.low
-            bar.volume = row.volume
+            bar.open = open_
+            bar.close = close
+            bar.high = high
+            bar.low = low
+            bar.volume = volume
             bar.vtSymbol = vtSymbol
-            bar.datetime = row.datetime
+            bar.datetime = dt
             histbar.append(bar)
         return histbar
 
@@ -1044,7 +1298,10 @@ class CtaEngine(object):
             self.mainEngine.initPosition(vtSymbol)
 
     def qryAllOrders(self,name):
-
+        """
+        主动查询策略所有合约的挂单
+        委托状态的定时核对由主引擎的OrderReconciler负责，这里只用于手动触发
+        """
         if name in self.strategyDict:
             strategy = self.strategyDict[name]
             s = self.strategyOrderDict[name]
@@ -0,0 +1,117 @@
+# encoding: UTF-8
+
+"""
+策略初始化时的历史数据请求
+
+HistoryLoader负责：
+1. 按接口限制同时进行的历史数据请求数量，避免并发初始化时触发交易所的频率限制
+2. 合并相同的请求：请求进行中时，其他线程的相同请求等待并共用结果；
+   在session期间（例如initAll）已完成的结果也会保留，供后续相同的请求直接使用
+3. 在线程池中并发执行任务（map）
+
+frameToArrays把接口返回的历史数据DataFrame按列转换为数组，
+用于直接写入ArrayManager，或者批量生成K线对象。
+"""
+
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+
+
+BAR_FIELDS = ['open', 'high', 'low', 'close', 'volume']
+
+
+########################################################################
+class HistoryLoader(object):
+    """历史数据请求的并发控制和合并"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, gatewayLimit=2):
+        """Constructor"""
+        self.gatewayLimit = gatewayLimit    # 每个接口同时进行的请求数量上限
+        self.semaphoreDict = {}             # 接口名：信号量
+        self.futureDict = {}                # 请求参数：Future
+        self.sessionCount = 0
+        self.lock = threading.Lock()
+
+    #----------------------------------------------------------------------
+    def getSemaphore(self, gatewayName):
+        """获取接口的信号量"""
+        with self.lock:
+            semaphore = self.semaphoreDict.get(gatewayName)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(max(self.gatewayLimit, 1))
+                self.semaphoreDict[gatewayName] = semaphore
+        return semaphore
+
+    #----------------------------------------------------------------------
+    def load(self, key, gatewayName, func, *args):
+        """
+        执行请求func(*args)，key为请求参数组成的元组
+        相同key的请求正在进行或者在session期间已完成时直接返回其结果，失败的请求不保留
+        """
+        with self.lock:
+            future = self.futureDict.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self.futureDict[key] = future
+
+        if not owner:
+            return future.result()
+
+        try:
+            with self.getSemaphore(gatewayName):
+                result = func(*args)
+        except Exception as e:
+            with self.lock:
+                self.futureDict.pop(key, None)
+            future.set_exception(e)
+            raise
+
+        with self.lock:
+            if not self.sessionCount:
+                self.futureDict.pop(key, None)
+        future.set_result(result)
+        return result
+
+    #----------------------------------------------------------------------
+    @contextmanager
+    def session(self):
+        """session期间保留已完成请求的结果，结束时清空"""
+        with self.lock:
+            self.sessionCount += 1
+        try:
+            yield self
+        finally:
+            with self.lock:
+                self.sessionCount -= 1
+                if not self.sessionCount:
+                    self.futureDict = dict([(key, future) for key, future in self.futureDict.items()
+                                            if not future.done()])
+
+    #----------------------------------------------------------------------
+    def map(self, func, itemList, workers):
+        """在线程池中对itemList中的每一项执行func，等待全部完成后按顺序返回结果，任务的异常在最后抛出"""
+        itemList = list(itemList)
+        if workers <= 1 or len(itemList) <= 1:
+            return [func(item) for item in itemList]
+
+        executor = ThreadPoolExecutor(min(workers, len(itemList)))
+        try:
+            futureList = [executor.submit(func, item) for item in itemList]
+        finally:
+            executor.shutdown(wait=True)
+        return [future.result() for future in futureList]
+
+
+#----------------------------------------------------------------------
+def frameToArrays(data):
+    """
+    历史数据DataFrame按列转换为(datetime列表, {字段：float数组})
+    datetime列表中为datetime对象（pandas的Timestamp）
+    """
+    datetimeList = data['datetime'].tolist()
+    values = data[BAR_FIELDS].to_numpy(dtype=float)
+    arrayDict = dict([(name, values[:, n]) for n, name in enumerate(BAR_FIELDS)])
+    return datetimeList, arrayDict
@@ -0,0 +1,349 @@
+# encoding: UTF-8
+
+"""
+历史数据服务器使用的列式缓存
+
+1. 每个(数据库, 合约)对应一个SymbolCache，按列保存数据，datetime列为int64纳秒时间戳并保持有序
+2. 记录已缓存的时间区间，请求任意子区间时只从数据库补充缺失的部分，再合并到已有数据中
+3. 所有合约共享一个内存预算，超出时按最近最少使用（LRU）的顺序淘汰
+4. 查询结果按块编码为紧凑的二进制格式（数值列为原始字节，常量列只传一个值）
+"""
+
+import sys
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+
+# 列编码类型
+COLUMN_NUMERIC = 'n'        # 数值列，dtype + 原始字节
+COLUMN_CONST = 'c'          # 常量列，只保存一个值
+COLUMN_OBJECT = 'o'         # 其他列，值列表
+
+DATETIME_FIELD = 'datetime'
+
+
+#----------------------------------------------------------------------
+def toNs(dt):
+    """datetime转换为int64纳秒时间戳"""
+    return int(np.datetime64(dt, 'ns').astype('int64'))
+
+
+#----------------------------------------------------------------------
+def isNumber(v):
+    """是否为数值（不包括bool）"""
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+
+#----------------------------------------------------------------------
+def encodeChunk(columns, begin, end):
+    """将[begin, end)行编码为数据块"""
+    d = {}
+    for name, column in columns.items():
+        if isinstance(column, np.ndarray) and column.dtype != object:
+            d[name] = [COLUMN_NUMERIC, column.dtype.str, column[begin:end].tobytes()]
+        elif isinstance(column, ConstColumn):
+            d[name] = [COLUMN_CONST, column.value]
+        else:
+            d[name] = [COLUMN_OBJECT, column[begin:end].tolist()]
+    return d
+
+
+#----------------------------------------------------------------------
+def decodeChunk(chunk):
+    """
+    解码数据块，返回(行数, 列名列表, 列值列表)
+    datetime列还原为datetime对象，数值列还原为Python数值
+    """
+    n = 0
+    for l in chunk.values():
+        if l[0] == COLUMN_NUMERIC:
+            n = len(l[2]) // np.dtype(l[1]).itemsize
+            break
+        elif l[0] == COLUMN_OBJECT:
+            n = len(l[1])
+            break
+
+    names = []
+    values = []
+    for name, l in chunk.items():
+        if l[0] == COLUMN_NUMERIC:
+            arr = np.frombuffer(l[2], dtype=np.dtype(l[1]))
+            if name == DATETIME_FIELD:
+                v = pd.to_datetime(arr).to_pydatetime().tolist()
+            else:
+                v = arr.tolist()
+        elif l[0] == COLUMN_CONST:
+            v = [l[1]] * n
+        else:
+            v = l[1]
+
+        names.append(name)
+        values.append(v)
+
+    return n, names, values
+
+
+########################################################################
+class ConstColumn(object):
+    """所有行取值相同的列，只保存一个值"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, value, size):
+        """Constructor"""
+        self.value = value
+        self.size = size
+
+    #----------------------------------------------------------------------
+    def toArray(self, other=None):
+        """展开为数组，数值常量与数值列拼接时保持数值类型"""
+        if isinstance(other, ConstColumn):
+            numeric = isNumber(other.value)
+        else:
+            numeric = isinstance(other, np.ndarray) and other.dtype.kind in 'if'
+
+        if numeric and isNumber(self.value):
+            return np.full(self.size, self.value)
+
+        arr = np.empty(self.size, dtype=object)
+        arr[:] = [self.value] * self.size
+        return arr
+
+
+########################################################################
+class SymbolCache(object):
+    """单个合约的列式缓存"""
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        """Constructor"""
+        self.columns = OrderedDict()    # 列名:数组（或ConstColumn）
+        self.size = 0                   # 行数
+        self.ranges = []                # 已缓存的时间区间[(startNs, endNs)]，有序且不重叠
+        self.nbytes = 0                 # 估算的内存占用
+
+        self.lock = threading.Lock()    # 加载数据时的锁
+
+    #----------------------------------------------------------------------
+    def getGaps(self, startNs, endNs):
+        """计算[startNs, endNs)中尚未缓存的区间"""
+        gaps = []
+        cursor = startNs
+        for s, e in self.ranges:
+            if e <= cursor:
+                continue
+            if s >= endNs:
+                break
+            if s > cursor:
+                gaps.append((cursor, s))
+            cursor = max(cursor, e)
+            if cursor >= endNs:
+                break
+        if cursor < endNs:
+            gaps.append((cursor, endNs))
+        return gaps
+
+    #----------------------------------------------------------------------
+    def addRange(self, startNs, endNs):
+        """登记已缓存区间，并与相邻或重叠的区间合并"""
+        ranges = sorted(self.ranges + [(startNs, endNs)])
+        merged = [ranges[0]]
+        for s, e in ranges[1:]:
+            if s <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], e))
+            else:
+                merged.append((s, e))
+        self.ranges = merged
+
+    #----------------------------------------------------------------------
+    def merge(self, docs):
+        """将数据库文档合并到缓存中，docs对应的区间与已有数据不重叠"""
+        if not docs:
+            return
+
+        new = self.toColumns(docs)
+        n = len(docs)
+
+        if not self.size:
+            self.columns = new
+            self.size = n
+        else:
+            # 两边的列不一致时补齐缺失列
+            names = list(self.columns.keys()) + [k for k in new.keys() if k not in self.columns]
+            columns = OrderedDict()
+            for name in names:
+                columns[name] = self.concat(self.columns.get(name, None), self.size,
+                                            new.get(name, None), n)
+
+            # 按时间排序，mergesort为稳定排序，同一时间的数据保持原有顺序
+            order = np.argsort(columns[DATETIME_FIELD], kind='mergesort')
+            for name, column in columns.items():
+                if not isinstance(column, ConstColumn):
+                    columns[name] = column[order]
+
+            self.columns = columns
+            self.size += n
+
+        self.nbytes = self.estimateBytes()
+
+    #----------------------------------------------------------------------
+    def concat(self, old, oldSize, new, newSize):
+        """拼接一列数据"""
+        if isinstance(old, ConstColumn) and isinstance(new, ConstColumn) and old.value == new.value:
+            return ConstColumn(old.value, oldSize + newSize)
+
+        old = self.fill(old, oldSize, new)
+        new = self.fill(new, newSize, old)
+        if isinstance(old, ConstColumn):
+            old = old.toArray(new)
+        if isinstance(new, ConstColumn):
+            new = new.toArray(old)
+        # 整数和浮点数拼接时由numpy自动转为浮点数，其他类型不一致时转为object
+        if old.dtype != new.dtype and (old.dtype == object or new.dtype == object):
+            old = old.astype(object)
+            new = new.astype(object)
+        return np.concatenate([old, new])
+
+    #----------------------------------------------------------------------
+    def fill(self, column, size, other):
+        """缺失的列用空值补齐"""
+        if column is not None:
+            return column
+        if isinstance(other, np.ndarray) and other.dtype.kind in 'if':
+            return np.full(size, np.nan)
+        return ConstColumn(None, size)
+
+    #----------------------------------------------------------------------
+    def toColumns(self, docs):
+        """文档列表转换为列"""
+        names = []
+        nameSet = set(['_id'])
+        for doc in docs:
+            for k in doc:
+                if k not in nameSet:
+                    nameSet.add(k)
+                    names.append(k)
+
+        columns = OrderedDict()
+        n = len(docs)
+        for name in names:
+            values = [doc.get(name, None) for doc in docs]
+
+            if name == DATETIME_FIELD:
+                columns[name] = np.array(values, dtype='datetime64[ns]').astype('int64')
+                continue
+
+            first = values[0]
+            if all(v == first for v in values):
+                columns[name] = ConstColumn(first, n)
+            elif all(isNumber(v) for v in values):
+                columns[name] = np.array(values)
+            else:
+                arr = np.empty(n, dtype=object)
+                arr[:] = values
+                columns[name] = arr
+        return columns
+
+    #----------------------------------------------------------------------
+    def estimateBytes(self):
+        """估算内存占用"""
+        nbytes = 0
+        for column in self.columns.values():
+            if isinstance(column, ConstColumn):
+                continue
+            nbytes += column.nbytes
+            if column.dtype == object and len(column):
+                nbytes += sys.getsizeof(column[0]) * len(column)
+        return nbytes
+
+    #----------------------------------------------------------------------
+    def locate(self, startNs, endNs):
+        """查找[startNs, endNs)对应的行范围"""
+        if not self.size:
+            return 0, 0
+        dt = self.columns[DATETIME_FIELD]
+        begin = int(np.searchsorted(dt, startNs, side='left'))
+        end = int(np.searchsorted(dt, endNs, side='left'))
+        return begin, end
+
+
+########################################################################
+class HistoryCache(object):
+    """
+    多合约共享的历史数据缓存
+    loadFunc(dbName, symbol, start, end)负责从数据库加载[start, end)的文档列表
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, loadFunc, memoryLimit=2*1024**3):
+        """Constructor"""
+        self.loadFunc = loadFunc
+        self.memoryLimit = memoryLimit      # 内存预算（字节）
+
+        self.cacheDict = OrderedDict()      # (dbName, symbol):SymbolCache，按最近使用排序
+        self.lock = threading.Lock()
+
+    #----------------------------------------------------------------------
+    def getCache(self, dbName, symbol):
+        """获取合约缓存，并标记为最近使用"""
+        key = (dbName, symbol)
+        with self.lock:
+            cache = self.cacheDict.pop(key, None)
+            if cache is None:
+                cache = SymbolCache()
+            self.cacheDict[key] = cache
+        return cache
+
+    #----------------------------------------------------------------------
+    def query(self, dbName, symbol, start, end=None):
+        """
+        查询[start, end)的数据，返回(列字典, begin, end)，即列字典中[begin, end)行
+        end为空时查询到当前时间
+        """
+        if not end:
+            end = datetime.now()
+        startNs = toNs(start)
+        endNs = toNs(end)
+
+        cache = self.getCache(dbName, symbol)
+
+        loaded = False
+        with cache.lock:
+            for gapStart, gapEnd in cache.getGaps(startNs, endNs):
+                docs = self.loadFunc(dbName, symbol,
+                                     pd.Timestamp(gapStart).to_pydatetime(),
+                                     pd.Timestamp(gapEnd).to_pydatetime())
+                cache.merge(docs)
+                cache.addRange(gapStart, gapEnd)
+                loaded = True
+
+            columns = cache.columns
+            begin, stop = cache.locate(startNs, endNs)
+
+        if loaded:
+            self.evict(cache)
+
+        return columns, begin, stop
+
+    #----------------------------------------------------------------------
+    def evict(self, current):
+        """超出内存预算时淘汰最近最少使用的合约缓存（不淘汰当前合约）"""
+        with self.lock:
+            total = sum(c.nbytes for c in self.cacheDict.values())
+            for key in list(self.cacheDict.keys()):
+                if total <= self.memoryLimit:
+                    break
+                cache = self.cacheDict[key]
+                if cache is current:
+                    continue
+                total -= cache.nbytes
+                del self.cacheDict[key]
+
+    #----------------------------------------------------------------------
+    def getStatus(self):
+        """获取缓存状态"""
+        with self.lock:
+            return [(key[0], key[1], cache.size, cache.nbytes) for key, cache in self.cacheDict.items()]
@@ -0,0 +1,219 @@
+# encoding: UTF-8
+
+"""
+CTA引擎的委托簿记工具
+
+1. ExpiringDict：已完成的条目在超过保存期限后自动清理，同时限制已完成条目的数量上限，
+   活动条目（尚未调用expire的）不会被清理
+2. tradingDay：当前时间所属的交易日，用于区分只在一个交易日内有效的委托号和成交号
+3. StopOrderBook：本地停止单按合约和方向索引，并按触发价排序，
+   收到行情时只需二分查找出可能触发的停止单
+"""
+
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from vnpy.trader.vtConstant import DIRECTION_LONG
+
+
+#----------------------------------------------------------------------
+def tradingDay(dt=None, boundary=18):
+    """dt所属的交易日，boundary点之后属于下一个交易日，周末属于下周一"""
+    if dt is None:
+        dt = datetime.now()
+    if dt.hour >= boundary:
+        dt += timedelta(days=1)
+    while dt.weekday() >= 5:
+        dt += timedelta(days=1)
+    return dt.strftime('%Y%m%d')
+
+
+########################################################################
+class ExpiringDict(object):
+    """带保存期限的字典"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, ttl, maxSize=0):
+        """Constructor"""
+        self.ttl = ttl                      # 完成后的保存期限（秒）
+        self.maxSize = maxSize              # 已完成条目的数量上限，0表示不限制
+
+        self.dataDict = {}                  # key:value
+        self.expireDict = OrderedDict()     # key:过期时间，按完成顺序排列
+
+    #----------------------------------------------------------------------
+    def __contains__(self, key):
+        """"""
+        return key in self.dataDict
+
+    #----------------------------------------------------------------------
+    def __getitem__(self, key):
+        """"""
+        return self.dataDict[key]
+
+    #----------------------------------------------------------------------
+    def __setitem__(self, key, value):
+        """重新设置的条目恢复为活动条目，之前的过期时间作废"""
+        self.dataDict[key] = value
+        self.expireDict.pop(key, None)
+
+    #----------------------------------------------------------------------
+    def __delitem__(self, key):
+        """"""
+        del self.dataDict[key]
+        self.expireDict.pop(key, None)
+
+    #----------------------------------------------------------------------
+    def __len__(self):
+        """"""
+        return len(self.dataDict)
+
+    #----------------------------------------------------------------------
+    def get(self, key, default=None):
+        """"""
+        return self.dataDict.get(key, default)
+
+    #----------------------------------------------------------------------
+    def items(self):
+        """"""
+        return self.dataDict.items()
+
+    #----------------------------------------------------------------------
+    def values(self):
+        """"""
+        return self.dataDict.values()
+
+    #----------------------------------------------------------------------
+    def expire(self, key, expireTime=None):
+        """标记条目已完成，超过保存期限后清理"""
+        if key not in self.dataDict or key in self.expireDict:
+            return
+
+        if expireTime is None:
+            expireTime = time.time() + self.ttl
+        self.expireDict[key] = expireTime
+
+        # 超出数量上限时清理最早完成的条目
+        if self.maxSize and len(self.expireDict) > self.maxSize:
+            k, t = self.expireDict.popitem(last=False)
+            self.dataDict.pop(k, None)
+
+    #----------------------------------------------------------------------
+    def purge(self, now=None):
+        """清理已过期的条目，返回清理数量"""
+        if now is None:
+            now = time.time()
+
+        count = 0
+        while self.expireDict:
+            # 保存期限相同，按完成顺序即按过期时间排列
+            key, expireTime = next(iter(self.expireDict.items()))
+            if expireTime > now:
+                break
+            del self.expireDict[key]
+            self.dataDict.pop(key, None)
+            count += 1
+        return count
+
+    #----------------------------------------------------------------------
+    def dump(self, func=None):
+        """导出为列表[[key, value, 过期时间]]，func用于转换value，活动条目的过期时间为None"""
+        l = []
+        for key, value in self.dataDict.items():
+            if func:
+                value = func(value)
+            l.append([key, value, self.expireDict.get(key, None)])
+        return l
+
+    #----------------------------------------------------------------------
+    def load(self, l, func=None):
+        """从dump导出的列表恢复，已过期的条目直接丢弃，func返回None的条目不恢复"""
+        now = time.time()
+        l = sorted(l, key=lambda x: x[2] or 0)
+
+        for key, value, expireTime in l:
+            if expireTime is not None and expireTime <= now:
+                continue
+            if func:
+                value = func(value)
+                if value is None:
+                    continue
+
+            self.dataDict[key] = value
+            if expireTime is not None:
+                self.expire(key, expireTime)
+
+
+########################################################################
+class StopOrderBook(object):
+    """
+    本地停止单索引
+
+    多头停止单在最新价大于等于触发价时触发，按触发价从低到高排列；
+    空头停止单在最新价小于等于触发价时触发，按触发价取负后从低到高排列。
+    两种情况下，已触发的停止单都位于列表的头部。
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        """Constructor"""
+        self.bookDict = {}      # (vtSymbol, 是否多头):[排序键列表, 停止单编号列表]
+
+    #----------------------------------------------------------------------
+    def getKey(self, so):
+        """获取停止单的索引和排序键"""
+        isLong = so.direction == DIRECTION_LONG
+        if isLong:
+            return (so.vtSymbol, isLong), so.price
+        else:
+            return (so.vtSymbol, isLong), -so.price
+
+    #----------------------------------------------------------------------
+    def add(self, so):
+        """添加停止单"""
+        index, key = self.getKey(so)
+        if index not in self.bookDict:
+            self.bookDict[index] = [[], []]
+        keys, ids = self.bookDict[index]
+
+        n = bisect_right(keys, key)
+        keys.insert(n, key)
+        ids.insert(n, so.stopOrderID)
+
+    #----------------------------------------------------------------------
+    def remove(self, so):
+        """移除停止单"""
+        index, key = self.getKey(so)
+        if index not in self.bookDict:
+            return
+        keys, ids = self.bookDict[index]
+
+        n = bisect_left(keys, key)
+        while n < len(keys) and keys[n] == key:
+            if ids[n] == so.stopOrderID:
+                del keys[n]
+                del ids[n]
+                break
+            n += 1
+
+        if not keys:
+            del self.bookDict[index]
+
+    #----------------------------------------------------------------------
+    def getTriggered(self, vtSymbol, lastPrice):
+        """获取在最新价下会触发的停止单编号列表"""
+        triggered = []
+
+        l = self.bookDict.get((vtSymbol, True), None)
+        if l:
+            n = bisect_right(l[0], lastPrice)
+            triggered.extend(l[1][:n])
+
+        l = self.bookDict.get((vtSymbol, False), None)
+        if l:
+            n = bisect_right(l[0], -lastPrice)
+            triggered.extend(l[1][:n])
+
+        return triggered
@@ -0,0 +1,256 @@
+# encoding: UTF-8
+
+"""
+策略函数的耗时统计和抽样分析
+
+StrategyPerf按照策略和回调函数（onTick、onOrder、onTrade等）统计调用次数、
+墙上时间和线程CPU时间，耗时分布使用对数分桶直方图，可以查询p50/p99。
+Python3.7之前没有线程CPU时间，CPU时间为整个进程的CPU时间，包含其他线程的消耗，
+只能作为参考。
+
+StrategySampler在后台线程中定时抓取正在执行策略函数的线程（事件引擎线程、
+initAll并发初始化策略的线程）的调用栈，只记录正在执行被分析策略的样本，
+停止时输出flamegraph.pl/speedscope可以直接读取的折叠栈文件：
+    策略名;函数 (文件:行号);函数 (文件:行号) 样本数
+"""
+
+from __future__ import division
+
+import os
+import sys
+import threading
+from collections import defaultdict
+from datetime import datetime
+from time import sleep
+
+from vnpy.event.eventTrace import LatencyHistogram
+from vnpy.trader.vtFunction import getTempPath
+
+try:
+    from time import thread_time_ns
+except ImportError:
+    from time import process_time
+
+    def thread_time_ns():
+        """Python3.7之前没有线程CPU时间，使用进程CPU时间代替，包含其他线程的消耗"""
+        return int(process_time() * 1000000000)
+
+
+########################################################################
+class CallbackStat(object):
+    """单个策略函数的耗时统计"""
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        """Constructor"""
+        self.count = 0
+        self.wallTotal = 0                  # 纳秒
+        self.cpuTotal = 0                   # 纳秒
+        self.wallHist = LatencyHistogram()
+        self.cpuHist = LatencyHistogram()
+
+    #----------------------------------------------------------------------
+    def record(self, wall, cpu):
+        """记录一次调用"""
+        self.count += 1
+        self.wallTotal += wall
+        self.cpuTotal += cpu
+        self.wallHist.record(wall)
+        self.cpuHist.record(cpu)
+
+    #----------------------------------------------------------------------
+    def merge(self, other):
+        """合并另一个统计，用于汇总策略的所有函数"""
+        self.count += other.count
+        self.wallTotal += other.wallTotal
+        self.cpuTotal += other.cpuTotal
+        self.wallHist.merge(other.wallHist)
+        self.cpuHist.merge(other.cpuHist)
+
+    #----------------------------------------------------------------------
+    def getSummary(self):
+        """统计摘要，总耗时单位为毫秒，分位数单位为微秒"""
+        return {
+            'count': self.count,
+            'wallMs': self.wallTotal / 1000000,
+            'cpuMs': self.cpuTotal / 1000000,
+            'wallP50Us': self.wallHist.getValueAtPercentile(50) / 1000,
+            'wallP99Us': self.wallHist.getValueAtPercentile(99) / 1000,
+            'cpuP50Us': self.cpuHist.getValueAtPercentile(50) / 1000,
+            'cpuP99Us': self.cpuHist.getValueAtPercentile(99) / 1000
+        }
+
+
+########################################################################
+class StrategyPerf(object):
+    """策略函数耗时统计，事件引擎线程和并发初始化策略的线程都会记录"""
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        """Constructor"""
+        self.statDict = defaultdict(dict)   # 策略名：{函数名：CallbackStat}
+        self.lock = threading.Lock()
+
+    #----------------------------------------------------------------------
+    def record(self, name, funcName, wall, cpu):
+        """记录一次调用"""
+        with self.lock:
+            d = self.statDict[name]
+            try:
+                stat = d[funcName]
+            except KeyError:
+                stat = CallbackStat()
+                d[funcName] = stat
+            stat.record(wall, cpu)
+
+    #----------------------------------------------------------------------
+    def getTotal(self, name):
+        """汇总策略所有函数的统计"""
+        total = CallbackStat()
+        for stat in list(self.statDict.get(name, {}).values()):
+            total.merge(stat)
+        return total
+
+    #----------------------------------------------------------------------
+    def getSummary(self, name):
+        """获取策略的统计摘要，返回{函数名：摘要字典}，汇总数据的函数名为total"""
+        d = dict([(funcName, stat.getSummary())
+                  for funcName, stat in list(self.statDict.get(name, {}).items())])
+        if d:
+            d['total'] = self.getTotal(name).getSummary()
+        return d
+
+    #----------------------------------------------------------------------
+    def getNames(self):
+        """有统计数据的策略名"""
+        return list(self.statDict.keys())
+
+    #----------------------------------------------------------------------
+    def clear(self, name=None):
+        """清空统计"""
+        if name:
+            self.statDict.pop(name, None)
+        else:
+            self.statDict.clear()
+
+
+########################################################################
+class StrategySampler(object):
+    """策略调用栈抽样分析"""
+
+    STOP_FUNC = 'callStrategyFunc'      # 调用栈向上追溯到此函数为止
+
+    #----------------------------------------------------------------------
+    def __init__(self, interval=0.005):
+        """Constructor"""
+        self.interval = interval            # 抽样间隔（秒）
+
+        self.nameSet = set()                # 正在分析的策略
+        self.stackDict = {}                 # 策略名：{折叠栈：样本数}
+        self.startDict = {}                 # 策略名：开始时间
+
+        # 由CtaEngine在调用策略函数时设置，initAll时多个线程同时执行不同的策略
+        self.currentDict = {}               # 线程编号：正在执行的策略
+
+        self.active = False
+        self.thread = None
+        self.switchInterval = None          # 分析前的GIL切换间隔
+
+    #----------------------------------------------------------------------
+    def start(self, name):
+        """开始分析策略"""
+        self.stackDict.setdefault(name, defaultdict(int))
+        self.startDict.setdefault(name, datetime.now())
+        self.nameSet.add(name)
+
+        if not self.active:
+            # 缩短GIL切换间隔，否则计算密集的策略函数执行期间抽样线程很难获得运行机会，
+            # 样本会偏向于sleep、IO等释放GIL的函数
+            if self.switchInterval is None:
+                self.switchInterval = sys.getswitchinterval()
+                sys.setswitchinterval(min(self.switchInterval, self.interval / 10))
+
+            self.active = True
+            self.thread = threading.Thread(target=self.run, name='CtaStrategySampler')
+            self.thread.daemon = True
+            self.thread.start()
+
+    #----------------------------------------------------------------------
+    def stop(self, name):
+        """停止分析策略，输出折叠栈文件并返回文件路径"""
+        if name not in self.nameSet:
+            return ''
+        self.nameSet.discard(name)
+        if not self.nameSet:
+            self.active = False
+            # 等待抽样线程退出，避免紧接着重新开始分析时同时运行两个抽样线程
+            if self.thread is not None:
+                self.thread.join()
+                self.thread = None
+            if self.switchInterval is not None:
+                sys.setswitchinterval(self.switchInterval)
+                self.switchInterval = None
+
+        stackDict = self.stackDict.pop(name, {})
+        startTime = self.startDict.pop(name)
+
+        fileName = 'profile_%s_%s.folded' % (name, startTime.strftime('%Y%m%d_%H%M%S'))
+        path = getTempPath(fileName)
+        with open(path, 'w') as f:
+            for stack, count in sorted(list(stackDict.items())):
+                f.write('%s %d\n' % (stack, count))
+        return path
+
+    #----------------------------------------------------------------------
+    def enter(self, name):
+        """当前线程开始执行策略函数"""
+        self.currentDict[threading.get_ident()] = name
+
+    #----------------------------------------------------------------------
+    def leave(self):
+        """当前线程的策略函数执行完毕"""
+        self.currentDict.pop(threading.get_ident(), None)
+
+    #----------------------------------------------------------------------
+    def isProfiling(self, name):
+        """策略是否正在分析"""
+        return name in self.nameSet
+
+    #----------------------------------------------------------------------
+    def run(self):
+        """抽样线程"""
+        while self.active:
+            sleep(self.interval)
+            currentList = [(threadId, name) for threadId, name in list(self.currentDict.items())
+                           if name in self.nameSet]
+            if not currentList:
+                continue
+
+            frames = sys._current_frames()
+            for threadId, name in currentList:
+                self.sample(threadId, name, frames.get(threadId))
+
+    #----------------------------------------------------------------------
+    def sample(self, threadId, name, frame):
+        """记录一次执行策略的线程的调用栈"""
+        if self.currentDict.get(threadId) != name:
+            return
+
+        labelList = []
+        while frame is not None:
+            code = frame.f_code
+            if code.co_name == self.STOP_FUNC:
+                break
+            labelList.append('%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename),
+                                             code.co_firstlineno))
+            frame = frame.f_back
+        else:
+            # 抓取时策略函数已经返回
+            return
+
+        if labelList:
+            labelList.append(name)
+            stack = ';'.join(reversed(labelList))
+            stackDict = self.stackDict.get(name)
+            if stackDict is not None:
+                stackDict[stack] += 1
@@ -15,6 +15,7 @@ from vnpy.trader.vtUtility import BarGenerator, ArrayManager
 from vnpy.trader.utils.email import mail
 
 from .ctaBase import *
+from .ctaHistory import frameToArrays
 
 ########################################################################
 class CtaTemplate(object):
@@ -145,6 +146,24 @@ class CtaTemplate(object):
             # 交易停止时发单返回空字符串
             return []
 
+    # ----------------------------------------------------------------------
+    def sendOrders(self, orderList):
+        """
+        批量发送委托
+        orderList中每个元素为(orderType, vtSymbol, price, volume)或
+        (orderType, vtSymbol, price, volume, priceType)，不支持本地停止单。
+        返回与orderList一一对应的委托号列表的列表。
+        """
+        if not self.trading:
+            return [[] for order in orderList]
+
+        l = []
+        for order in orderList:
+            if len(order) == 4:
+                order = tuple(order) + (PRICETYPE_LIMITPRICE,)
+            l.append(order)
+        return self.ctaEngine.sendOrders(l, self)
+
     # ----------------------------------------------------------------------
     def cancelOrder(self, vtOrderID):
         """撤单"""
@@ -242,6 +261,26 @@ class CtaTemplate(object):
                 u'下载历史数据参数错误，请参考以下参数["1min","5min","15min","30min","60min","120min","240min","360min","480min","1day","1week","1month"]，同时size建议不大于2000')
             return
         
+    def loadHistoryArray(self, am, vtSymbol, type_, size=None, since=None):
+        """
+        策略开始前下载历史数据，按列直接写入ArrayManager，不生成K线对象
+        返回写入的K线数量，最后一个非完整K线被抛弃
+        """
+        if type_ not in ["1min","5min","15min","30min","60min","120min","240min","360min","480min","1day","1week","1month"]:
+            self.writeCtaLog(u'下载历史数据参数错误，频率%s' % type_)
+            return 0
+
+        data = self.ctaEngine.loadHistoryFrame(vtSymbol, type_, size, since)
+        datetimeList, arrayDict = frameToArrays(data)
+        if 'min' in type_ and datetimeList:
+            minute = int(type_[:-3])
+            if datetime.now() < (datetimeList[-1] + timedelta(seconds = 60*minute)):
+                datetimeList = datetimeList[:-1]
+
+        n = len(datetimeList)
+        am.updateArrays(datetimeList, *[arrayDict[name][:n] for name in ['open', 'high', 'low', 'close', 'volume']])
+        return n
+
     def qryOrder(self, vtSymbol, status= None):
         """查询特定的订单"""
         return self.ctaEngine.qryOrder(vtSymbol,self.name,status)
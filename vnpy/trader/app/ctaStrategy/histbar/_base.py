@@ -1,3 +1,7 @@
+import os
+import re
+import pickle
+import threading
 from datetime import datetime, timedelta
 from functools import partial
 from importlib import import_module
@@ -8,6 +12,8 @@ import numpy as np
 from vnpy.event import EventEngine
 from vnpy.trader.vtObject import VtBarData
 from vnpy.trader.vtConstant import VN_SEPARATOR
+from vnpy.trader.vtFunction import getTempPath
+from vnpy.trader.utils import LoggerMixin
 from vnpy.trader.utils.datetime import standardize_freq, split_freq
 
 DATEFORMAT = "%Y%m%d"
@@ -18,6 +24,8 @@ MINUTES = [1, 5, 15, 30, 60, 120, 240, 360, 480, 60*24, 60*24*7]
 FREQS = ["1min","5min","15min","30min","60min","120min","240min","360min","480min","1day","1week"]
 MFINDEX = list(range(len(MINUTES)))
 
+logger = LoggerMixin()
+
 _base_freq_minutes = {
     "m": 1,
     "h": 60,
@@ -54,7 +62,7 @@ def daily_grouper(dt, spliter):
     return datetime(dt.year, dt.month, dt.day)
 
 def weekly_grouper(dt, spliter):
-    date = datetime(dt.year, dt.month, dt.day) - timedelta(days=dt.weekday())
+    return datetime(dt.year, dt.month, dt.day) - timedelta(days=dt.weekday())
 
 groupers = {
     "m": minute_grouper,
@@ -132,81 +140,89 @@ def select(bars, index, start=None, end=None, size=None):
 
 class BarCache(object):
     """
-    用于存储近期请求的完整bar数据，加速局部性数据读取速度。
-    缓存中加入新数据时优先保证数据连续性，数据时间戳不连续时只保留最新加入的连续数据。
+    用于存储近期请求的已完成bar数据，加速局部性数据读取速度。
+    bar按时间升序排列且不重复，未完成的bar不进入缓存。
+    新数据只有和缓存末尾重叠时才合并，否则无法确认中间没有缺失，由调用方重新读取完整数据。
+    长度超过maxsize时丢弃最早的bar。
     """
 
-    def __init__(self, gap, maxsize=2**16):
-        self.gap = gap
+    def __init__(self, maxsize=2**16):
         self.maxsize = maxsize
-        self.start = None
-        self.end = None
-        self.length = 0
         self.bars = []
         self.index = []
 
+    def __len__(self):
+        return len(self.bars)
+
     @property
     def empty(self):
-        return self.start and self.end and self.length
+        return not self.bars
+
+    @property
+    def start(self):
+        return self.index[0] if self.index else None
+
+    @property
+    def end(self):
+        return self.index[-1] if self.index else None
 
-    def refresh(self):
-        if len(self.bars) > self.maxsize:
-            self.bars = self.bars[-self.maxsize]
-        self.start = self.bars[0]
-        self.end = self.bars[-1]
-        self.length = len(self.bars)
-        self.index = [bar.datetime for bar in self.bars]
+    def trim(self):
+        overflow = len(self.bars) - self.maxsize
+        if overflow > 0:
+            del self.bars[:overflow]
+            del self.index[:overflow]
 
     def init(self, bars):
-        self.bars = list(bars)
-        self.refresh()
+        self.bars = []
+        self.index = []
+        self.rput(bars)
 
     def rput(self, bars):
+        """合并尾部数据，只追加晚于缓存末尾的bar，返回追加的数量"""
+        last = self.end
+        count = 0
+        for bar in bars:
+            if last is None or bar.datetime > last:
+                self.bars.append(bar)
+                self.index.append(bar.datetime)
+                last = bar.datetime
+                count += 1
+        self.trim()
+        return count
+
+    def covers(self, size=None, start=None, end=None):
+        """缓存是否包含请求的起始部分"""
         if self.empty:
-            self.init(bars)
-        else:
-            count = 0
-            for bar in bars:
-                if bar.datetime > self.end:
-                    if bar.datetime - self.end == self.gap:
-                        self.bars.extend(bars[count:])
-                        self.refresh()
-                    else:
-                        self.init(bars)
-                    break
-                else:
-                    count += 1 
-
-    def lput(self, bars):
-        if self.empty():
-            self.init(bars)
-        else:
-            count = len(bars)
-            for bar in reversed(bars):
-                if bar.datetime < self.start:
-                    if self.start - bar.datetime == self.gap:
-                        bars = bars[:count]
-                        bars.extend(self.bars)
-                        self.bars = bars
-                        self.refresh()
-                    else:
-                        self.bars = list(bars)
-                        self.refresh()
-                    break
-                else:
-                    count -= 1
-    
+            return False
+        if start:
+            return start >= self.start
+        if size:
+            if end:
+                return np.searchsorted(self.index, end, "right") >= size
+            return len(self.bars) >= size
+        return False
+
     def read(self, start=None, end=None, size=None):
-        return select(selr.bars, self.index, start, end, size)
+        return select(self.bars, self.index, start, end, size)
 
 
 class BarReader(object):
     FREQUENCIES = list(zip(FREQS, MINUTES))
+    CACHE_SIZE = 2**16
 
-    def __init__(self, gateway):
+    def __init__(self, gateway, cache_size=CACHE_SIZE, persist=False):
+        """
+        gateway: VtGateway, 提供loadHistoryBar的接口
+        cache_size: int, 每个品种每个周期缓存的bar数量上限
+        persist: bool, 是否把缓存保存到temp目录, 重启后只需要补充缺失的部分
+        """
         self.gateway = gateway
         self.gatewayName = gateway.gatewayName
+        self.cache_size = cache_size
+        self.persist = persist
         self.cache = {}
+        self._locks = {}
+        self._lock = threading.Lock()
         self._current_datetime = None
 
     @property
@@ -217,29 +233,110 @@ class BarReader(object):
         self._current_time = dt
 
     @classmethod
-    def new(cls, gateway):
+    def new(cls, gateway, **kwargs):
         module_name = gateway.__class__.__name__.lower().replace("gateway", "")
         cls_name = module_name[0].upper() + module_name[1:] + "BarReader"
         package = ".".join(__name__.split(".")[:-1])
         try:
             module = import_module(".".join([package, module_name]))
             cls_ = getattr(module, cls_name)
-            return cls_(gateway)
         except (ImportError, AttributeError):
             raise TypeError("Not supported gateway: %s" % gateway.__class__.__name__)
-        
-    def read_cache(self, symbol, freq, start, end, size):
+        return cls_(gateway, **kwargs)
+
+    def get_lock(self, symbol, freq):
+        """每个品种每个周期一个锁，同时请求相同数据时只有一个线程访问接口，其余的直接读缓存"""
+        key = (symbol, freq)
+        with self._lock:
+            lock = self._locks.get(key, None)
+            if lock is None:
+                lock = threading.Lock()
+                self._locks[key] = lock
+        return lock
+
+    def get_cache(self, symbol, freq):
         try:
-            cache = self.cache[symbol][freq]
-        except IndexError:
-            cache = None
+            return self.cache[symbol][freq]
+        except KeyError:
+            cache = BarCache(self.cache_size)
+            if self.persist:
+                cache.init(self.load_cache(symbol, freq))
             self.cache.setdefault(symbol, {})[freq] = cache
-    
+            return cache
+
+    def cache_path(self, symbol, freq):
+        name = "histbar_%s_%s_%s.pkl" % (self.gatewayName, symbol, freq)
+        return getTempPath(re.sub(r"[^\w.-]", "_", name))
+
+    def load_cache(self, symbol, freq):
+        path = self.cache_path(symbol, freq)
+        if not os.path.exists(path):
+            return []
+        try:
+            with open(path, "rb") as f:
+                records = pickle.load(f)
+            return [self.make_bar(symbol, *record) for record in records]
+        except Exception:
+            logger.exception("读取bar缓存文件失败: %s", path)
+            return []
+
+    def save_cache(self, symbol, freq, cache):
+        path = self.cache_path(symbol, freq)
+        records = [(bar.datetime, bar.open, bar.high, bar.low, bar.close, bar.volume) for bar in cache.bars]
+        try:
+            with open(path + ".tmp", "wb") as f:
+                pickle.dump(records, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(path + ".tmp", path)
+        except Exception:
+            logger.exception("保存bar缓存文件失败: %s", path)
+
+    def clear_cache(self, symbol=None):
+        """清空内存中的缓存, 不影响已保存的文件"""
+        if symbol:
+            self.cache.pop(symbol, None)
+        else:
+            self.cache.clear()
+
+    def read_cache(self, cache, symbol, multipler, unit, size, start, end, keep_active):
+        """
+        缓存包含请求的起始部分时，只从接口读取缓存末尾之后的数据并合并。
+        return: bool 缓存是否可用, VtBarData or None 未完成bar
+        """
+        if not cache.covers(size, start, end):
+            return False, None
+
+        minutes = freq_minutes(multipler, unit)
+        now = datetime.now()
+        # 缓存末尾之后的下一根bar在now >= end + 2*周期时才会完成
+        if not keep_active:
+            if end and end <= cache.end:
+                return True, None
+            if (now - cache.end).total_seconds() < 2 * 60 * minutes:
+                return True, None
+
+        # 多读取一根bar保证和缓存重叠，重叠部分以缓存为准
+        length = int((now - cache.end).total_seconds() / 60 / minutes) + 2
+        size_, start_ = self.transform_params(multipler, unit, length, None, None)
+        bars = self._read(symbol, multipler, unit, size_, start_)
+        if bars[0].datetime > cache.end:
+            return False, None
+
+        bars, active = self.split_active(bars, minutes)
+        if cache.rput(bars) and self.persist:
+            self.save_cache(symbol, "%d%s" % (multipler, unit), cache)
+        return True, active
+
+    def split_active(self, bars, minutes):
+        """分离最后一根未完成的bar"""
+        if bars and (datetime.now() - bars[-1].datetime).total_seconds() < 60 * minutes:
+            return bars[:-1], bars[-1]
+        return bars, None
+
     def check_result(self, bars, start=None, end=None, size=None):
         assert len(bars), "length of bars is 0"
         if start:
             if bars[0].datetime != start:
-                raise ValueError("Start time not match: start=%s, bars[0]=%s" % (start, bars[0].datetime)) 
+                raise ValueError("Start time not match: start=%s, bars[0]=%s" % (start, bars[0].datetime))
         if end:
             if bars[-1].datetime != end:
                 raise ValueError("End time not match: end=%s, bars[-1]=%s" % (start, bars[-1].datetime))
@@ -259,13 +356,13 @@ class BarReader(object):
         end: datetime or None, 结束时间
         check_result: bool, 是否检查结果, 结果不符合条件(长度, 起止时间等)时抛出异常
 
-        return: list(VtBarData)
+        return: list(VtBarData), 已完成的bar与缓存共享, 不要修改
         """
         freq = standardize_freq(freq)
         self.check_freq(freq)
         multipler, unit = split_freq(freq)
         return self.read(symbol, multipler, unit, size, start, end, False, check_result)
-    
+
     def historyActive(self, symbol, freq, size=None, start=None, end=None, check_result=True):
         """
         获取bar数据，包含未完成bar和最新1mbar的时间。
@@ -293,27 +390,32 @@ class BarReader(object):
         return size, start
 
     def read(self, symbol, multipler, unit, size=None, start=None, end=None, keep_active=False, check_result=True):
-        # TODO: Get cache and modify read params.
-        # TODO: set param end when there only one input param. 
+        # TODO: set param end when there only one input param.
         if end is None and not (size and start):
             end = self.current_datetime
-        size_, start_ = self.transform_params(multipler, unit, size, start, end)
-        bars = self._read(symbol, multipler, unit, size_, start_)
-        
-        # TODO: Merge cache and adjust bars.
-        
-        if not keep_active:
-            if (datetime.now() - bars[-1].datetime).seconds/60 < freq_minutes(multipler, unit):
-                bars = bars[:-1]
-        if start or end:
-            index = [bar.datetime for bar in bars]
-        else:
-            index = None
-        bars = select(bars, index, start, end, size)
+        freq = "%d%s" % (multipler, unit)
+        with self.get_lock(symbol, freq):
+            cache = self.get_cache(symbol, freq)
+            hit, active = self.read_cache(cache, symbol, multipler, unit, size, start, end, keep_active)
+            if hit:
+                bars, index = cache.bars, cache.index
+            else:
+                size_, start_ = self.transform_params(multipler, unit, size, start, end)
+                bars = self._read(symbol, multipler, unit, size_, start_)
+                bars, active = self.split_active(bars, freq_minutes(multipler, unit))
+                cache.init(bars)
+                if self.persist:
+                    self.save_cache(symbol, freq, cache)
+                index = [bar.datetime for bar in bars]
+            if keep_active and active:
+                bars = bars + [active]
+                index = index + [active.datetime]
+            bars = select(bars, index, start, end, size)
+
         if check_result:
             self.check_result(bars, start, end, size)
         return bars
-    
+
     def check_freq(self, freq):
         multipler, unit = split_freq(freq)
         if unit in {"d", "w"} and (multipler > 1):
@@ -327,13 +429,16 @@ class BarReader(object):
             since = since.strftime(DATEFORMAT)
         data = self.gateway.loadHistoryBar(symbol, f, size, since)
         check_bar(data)
-        data = data[["datetime", "open", "high", "low", "close", "volume"]].set_index("datetime").applymap(float)
+        data = data[BAR_COLUMN].set_index("datetime").astype(float)
+        data = data[~data.index.duplicated(keep="last")].sort_index()
         if multiplier > 1:
             grouper = groupers.get(unit, None)
             if grouper:
                 data = resample(data, grouper, multipler)
-        data = data.reset_index().rename_axis({"index": "datetime"}, 1)
-        return [self.make_bar(symbol, **bar) for bar in data.to_dict("record")]
+        # 按列取出数值后逐行生成bar，避免逐元素转换和生成中间字典
+        datetimes = pd.DatetimeIndex(data.index).to_pydatetime()
+        values = data[BAR_COLUMN[1:]].values.tolist()
+        return [self.make_bar(symbol, dt, *value) for dt, value in zip(datetimes, values)]
 
     def make_bar(self, symbol, datetime, open, high, low, close, volume):
         bar = VtBarData()
@@ -45,6 +45,30 @@ import pandas as pd
 
 #------------------
 
+def _dm(df):
+    '''
+    相邻两行之间的上升动向和下降动向
+    【输出】
+        UpMove，high[i+1]-high[i]
+        DoMove，low[i]-low[i+1]
+        长度均比df少一行
+    '''
+    high = df['high'].values
+    low = df['low'].values
+    return high[1:] - high[:-1], low[:-1] - low[1:]
+
+
+def _tr(df, ksgn='close'):
+    '''
+    真实波幅TR，max(high, 昨收) - min(low, 昨收)，第一行为0
+    '''
+    high = df['high'].values
+    low = df['low'].values
+    close = df[ksgn].values
+    TR = np.maximum(high[1:], close[:-1]) - np.minimum(low[1:], close[:-1])
+    return np.concatenate(([0], TR))
+
+
 def ACCDIST(df, n,ksgn='close'): 
     '''
     def ACCDIST(df, n,ksgn='close'): 
@@ -82,41 +106,16 @@ def ADX(df, n, n_ADX,ksgn='close'):
         df, pd.dataframe格式数据源,
         增加了一栏：adx_{n}_{n2}，输出数据
     '''
-    i = 0
-    UpI = []
-    DoI = []
     xnam='adx_{n}_{n2}'.format(n=n,n2=n_ADX)
-    while i + 1 <= len(df) - 1:  # df.index[-1]:
-        #UpMove = df.get_value(i + 1, 'high') - df.get_value(i, 'high')
-        #DoMove = df.get_value(i, 'low') - df.get_value(i + 1, 'low')
-        #..UpMove=df['high'].iloc[i+1]-df['high'].iloc[i]
-        UpMove = df['high'].iloc[i+1] - df['high'].iloc[i]
-        DoMove = df['low'].iloc[i] - df['low'].iloc[i+1]
-        if UpMove > DoMove and UpMove > 0:
-            UpD = UpMove
-        else:
-            UpD = 0
-        UpI.append(UpD)
-        if DoMove > UpMove and DoMove > 0:
-            DoD = DoMove
-        else:
-            DoD = 0
-        DoI.append(DoD)
-        i = i + 1
-    i = 0
-    TR_l = [0]
-    while i < len(df) - 1:  # df.index[-1]:
-        #TR = max(df.get_value(i + 1, 'high'), df.get_value(i, 'close')) - min(df.get_value(i + 1, 'low'), df.get_value(i, 'close'))
-        TR = max(df['high'].iloc[i+1], df[ksgn].iloc[i]) - min(df['low'].iloc[i+1], df[ksgn].iloc[i])
-        TR_l.append(TR)
-        i = i + 1
-    TR_s = pd.Series(TR_l)
-    ATR = pd.Series(pd.ewma(TR_s, span=n, min_periods=n))
-    UpI = pd.Series(UpI)
-    DoI = pd.Series(DoI)
-    PosDI = pd.Series(pd.ewma(UpI, span=n, min_periods=n - 1) / ATR)
-    NegDI = pd.Series(pd.ewma(DoI, span=n, min_periods=n - 1) / ATR)
-    ds = pd.Series(pd.ewma(abs(PosDI - NegDI) / (PosDI + NegDI), span=n_ADX, min_periods=n_ADX - 1), name=xnam)
+    UpMove, DoMove = _dm(df)
+    # UpI、DoI比df少一行，第i个元素对应第i行到第i+1行的变动
+    UpI = pd.Series(np.where((UpMove > DoMove) & (UpMove > 0), UpMove, 0))
+    DoI = pd.Series(np.where((DoMove > UpMove) & (DoMove > 0), DoMove, 0))
+    TR_s = pd.Series(_tr(df, ksgn))
+    ATR = TR_s.ewm(span=n, min_periods=n).mean()
+    PosDI = UpI.ewm(span=n, min_periods=n - 1).mean() / ATR
+    NegDI = DoI.ewm(span=n, min_periods=n - 1).mean() / ATR
+    ds = pd.Series((abs(PosDI - NegDI) / (PosDI + NegDI)).ewm(span=n_ADX, min_periods=n_ADX - 1).mean(), name=xnam)
     ds.index=df.index;df[xnam]=ds
     #df = df.join(ds)  
     return df
@@ -136,17 +135,13 @@ def ATR(df, n,ksgn='close'):
         增加了一栏：atr_{n}，输出数据
     '''    
     xnam='atr_{n}'.format(n=n)
-    i = 0
-    TR_l = [0]
-    while i < len(df) - 1:  # df.index[-1]:
-    # for i, idx in enumerate(df.index)
-        # TR=max(df.get_value(i + 1, 'High'), df.get_value(i, 'Close')) - min(df.get_value(i + 1, 'Low'), df.get_value(i, 'Close'))
-        #TR = max(df['High'].iloc[i + 1], df['Close'].iloc[i] - min(df['Low'].iloc[i + 1], df['Close'].iloc[i]))
-        TR = max(df['high'].iloc[i + 1], df[ksgn].iloc[i] - min(df['low'].iloc[i + 1], df[ksgn].iloc[i]))
-        TR_l.append(TR)
-        i = i + 1;#print('#',i,TR)
+    # 保持原有公式：max(high, 昨收 - min(low, 昨收))
+    high = df['high'].values
+    low = df['low'].values
+    close = df[ksgn].values
+    TR_l = np.concatenate(([0], np.maximum(high[1:], close[:-1] - np.minimum(low[1:], close[:-1]))))
     TR_s = pd.Series(TR_l)
-    ds = pd.Series(pd.ewma(TR_s, span=n, min_periods=n), name=xnam)
+    ds = pd.Series(TR_s.ewm(span=n, min_periods=n).mean(), name=xnam)
     #df = df.join(ds)  
     ds.index=df.index;df[xnam]=ds
     #print('ds',ds.head())
@@ -165,8 +160,8 @@ def BBANDS(df, n,ksgn='close'):
         增加了2栏：_{n}，_{n}b，输出数据
     '''    
     xnam='boll_{n}'.format(n=n)
-    MA = pd.Series(pd.rolling_mean(df[ksgn], n))  
-    MSD = pd.Series(pd.rolling_std(df[ksgn], n))  
+    MA = df[ksgn].rolling(n).mean()
+    MSD = df[ksgn].rolling(n).std()
     b1 = 4 * MSD / MA  
     B1 = pd.Series(b1, name = xnam+'b')  
     df = df.join(B1)  
@@ -192,8 +187,8 @@ def BBANDS_UpLow(df, n,ksgn='close'):
             boll_up，布林带上轨带差据
             boll_low，布林带下轨带差据
     '''        
-    df['boll_ma']=pd.Series(pd.rolling_mean(df[ksgn], n))  
-    df['boll_std']= pd.Series(pd.rolling_std(df[ksgn], n))  
+    df['boll_ma']=df[ksgn].rolling(n).mean()
+    df['boll_std']=df[ksgn].rolling(n).std()
     #df[#MSD = pd.Series(pd.rolling_std(df[ksgn], n))  
     MA=df['boll_ma']
     MSD=df['boll_std']
@@ -223,7 +218,7 @@ def CCI(df, n,ksgn='close'):
     '''
     xnam='cci_{d}'.format(d=n)
     PP = (df['high'] + df['low'] + df[ksgn]) / 3  
-    CCI = pd.Series((PP - pd.rolling_mean(PP, n)) / pd.rolling_std(PP, n), name = xnam)  
+    CCI = pd.Series((PP - PP.rolling(n).mean()) / PP.rolling(n).std(), name = xnam)  
     df = df.join(CCI)  
     
     return df
@@ -254,7 +249,7 @@ def COPP(df, n,ksgn='close'):
     M = df[ksgn].diff(int(n * 14 / 10) - 1)  
     N = df[ksgn].shift(int(n * 14 / 10) - 1)  
     ROC2 = M / N  
-    Copp = pd.Series(pd.ewma(ROC1 + ROC2, span = n, min_periods = n), name = xnam)  
+    Copp = pd.Series((ROC1 + ROC2).ewm(span = n, min_periods = n).mean(), name = xnam)  
     df = df.join(Copp)  
     return df
     
@@ -273,7 +268,7 @@ def CHAIKIN(df,ksgn='close'):
     '''
     xnam='ck'
     ad = (2 * df[ksgn] - df['high'] - df['low']) / (df['high'] - df['low']) * df['volume']  
-    Chaikin = pd.Series(pd.ewma(ad, span = 3, min_periods = 2) - pd.ewma(ad, span = 10, min_periods = 9), name = xnam)  
+    Chaikin = pd.Series(ad.ewm(span = 3, min_periods = 2).mean() - ad.ewm(span = 10, min_periods = 9).mean(), name = xnam)  
     df = df.join(Chaikin)  
     return df
     
@@ -295,24 +290,12 @@ def DONCH(df, n):
             donch__{n}，输出数据
     '''
     xnam='donch_{d}'.format(d=n)
-    i = 0  
-    DC_l = []  
-    while i < n - 1:  
-        DC_l.append(0)  
-        i = i + 1  
-    i = 0  
-    while (i + n - 1) <=(len(df) - 1):  #df.index[-1]:  
-        #DC = max(df['high'].ix[i:i + n - 1]) - min(df['low'].ix[i:i + n - 1])  
-        DC = max(df['high'].iloc[i:i + n - 1]) - min(df['low'].iloc[i:i + n - 1])  
-        DC_l.append(DC)  
-        i = i + 1  
-    #
-    #DC_l.append(DC)  
-    #
-    DonCh = pd.Series(DC_l, name = xnam)   #'Donchian_' + str(n)
+    # 第i行取之前n-1行（不含当前行）的最高价和最低价，前n-1行为0
+    m = n - 1
+    DonCh = df['high'].rolling(m).max().shift(1) - df['low'].rolling(m).min().shift(1)
+    DonCh.iloc[:m] = 0
+    DonCh.name = xnam   #'Donchian_' + str(n)
     
-    #df = df.join(DonCh)  
-    DonCh.index=df.index;
     df[xnam+'_sr']=DonCh
     df[xnam]=df[xnam+'_sr'].shift(n - 1)  
     #DonCh = DonCh.shift(n - 1)  
@@ -335,7 +318,7 @@ def EMA(df, n,ksgn='close'):
         增加了一栏：ema_{n}，输出数据
     '''
     xnam='ema_{n}'.format(n=n)
-    EMA = pd.Series(pd.ewma(df[ksgn], span = n, min_periods = n - 1), name = xnam)  
+    EMA = pd.Series(df[ksgn].ewm(span = n, min_periods = n - 1).mean(), name = xnam)  
     df = df.join(EMA)  
     return df    
    
@@ -361,7 +344,7 @@ def EOM(df, n):
     '''
     xnam='eom_{d}'.format(d=n)
     EoM = (df['high'].diff(1) + df['low'].diff(1)) * (df['high'] - df['low']) / (2 * df['volume'])  
-    Eom_ma = pd.Series(pd.rolling_mean(EoM, n), name = xnam)  
+    Eom_ma = pd.Series(EoM.rolling(n).mean(), name = xnam)  
     df = df.join(Eom_ma)  
     df['eom_x']=df[xnam]*10e10
     return df
@@ -409,9 +392,9 @@ def KELCH(df, n,ksgn='close'):
     xnam='kc_m'
     xnam2='kc_u'
     xnam3='kc_d'
-    KelChM = pd.Series(pd.rolling_mean((df['high'] + df['low'] + df[ksgn]) / 3, n), name = xnam)  #'KelChM_' + str(n)
-    KelChU = pd.Series(pd.rolling_mean((4 * df['high'] - 2 * df['low'] + df[ksgn]) / 3, n), name = xnam2)   #'KelChU_' + str(n)
-    KelChD = pd.Series(pd.rolling_mean((-2 * df['high'] + 4 * df['low'] + df[ksgn]) / 3, n), name =xnam3)    #'KelChD_' + str(n)
+    KelChM = pd.Series(((df['high'] + df['low'] + df[ksgn]) / 3).rolling(n).mean(), name = xnam)  #'KelChM_' + str(n)
+    KelChU = pd.Series(((4 * df['high'] - 2 * df['low'] + df[ksgn]) / 3).rolling(n).mean(), name = xnam2)   #'KelChU_' + str(n)
+    KelChD = pd.Series(((-2 * df['high'] + 4 * df['low'] + df[ksgn]) / 3).rolling(n).mean(), name =xnam3)    #'KelChD_' + str(n)
     df = df.join(KelChM)  
     df = df.join(KelChU)  
     df = df.join(KelChD)  
@@ -455,7 +438,7 @@ def KST(df, r1, r2, r3, r4, n1, n2, n3, n4,ksgn='close'):
     N = df[ksgn].shift(r4 - 1)  
     ROC4 = M / N  
     #'KST_' + str(r1) + '_' + str(r2) + '_' + str(r3) + '_' + str(r4) + '_' + str(n1) + '_' + str(n2) + '_' + str(n3) + '_' + str(n4)
-    KST = pd.Series(pd.rolling_sum(ROC1, n1) + pd.rolling_sum(ROC2, n2) * 2 + pd.rolling_sum(ROC3, n3) * 3 + pd.rolling_sum(ROC4, n4) * 4, name = xnam)  
+    KST = pd.Series(ROC1.rolling(n1).sum() + ROC2.rolling(n2).sum() * 2 + ROC3.rolling(n3).sum() * 3 + ROC4.rolling(n4).sum() * 4, name = xnam)  
     df = df.join(KST)  
     return df
 
@@ -527,10 +510,10 @@ def MACD(df, n_fast, n_slow,ksgn='close'):
     xnam='macd'.format(n=n_fast,n2=n_slow)
     xnam2='msign'.format(n=n_fast,n2=n_slow)
     xnam3='mdiff'.format(n=n_fast,n2=n_slow)
-    EMAfast = pd.Series(pd.ewma(df[ksgn], span = n_fast, min_periods = n_slow - 1))  
-    EMAslow = pd.Series(pd.ewma(df[ksgn], span = n_slow, min_periods = n_slow - 1))  
+    EMAfast = df[ksgn].ewm(span = n_fast, min_periods = n_slow - 1).mean()
+    EMAslow = df[ksgn].ewm(span = n_slow, min_periods = n_slow - 1).mean()
     MACD = pd.Series(EMAfast - EMAslow, name = xnam)  
-    MACDsign = pd.Series(pd.ewma(MACD, span = 9, min_periods = 8), name =xnam2)  
+    MACDsign = pd.Series(MACD.ewm(span = 9, min_periods = 8).mean(), name =xnam2)  
     MACDdiff = pd.Series(MACD - MACDsign, name =xnam3)  
     df = df.join(MACD)  
     df = df.join(MACDsign)  
@@ -558,22 +541,13 @@ def MFI(df, n,ksgn='close'):
     '''
     xnam='mfi_{d}'.format(d=n)
     PP = (df['high'] + df['low'] + df[ksgn]) / 3  
-    i = 0  
-    PosMF = [0]  
-    while i <(len(df) - 1): #df.index[-1]:  
-        if PP.iloc[i + 1] > PP.iloc[i]:  
-            #PosMF.append(PP[i + 1] * df.get_value(i + 1, 'volume'))  
-            PosMF.append(PP.iloc[i + 1] * df['volume'].iloc[i + 1])  
-        else:  
-            PosMF.append(0)  
-        i = i + 1  
-    #    
-    PosMF = pd.Series(PosMF)  
     TotMF = PP * df['volume']  
-    #MFR = pd.Series(PosMF / TotMF)  
-    PosMF.index=TotMF.index
+    # 典型价格上涨的行计入正向资金流
+    pp = PP.values
+    PosMF = np.concatenate(([0], np.where(pp[1:] > pp[:-1], TotMF.values[1:], 0)))
+    PosMF = pd.Series(PosMF, index=TotMF.index)
     MFR =PosMF / TotMF
-    MFI = pd.Series(pd.rolling_mean(MFR, n), name = xnam)  
+    MFI = pd.Series(MFR.rolling(n).mean(), name = xnam)  
     #df = df.join(MFI)  
     #MFI.index=df.index;
     df[xnam]=MFI
@@ -621,10 +595,10 @@ def MASS(df):
     '''
     xnam='mass'
     Range = df['high'] - df['low']  
-    EX1 = pd.ewma(Range, span = 9, min_periods = 8)  
-    EX2 = pd.ewma(EX1, span = 9, min_periods = 8)  
+    EX1 = Range.ewm(span = 9, min_periods = 8).mean()
+    EX2 = EX1.ewm(span = 9, min_periods = 8).mean()
     Mass = EX1 / EX2  
-    MassI = pd.Series(pd.rolling_sum(Mass, 25), name = xnam)  #'Mass Index'
+    MassI = pd.Series(Mass.rolling(25).sum(), name = xnam)  #'Mass Index'
     df = df.join(MassI)  
     return df    
     
@@ -649,22 +623,11 @@ def OBV(df, n,ksgn='close'):
         obv_x，放大10e6倍的输出数据
     '''
     xnam='obv_{d}'.format(d=n)
-    i = 0  
-    OBV = [0]  
-    while i <  len(df) - 1:  #df.index[-1]
-        #if df.get_value(i + 1, ksgn) - df.get_value(i, ksgn) > 0:  
-        if df[ksgn].iloc[i+1]-df[ksgn].iloc[i] > 0:  
-            #OBV.append(df.get_value(i + 1, 'Volume'))  
-            OBV.append(df['volume'].iloc[i + 1])  
-        if (df[ksgn].iloc[i+1]-df[ksgn].iloc[i]) == 0:  
-            OBV.append(0)  
-        if (df[ksgn].iloc[i+1]-df[ksgn].iloc[i]) < 0:  
-            OBV.append(-df['volume'].iloc[i + 1])  
-        i = i + 1  
-    OBV = pd.Series(OBV)  
-    OBV_ma = pd.Series(pd.rolling_mean(OBV, n), name = xnam)  
-    #df = df.join(OBV_ma)  
-    OBV_ma.index=df.index;
+    change = np.diff(df[ksgn].values)
+    volume = df['volume'].values[1:]
+    OBV = np.concatenate(([0], np.where(change > 0, volume, np.where(change < 0, -volume, 0))))
+    OBV = pd.Series(OBV, index=df.index)  
+    OBV_ma = pd.Series(OBV.rolling(n).mean(), name = xnam)  
     df[xnam]=OBV_ma
     df['obv_x']=df[xnam]/10e6
     return df
@@ -744,32 +707,11 @@ def RSI(df, n):
         增加了一栏：rsi_{n}，输出数据
     '''
     xnam='rsi_{n}'.format(n=n)
-    print( xnam)
-    i = 0
-    UpI = [0]
-    DoI = [0]
-    while i + 1 <= len(df) - 1:  # df.index[-1]
-        #UpMove = df.get_value(i + 1, 'high') - df.get_value(i, 'high')
-        #DoMove = df.get_value(i, 'low') - df.get_value(i + 1, 'low')
-        UpMove=df['high'].iloc[i+1]-df['high'].iloc[i]
-        DoMove=df['low'].iloc[i]-df['low'].iloc[i+1]
-
-        #Range=abs(df['high'].iloc[i+1]-df['low'].iloc[i])-abs(df['low'].iloc[i+1]-df['high'].iloc[i])
-        if UpMove > DoMove and UpMove > 0:
-            UpD = UpMove
-        else:
-            UpD = 0
-        UpI.append(UpD)
-        if DoMove > UpMove and DoMove > 0:
-            DoD = DoMove
-        else:
-            DoD = 0
-        DoI.append(DoD)
-        i = i + 1
-    UpI = pd.Series(UpI)
-    DoI = pd.Series(DoI)
-    PosDI = pd.Series(pd.ewma(UpI, span=n, min_periods=n - 1))
-    NegDI = pd.Series(pd.ewma(DoI, span=n, min_periods=n - 1))
+    UpMove, DoMove = _dm(df)
+    UpI = pd.Series(np.concatenate(([0], np.where((UpMove > DoMove) & (UpMove > 0), UpMove, 0))))
+    DoI = pd.Series(np.concatenate(([0], np.where((DoMove > UpMove) & (DoMove > 0), DoMove, 0))))
+    PosDI = UpI.ewm(span=n, min_periods=n - 1).mean()
+    NegDI = DoI.ewm(span=n, min_periods=n - 1).mean()
     ds = pd.Series(PosDI / (PosDI + NegDI), name=xnam)
     #df = df.join(ds)
     #print('rsi')
@@ -797,31 +739,11 @@ def RSI100(df, n):
           rsi_k，中间输出数据
     '''    
     xnam='rsi_{n}'.format(n=n)
-    i = 0
-    UpI = [0]
-    DoI = [0]
-    while i + 1 <= len(df) - 1:  # df.index[-1]
-        #UpMove = df.get_value(i + 1, 'high') - df.get_value(i, 'high')
-        #DoMove = df.get_value(i, 'low') - df.get_value(i + 1, 'low')
-        UpMove=df['high'].iloc[i+1]-df['high'].iloc[i];
-        DoMove=df['low'].iloc[i]-df['low'].iloc[i+1];
-        
-        #Range=abs(df['high'].iloc[i+1]-df['low'].iloc[i])-abs(df['low'].iloc[i+1]-df['high'].iloc[i])
-        if UpMove > DoMove and UpMove > 0:
-            UpD = UpMove
-        else:
-            UpD = 0
-        UpI.append(UpD)
-        if DoMove > UpMove and DoMove > 0:
-            DoD = DoMove
-        else:
-            DoD = 0
-        DoI.append(DoD)
-        i = i + 1
-    UpI = pd.Series(UpI)
-    DoI = pd.Series(DoI)
-    PosDI = pd.Series(pd.ewma(UpI, span=n, min_periods=n - 1))
-    NegDI = pd.Series(pd.ewma(DoI, span=n, min_periods=n - 1))
+    UpMove, DoMove = _dm(df)
+    UpI = pd.Series(np.concatenate(([0], np.where((UpMove > DoMove) & (UpMove > 0), UpMove, 0))))
+    DoI = pd.Series(np.concatenate(([0], np.where((DoMove > UpMove) & (DoMove > 0), DoMove, 0))))
+    PosDI = UpI.ewm(span=n, min_periods=n - 1).mean()
+    NegDI = DoI.ewm(span=n, min_periods=n - 1).mean()
     #ds = pd.Series(PosDI / (PosDI + NegDI))
     ds = pd.Series(PosDI / (PosDI + NegDI))
     ds.index=df.index
@@ -848,7 +770,7 @@ def STDDEV(df, n,ksgn='close'):
         增加了一栏：std_{n}，输出数据
     '''
     xnam='std_{d}'.format(d=n)
-    df = df.join(pd.Series(pd.rolling_std(df[ksgn], n), name =xnam))  
+    df = df.join(pd.Series(df[ksgn].rolling(n).std(), name =xnam))  
     return df      
     
     
@@ -875,7 +797,7 @@ def STOD(df, n,ksgn='close'):
     #xnam='stod'
     xnam='stod'
     SOk = pd.Series((df[ksgn] - df['low']) / (df['high'] - df['low']), name = 'stok')
-    SOd = pd.Series(pd.ewma(SOk, span = n, min_periods = n - 1), name = xnam)
+    SOd = pd.Series(SOk.ewm(span = n, min_periods = n - 1).mean(), name = xnam)
     df = df.join(SOk) 
     df = df.join(SOd) 
     df['stod']=df['stod']*100
@@ -921,18 +843,11 @@ def TRIX(df, n,ksgn='close'):
         增加了一栏：trix_{n}，输出数据
     '''
     xnam='trix_{n}'.format(n=n)
-    EX1 = pd.ewma(df[ksgn], span=n, min_periods=n - 1)
-    EX2 = pd.ewma(EX1, span=n, min_periods=n - 1)
-    EX3 = pd.ewma(EX2, span=n, min_periods=n - 1)
-    i = 0
-    ROC_l = [0]
-    while i + 1 <= len(df) - 1:  # df.index[-1]:
-        ROC = (EX3[i + 1] - EX3[i]) / EX3[i]
-        ROC_l.append(ROC)
-        i = i + 1
-    trix  = pd.Series(ROC_l, name=xnam)
-    #df = df.join(trix)     
-    trix.index=df.index;
+    EX1 = df[ksgn].ewm(span=n, min_periods=n - 1).mean()
+    EX2 = EX1.ewm(span=n, min_periods=n - 1).mean()
+    EX3 = EX2.ewm(span=n, min_periods=n - 1).mean().values
+    ROC_l = np.concatenate(([0], (EX3[1:] - EX3[:-1]) / EX3[:-1]))
+    trix  = pd.Series(ROC_l, index=df.index, name=xnam)
     df[xnam]=trix
      
     #print(trix.tail())
@@ -960,10 +875,10 @@ def TSI(df, r, s,ksgn='close'):
     xnam='tsi'.format(d=r,d2=s)
     M = pd.Series(df[ksgn].diff(1))  
     aM = abs(M)  
-    EMA1 = pd.Series(pd.ewma(M, span = r, min_periods = r - 1))  
-    aEMA1 = pd.Series(pd.ewma(aM, span = r, min_periods = r - 1))  
-    EMA2 = pd.Series(pd.ewma(EMA1, span = s, min_periods = s - 1))  
-    aEMA2 = pd.Series(pd.ewma(aEMA1, span = s, min_periods = s - 1))  
+    EMA1 = M.ewm(span = r, min_periods = r - 1).mean()
+    aEMA1 = aM.ewm(span = r, min_periods = r - 1).mean()
+    EMA2 = EMA1.ewm(span = s, min_periods = s - 1).mean()
+    aEMA2 = aEMA1.ewm(span = s, min_periods = s - 1).mean()
     TSI = pd.Series(EMA2 / aEMA2, name = xnam)  
     df = df.join(TSI)  
     
@@ -990,21 +905,12 @@ def ULTOSC(df,ksgn='close'):
         df, pd.dataframe格式数据源,
         增加了一栏：uos，输出数据
     '''
-    i = 0  
-    TR_l = [0]  
-    BP_l = [0]  
     xnam='uos'
-    while i <  len(df) - 1:   #df.index[-1]:  
-        #TR = max(df.get_value(i + 1, 'high'), df.get_value(i, 'close')) - min(df.get_value(i + 1, 'low'), df.get_value(i, 'close'))  
-        TR = max(df['high'].iloc[i+1],df[ksgn].iloc[i])-min(df['low'].iloc[i+1],df[ksgn].iloc[i])  
-        TR_l.append(TR)  
-        #BP = df.get_value(i + 1, 'close') - min(df.get_value(i + 1, 'low'), df.get_value(i, 'close'))  
-        BP =df[ksgn].iloc[i+1]-min(df['low'].iloc[i+1], df[ksgn].iloc[i])  
-        BP_l.append(BP)  
-        i = i + 1  
-    UltO = pd.Series((4 * pd.rolling_sum(pd.Series(BP_l), 7) / pd.rolling_sum(pd.Series(TR_l), 7)) + (2 * pd.rolling_sum(pd.Series(BP_l), 14) / pd.rolling_sum(pd.Series(TR_l), 14)) + (pd.rolling_sum(pd.Series(BP_l), 28) / pd.rolling_sum(pd.Series(TR_l), 28)), name =xnam)  # 'Ultimate_Osc'
-    #df = df.join(UltO)      
-    UltO.index=df.index;
+    low = df['low'].values
+    close = df[ksgn].values
+    TR_l = pd.Series(_tr(df, ksgn), index=df.index)
+    BP_l = pd.Series(np.concatenate(([0], close[1:] - np.minimum(low[1:], close[:-1]))), index=df.index)
+    UltO = pd.Series((4 * BP_l.rolling(7).sum() / TR_l.rolling(7).sum()) + (2 * BP_l.rolling(14).sum() / TR_l.rolling(14).sum()) + (BP_l.rolling(28).sum() / TR_l.rolling(28).sum()), name =xnam)  # 'Ultimate_Osc'
     df[xnam]=UltO
     return df
 
@@ -1026,24 +932,11 @@ def VORTEX(df, n):
         增加了一栏：vortex__{n}，输出数据
     '''
     xnam='vortex_{n}'.format(n=n)
-    i = 0
-    TR = [0]
-    while i < len(df) - 1:  # df.index[-1]:
-        #Range = max(df.get_value(i + 1, 'high'), df.get_value(i, 'close')) - min(df.get_value(i + 1, 'low'), df.get_value(i, 'close'))
-        Range=max(df['high'].iloc[i+1],df['close'].iloc[i])-min(df['low'].iloc[i+1],df['close'].iloc[i])
-        #TR = max(df['High'].iloc[i + 1], df['Close'].iloc[i] - min(df['Low'].iloc[i + 1], df['Close'].iloc[i]))
-        TR.append(Range)
-        i = i + 1
-    i = 0
-    VM = [0]
-    while i < len(df) - 1:  # df.index[-1]:
-        #Range = abs(df.get_value(i + 1, 'high') - df.get_value(i, 'low')) - abs(df.get_value(i + 1, 'low') - df.get_value(i, 'high'))
-        Range=abs(df['high'].iloc[i+1]-df['low'].iloc[i])-abs(df['low'].iloc[i+1]-df['high'].iloc[i])
-        VM.append(Range)
-        i = i + 1
-    ds = pd.Series(pd.rolling_sum(pd.Series(VM), n) / pd.rolling_sum(pd.Series(TR), n), name=xnam)
-    #df = df.join(ds)  
-    ds.index=df.index;
+    high = df['high'].values
+    low = df['low'].values
+    TR = pd.Series(_tr(df, 'close'), index=df.index)
+    VM = pd.Series(np.concatenate(([0], np.abs(high[1:] - low[:-1]) - np.abs(low[1:] - high[:-1]))), index=df.index)
+    ds = pd.Series(VM.rolling(n).sum() / TR.rolling(n).sum(), name=xnam)
     df[xnam]=ds
     
     return df
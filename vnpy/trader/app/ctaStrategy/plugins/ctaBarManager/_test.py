@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from vnpy.trader.vtObject import VtBarData
+from vnpy.trader.vtUtility import ArrayManager as BaseArrayManager
+from .arraymanager import ArrayManager
+
+
+def make_bars(count, start=datetime(2019, 1, 2, 9)):
+    bars = []
+    for i in range(count):
+        bar = VtBarData()
+        bar.datetime = start + timedelta(minutes=i)
+        bar.open = 100.0 + i
+        bar.high = 101.0 + i
+        bar.low = 99.0 + i
+        bar.close = 100.5 + i
+        bar.volume = 10.0 * i
+        bars.append(bar)
+    return bars
+
+
+def assert_same(am1, am2):
+    assert am1.count == am2.count, (am1.count, am2.count)
+    assert am1.inited == am2.inited
+    for name in am1.array.dtype.names:
+        assert np.array_equal(am1.array[name], am2.array[name]), (name, am1.array[name], am2.array[name])
+
+
+def test_update_bars(cls, size=10, batches=(3, 12, 1, 7, 0, 25)):
+    """updateBars分批写入的结果和逐根updateBar一致"""
+    bars = make_bars(sum(batches))
+    am1 = cls(size=size)
+    am2 = cls(size=size)
+    n = 0
+    for batch in batches:
+        chunk = bars[n:n + batch]
+        n += batch
+        for bar in chunk:
+            am1.updateBar(bar)
+        am2.updateBars(chunk)
+        assert_same(am1, am2)
+
+
+def test():
+    for cls in (BaseArrayManager, ArrayManager):
+        for size in (1, 5, 10, 30):
+            test_update_bars(cls, size)
+        print("%s.updateBars ok" % cls.__module__)
+
+
+if __name__ == "__main__":
+    test()
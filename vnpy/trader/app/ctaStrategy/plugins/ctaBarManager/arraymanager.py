@@ -25,6 +25,14 @@ class ArrayManager(OriginArrayManager):
             self.array['datetimeint'][0:self.size - 1] = self.array['datetimeint'][1:self.size]
             self.array['datetimeint'][-1] = dt2int(bar.datetime)
 
+    def updateArrays(self, datetimes, open, high, low, close, volume):
+        count = self.count
+        super(ArrayManager, self).updateArrays(datetimes, open, high, low, close, volume)
+        m = min(self.count - count, self.size)
+        if m:
+            # 基类已经整体移动了包含datetimeint的记录，这里只写入新数据
+            self.array['datetimeint'][-m:] = [dt2int(dt) for dt in datetimes[-m:]]
+
     @property
     def datetimeint(self):
         return self.array['datetimeint']
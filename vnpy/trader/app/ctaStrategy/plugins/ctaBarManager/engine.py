@@ -1,4 +1,7 @@
+import threading
+
 from vnpy.trader.vtConstant import VN_SEPARATOR
+from vnpy.trader.vtGlobal import globalSetting
 from vnpy.trader.utils.datetime import freq2seconds
 
 from .manager import BarManagerPlugin, BarManager
@@ -14,11 +17,18 @@ class CtaEngine(CtaEngineWithPlugins):
         super(CtaEngine, self).__init__(mainEngine, eventEngine)
         self.addPlugin(BarManagerPlugin())
         self._barReaders = {}
+        self._barReaderLock = threading.Lock()
 
     def getBarReader(self, gatewayName):
-        if gatewayName not in self._barReaders:
-            self._barReaders[gatewayName] = BarReader.new(self.getGateway(gatewayName))
-        return self._barReaders[gatewayName]
+        # 初始化时多个线程同时请求历史数据，每个接口只能创建一个BarReader以共享缓存
+        with self._barReaderLock:
+            if gatewayName not in self._barReaders:
+                self._barReaders[gatewayName] = BarReader.new(
+                    self.getGateway(gatewayName),
+                    cache_size=globalSetting.get("barCacheSize", BarReader.CACHE_SIZE),
+                    persist=globalSetting.get("barCachePersist", False)
+                )
+            return self._barReaders[gatewayName]
 
     def getBarReaderBySymbol(self, symbol):
         _, gatewayName = symbol.split(VN_SEPARATOR)
@@ -26,7 +36,9 @@ class CtaEngine(CtaEngineWithPlugins):
 
     def registerOnBar(self, symbol, freq, func):
         p = self.getPlugin(BarManagerPlugin)
-        return p.manager.register(symbol, freq, func)
+        result = p.manager.register(symbol, freq, func)
+        p.refresh()
+        return result
     
     def getArrayManager(self, symbol, freq="1m"):
         p = self.getPlugin(BarManagerPlugin)
@@ -36,6 +48,13 @@ class CtaEngine(CtaEngineWithPlugins):
         p = self.getPlugin(BarManagerPlugin)
         return p.manager.set_size(size)
 
+    def initAll(self):
+        # 先并发请求所有品种和周期的历史K线，预热BarReader的缓存
+        p = self.getPlugin(BarManagerPlugin)
+        with self.historyLoader.session():
+            p.manager.prefetch_history(self.historyLoader, self.initWorkers)
+            super(CtaEngine, self).initAll()
+
     def loadStrategy(self, setting):
         super(CtaEngine, self).loadStrategy(setting)
         p = self.getPlugin(BarManagerPlugin)
@@ -46,6 +65,7 @@ class CtaEngine(CtaEngineWithPlugins):
             return
         if isinstance(strategy, CtaTemplate):
             p.manager.register_strategy(strategy)
+            p.refresh()
 
 
 class CtaTemplate(CtaTemplateWithPlugins):
@@ -17,6 +17,7 @@ from vnpy.trader.utils import LoggerMixin
 from vnpy.trader.vtConstant import VN_SEPARATOR
 from vnpy.trader.utils.datetime import *
 from vnpy.trader.utils.datetime import _freq_re_str
+from vnpy.trader.utils.canlendar import get_calendar
 
 from .arraymanager import ArrayManager
 from .utils import BarTimer, BarUtilsMixin
@@ -29,12 +30,14 @@ logger = LoggerMixin()
 
 class SymbolBarManager(LoggerMixin, BarUtilsMixin):
     default_size = 100
+    use_calendar = True # align bars with trading sessions of the symbol when its calendar is known.
 
     def __init__(self, parent, symbol, size=None):
         LoggerMixin.__init__(self)
         BarUtilsMixin.__init__(self)
         self._parent = proxy(parent)
         self._symbol = symbol
+        self._calendar = get_calendar(symbol) if self.use_calendar else None
         self._callback = {}
         self._high_freqs = OrderedDict() # higher frequencys than 1min(contains 1min).
         self._low_freqs = OrderedDict() # lower frequencys than 1min(contains 1min).
@@ -76,10 +79,19 @@ class SymbolBarManager(LoggerMixin, BarUtilsMixin):
                 self._low_freqs[freq] = True
         if func is not None:
             self._callback[freq].append(func)
-        self._bar_timers[freq] = BarTimer(freq)
+        self._bar_timers[freq] = BarTimer(freq, calendar=self._calendar)
     
     def is_backtesting(self):
         return self._parent.is_backtesting()
+
+    def align_datetime(self, dt, freq):
+        if self._calendar is not None:
+            return self._calendar.align(dt, freq)
+        return align_datetime(dt, freq)
+
+    @property
+    def calendar(self):
+        return self._calendar
     
     def fetch_hist_bars(self, freq):
         # In backtesting, get hist bars only once.
@@ -124,8 +136,7 @@ class SymbolBarManager(LoggerMixin, BarUtilsMixin):
             return
         self._ready.add(freq)
         am = self.get_array_manager(freq)
-        for bar in self._gen_bars.get(freq, []):
-            am.updateBar(bar)
+        am.updateBars(self._gen_bars.get(freq, []))
         self.info("品种%s的无可用历史%sK线,更新关闭", self._symbol, freq)
 
     def update_hist_bars(self, freq, bars, end_dt):
@@ -155,8 +166,7 @@ class SymbolBarManager(LoggerMixin, BarUtilsMixin):
         # self.debug("-" * 100)
         if not new_bars:
             return
-        for bar in new_bars:
-            am.updateBar(bar)
+        am.updateBars(new_bars)
         self.info(
             "品种%s的历史%sK线更新，范围为:[%s , %s]",
             self._symbol,
@@ -213,8 +223,7 @@ class SymbolBarManager(LoggerMixin, BarUtilsMixin):
         #         self.error("品种%s的%sK线无法拼接成功" % (self._symbol, freq))
         #         self._ready.remove(freq)
         self._ready.add(freq)
-        for bar in gen_bars:
-            am.updateBar(bar)
+        am.updateBars(gen_bars)
         self._hist_bars.pop(freq, None) # clear cached history bar
         # self._gen_bars[freq] = gen_bars
         self.info("品种%s的%sK线准备就绪,当前K线时间为%s", self._symbol, freq, am.datetimeint[-1])
@@ -460,6 +469,23 @@ class BarManager(object):
             return None
         dtstart = parse(self._engine.startDate)
         unit_s = freq2seconds(freq)
+        end = dtstart + timedelta(days=2, seconds=unit_s) # fetch one unit time more forward, plus two day to skip weekends.
+        bars = []
+        for start in self._history_starts(manager, dtstart, freq, size):
+            bars, end_dt = self._resample_history(manager, symbol, freq, start, end, dtstart)
+            if len(bars) >= size:
+                break
+        assert len(bars) >= size, "%s历史%sK线数据长度不足，%s不足所需要的%s条" % (symbol, freq, len(bars), size)
+        return bars, end_dt
+
+    def _history_starts(self, manager, dtstart, freq, size):
+        """Yield start time of history window, the exact one counted by trading calendar first."""
+        calendar_start = None
+        if manager.calendar is not None:
+            # the first bar will be skipped as it may be incomplete, and the last one may be unfinished.
+            calendar_start = manager.calendar.shift(dtstart, freq, -(size + 1))
+            yield calendar_start
+        unit_s = freq2seconds(freq)
         # NOTE: consider most contract is traded in business day, get #1 multiper: 7/5 ~= 1.4,
         # and some contract only be traded 4 hours in a day, get #2 multiper: 24 / 4 = 6,
         # then get #1 * #2 ~= 9
@@ -468,7 +494,12 @@ class BarManager(object):
         else:
             delta = unit_s * size * 9
         start = dtstart - timedelta(seconds=delta)
-        end = dtstart + timedelta(days=2, seconds=unit_s) # fetch one unit time more forward, plus two day to skip weekends.
+        if calendar_start is not None and start >= calendar_start:
+            # holidays are not in calendar, double the window.
+            start = calendar_start - (dtstart - calendar_start)
+        yield start
+
+    def _resample_history(self, manager, symbol, freq, start, end, dtstart):
         cache = self._caches[symbol]
         bars_1min = cache.fetch(start, end)
         dts_1min = [bar.datetime for bar in bars_1min]
@@ -493,7 +524,6 @@ class BarManager(object):
                         else:
                             bar_current = manager.merge_bar_with_bar(bar_current, bar)
             bars.append(bar_current)
-        assert len(bars) >= size, "%s历史%sK线数据长度不足，%s不足所需要的%s条" % (symbol, freq, len(bars), size)
         return bars, end_dt
 
     def load_history_bar(self, symbol, freq, size):
@@ -516,6 +546,29 @@ class BarManager(object):
             end_dt = bars[-1].datetime + timedelta(seconds=unit_s)
             return bars, end_dt
 
+    def prefetch_history(self, loader, workers):
+        """Fetch history bars of all registered symbols and freqs concurrently to warm up bar readers' cache,
+        so that fetch_hist_bars in event thread only need to fetch the latest bars."""
+        if self.is_backtesting():
+            return
+        tasks = []
+        for symbol, manager in self._managers.items():
+            size = manager._size + 1
+            for freq in manager._low_freqs:
+                tasks.append((symbol, freq, size))
+
+        def prefetch(task):
+            symbol, freq, size = task
+            gateway_name = symbol.split(VN_SEPARATOR)[-1]
+            try:
+                t_start = time.time()
+                loader.load(task, gateway_name, self.load_history_bar, symbol, freq, size)
+                logger.debug("预加载%s的%sK线数据%s根，耗时%s秒", symbol, freq, size, time.time() - t_start)
+            except Exception:
+                logger.warn("预加载%s的历史%sK线失败，将在生成K线时重新获取,失败原因:\n%s", symbol, freq, traceback.format_exc())
+
+        loader.map(prefetch, tasks, workers)
+
     def get_array_manager(self, symbol, freq="1m"):
         manager = self._managers[symbol]
         return manager.get_array_manager(freq)
@@ -545,6 +598,20 @@ class BarManager(object):
             return func(obj, bar, *args, **kwargs)
         return wrapper
 
+    def strategy_callback(self, strategy, func):
+        """实盘中K线回调经由引擎的callStrategyFunc执行，进行耗时统计、抽样分析和异常处理"""
+        call = getattr(self._engine, "callStrategyFunc", None)
+        if call is None:  # backtesting
+            return partial(func, strategy)
+
+        @wraps(func)
+        def method(bar):
+            return func(strategy, bar)
+
+        def callback(bar):
+            call(strategy, method, bar)
+        return callback
+
     def register_strategy(self, strategy):
         symbols = strategy.symbolList
         for vtSymbol in symbols:
@@ -565,7 +632,7 @@ class BarManager(object):
             m = _on_bar_re.match(k)
             if m is not None:
                 freq = m.group(1) + m.group(2)
-                func = partial(self.must_in_trading(v), strategy)
+                func = self.strategy_callback(strategy, self.must_in_trading(v))
                 for vtSymbol in symbols:
                     to_register.append((vtSymbol, freq, func))
         to_register = sorted(to_register, key=lambda x: freq2seconds(standardize_freq(x[1])), reverse=True)
@@ -582,6 +649,10 @@ class BarManagerPlugin(CtaEnginePlugin):
         super(BarManagerPlugin, self).register(engine)
         self.manager = BarManager(engine)
 
+    def acceptSymbol(self, vtSymbol):
+        # only ticks of symbols with bar managers are routed here, call refresh() after adding symbols
+        return vtSymbol in self.manager._managers
+
     def postTickEvent(self, event):
         tick = event.dict_["data"]
         self.manager.on_tick(tick)
@@ -80,10 +80,13 @@ class BarUtilsMixin(object):
 class BarTimer(object):
     """对于常用的freq成立，必须保证上一级单位的换算系数被freq的乘数整除。
     比如对于m，换算系数为1h=60m，12m，4m，5m，6m这种是可用的，但7m这种是不可用的。
+    提供交易时段日历calendar时按日历对齐：休息和收盘时刻的数据归入之前的K线，
+    集合竞价的数据归入开盘后的第一根K线，日线和周线按交易日划分。
     """
 
-    def __init__(self, freq, offset=0):
+    def __init__(self, freq, offset=0, calendar=None):
         self._freq = freq
+        self._calendar = calendar
         self._offset = timedelta(seconds=offset) if offset else None
         self._freq_mul, self._freq_unit = split_freq(freq) # frequency unit and multiplier
         self._freq_seconds = freq2seconds(freq)
@@ -108,12 +111,18 @@ class BarTimer(object):
         return dt.replace(day=dt.day // self._freq_mul * self._freq_mul)
 
     def _get_current_dt(self, dt):
-        return self.align_datetime(dt, self._freq)
+        return align_datetime(dt, self._freq)
+
+    def _get_current_dt_calendar(self, dt):
+        return self._calendar.align(dt, self._freq)
 
     def get_current_dt(self, dt):
         """Get the current time"""
         if not self._f_get_current_dt:
-            self._f_get_current_dt = getattr(self, "_get_current_dt_" + self._freq_unit, self._get_current_dt)
+            if self._calendar is not None:
+                self._f_get_current_dt = self._get_current_dt_calendar
+            else:
+                self._f_get_current_dt = getattr(self, "_get_current_dt_" + self._freq_unit, self._get_current_dt)
         return self._f_get_current_dt(dt)
     
     def _is_new_bar_s(self, bar_dt, dt):
@@ -1,6 +1,7 @@
 import time
-import pandas as pd
+from collections import OrderedDict
 
+from vnpy.event.eventTrace import tracer
 from vnpy.trader.vtConstant import VN_SEPARATOR
 from vnpy.trader.vtEvent import EVENT_TIMER
 from vnpy.trader.vtConstant import *
@@ -9,6 +10,12 @@ from .base import MetricAggregator, register_aggregator, OpenFalconMetricCounter
 
 
 class StrategySplitedAggregator(MetricAggregator):
+    def __init__(self, plugin):
+        super(StrategySplitedAggregator, self).__init__(plugin)
+        self._symbolStrategies = {}
+        self._gatewayStrategies = {}
+        self._strategyCount = -1
+
     @property
     def strategys(self):
         return self.engine.strategyDict
@@ -19,6 +26,27 @@ class StrategySplitedAggregator(MetricAggregator):
     def getVtSymbols(self, strategy):
         return strategy.symbolList
 
+    def _updateIndex(self):
+        # symbolList of a strategy is fixed once loaded, so only rebuild when strategies are added.
+        if len(self.strategys) == self._strategyCount:
+            return
+        self._symbolStrategies = {}
+        self._gatewayStrategies = {}
+        for name, strategy in self.strategys.items():
+            for vtSymbol in set(self.getVtSymbols(strategy)):
+                self._symbolStrategies.setdefault(vtSymbol, []).append(name)
+            for gateway in set(self.getGateways(strategy)):
+                self._gatewayStrategies.setdefault(gateway, []).append(name)
+        self._strategyCount = len(self.strategys)
+
+    def getStrategiesBySymbol(self, vtSymbol):
+        self._updateIndex()
+        return self._symbolStrategies.get(vtSymbol, [])
+
+    def getStrategiesByGateway(self, gateway):
+        self._updateIndex()
+        return self._gatewayStrategies.get(gateway, [])
+
 
 @register_aggregator
 class BaseStrategyAggregator(StrategySplitedAggregator):
@@ -53,78 +81,23 @@ class BaseStrategyAggregator(StrategySplitedAggregator):
 
 @register_aggregator
 class PositionAggregator(StrategySplitedAggregator):
-    def __init__(self, plugin):
-        super(PositionAggregator, self).__init__(plugin)
-        self._positions = {}
-
-    def aggregatePositionEvents(self, data):
-        if not data.empty:
-            for name, strategy in self.strategys.items():
-                symbols = set(self.getVtSymbols(strategy))
-                sub = data.loc[data.vtSymbol.apply(lambda x: x in symbols)]
-                if sub.empty:
-                    continue
-                if name in self._positions:
-                    self._positions[name] = self._positions[name].append(sub).groupby("vtPositionName").last()
-                else:
-                    self._positions[name] = sub.groupby("vtPositionName").last()
-
-    def getMetrics(self):
+    def onPositionEvent(self, position):
         metric = "position.volume"
-        for strategy_name, positions in self._positions.items():
-            if positions.empty:
-                continue
-            for _, dct in positions.to_dict("index").items():
-                tags = "strategy={},gateway={},symbol={},direction={}".format(
-                strategy_name, dct["gatewayName"], dct["symbol"], dct["direction"])
-                self.plugin.addMetric(dct["position"], metric, tags, strategy=strategy_name)
+        for strategy_name in self.getStrategiesBySymbol(position.vtSymbol):
+            tags = "strategy={},gateway={},symbol={},direction={}".format(
+                strategy_name, position.gatewayName, position.symbol, position.direction)
+            self.setValue(position.position, metric, tags, strategy=strategy_name)
 
 
 @register_aggregator
 class TradeAggregator(StrategySplitedAggregator):
-    def __init__(self, plugin):
-        super(TradeAggregator, self).__init__(plugin)
-        self._counts = {}
-        self._volumes = {}
-
-    @staticmethod
-    def series_sum(s1, s2):
-        return pd.concat([s1, s2], axis=1).fillna(0).sum(axis=1)
-
-    def aggregateTradeEvents(self, data):
-        if not data.empty:
-            data["gatewayName"] = data["vtSymbol"].apply(lambda x: x.split(VN_SEPARATOR)[-1])
-            for name, strategy in self.strategys.items():
-                symbols = set(self.getVtSymbols(strategy))
-                sub = data.loc[data.vtSymbol.apply(lambda x: x in symbols)]
-                counts = sub.groupby(["gatewayName", 'symbol']).volume.count()
-                volumes = sub.groupby(["gatewayName", 'symbol']).volume.sum()
-                if name in self._counts:
-                    self._counts[name] = self.series_sum(self._counts[name], counts)
-                else:
-                    self._counts[name] = counts
-                if name in self._volumes:
-                    self._volumes[name] = self.series_sum(self._volumes[name], volumes)
-                else:
-                    self._volumes[name] = volumes
-
-    def getMetrics(self):
-        # count
-        metric = "trade.count"
-        for strategy_name, counts in self._counts.items():
-            for k, v in counts.iteritems():
-                gateway, symbol = k
-                tags = "strategy={},gateway={},symbol={}".format(
-                    strategy_name, gateway, symbol)
-                self.plugin.addMetric(v, metric, tags, strategy=strategy_name)
-        # volume
-        metric = "trade.volume"
-        for strategy_name, volumes in self._volumes.items():
-            for k, v in volumes.iteritems():
-                gateway, symbol = k
-                tags = "strategy={},gateway={},symbol={}".format(
-                    strategy_name, gateway, symbol)
-                self.plugin.addMetric(v, metric, tags, strategy=strategy_name)
+    def onTradeEvent(self, trade):
+        gateway = trade.vtSymbol.split(VN_SEPARATOR)[-1]
+        for strategy_name in self.getStrategiesBySymbol(trade.vtSymbol):
+            tags = "strategy={},gateway={},symbol={}".format(
+                strategy_name, gateway, trade.symbol)
+            self.incValue(1, "trade.count", tags, strategy=strategy_name)
+            self.incValue(trade.volume, "trade.volume", tags, strategy=strategy_name)
 
 _order_status_map_status = {
     STATUS_NOTTRADED: 0,
@@ -148,130 +121,101 @@ def issolidorder(status):
 
 @register_aggregator
 class OrderAggregator(StrategySplitedAggregator):
+    MAX_SOLID_ORDERS = 100000
+
     def __init__(self, plugin):
         super(OrderAggregator, self).__init__(plugin)
-        self._counts = {}
-        self._volumes = {}
-        self._solid_orders = {}
-        self._active_orders = {}
-
-    @staticmethod
-    def series_sum(s1, s2):
-        return pd.concat([s1, s2], axis=1).fillna(0).sum(axis=1)
-
-    def merge_orders(self, df):
-        if df.empty:
-            return df
-        return df.loc[df.groupby("vtOrderID").apply(lambda x: x["statusint"].idxmax()).values]
-
-    # 将消失的活动订单count和volume的value清零
-    def reset_active_orders(self, data, metric, strategy_name):
-        data = data.reset_index().set_index(['gatewayName', 'symbol'])
-        for k, v in data.groupby(level=['gatewayName', 'symbol']).status:
-            for status in _activate_set - set(v.tolist()):
-                gateway, symbol = k
-                tags = "strategy={},gateway={},symbol={},status={}".format(
-                    strategy_name, gateway, symbol, status)
-                self.plugin.addMetric(0, metric, tags, strategy=strategy_name)
-
-    def aggregateOrderEvents(self, data):
-        if not data.empty:
-            data["statusint"] = data["status"].apply(lambda x: orderstatus2int(x))
-            data["gatewayName"] = data["vtSymbol"].apply(lambda x: x.split(VN_SEPARATOR)[-1])
-            for name, strategy in self.strategys.items():
-                # filter order belong to this strategy
-                symbols = self.getVtSymbols(strategy)
-                sub = data.loc[data.vtSymbol.apply(lambda x: x in symbols)]
-                # get final status of order
-                sub = self.merge_orders(sub)
-                # drop previous solid order to drop some misordered status
-                if name in self._solid_orders:
-                    previous_solid = set(self._solid_orders[name]["vtOrderID"].tolist())
-                else:
-                    previous_solid = set()
-                sub = sub.loc[sub["vtOrderID"].apply(lambda x: x not in previous_solid)]
-                # handle solid
-                solid_mask = sub["status"].apply(lambda x: issolidorder(x))
-                solid = sub.loc[solid_mask]
-                counts = solid.groupby(["status", "gatewayName", "symbol"])["totalVolume"].count()
-                volumes = solid.groupby(["status", "gatewayName", "symbol"])["totalVolume"].sum()
-                if name in self._counts:
-                    self._counts[name] = self.series_sum(self._counts[name], counts)
-                else:
-                    self._counts[name] = counts
-                if name in self._volumes:
-                    self._volumes[name] = self.series_sum(self._volumes[name], volumes)
-                else:
-                    self._volumes[name] = volumes
-                if name in self._solid_orders:
-                    self._solid_orders[name] = self._solid_orders[name].append(solid, ignore_index=True)
-                else:
-                    self._solid_orders[name] = solid
-                self._solid_orders[name] = self._solid_orders[name].iloc[-100000:] # only store last 10000 solid orders.
-                # handle active
-                active = sub.loc[~solid_mask]
-                if name in self._active_orders:
-                    temp = self._active_orders[name]
-                    current_solid = set(self._solid_orders[name]["vtOrderID"].tolist())
-                    temp = temp[temp["vtOrderID"].apply(lambda x: x not in current_solid)]
-                    self._active_orders[name] = temp.append(active, ignore_index=True)
-                else:
-                    self._active_orders[name] = active
-                self._active_orders[name] = self.merge_orders(self._active_orders[name])
+        self._active_orders = {}  # (strategy, vtOrderID): (statusint, status, volume)
+        self._solid_orders = OrderedDict()  # (strategy, vtOrderID): None, to drop misordered status
+        self._groups = set()  # (strategy, gateway, symbol)
+
+    def _tags(self, strategy_name, gateway, symbol, status):
+        return "strategy={},gateway={},symbol={},status={}".format(
+            strategy_name, gateway, symbol, status)
+
+    def _addGroup(self, strategy_name, gateway, symbol):
+        # report zero for active status never seen, so alarms on active orders recover
+        group = (strategy_name, gateway, symbol)
+        if group in self._groups:
+            return
+        self._groups.add(group)
+        for status in _activate_set:
+            tags = self._tags(strategy_name, gateway, symbol, status)
+            self.incValue(0, "order.count", tags, strategy=strategy_name)
+            self.incValue(0, "order.volume", tags, strategy=strategy_name)
+
+    def _count(self, strategy_name, gateway, symbol, status, volume, sign):
+        tags = self._tags(strategy_name, gateway, symbol, status)
+        self.incValue(sign, "order.count", tags, strategy=strategy_name)
+        self.incValue(sign * volume, "order.volume", tags, strategy=strategy_name)
+
+    def onOrderEvent(self, order):
+        gateway = order.vtSymbol.split(VN_SEPARATOR)[-1]
+        statusint = orderstatus2int(order.status)
+        solid = issolidorder(order.status)
+
+        for strategy_name in self.getStrategiesBySymbol(order.vtSymbol):
+            key = (strategy_name, order.vtOrderID)
+            if key in self._solid_orders:
+                continue
+            self._addGroup(strategy_name, gateway, order.symbol)
 
-    def getMetrics(self):
-        active_counts = {k: v.groupby(["status", "gatewayName", "symbol"])["totalVolume"].count() for k, v in self._active_orders.items()}
-        active_volumes = {k: v.groupby(["status", "gatewayName", "symbol"])["totalVolume"].sum() for k, v in self._active_orders.items()}
-        metric = "order.count"
-        for strategy_name, counts in self._counts.items():
-            if strategy_name in active_counts:
-                counts = self.series_sum(counts, active_counts[strategy_name])
-            for k, v in counts.iteritems():
-                status, gateway, symbol = k
-                tags = "strategy={},gateway={},symbol={},status={}".format(
-                    strategy_name, gateway, symbol, status)
-                self.plugin.addMetric(v, metric, tags, strategy=strategy_name)
-
-            self.reset_active_orders(counts, metric, strategy_name)
-
-        metric = "order.volume"
-        for strategy_name, volumes in self._volumes.items():
-            if strategy_name in active_volumes:
-                volumes = self.series_sum(volumes, active_volumes[strategy_name])
-            for k, v in volumes.iteritems():
-                status, gateway, symbol = k
-                tags = "strategy={},gateway={},symbol={},status={}".format(
-                    strategy_name, gateway, symbol, status)
-                self.plugin.addMetric(v, metric, tags, strategy=strategy_name)
-
-            self.reset_active_orders(volumes, metric, strategy_name)
+            # keep the final status of order, same as the max status
+            previous = self._active_orders.get(key, None)
+            if previous:
+                if previous[0] >= statusint:
+                    continue
+                self._count(strategy_name, gateway, order.symbol, previous[1], previous[2], -1)
+
+            self._count(strategy_name, gateway, order.symbol, order.status, order.totalVolume, 1)
+
+            if solid:
+                self._active_orders.pop(key, None)
+                self._solid_orders[key] = None
+                if len(self._solid_orders) > self.MAX_SOLID_ORDERS:
+                    self._solid_orders.popitem(last=False)
+            else:
+                self._active_orders[key] = (statusint, order.status, order.totalVolume)
 
 
 @register_aggregator
 class AccountAggregator(StrategySplitedAggregator):
-    def __init__(self, plugin):
-        super(AccountAggregator, self).__init__(plugin)
-        self._accounts = {}
-
-    def aggregateAccountEvents(self, data):
-        if not data.empty:
-            for name, strategy in self.strategys.items():
-                gateways = set(self.getGateways(strategy))
-                mask = data.gatewayName.apply(lambda x: x in gateways)
-                if name in self._accounts:
-                    self._accounts[name] = self._accounts[name].append(data[mask]).groupby("vtAccountID").last()
-                else:
-                    self._accounts[name] = data[mask].groupby("vtAccountID").last()
+    def onAccountEvent(self, account):
+        for strategy_name in self.getStrategiesByGateway(account.gatewayName):
+            tags = "strategy={},gateway={},account={}".format(
+                strategy_name, account.gatewayName, account.accountID)
+            self.setValue(account.balance, "account.balance", tags, strategy=strategy_name)
+            if account.preBalance:
+                pnl = (account.balance - account.preBalance) / account.preBalance
+                self.setValue(pnl, "account.intraday_pnl_ratio", tags, strategy=strategy_name)
+
+
+@register_aggregator
+class LatencyTraceAggregator(MetricAggregator):
+    """Push tick-to-order latency of sampled ticks, histograms are reset on every push."""
 
     def getMetrics(self):
-        for strategy_name, accounts in self._accounts.items():
-            for _, dct in accounts.to_dict("index").items():
-                tags = "strategy={},gateway={},account={}".format(
-                    strategy_name, dct["gatewayName"], dct["accountID"])
-                metric = "account.balance"
-                self.plugin.addMetric(dct['balance'], metric, tags, strategy=strategy_name)
-                metric = "account.intraday_pnl_ratio"
-                if dct["preBalance"]:
-                    pnl = (dct["balance"] - dct["preBalance"]) / dct["preBalance"]
-                    self.plugin.addMetric(pnl, metric, tags, strategy=strategy_name)
+        if not tracer.active:
+            return
+        for name, summary in tracer.getSnapshot(reset=True).items():
+            tags = "stage={}".format(name)
+            for key, value in summary.items():
+                if key == "count":
+                    self.setValue(value, "latency.count", tags)
+                else:
+                    # nanoseconds to microseconds
+                    self.setValue(value / 1000.0, "latency.{}_us".format(key), tags)
 
+
+@register_aggregator
+class StrategyPerfAggregator(MetricAggregator):
+    """Push wall/cpu time of strategy callbacks, see CtaEngine.setStrategyPerf."""
+
+    def getMetrics(self):
+        if not getattr(self.engine, "perfActive", False):
+            return
+        for name, funcDict in self.engine.getStrategyPerf().items():
+            for funcName, summary in funcDict.items():
+                tags = "strategy={},callback={}".format(name, funcName)
+                for key, value in summary.items():
+                    self.setValue(value, "strategy.perf.{}".format(key), tags, strategy=name)
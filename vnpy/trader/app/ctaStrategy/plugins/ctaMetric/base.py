@@ -7,8 +7,10 @@ import requests
 import json
 import copy
 import os
+import threading
 from collections import defaultdict
 from enum import Enum
+from queue import Queue, Empty, Full
 
 import numpy as np
 import pandas as pd
@@ -98,7 +100,10 @@ class MetricAggregator(object):
 
         self._plugin = plugin
         self._aggregate_funcs = {}
+        self._values = {}  # (metric, tags, strategy): value
+        self._dirty = set()  # keys changed since last push
         self._get_aggregate_funcs()
+        self._get_event_handlers()
         self._plugin.addMetricFunc(self.addMetrics)
 
     @property
@@ -116,12 +121,26 @@ class MetricAggregator(object):
     def _get_aggregate_funcs(self):
         if self.aggregatePositionEvents != types.MethodType(MetricAggregator.aggregatePositionEvents, self):
             self.addAggregateFuncs(self.aggregatePositionEvents, self._plugin.getPositionEvents)
+            self._plugin.bufferEvents("position")
         if self.aggregateAccountEvents != types.MethodType(MetricAggregator.aggregateAccountEvents, self):
             self.addAggregateFuncs(self.aggregateAccountEvents, self._plugin.getAccountEvents)
+            self._plugin.bufferEvents("account")
         if self.aggregateOrderEvents != types.MethodType(MetricAggregator.aggregateOrderEvents, self):
             self.addAggregateFuncs(self.aggregateOrderEvents, self._plugin.getOrderEvents)
+            self._plugin.bufferEvents("order")
         if self.aggregateTradeEvents != types.MethodType(MetricAggregator.aggregateTradeEvents, self):
             self.addAggregateFuncs(self.aggregateTradeEvents, self._plugin.getTradeEvents)
+            self._plugin.bufferEvents("trade")
+
+    def _get_event_handlers(self):
+        if self.onPositionEvent != types.MethodType(MetricAggregator.onPositionEvent, self):
+            self._plugin.addEventHandler("position", self.onPositionEvent)
+        if self.onAccountEvent != types.MethodType(MetricAggregator.onAccountEvent, self):
+            self._plugin.addEventHandler("account", self.onAccountEvent)
+        if self.onOrderEvent != types.MethodType(MetricAggregator.onOrderEvent, self):
+            self._plugin.addEventHandler("order", self.onOrderEvent)
+        if self.onTradeEvent != types.MethodType(MetricAggregator.onTradeEvent, self):
+            self._plugin.addEventHandler("trade", self.onTradeEvent)
 
     def addMetrics(self):
         # do aggregate
@@ -132,6 +151,29 @@ class MetricAggregator(object):
         # add metric after aggregation
         metrics = self.getMetrics() or []
         self._plugin.addMetrics(metrics)
+        # add values maintained incrementally
+        self.flushValues(self._plugin.isFullPush())
+
+    def setValue(self, value, metric, tags, strategy=None):
+        """Set a metric value, it will be pushed only if changed."""
+        key = (metric, tags, strategy)
+        if key not in self._values or self._values[key] != value:
+            self._values[key] = value
+            self._dirty.add(key)
+
+    def incValue(self, delta, metric, tags, strategy=None):
+        """Increase a metric value by delta."""
+        key = (metric, tags, strategy)
+        self._values[key] = self._values.get(key, 0) + delta
+        self._dirty.add(key)
+
+    def flushValues(self, full=False):
+        """Push changed values, or all values when full is True."""
+        keys = self._values.keys() if full else self._dirty
+        for key in keys:
+            metric, tags, strategy = key
+            self._plugin.addMetric(self._values[key], metric, tags, strategy=strategy)
+        self._dirty = set()
 
     def getMetrics(self): 
         return []
@@ -151,6 +193,19 @@ class MetricAggregator(object):
     def aggregateTradeEvents(self, trades):
         raise NotImplementedError
 
+    # incremental handlers, called on event engine thread with the event data as it arrives.
+    def onPositionEvent(self, position):
+        raise NotImplementedError
+
+    def onAccountEvent(self, account):
+        raise NotImplementedError
+
+    def onOrderEvent(self, order):
+        raise NotImplementedError
+
+    def onTradeEvent(self, trade):
+        raise NotImplementedError
+
 
 class MetricSender(object):
     def pushMetrics(self, metrics):
@@ -185,6 +240,7 @@ def set_sender(cls):
 class CtaMerticPlugin(CtaEnginePlugin):
     aggregator_classes = []
     sender_class = DefaultMetricSender
+    send_queue_size = 10
 
     def __init__(self, step=30, interval=10):
         super(CtaMerticPlugin, self).__init__()
@@ -198,6 +254,13 @@ class CtaMerticPlugin(CtaEnginePlugin):
         self._metricFuncs = []
         self._metricCaches = []
         self._aggregators = []
+        self._eventHandlers = {"position": [], "account": [], "order": [], "trade": []}
+        self._bufferedEvents = set()  # event types needed by aggregate*Events of legacy aggregators
+        self._pushCount = 0
+        self._fullPush = True
+        # metrics are sent by a background thread, so slow senders never block the event engine.
+        self._sendQueue = Queue(self.send_queue_size)
+        self._sendThread = None
         self._positionEvents = []
         self._accountEvents = []
         self._orderEvents = []
@@ -224,6 +287,16 @@ class CtaMerticPlugin(CtaEnginePlugin):
     def getHostName(self):
         return socket.gethostname()
 
+    def addEventHandler(self, eventType, func):
+        self._eventHandlers[eventType].append(func)
+
+    def bufferEvents(self, eventType):
+        self._bufferedEvents.add(eventType)
+
+    def isFullPush(self):
+        """Whether all values should be pushed in current push, at least once every step."""
+        return self._fullPush
+
     def getPositionEvents(self, dataframe=True):
         if not dataframe:
             return self._positionEvents
@@ -261,20 +334,45 @@ class CtaMerticPlugin(CtaEnginePlugin):
 
     def pushMetrics(self):
         # self.ctaEngine.writeCtaLog("计算获取监控指标")
+        fullInterval = max(1, self.step // max(1, self.interval))
+        self._fullPush = self._pushCount % fullInterval == 0
+        self._pushCount += 1
         for func in self._metricFuncs:
             try:
                 func()
             except: # prevent stop eventengine's thread
                 self.ctaEngine.error(traceback.format_exc())
-        st = time.time()
-        try:
-            self._metricSender.pushMetrics(self._metricCaches)
-        except:
-            self.ctaEngine.error(traceback.format_exc())
-        et = time.time()
-        self.ctaEngine.debug("推送%s个监控指标,耗时%s", len(self._metricCaches), et - st)
+        self.sendMetrics(self._metricCaches)
         self.clearCache()
 
+    def sendMetrics(self, metrics):
+        """Hand metrics to the sender thread, drop the oldest batch if sender falls behind."""
+        if self._sendThread is None or not self._sendThread.is_alive():
+            self._sendThread = threading.Thread(target=self._runSender, name="CtaMetricSender")
+            self._sendThread.daemon = True
+            self._sendThread.start()
+        while True:
+            try:
+                self._sendQueue.put_nowait(metrics)
+                break
+            except Full:
+                try:
+                    dropped = self._sendQueue.get_nowait()
+                    self.ctaEngine.warn("监控指标推送积压，丢弃%s个指标", len(dropped))
+                except Empty:
+                    pass
+
+    def _runSender(self):
+        while True:
+            metrics = self._sendQueue.get()
+            st = time.time()
+            try:
+                self._metricSender.pushMetrics(metrics)
+            except:
+                self.ctaEngine.error(traceback.format_exc())
+            et = time.time()
+            self.ctaEngine.debug("推送%s个监控指标,耗时%s", len(metrics), et - st)
+
     def clearCache(self):
         self._metricCaches = []
         self._positionEvents.clear()
@@ -317,17 +415,28 @@ class CtaMerticPlugin(CtaEnginePlugin):
             self.timer = 0
             self.pushMetrics()
 
+    def _dispatch(self, eventType, events, event):
+        # events are only buffered for legacy aggregators working on dataframes
+        if eventType in self._bufferedEvents:
+            events.append(event)
+        data = event.dict_["data"]
+        for func in self._eventHandlers[eventType]:
+            try:
+                func(data)
+            except: # prevent stop eventengine's thread
+                self.ctaEngine.error(traceback.format_exc())
+
     def postPositionEvent(self, event):
-        self._positionEvents.append(event)
+        self._dispatch("position", self._positionEvents, event)
 
     def postAccountEvent(self, event):
-        self._accountEvents.append(event)
+        self._dispatch("account", self._accountEvents, event)
 
     def postOrderEvent(self, event):
-        self._orderEvents.append(event)
+        self._dispatch("order", self._orderEvents, event)
 
     def postTradeEvent(self, event):
-        self._tradeEvents.append(event)
+        self._dispatch("trade", self._tradeEvents, event)
 
 
 class CtaEngine(CtaEngineWithPlugins):
@@ -7,55 +7,52 @@ import logging
 import requests
 from watchdog.observers import Observer
 from watchdog.events import RegexMatchingEventHandler
-import pandas as pd
 
 
 class HandleMetric(object):
+    """Follow lines appended after the last read offset, keep last values in a dict."""
+
     def __init__(self, metric_file):
         self.metric_file = metric_file
-        self.data = []
         self.groupByTag = ["endpoint", "metric", "tags", "step", "counterType"]
-        self.df_last_data = None
-        self.file_position = 0  # 上次读取位置
+        self.last_data = {}  # groupByTag values: latest metric dict
+        self.file_position = 0  # 上次读取位置（字节）
         self.load_data()
 
     def load_data(self):
-        if os.path.exists(self.metric_file):
-            with open(self.metric_file, 'r') as f:
-                if self.file_position != 0:
-                    f.seek(self.file_position, 0)
-                while True:
-                    line = f.readline()
-                    self.file_position = self.file_position + len(line)
-                    if not line.strip():
-                        break
-                    elif '|' in line:
-                        self.data.append(json.loads(line.strip().split('|')[-1]))
-                    else:
-                        pass
-            self.get_last()
-
-    def clear_data(self):
-        self.data = []
-
-    def data_order(self, data):
-        return data.loc[data.groupby(self.groupByTag).timestamp.idxmax().values]
-
-    def get_last(self):
-        if self.data:
-            if self.df_last_data is None:
-                self.df_last_data = self.data_order(pd.DataFrame(self.data))
-            elif not self.df_last_data.empty:
-                temp = self.data_order(pd.DataFrame(self.data))
-                self.df_last_data = self.data_order(self.df_last_data.append(temp, ignore_index=True))
-        self.clear_data()
+        """Read new complete lines, return the metrics updated by them."""
+        updated = {}
+        if not os.path.exists(self.metric_file):
+            return updated
+        if os.path.getsize(self.metric_file) < self.file_position:
+            # the file was truncated or rotated, start over
+            self.file_position = 0
+        with open(self.metric_file, 'rb') as f:
+            f.seek(self.file_position, 0)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # incomplete line, read it next time
+                self.file_position += len(line)
+                line = line.decode('utf-8', 'ignore').strip()
+                if '|' not in line:
+                    continue
+                try:
+                    data = json.loads(line.split('|')[-1])
+                except ValueError:
+                    continue
+                key = tuple(data.get(tag) for tag in self.groupByTag)
+                last = self.last_data.get(key, None)
+                if last is None or data["timestamp"] >= last["timestamp"]:
+                    self.last_data[key] = data
+                    updated[key] = data
+        return updated
 
 
 class FileEventHandler(RegexMatchingEventHandler):
     def __init__(self, root, reg):
         RegexMatchingEventHandler.__init__(self, regexes=[reg])
         self.handlers = {}
-        self.df_total = None  # 所有文件的最后记录的总数据
+        self.total = {}  # 所有文件的最后记录的总数据
         self._root = root
         self._reg = reg
         self._init()
@@ -67,19 +64,17 @@ class FileEventHandler(RegexMatchingEventHandler):
                     path = os.path.join(dirpath, file)
                     self.handle_file(path)
 
-    def merge_data(self, data):
-        if data.df_last_data is None:
-            pass
-        elif self.df_total is None:
-            self.df_total = data.df_last_data
-        else:
-            self.df_total = data.data_order(self.df_total.append(data.df_last_data, ignore_index=True))
+    def merge_data(self, updated):
+        for key, data in updated.items():
+            last = self.total.get(key, None)
+            if last is None or data["timestamp"] >= last["timestamp"]:
+                self.total[key] = data
 
     def handle_file(self, path):
         if path not in self.handlers:
             logging.info("开始监听log文件:%s" % path)
             self.handlers[path] = HandleMetric(path)
-            self.merge_data(self.handlers[path])  # 把单个文件的最后记录加进来
+            self.merge_data(self.handlers[path].last_data)  # 把单个文件的最后记录加进来
 
     def on_created(self, event):
         self.handle_file(event.src_path)
@@ -88,9 +83,9 @@ class FileEventHandler(RegexMatchingEventHandler):
         path =event.src_path
         if path not in self.handlers:
             self.handle_file(path)
+            return
         handler = self.handlers[path]
-        handler.load_data()
-        self.merge_data(handler)
+        self.merge_data(handler.load_data())
 
 
 class LogFileMetricObserver(object):
@@ -109,22 +104,21 @@ class LogFileMetricObserver(object):
         try:
             while True:
                 time.sleep(self.interval)
-                self.push_metric(self._handler.df_total)  # 每5秒push一次
+                self.push_metric(list(self._handler.total.values()))  # 每5秒push一次
         except KeyboardInterrupt:
             self._observer.stop()
         self._observer.join()
 
-    def push_metric(self, df):
-        if df is None:
-            return
-        if df.empty:
+    def push_metric(self, data):
+        if not data:
             return
         payload = []
-        for _, row in df.iterrows():
+        now = int(time.time())
+        for row in data:
             push_data = {
                 "endpoint": row['endpoint'],
                 "metric": row['metric'],
-                "timestamp": int(time.time()), # update the local time
+                "timestamp": now, # update the local time
                 "step": row['step'],
                 "value": row['value'],
                 "counterType": row['counterType'],
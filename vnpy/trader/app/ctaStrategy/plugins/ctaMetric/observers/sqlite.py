@@ -7,42 +7,54 @@ import logging
 import requests
 from watchdog.observers import Observer
 from watchdog.events import RegexMatchingEventHandler
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import text
 
 from vnpy.trader.app.ctaStrategy.plugins.ctaMetric.base import NumpyEncoder
-from vnpy.trader.app.ctaStrategy.plugins.ctaMetric.senders.sqlite import OpenFalconMetric as OpenFalconMetricModel 
+from vnpy.trader.app.ctaStrategy.plugins.ctaMetric.senders.sqlite import OpenFalconMetric as OpenFalconMetricModel, create_sqlite_engine
 from vnpy.trader.app.ctaStrategy.plugins.ctaMetric.base import OpenFalconMetric
 
 class HandleMetric(object):
+    """Follow rows updated after the last read by the seq cursor, keep last values in a dict."""
+
     def __init__(self, filepath):
         self.filepath = filepath
+        self.seq = 0
+        self.metrics = {}  # (endpoint, metric, tags): OpenFalconMetric
         self._init()
 
     def _init(self):
-        engine = create_engine('sqlite:///%s' % self.filepath)
+        engine = create_sqlite_engine(self.filepath)
         self.engine = engine
-        Session = sessionmaker()
-        Session.configure(bind=engine)
-        self.session = Session()
     
     def has_table(self):
         return self.engine.dialect.has_table(self.engine, OpenFalconMetricModel.__tablename__)
 
+    def load_data(self):
+        if not self.has_table():
+            return
+        sql = text("SELECT endpoint, metric, timestamp, step, value, counterType, tags, seq FROM %s "
+                   "WHERE seq > :seq ORDER BY seq" % OpenFalconMetricModel.__tablename__)
+        with self.engine.connect() as conn:
+            last = conn.execute(text("SELECT COALESCE(MAX(seq), 0) FROM %s" % OpenFalconMetricModel.__tablename__)).scalar()
+            if last < self.seq:
+                # the file was recreated, start over
+                self.seq = 0
+                self.metrics = {}
+            rows = conn.execute(sql, seq=self.seq).fetchall()
+        for row in rows:
+            metric = OpenFalconMetric.from_dict(dict(row))
+            self.metrics[(metric.endpoint, metric.metric, metric.tags)] = metric
+            self.seq = row["seq"]
+
     def get_metrics(self):
-        if self.has_table():
-            metrics = self.session.query(OpenFalconMetricModel).all()
-            metrics = [OpenFalconMetric.from_dict(metric.__dict__) for metric in metrics]
-            return metrics
-        else:
-            return []
+        self.load_data()
+        return list(self.metrics.values())
 
 
 class FileEventHandler(RegexMatchingEventHandler):
     def __init__(self, root, reg):
         RegexMatchingEventHandler.__init__(self, regexes=[reg])
         self.handlers = {}
-        self.df_total = None  # 所有文件的最后记录的总数据
         self._root = root
         self._reg = reg
         self._init()
@@ -56,10 +68,10 @@ class FileEventHandler(RegexMatchingEventHandler):
 
     def get_metrics(self):
         metrics = {}
-        for handler in self.handlers.values():
+        for handler in list(self.handlers.values()):
             try:
                 for metric in handler.get_metrics():
-                    key = (metric.endpoint, metric.metric)
+                    key = (metric.endpoint, metric.metric, metric.tags)
                     if key in metrics:
                         old = metrics[key]
                         if old.timestamp > metric.timestamp:
@@ -84,7 +96,7 @@ class FileEventHandler(RegexMatchingEventHandler):
 
 class SqliteMetricObserver(object):
     interval = 10
-    reg = r"ctaMetric.sqlite"  # 监控的文件
+    reg = r"ctaMetric.sqlite$"  # 监控的文件
 
     def __init__(self, root=".", url=None):
         self._root = os.path.abspath(root)
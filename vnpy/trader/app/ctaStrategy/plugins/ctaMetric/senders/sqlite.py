@@ -1,9 +1,10 @@
 import logging
 import json
+import sqlite3
 from logging.handlers import TimedRotatingFileHandler
 
 from six import with_metaclass
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import Column, String, Integer, Float, UniqueConstraint, Index
 from sqlalchemy.orm import sessionmaker
@@ -25,9 +26,10 @@ class OpenFalconMetric(Base):
     value = Column(Float())
     counterType = Column(String(length=10, convert_unicode=True))
     tags = Column(String(length=200, convert_unicode=True), nullable=False)
+    seq = Column(Integer(), nullable=False, default=0)  # increased on every update, observers follow it as a cursor
     __table_args__ = (
-        UniqueConstraint('endpoint', 'metric', name='endpoint_metric_uc'),
-        Index("endpoint_metric_index", "endpoint", "metric")
+        UniqueConstraint('endpoint', 'metric', 'tags', name='endpoint_metric_tags_uc'),
+        Index("metric_seq_index", "seq")
     )
 
     @classmethod
@@ -51,6 +53,41 @@ class OpenFalconMetric(Base):
         dct["value"] = self.value
         dct["counterType"] = self.counterType
         dct["tags"] = self.tags
+        return dct
+
+
+def create_sqlite_engine(filepath):
+    """sqlite engine in WAL mode, so observers can read while the sender is writing."""
+    engine = create_engine('sqlite:///%s' % filepath)
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragma(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+    return engine
+
+
+# ON CONFLICT ... DO UPDATE requires sqlite 3.24+, older runtimes (e.g. some py3.6 builds) fall back
+# to INSERT OR REPLACE, which deletes and re-inserts the conflicting row (a new id, same seq cursor)
+if sqlite3.sqlite_version_info >= (3, 24, 0):
+    UPSERT_SQL = text("""
+INSERT INTO metrics (endpoint, metric, timestamp, step, value, counterType, tags, seq)
+VALUES (:endpoint, :metric, :timestamp, :step, :value, :counterType, :tags, :seq)
+ON CONFLICT (endpoint, metric, tags) DO UPDATE SET
+    timestamp = excluded.timestamp,
+    step = excluded.step,
+    value = excluded.value,
+    counterType = excluded.counterType,
+    seq = excluded.seq
+""")
+else:
+    UPSERT_SQL = text("""
+INSERT OR REPLACE INTO metrics (endpoint, metric, timestamp, step, value, counterType, tags, seq)
+VALUES (:endpoint, :metric, :timestamp, :step, :value, :counterType, :tags, :seq)
+""")
 
 
 class SqliteMetricSender(with_metaclass(Singleton, MetricSender)):
@@ -58,30 +95,33 @@ class SqliteMetricSender(with_metaclass(Singleton, MetricSender)):
         super(SqliteMetricSender, self).__init__()
         filename = "ctaMetric.sqlite"
         filepath = getTempPath(filename)
-        engine = create_engine('sqlite:///%s' % filepath)
+        engine = create_sqlite_engine(filepath)
         self.engine = engine
         self.ensure_table()
         Session = sessionmaker()
         Session.configure(bind=engine)
         self.session = Session()
+        with self.engine.connect() as conn:
+            self.seq = conn.execute(text("SELECT COALESCE(MAX(seq), 0) FROM metrics")).scalar()
 
     def ensure_table(self):
+        # tables created before tags joined the unique key can not be upserted, rebuild them
+        inspector = inspect(self.engine)
+        if OpenFalconMetric.__tablename__ in inspector.get_table_names():
+            columns = [c["name"] for c in inspector.get_columns(OpenFalconMetric.__tablename__)]
+            if "seq" not in columns:
+                logging.warning("Rebuild outdated metric table %s", OpenFalconMetric.__tablename__)
+                OpenFalconMetric.__table__.drop(self.engine)
         Base.metadata.create_all(self.engine)
 
     def pushMetrics(self, metrics):
-        new = {(metric.endpoint, metric.metric): OpenFalconMetric.from_dict(metric.__dict__) for metric in metrics}
-        old = {(metric.endpoint, metric.metric): metric for metric in self.session.query(OpenFalconMetric).all()}
-        objs = []
-        for k, v in new.items():
-            if k in old:
-                obj = old[k]
-                obj.timestamp = v.timestamp
-                obj.step = v.step
-                obj.value = v.value
-                obj.counterType = v.counterType
-                obj.tags = v.tags
-                objs.append(obj)
-            else:
-                objs.append(v)
-        self.session.bulk_save_objects(objs)
-        self.session.commit()
+        if not metrics:
+            return
+        self.seq += 1
+        rows = {}
+        for metric in metrics:
+            dct = OpenFalconMetric.from_dict(metric.__dict__).to_dict()
+            dct["seq"] = self.seq
+            rows[(metric.endpoint, metric.metric, metric.tags)] = dct
+        with self.engine.begin() as conn:
+            conn.execute(UPSERT_SQL, list(rows.values()))
@@ -1,5 +1,7 @@
+import time
 import types
 import logging
+from collections import defaultdict
 
 from vnpy.trader.utils import LoggerMixin
 
@@ -7,21 +9,29 @@ from ..ctaEngine import CtaEngine
 from ..ctaTemplate import CtaTemplate
 from ..ctaBase import ENGINETYPE_BACKTESTING
 
+EVENT_TYPES = ("Tick", "Position", "Order", "Trade", "Account")
+
+
 class CtaEngineWithPlugins(CtaEngine, LoggerMixin):
+    """Dispatch pre/post event hooks to plugins.
+
+    Handlers of enabled plugins are compiled into per-symbol tuples of plain
+    callables, so dispatching an event costs one dict lookup and the calls
+    themselves. Chains are rebuilt only when plugins are added, enabled,
+    disabled or refreshed; a disabled plugin costs nothing.
+    """
+
     def __init__(self, mainEngine, eventEngine):
+        self._plugin = {}
+        self._handlers = {}  # (stage, eventType): [(plugin, func, priority)]
+        for eventType in EVENT_TYPES:
+            self._handlers[("pre", eventType)] = []
+            self._handlers[("post", eventType)] = []
+        self._chains = {}  # (eventType, vtSymbol): (preChain, postChain)
+        self._profiling = False
+        self._pluginStats = defaultdict(lambda: [0, 0.0])  # (pluginName, stage+eventType): [count, seconds]
         super(CtaEngineWithPlugins, self).__init__(mainEngine, eventEngine)
         LoggerMixin.__init__(self)
-        self._plugin = {}
-        self._preTickEventHandlers = []
-        self._postTickEventHandlers = []
-        self._prePositionEventHandlers = []
-        self._postPositionEventHandlers = []
-        self._preOrderEventHandlers = []
-        self._postOrderEventHandlers = []
-        self._preTradeEventHandlers = []
-        self._postTradeEventHandlers = []
-        self._preAccountEventHandlers = []
-        self._postAccountEventHandlers = []
 
     def log(self, msg, level=logging.INFO):
         self.writeCtaLog(msg)
@@ -33,6 +43,7 @@ class CtaEngineWithPlugins(CtaEngine, LoggerMixin):
             plugin.register(self)
             plugin.name = name
             self.info("Register ctaEngine plugin named %s: %s.", name, plugin)
+            self.refreshPluginChains()
         else:
             self.warn("Plugin with name %s has already been registered.", name)
 
@@ -55,99 +66,151 @@ class CtaEngineWithPlugins(CtaEngine, LoggerMixin):
         self.info("Enable ctaEngine plugin: %s", plugin.name)
         plugin.enable()
 
+    def refreshPluginChains(self):
+        """Drop compiled chains, they are rebuilt lazily on the next event."""
+        self._chains = {}
+
+    def setPluginProfiling(self, enabled=True):
+        """Wrap every handler with a timer, see getPluginStats."""
+        self._profiling = enabled
+        self.refreshPluginChains()
+
+    def getPluginStats(self):
+        """Return {(pluginName, hook): (count, totalSeconds, averageSeconds)}."""
+        stats = {}
+        for key, (count, total) in list(self._pluginStats.items()):
+            stats[key] = (count, total, total / count if count else 0.0)
+        return stats
+
+    def clearPluginStats(self):
+        self._pluginStats.clear()
+
+    def reportPluginStats(self):
+        """Write per-plugin time spent per event type to the cta log."""
+        stats = sorted(self.getPluginStats().items(), key=lambda x: x[1][1], reverse=True)
+        for (name, hook), (count, total, average) in stats:
+            self.writeCtaLog(u"插件%s %s: 调用%s次，总耗时%.6f秒，平均%.2f微秒" % (name, hook, count, total, average * 1e6))
+
     def _sortedHanlders(self, handlers):
         return sorted(handlers, key=lambda x: x[2])
 
+    def _registerHandler(self, stage, eventType, plugin, func, priorty):
+        key = (stage, eventType)
+        self._handlers[key] = self._sortedHanlders(self._handlers[key] + [(plugin, func, priorty)])
+        self.refreshPluginChains()
+
+    def _profiled(self, plugin, func, stage, eventType):
+        stat = self._pluginStats[(plugin.name, stage + eventType)]
+        clock = time.perf_counter
+
+        def wrapper(event):
+            start = clock()
+            try:
+                func(event)
+            finally:
+                stat[0] += 1
+                stat[1] += clock() - start
+        return wrapper
+
+    def _compileChain(self, stage, eventType, vtSymbol):
+        chain = []
+        for plugin, func, _ in self._handlers[(stage, eventType)]:
+            if not plugin.is_enabled():
+                continue
+            if vtSymbol is not None and not plugin.acceptSymbol(vtSymbol):
+                continue
+            if self._profiling:
+                func = self._profiled(plugin, func, stage, eventType)
+            chain.append(func)
+        return tuple(chain)
+
+    def _getChains(self, eventType, vtSymbol=None):
+        key = (eventType, vtSymbol)
+        chains = self._chains.get(key, None)
+        if chains is None:
+            chains = (self._compileChain("pre", eventType, vtSymbol),
+                      self._compileChain("post", eventType, vtSymbol))
+            self._chains[key] = chains
+        return chains
+
     def registerPreTickEvent(self, plugin, func, priorty):
-        self._preTickEventHandlers.append((plugin, func, priorty))
-        self._preTickEventHandlers = self._sortedHanlders(self._preTickEventHandlers)
+        self._registerHandler("pre", "Tick", plugin, func, priorty)
 
     def registerPostTickEvent(self, plugin, func, priorty):
-        self._postTickEventHandlers.append((plugin, func, priorty))
-        self._postTickEventHandlers = self._sortedHanlders(self._postTickEventHandlers)
+        self._registerHandler("post", "Tick", plugin, func, priorty)
 
     def registerPrePositionEvent(self, plugin, func, priorty):
-        self._prePositionEventHandlers.append((plugin, func, priorty))
-        self._prePositionEventHandlers = self._sortedHanlders(self._prePositionEventHandlers)
+        self._registerHandler("pre", "Position", plugin, func, priorty)
 
     def registerPostPositionEvent(self, plugin, func, priorty):
-        self._postPositionEventHandlers.append((plugin, func, priorty))
-        self._postPositionEventHandlers = self._sortedHanlders(self._postPositionEventHandlers)
+        self._registerHandler("post", "Position", plugin, func, priorty)
 
     def registerPreOrderEvent(self, plugin, func, priorty):
-        self._preOrderEventHandlers.append((plugin, func, priorty))
-        self._preOrderEventHandlers = self._sortedHanlders(self._preOrderEventHandlers)
+        self._registerHandler("pre", "Order", plugin, func, priorty)
 
     def registerPostOrderEvent(self, plugin, func, priorty):
-        self._postOrderEventHandlers.append((plugin, func, priorty))
-        self._postOrderEventHandlers = self._sortedHanlders(self._postOrderEventHandlers)
+        self._registerHandler("post", "Order", plugin, func, priorty)
+
+    def registerPreTradeEvent(self, plugin, func, priorty):
+        self._registerHandler("pre", "Trade", plugin, func, priorty)
 
-    def regsiterPreTradeEvent(self, plugin, func, priorty):
-        self._preTradeEventHandlers.append((plugin, func, priorty))
-        self._preTradeEventHandlers = self._sortedHanlders(self._preTradeEventHandlers)
+    regsiterPreTradeEvent = registerPreTradeEvent  # keep the old misspelt name working
 
     def registerPostTradeEvent(self, plugin, func, priorty):
-        self._postTradeEventHandlers.append((plugin, func, priorty))
-        self._postTradeEventHandlers = self._sortedHanlders(self._postTradeEventHandlers)
+        self._registerHandler("post", "Trade", plugin, func, priorty)
 
     def registerPreAccountEvent(self, plugin, func, priorty):
-        self._preAccountEventHandlers.append((plugin, func, priorty))
-        self._preAccountEventHandlers = self._sortedHanlders(self._preAccountEventHandlers)
+        self._registerHandler("pre", "Account", plugin, func, priorty)
 
     def registerPostAccountEvent(self, plugin, func, priorty):
-        self._postAccountEventHandlers.append((plugin, func, priorty))
-        self._postAccountEventHandlers = self._sortedHanlders(self._postAccountEventHandlers)
+        self._registerHandler("post", "Account", plugin, func, priorty)
 
     def processTickEvent(self, event):
-        for plugin, func, _ in self._preTickEventHandlers:
-            if plugin.is_enabled():
-                func(event)
+        pre, post = self._getChains("Tick", event.dict_["data"].vtSymbol)
+        for func in pre:
+            func(event)
         super(CtaEngineWithPlugins, self).processTickEvent(event)
-        for plugin, func, _ in self._postTickEventHandlers:
-            if plugin.is_enabled():
-                func(event)
+        for func in post:
+            func(event)
 
     def processPositionEvent(self, event):
-        for plugin, func, _ in self._prePositionEventHandlers:
-            if plugin.is_enabled():
-                func(event)
+        pre, post = self._getChains("Position", event.dict_["data"].vtSymbol)
+        for func in pre:
+            func(event)
         super(CtaEngineWithPlugins, self).processPositionEvent(event)
-        for plugin, func, _ in self._postPositionEventHandlers:
-            if plugin.is_enabled():
-                func(event)
+        for func in post:
+            func(event)
 
     def processOrderEvent(self, event):
-        for plugin, func, _ in self._preOrderEventHandlers:
-            if plugin.is_enabled():
-                func(event)
+        pre, post = self._getChains("Order", event.dict_["data"].vtSymbol)
+        for func in pre:
+            func(event)
         super(CtaEngineWithPlugins, self).processOrderEvent(event)
-        for plugin, func, _ in self._postOrderEventHandlers:
-            if plugin.is_enabled():
-                func(event) 
+        for func in post:
+            func(event)
 
     def processTradeEvent(self, event):
-        for plugin, func, _ in self._preTradeEventHandlers:
-            if plugin.is_enabled():
-                func(event)
+        pre, post = self._getChains("Trade", event.dict_["data"].vtSymbol)
+        for func in pre:
+            func(event)
         super(CtaEngineWithPlugins, self).processTradeEvent(event)
-        for plugin, func, _ in self._postTradeEventHandlers:
-            if plugin.is_enabled():
-                func(event) 
+        for func in post:
+            func(event)
 
     def processAccountEvent(self, event):
-        for plugin, func, _ in self._preAccountEventHandlers:
-            if plugin.is_enabled():
-                func(event)
+        pre, post = self._getChains("Account")
+        for func in pre:
+            func(event)
         super(CtaEngineWithPlugins, self).processAccountEvent(event)
-        for plugin, func, _ in self._postAccountEventHandlers:
-            if plugin.is_enabled():
-                func(event) 
+        for func in post:
+            func(event)
 
 
 class CtaEnginePlugin(object):
     def __init__(self):
         self._enabled = True
         self._name = None
+        self._engine = None
 
     @property
     def name(self):
@@ -165,6 +228,7 @@ class CtaEnginePlugin(object):
         engine : ctaEngineWithPlugins
             ctaEngine
         """
+        self._engine = engine
         if self.preTickEvent != types.MethodType(CtaEnginePlugin.preTickEvent, self):
             engine.registerPreTickEvent(self, self.preTickEvent, 0)
         if self.postTickEvent != types.MethodType(CtaEnginePlugin.postTickEvent, self):
@@ -186,14 +250,25 @@ class CtaEnginePlugin(object):
         if self.postAccountEvent != types.MethodType(CtaEnginePlugin.postAccountEvent, self):
             engine.registerPostAccountEvent(self, self.postAccountEvent, 0)
 
+    def refresh(self):
+        """Ask the engine to recompile handler chains, e.g. after acceptSymbol changes."""
+        if self._engine is not None:
+            self._engine.refreshPluginChains()
+
+    def acceptSymbol(self, vtSymbol):
+        """Whether handlers should receive events of vtSymbol, all symbols by default."""
+        return True
+
     def is_enabled(self):
         return self._enabled
 
     def enable(self):
         self._enabled = True
+        self.refresh()
 
     def disable(self):
         self._enabled = False
+        self.refresh()
 
     def preTickEvent(self, event):
         raise NotImplementedError
@@ -240,4 +315,4 @@ class CtaTemplateWithPlugins(CtaTemplate):
         if self.isBacktesting():
             self.writeCtaLog("处于回测模式，插件功能禁用")
         else:
-            return self.ctaEngine.enablePlugin(plug)
\ No newline at end of file
+            return self.ctaEngine.enablePlugin(plug)
@@ -40,7 +40,9 @@ class CtaValueMonitor(QtWidgets.QTableWidget):
     #----------------------------------------------------------------------
     def updateData(self, data):
         """更新数据"""
-        if not self.inited:
+        # 字段变化时（例如开启耗时统计后增加的字段）重新生成表格
+        if not self.inited or len(data) != len(self.keyCellDict):
+            self.keyCellDict = {}
             self.setColumnCount(len(data))
             self.setHorizontalHeaderLabels(list(data.keys()))
 
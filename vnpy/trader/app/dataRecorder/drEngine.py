@@ -17,10 +17,11 @@ from queue import Queue, Empty
 from threading import Thread
 from pymongo.errors import DuplicateKeyError
 
-from vnpy.event import Event
 from vnpy.trader.vtEvent import *
 from vnpy.trader.vtFunction import todayDate, getJsonPath
-from vnpy.trader.vtObject import VtSubscribeReq, VtLogData, VtBarData, VtTickData
+from vnpy.trader.vtLog import createLogEvent
+from vnpy.trader.vtTime import parseDateTime
+from vnpy.trader.vtObject import VtSubscribeReq, VtBarData, VtTickData
 from vnpy.trader.app.ctaStrategy.ctaTemplate import BarGenerator
 # from vnpy.trader.app.ctaStrategy.ctaTemplate import BarManager
 
@@ -179,7 +180,7 @@ class DrEngine(object):
         
         # 生成datetime对象
         if not tick.datetime:
-            tick.datetime = datetime.strptime(' '.join([tick.date, tick.time]), '%Y%m%d %H:%M:%S.%f')            
+            tick.datetime = parseDateTime(tick.date, tick.time)
 
         self.onTick(tick)
         
@@ -232,6 +233,7 @@ class DrEngine(object):
     #----------------------------------------------------------------------
     def insertData(self, dbName, collectionName, data):
         """插入数据到数据库（这里的data可以是VtTickData或者VtBarData）"""
+        data.fillTime()
         self.queue.put((dbName, collectionName, data.__dict__))
         
     #----------------------------------------------------------------------
@@ -268,11 +270,9 @@ class DrEngine(object):
             self.thread.join()
         
     #----------------------------------------------------------------------
-    def writeDrLog(self, content):
-        """快速发出日志事件"""
-        log = VtLogData()
-        log.logContent = content
-        event = Event(type_=EVENT_DATARECORDER_LOG)
-        event.dict_['data'] = log
-        self.eventEngine.put(event)   
+    def writeDrLog(self, content, *args):
+        """快速发出日志事件，args不为空时在通过流控后才格式化content % args"""
+        event = createLogEvent(EVENT_DATARECORDER_LOG, 'DATA_RECORDER', content, args)
+        if event:
+            self.eventEngine.put(event)   
     
\ No newline at end of file
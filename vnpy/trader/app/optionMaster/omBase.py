@@ -7,11 +7,7 @@ from vnpy.trader.vtConstant import *
 from vnpy.trader.vtObject import VtTickData
 
 from .omDate import getTimeToMaturity
-
-
-# 常量定义
-CALL = 1
-PUT = -1
+from .omPricing import CALL, PUT, OmChainPricer
 
 
 ########################################################################
@@ -24,6 +20,7 @@ class OmInstrument(VtTickData):
         super(OmInstrument, self).__init__()
         
         # 初始化合约信息
+        self.symbol = contract.symbol
         self.exchange = contract.exchange
         self.vtSymbol = contract.vtSymbol
     
@@ -33,6 +30,7 @@ class OmInstrument(VtTickData):
         
         # 中间价
         self.midPrice = EMPTY_FLOAT
+        self.tickInited = False
         
         # 持仓数据
         self.longPos = detail.longPos
@@ -58,6 +56,11 @@ class OmInstrument(VtTickData):
         self.askPrice1 = tick.askPrice1
         self.bidVolume1 = tick.bidVolume1
         self.askVolume1 = tick.askVolume1
+        
+        if self.bidPrice1 and self.askPrice1:
+            self.midPrice = (self.bidPrice1 + self.askPrice1) / 2
+        else:
+            self.midPrice = self.lastPrice
 
     #----------------------------------------------------------------------
     def newTrade(self, trade):
@@ -95,17 +98,24 @@ class OmUnderlying(OmInstrument):
     """标的物"""
 
     #----------------------------------------------------------------------
-    def __init__(self, contract, chainList):
+    def __init__(self, contract, detail, chainList=None):
         """Constructor"""
-        super(OmUnderlying, self).__init__(contract)
+        super(OmUnderlying, self).__init__(contract, detail)
         
         # 以该合约为标的物的期权链字典
-        self.chainDict = OrderedDict((chain.symbol, chain) for chain in chainList)
+        self.chainDict = OrderedDict()
+        for chain in chainList or []:
+            self.addChain(chain)
         
         # 希腊值
         self.theoDelta = EMPTY_FLOAT    # 理论delta值
         self.posDelta = EMPTY_FLOAT     # 持仓delta值
         
+    #----------------------------------------------------------------------
+    def addChain(self, chain):
+        """添加以该合约为标的物的期权链"""
+        self.chainDict[chain.symbol] = chain
+        
     #----------------------------------------------------------------------
     def newTick(self, tick):
         """行情更新"""
@@ -114,7 +124,7 @@ class OmUnderlying(OmInstrument):
         self.theoDelta = self.size * self.midPrice / 100
         
         # 遍历推送自己的行情到期权链中
-        for chain in self.chainList:
+        for chain in self.chainDict.values():
             chain.newUnderlyingTick()
 
     #----------------------------------------------------------------------
@@ -134,9 +144,9 @@ class OmOption(OmInstrument):
     """期权"""
 
     #----------------------------------------------------------------------
-    def __init__(self, contract, underlying, model, r):
+    def __init__(self, contract, detail, underlying, model, r):
         """Constructor"""
-        super(OmOption, self).__init__(contract)
+        super(OmOption, self).__init__(contract, detail)
         
         # 期权属性
         self.underlying = underlying    # 标的物对象
@@ -156,10 +166,8 @@ class OmOption(OmInstrument):
         self.askImpv = EMPTY_FLOAT
         self.midImpv = EMPTY_FLOAT
     
-        # 定价公式
-        self.calculatePrice = model.calculatePrice
-        self.calculateGreeks = model.calculateGreeks
-        self.calculateImpv = model.calculateImpv
+        # 定价模型，见omPricing
+        self.model = model
     
         # 模型定价
         self.pricingImpv = EMPTY_FLOAT
@@ -186,10 +194,11 @@ class OmOption(OmInstrument):
         if not underlyingPrice:
             return        
         
-        self.askImpv = self.calculateImpv(self.askPrice1, underlyingPrice, self.k,
-                                          self.r, self.t, self.cp)
-        self.bidImpv = self.calculateImpv(self.bidPrice1, underlyingPrice, self.k,
-                                          self.r, self.t, self.cp)        
+        # 以上一次的结果作为初值
+        self.askImpv = self.model.calculateImpv(self.askPrice1, underlyingPrice, self.k,
+                                                self.r, self.t, self.cp, self.askImpv)
+        self.bidImpv = self.model.calculateImpv(self.bidPrice1, underlyingPrice, self.k,
+                                                self.r, self.t, self.cp, self.bidImpv)
         self.midImpv = (self.askImpv + self.bidImpv) / 2
     
     #----------------------------------------------------------------------
@@ -199,12 +208,18 @@ class OmOption(OmInstrument):
         if not underlyingPrice or not self.pricingImpv:
             return
         
-        self.theoPrice, self.theoDelta, self.theoGamma, self.theoTheta, self.theoVega = self.calculateGreeks(underlyingPrice, 
-                                                                                                             self.k, 
-                                                                                                             self.r, 
-                                                                                                             self.t, 
-                                                                                                             self.pricingImpv, 
-                                                                                                             self.cp)
+        price, delta, gamma, theta, vega = self.model.calculateGreeks(underlyingPrice, 
+                                                                      self.k, 
+                                                                      self.r, 
+                                                                      self.t, 
+                                                                      self.pricingImpv, 
+                                                                      self.cp)
+        
+        self.theoPrice = float(price)
+        self.theoDelta = float(delta) * self.size
+        self.theoGamma = float(gamma) * self.size
+        self.theoTheta = float(theta) * self.size
+        self.theoVega = float(vega) * self.size
         
     #----------------------------------------------------------------------
     def calculatePosGreeks(self):
@@ -259,6 +274,18 @@ class OmChain(object):
             self.putDict[option.symbol] = option
             self.optionDict[option.symbol] = option
         
+        # 标的物，同一条期权链中的期权使用相同的标的物、定价模型和利率
+        self.underlying = None
+        self.pricer = None
+        
+        if self.optionDict:
+            first = list(self.optionDict.values())[0]
+            self.underlying = first.underlying
+            self.pricer = OmChainPricer(self.optionDict.values(), first.model, first.r)
+            
+            if self.underlying:
+                self.underlying.addChain(self)
+        
         # 持仓数据
         self.longPos = EMPTY_INT
         self.shortPos = EMPTY_INT
@@ -272,41 +299,43 @@ class OmChain(object):
     
     #----------------------------------------------------------------------
     def calculatePosGreeks(self):
-        """计算持仓希腊值"""
-        # 清空数据
-        self.longPos = 0
-        self.shortPos = 0
-        self.netPos = 0
-        self.posDelta = 0
-        self.posGamma = 0
-        self.posTheta = 0
-        self.posVega = 0
+        """计算持仓希腊值，由定价引擎通过数组运算汇总"""
+        if not self.pricer:
+            return
         
-        # 遍历汇总
-        for option in list(self.optionDict.values()):
-            self.longPos += option.longPos
-            self.shortPos += option.shortPos
-            
-            self.posValue += option.posValue
-            self.posDelta += option.posDelta
-            self.posGamma += option.posGamma
-            self.posTheta += option.posTheta
-            self.posVega += option.posVega
+        (self.longPos, self.shortPos, self.posValue, self.posDelta, 
+         self.posGamma, self.posTheta, self.posVega) = [float(x) for x in self.pricer.getPosGreeks()]
         
         self.netPos = self.longPos - self.shortPos    
     
+    #----------------------------------------------------------------------
+    def setPricingImpv(self, symbol, pricingImpv):
+        """设置期权的定价波动率"""
+        option = self.optionDict[symbol]
+        option.pricingImpv = pricingImpv
+        self.pricer.updateOption(self.pricer.indexDict[symbol], option)
+    
     #----------------------------------------------------------------------
     def newTick(self, tick):
         """期权行情更新"""
         option = self.optionDict[tick.symbol]
         option.newTick(tick)
+        
+        # 同步盘口和隐含波动率，后者作为下一次整链求解的初值
+        n = self.pricer.indexDict[tick.symbol]
+        self.pricer.updateOption(n, option)
+        self.pricer.bidImpv[n] = option.bidImpv
+        self.pricer.askImpv[n] = option.askImpv
+        self.pricer.midImpv[n] = option.midImpv
     
     #----------------------------------------------------------------------
     def newUnderlyingTick(self):
-        """期货行情更新"""
-        for option in list(self.optionDict.values()):
-            option.newUnderlyingTick()
-            
+        """期货行情更新，整条期权链向量化定价"""
+        if not self.pricer or not self.underlying.midPrice:
+            return
+        
+        self.pricer.calculate(self.underlying.midPrice)
+        self.pricer.writeBack()
         self.calculatePosGreeks()
         
     #----------------------------------------------------------------------
@@ -314,29 +343,12 @@ class OmChain(object):
         """期权成交更新"""
         option = self.optionDict[trade.symbol]
         
-        # 缓存旧数据
-        oldLongPos = option.longPos
-        oldShortPos = option.shortPos
-        
-        oldPosValue = option.posValue
-        oldPosDelta = option.posDelta
-        oldPosGamma = option.posGamma
-        oldPosTheta = option.posTheta
-        oldPosVega = option.posVega
-        
-        # 更新到期权s中
+        # 更新到期权中
         option.newTrade(trade)
+        self.pricer.updateOption(self.pricer.indexDict[trade.symbol], option)
         
         # 计算持仓希腊值
-        self.longPos = self.longPos - oldLongPos + option.longPos
-        self.shortPos = self.shortPos - oldShortPos+ option.shortPos
-        self.netPos = self.longPos - self.shortPos
-        
-        self.posValue = self.posValue - oldPosValue + option.posValue
-        self.posDelta = self.posDelta - oldPosDelta + option.posDelta
-        self.posGamma = self.posGamma - oldPosGamma + option.posGamma
-        self.posTheta = self.posTheta - oldPosTheta + option.posTheta
-        self.posVega = self.posVega - oldPosVega + option.posVega
+        self.calculatePosGreeks()
 
 
 ########################################################################
@@ -385,10 +397,10 @@ class OmPortfolio(object):
         self.posTheta = 0
         self.posVega = 0
         
-        for underlying in self.underlyingList:
+        for underlying in self.underlyingDict.values():
             self.posDelta += underlying.posDelta
         
-        for chain in self.chainList:
+        for chain in self.chainDict.values():
             self.longPos += chain.longPos
             self.shortPos += chain.shortPos
             
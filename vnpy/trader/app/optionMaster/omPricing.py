@@ -0,0 +1,398 @@
+# encoding: UTF-8
+
+'''
+期权定价模型和期权链向量化定价引擎
+
+1. 内置Black-Scholes（现货标的）和Black-76（期货标的）模型，所有函数同时支持标量和numpy数组输入
+2. 隐含波动率使用带区间保护的牛顿法求解，整条期权链的买卖价一次迭代完成，
+   并以上一次的解作为初值（热启动），行情小幅变化时通常2到3次迭代即可收敛
+3. 希腊值的单位与界面显示保持一致：
+   delta为标的价格变动1%的盈亏，gamma为标的价格变动1%时delta的变化，
+   theta为每个交易日的时间损耗，vega为波动率变动1个百分点的盈亏
+'''
+
+from __future__ import division
+
+import numpy as np
+
+from vnpy.trader.vtConstant import EMPTY_FLOAT
+
+
+# 常量定义
+CALL = 1
+PUT = -1
+
+DAYS_PER_YEAR = 240         # 每年交易日数，用于计算每日theta
+
+VOL_MIN = 0.0001            # 隐含波动率求解区间
+VOL_MAX = 5.0
+VOL_GUESS = 0.3             # 没有上一次的解时使用的初值
+
+IMPV_TOLERANCE = 1e-8       # 理论价与市场价的误差容忍度
+IMPV_MAX_ITERATION = 50     # 最大迭代次数
+
+# 正态分布函数的有理逼近系数（Abramowitz and Stegun 26.2.17，误差小于7.5e-8）
+_P = 0.2316419
+_B = (0.319381530, -0.356563782, 1.781477937, -1.821255978, 1.330274429)
+_INV_SQRT_2PI = 1 / np.sqrt(2 * np.pi)
+
+
+#----------------------------------------------------------------------
+def normPdf(x):
+    """标准正态分布的概率密度"""
+    return _INV_SQRT_2PI * np.exp(-0.5 * x * x)
+
+
+#----------------------------------------------------------------------
+def normCdf(x):
+    """标准正态分布的累积分布"""
+    x = np.asarray(x, dtype=float)
+    a = np.abs(x)
+    k = 1 / (1 + _P * a)
+    poly = k * (_B[0] + k * (_B[1] + k * (_B[2] + k * (_B[3] + k * _B[4]))))
+    cdf = 1 - normPdf(a) * poly
+    return np.where(x >= 0, cdf, 1 - cdf)
+
+
+########################################################################
+class BlackScholes(object):
+    """Black-Scholes模型，s为现货价格"""
+
+    #----------------------------------------------------------------------
+    @staticmethod
+    def calculateD(s, k, r, t, v):
+        """计算d1和d2"""
+        vt = v * np.sqrt(t)
+        d1 = (np.log(s / k) + (r + 0.5 * v * v) * t) / vt
+        d2 = d1 - vt
+        return d1, d2
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def calculatePrice(cls, s, k, r, t, v, cp):
+        """计算期权价格"""
+        d1, d2 = cls.calculateD(s, k, r, t, v)
+        return cp * (s * normCdf(cp * d1) - k * np.exp(-r * t) * normCdf(cp * d2))
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def calculatePriceVega(cls, s, k, r, t, v, cp):
+        """计算期权价格和原始vega，用于求解隐含波动率"""
+        d1, d2 = cls.calculateD(s, k, r, t, v)
+        price = cp * (s * normCdf(cp * d1) - k * np.exp(-r * t) * normCdf(cp * d2))
+        vega = s * normPdf(d1) * np.sqrt(t)
+        return price, vega
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def calculateGreeks(cls, s, k, r, t, v, cp):
+        """计算期权价格和希腊值，返回(price, delta, gamma, theta, vega)"""
+        sqrtT = np.sqrt(t)
+        d1, d2 = cls.calculateD(s, k, r, t, v)
+        pdf = normPdf(d1)
+        discount = k * np.exp(-r * t)
+        nd1 = normCdf(cp * d1)
+        nd2 = normCdf(cp * d2)
+
+        price = cp * (s * nd1 - discount * nd2)
+        delta = cp * nd1
+        gamma = pdf / (s * v * sqrtT)
+        theta = -s * pdf * v / (2 * sqrtT) - cp * r * discount * nd2
+        vega = s * pdf * sqrtT
+
+        return (price,
+                delta * s * 0.01,
+                gamma * s * s * 0.0001,
+                theta / DAYS_PER_YEAR,
+                vega / 100)
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def calculateImpv(cls, price, s, k, r, t, cp, guess=None):
+        """计算隐含波动率"""
+        return solveImpv(cls, price, s, k, r, t, cp, guess)
+
+
+########################################################################
+class Black76(object):
+    """Black-76模型，s为期货价格"""
+
+    #----------------------------------------------------------------------
+    @staticmethod
+    def calculateD(s, k, r, t, v):
+        """计算d1和d2"""
+        vt = v * np.sqrt(t)
+        d1 = (np.log(s / k) + 0.5 * v * v * t) / vt
+        d2 = d1 - vt
+        return d1, d2
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def calculatePrice(cls, s, k, r, t, v, cp):
+        """计算期权价格"""
+        d1, d2 = cls.calculateD(s, k, r, t, v)
+        return np.exp(-r * t) * cp * (s * normCdf(cp * d1) - k * normCdf(cp * d2))
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def calculatePriceVega(cls, s, k, r, t, v, cp):
+        """计算期权价格和原始vega，用于求解隐含波动率"""
+        d1, d2 = cls.calculateD(s, k, r, t, v)
+        discount = np.exp(-r * t)
+        price = discount * cp * (s * normCdf(cp * d1) - k * normCdf(cp * d2))
+        vega = discount * s * normPdf(d1) * np.sqrt(t)
+        return price, vega
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def calculateGreeks(cls, s, k, r, t, v, cp):
+        """计算期权价格和希腊值，返回(price, delta, gamma, theta, vega)"""
+        sqrtT = np.sqrt(t)
+        d1, d2 = cls.calculateD(s, k, r, t, v)
+        pdf = normPdf(d1)
+        discount = np.exp(-r * t)
+        nd1 = normCdf(cp * d1)
+        nd2 = normCdf(cp * d2)
+
+        price = discount * cp * (s * nd1 - k * nd2)
+        delta = discount * cp * nd1
+        gamma = discount * pdf / (s * v * sqrtT)
+        theta = -discount * s * pdf * v / (2 * sqrtT) + r * price
+        vega = discount * s * pdf * sqrtT
+
+        return (price,
+                delta * s * 0.01,
+                gamma * s * s * 0.0001,
+                theta / DAYS_PER_YEAR,
+                vega / 100)
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def calculateImpv(cls, price, s, k, r, t, cp, guess=None):
+        """计算隐含波动率"""
+        return solveImpv(cls, price, s, k, r, t, cp, guess)
+
+
+# 定价模型字典
+MODEL_DICT = {
+    'BlackScholes': BlackScholes,
+    'Black76': Black76
+}
+
+
+#----------------------------------------------------------------------
+def solveImpv(model, price, s, k, r, t, cp, guess=None,
+              tolerance=IMPV_TOLERANCE, maxIteration=IMPV_MAX_ITERATION):
+    """
+    向量化求解隐含波动率
+    牛顿迭代的同时维护波动率的上下界，牛顿步越界或vega过小时改用二分，保证收敛。
+    价格超出模型可达范围（低于内在价值等）或参数无效的位置返回0。
+    输入为标量时返回标量。
+    """
+    scalar = np.ndim(price) == 0 and np.ndim(s) == 0 and np.ndim(k) == 0 and np.ndim(cp) == 0
+    price, s, k, r, t, cp = np.broadcast_arrays(*[np.asarray(x, dtype=float)
+                                                  for x in (price, s, k, r, t, cp)])
+    price = price.ravel()
+    s = s.ravel()
+    k = k.ravel()
+    r = r.ravel()
+    t = t.ravel()
+    cp = cp.ravel()
+    n = price.size
+
+    result = np.zeros(n)
+
+    # 检查价格是否在模型可达范围内
+    with np.errstate(divide='ignore', invalid='ignore'):
+        valid = (price > 0) & (s > 0) & (k > 0) & (t > 0)
+        idx = np.nonzero(valid)[0]
+        if idx.size:
+            low = model.calculatePrice(s[idx], k[idx], r[idx], t[idx], VOL_MIN, cp[idx])
+            high = model.calculatePrice(s[idx], k[idx], r[idx], t[idx], VOL_MAX, cp[idx])
+            p = price[idx]
+            valid[idx] = (p > low) & (p < high)
+
+    idx = np.nonzero(valid)[0]
+    if not idx.size:
+        return EMPTY_FLOAT if scalar else result
+
+    # 初值，优先使用上一次的解
+    if guess is None:
+        v = np.full(idx.size, VOL_GUESS)
+    else:
+        v = np.broadcast_to(np.asarray(guess, dtype=float), (n,)).ravel()[idx].copy()
+        v[~((v > VOL_MIN) & (v < VOL_MAX))] = VOL_GUESS
+
+    lo = np.full(idx.size, VOL_MIN)
+    hi = np.full(idx.size, VOL_MAX)
+    p, s_, k_, r_, t_, cp_ = price[idx], s[idx], k[idx], r[idx], t[idx], cp[idx]
+    active = np.arange(idx.size)
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        for i in range(maxIteration):
+            a = active
+            theo, vega = model.calculatePriceVega(s_[a], k_[a], r_[a], t_[a], v[a], cp_[a])
+            diff = theo - p[a]
+
+            done = (np.abs(diff) < tolerance) | (hi[a] - lo[a] < tolerance)
+
+            # 价格关于波动率单调递增，更新求解区间
+            over = diff > 0
+            hi[a] = np.where(over, v[a], hi[a])
+            lo[a] = np.where(over, lo[a], v[a])
+
+            newton = v[a] - diff / vega
+            bad = ~np.isfinite(newton) | (newton <= lo[a]) | (newton >= hi[a])
+            step = np.where(bad, 0.5 * (lo[a] + hi[a]), newton)
+            v[a] = np.where(done, v[a], step)
+
+            active = a[~done]
+            if not active.size:
+                break
+
+    result[idx] = v
+    if scalar:
+        return float(result[0])
+    return result
+
+
+########################################################################
+class OmChainPricer(object):
+    """
+    期权链向量化定价引擎
+
+    期权的行权价、剩余时间、盘口和持仓保存在numpy数组中，
+    标的行情更新时整条链一次性求解买卖价隐含波动率、计算理论希腊值，
+    持仓希腊值通过数组求和汇总。
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, optionList, model, r):
+        """Constructor"""
+        self.model = model
+        self.r = r
+
+        self.optionList = list(optionList)
+        self.indexDict = dict((option.symbol, n) for n, option in enumerate(self.optionList))
+        size = len(self.optionList)
+
+        # 合约属性
+        self.k = np.array([option.k for option in self.optionList], dtype=float)
+        self.cp = np.array([option.cp for option in self.optionList], dtype=float)
+        self.t = np.array([option.t for option in self.optionList], dtype=float)
+        self.size = np.array([option.size for option in self.optionList], dtype=float)
+
+        # 行情和持仓
+        self.bidPrice = np.zeros(size)
+        self.askPrice = np.zeros(size)
+        self.longPos = np.zeros(size)
+        self.shortPos = np.zeros(size)
+        self.netPos = np.zeros(size)
+
+        # 波动率
+        self.bidImpv = np.zeros(size)
+        self.askImpv = np.zeros(size)
+        self.midImpv = np.zeros(size)
+        self.pricingImpv = np.zeros(size)
+
+        # 理论价和希腊值（希腊值乘以了合约大小）
+        self.theoPrice = np.zeros(size)
+        self.theoDelta = np.zeros(size)
+        self.theoGamma = np.zeros(size)
+        self.theoTheta = np.zeros(size)
+        self.theoVega = np.zeros(size)
+
+        for n, option in enumerate(self.optionList):
+            self.updateOption(n, option)
+
+    #----------------------------------------------------------------------
+    def updateOption(self, n, option):
+        """从期权对象同步盘口、持仓和定价波动率"""
+        self.bidPrice[n] = option.bidPrice1
+        self.askPrice[n] = option.askPrice1
+        self.longPos[n] = option.longPos
+        self.shortPos[n] = option.shortPos
+        self.netPos[n] = option.longPos - option.shortPos
+        self.pricingImpv[n] = option.pricingImpv
+
+    #----------------------------------------------------------------------
+    def updateTime(self):
+        """重新计算剩余时间"""
+        self.t = np.array([option.t for option in self.optionList], dtype=float)
+
+    #----------------------------------------------------------------------
+    def calculateImpv(self, underlyingPrice, index=None):
+        """计算隐含波动率，index为空时计算整条链"""
+        if index is None:
+            index = slice(None)
+
+        k = self.k[index]
+        t = self.t[index]
+        cp = self.cp[index]
+
+        # 买价和卖价拼接后一次求解
+        price = np.concatenate([self.bidPrice[index], self.askPrice[index]])
+        guess = np.concatenate([self.bidImpv[index], self.askImpv[index]])
+        impv = solveImpv(self.model, price, underlyingPrice,
+                         np.concatenate([k, k]), self.r,
+                         np.concatenate([t, t]), np.concatenate([cp, cp]), guess)
+
+        n = impv.size // 2
+        self.bidImpv[index] = impv[:n]
+        self.askImpv[index] = impv[n:]
+        self.midImpv[index] = (impv[:n] + impv[n:]) / 2
+
+    #----------------------------------------------------------------------
+    def calculateTheoGreeks(self, underlyingPrice):
+        """计算理论价和希腊值，只计算设置了定价波动率的期权"""
+        mask = (self.pricingImpv > 0) & (self.t > 0)
+        if not underlyingPrice or not mask.any():
+            return
+
+        price, delta, gamma, theta, vega = self.model.calculateGreeks(underlyingPrice,
+                                                                      self.k[mask],
+                                                                      self.r,
+                                                                      self.t[mask],
+                                                                      self.pricingImpv[mask],
+                                                                      self.cp[mask])
+        size = self.size[mask]
+        self.theoPrice[mask] = price
+        self.theoDelta[mask] = delta * size
+        self.theoGamma[mask] = gamma * size
+        self.theoTheta[mask] = theta * size
+        self.theoVega[mask] = vega * size
+
+    #----------------------------------------------------------------------
+    def calculate(self, underlyingPrice):
+        """标的行情更新后重新定价整条链"""
+        if not underlyingPrice:
+            return
+        self.calculateImpv(underlyingPrice)
+        self.calculateTheoGreeks(underlyingPrice)
+
+    #----------------------------------------------------------------------
+    def getPosGreeks(self):
+        """持仓汇总，返回(longPos, shortPos, posValue, posDelta, posGamma, posTheta, posVega)"""
+        netPos = self.netPos
+        return (self.longPos.sum(),
+                self.shortPos.sum(),
+                np.dot(self.theoPrice, netPos),
+                np.dot(self.theoDelta, netPos),
+                np.dot(self.theoGamma, netPos),
+                np.dot(self.theoTheta, netPos),
+                np.dot(self.theoVega, netPos))
+
+    #----------------------------------------------------------------------
+    def writeBack(self):
+        """将计算结果写回期权对象，供界面显示"""
+        netPos = self.netPos
+        columns = [self.bidImpv, self.askImpv, self.midImpv,
+                   self.theoPrice, self.theoDelta, self.theoGamma, self.theoTheta, self.theoVega,
+                   self.theoPrice * netPos, self.theoDelta * netPos, self.theoGamma * netPos,
+                   self.theoTheta * netPos, self.theoVega * netPos]
+        rows = zip(*[column.tolist() for column in columns])
+
+        for option, row in zip(self.optionList, rows):
+            (option.bidImpv, option.askImpv, option.midImpv,
+             option.theoPrice, option.theoDelta, option.theoGamma, option.theoTheta, option.theoVega,
+             option.posValue, option.posDelta, option.posGamma, option.posTheta, option.posVega) = row
@@ -5,6 +5,11 @@
 1. 委托流控（单位时间内最大允许发出的委托数量）
 2. 总成交限制（每日总成交数量限制）
 3. 单笔委托的委托数量控制
+4. 按策略、合约、接口分别统计的活动委托、委托金额、持仓、撤单次数限制，
+   以及基于令牌桶的委托和撤单流控
+
+所有计数随委托、成交推送增量更新，发单时的检查不遍历任何委托列表。
+超过撤单流控的撤单不会被丢弃，而是排队等待，由定时器在流控恢复后重新发出。
 '''
 
 
@@ -12,12 +17,159 @@
 import json
 import os
 import platform
+from collections import OrderedDict, deque
+from time import perf_counter
 
-from vnpy.event import Event
 from vnpy.trader.vtEvent import *
 from vnpy.trader.vtConstant import *
-from vnpy.trader.vtGateway import VtLogData
 from vnpy.trader.vtFunction import getJsonPath
+from vnpy.trader.vtLog import createLogEvent
+
+
+########################################################################
+class TokenBucket(object):
+    """
+    令牌桶流控
+    桶容量为limit，每clear秒匀速补充limit个令牌，
+    允许瞬间发出limit次，长期平均速度不超过每clear秒limit次
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, limit, clear):
+        """Constructor"""
+        self.limit = float(limit)
+        self.rate = self.limit / clear if clear > 0 else self.limit
+        self.tokens = self.limit
+        self.updateTime = perf_counter()
+
+    #----------------------------------------------------------------------
+    def refill(self, now):
+        """补充令牌，返回当前令牌数量"""
+        tokens = self.tokens + (now - self.updateTime) * self.rate
+        if tokens > self.limit:
+            tokens = self.limit
+        self.tokens = tokens
+        self.updateTime = now
+        return tokens
+
+    #----------------------------------------------------------------------
+    def consume(self):
+        """消耗一个令牌"""
+        self.tokens -= 1
+
+    #----------------------------------------------------------------------
+    def reset(self):
+        """填满令牌桶"""
+        self.tokens = self.limit
+        self.updateTime = perf_counter()
+
+
+########################################################################
+class RmCounter(object):
+    """
+    单个策略、合约或者接口的风控计数
+    限制参数为0表示不做该项检查
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, name, limit):
+        """Constructor"""
+        self.name = name
+
+        self.workingOrderCount = EMPTY_INT      # 活动委托数量
+        self.workingNotional = EMPTY_FLOAT      # 活动委托未成交部分的金额
+        self.pos = EMPTY_INT                    # 净持仓
+        self.cancelCount = EMPTY_INT            # 撤单次数
+
+        self.setLimit(limit)
+
+    #----------------------------------------------------------------------
+    def setLimit(self, limit):
+        """设置限制参数"""
+        self.orderFlowLimit = limit.get('orderFlowLimit', 0)
+        self.orderFlowClear = limit.get('orderFlowClear', 1)
+        self.cancelFlowLimit = limit.get('cancelFlowLimit', 0)
+        self.cancelFlowClear = limit.get('cancelFlowClear', 1)
+        self.workingOrderLimit = limit.get('workingOrderLimit', 0)
+        self.notionalLimit = limit.get('notionalLimit', 0)
+        self.positionLimit = limit.get('positionLimit', 0)
+        self.orderCancelLimit = limit.get('orderCancelLimit', 0)
+
+        self.orderBucket = None
+        if self.orderFlowLimit:
+            self.orderBucket = TokenBucket(self.orderFlowLimit, self.orderFlowClear)
+
+        self.cancelBucket = None
+        if self.cancelFlowLimit:
+            self.cancelBucket = TokenBucket(self.cancelFlowLimit, self.cancelFlowClear)
+
+    #----------------------------------------------------------------------
+    def checkOrder(self, volume, notional, direction, now):
+        """检查委托，通过返回空字符串，否则返回原因"""
+        if self.orderBucket and self.orderBucket.refill(now) < 1:
+            return '%s委托流超过限制每%s秒%s' %(self.name, self.orderFlowClear, self.orderFlowLimit)
+
+        if self.workingOrderLimit and self.workingOrderCount >= self.workingOrderLimit:
+            return '%s活动委托数量%s，超过限制%s' %(self.name, self.workingOrderCount, self.workingOrderLimit)
+
+        if self.notionalLimit and self.workingNotional + notional > self.notionalLimit:
+            return '%s活动委托金额%s，加上本笔%s超过限制%s' %(self.name, self.workingNotional,
+                                                 notional, self.notionalLimit)
+
+        if self.positionLimit:
+            if direction == DIRECTION_LONG:
+                pos = self.pos + volume
+            else:
+                pos = self.pos - volume
+            # 只限制增加持仓方向的委托
+            if abs(pos) > self.positionLimit and abs(pos) > abs(self.pos):
+                return '%s持仓%s，委托成交后%s超过限制%s' %(self.name, self.pos, pos, self.positionLimit)
+
+        if self.orderCancelLimit and self.cancelCount >= self.orderCancelLimit:
+            return '%s撤单次数%s，超过限制%s' %(self.name, self.cancelCount, self.orderCancelLimit)
+
+        return EMPTY_STRING
+
+    #----------------------------------------------------------------------
+    def checkCancel(self, now):
+        """检查撤单流控"""
+        if self.cancelBucket and self.cancelBucket.refill(now) < 1:
+            return '%s撤单流超过限制每%s秒%s' %(self.name, self.cancelFlowClear, self.cancelFlowLimit)
+        return EMPTY_STRING
+
+    #----------------------------------------------------------------------
+    def consumeOrder(self):
+        """委托通过检查后消耗令牌"""
+        if self.orderBucket:
+            self.orderBucket.consume()
+
+    #----------------------------------------------------------------------
+    def consumeCancel(self):
+        """撤单通过检查后消耗令牌"""
+        if self.cancelBucket:
+            self.cancelBucket.consume()
+
+    #----------------------------------------------------------------------
+    def resetFlow(self):
+        """清空流控"""
+        if self.orderBucket:
+            self.orderBucket.reset()
+        if self.cancelBucket:
+            self.cancelBucket.reset()
+
+
+########################################################################
+class RmOrder(object):
+    """风控引擎跟踪的委托，记录其所属的计数对象"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, counterList, volume, unitNotional):
+        """Constructor"""
+        self.counterList = counterList      # 所属的策略、合约、接口计数
+        self.volume = volume                # 委托数量
+        self.tradedVolume = EMPTY_INT       # 已成交数量
+        self.unitNotional = unitNotional    # 每手金额
+        self.active = True                  # 是否仍计入活动委托
 
 
 ########################################################################
@@ -41,10 +193,9 @@ class RmEngine(object):
         self.active = False
 
         # 流控相关
-        self.orderFlowCount = EMPTY_INT     # 单位时间内委托计数
         self.orderFlowLimit = EMPTY_INT     # 委托限制
         self.orderFlowClear = EMPTY_INT     # 计数清空时间（秒）
-        self.orderFlowTimer = EMPTY_INT     # 计数清空时间计时
+        self.orderFlowBucket = None         # 委托流控令牌桶
 
         # 单笔委托相关
         self.orderSizeLimit = EMPTY_INT     # 单笔委托最大限制
@@ -59,11 +210,33 @@ class RmEngine(object):
 
         # 活动合约相关
         self.workingOrderLimit = EMPTY_INT  # 活动合约最大限制
+        self.workingOrderCount = EMPTY_INT  # 当前活动委托数量
         
         # 保证金相关
         self.marginRatioDict = {}           # 保证金占账户净值比例字典
         self.marginRatioLimit = EMPTY_FLOAT # 最大比例限制
 
+        # 分策略、合约、接口的限制，key为名称，'default'为默认限制
+        self.strategyLimitDict = {}
+        self.symbolLimitDict = {}
+        self.gatewayLimitDict = {}
+
+        self.strategyCounterDict = {}       # 策略名称:RmCounter
+        self.symbolCounterDict = {}         # vtSymbol:RmCounter
+        self.gatewayCounterDict = {}        # 接口名称:RmCounter
+
+        self.orderDict = {}                 # 未结束的委托，vtOrderID:RmOrder
+        self.finishedDict = OrderedDict()   # 最近结束的委托，vtOrderID:计数对象列表
+        self.finishedSize = 10000           # 保留的已结束委托数量
+        self.cancelQueue = deque()          # 超过撤单流控等待重发的撤单，(cancelOrderReq, gatewayName)
+        self.pendingDict = {}               # 已通过检查、尚未获得委托号的委托，orderReq:RmOrder
+        self.sizeDict = {}                  # vtSymbol:合约乘数
+
+        # 检查耗时统计
+        self.checkCount = EMPTY_INT
+        self.checkTime = EMPTY_FLOAT
+        self.checkTimeMax = EMPTY_FLOAT
+
         self.loadSetting()
         self.registerEvent()
 
@@ -89,6 +262,12 @@ class RmEngine(object):
             
             self.marginRatioLimit = d['marginRatioLimit']
 
+            self.strategyLimitDict = d.get('strategyLimit', {})
+            self.symbolLimitDict = d.get('symbolLimit', {})
+            self.gatewayLimitDict = d.get('gatewayLimit', {})
+
+        self.orderFlowBucket = TokenBucket(self.orderFlowLimit, self.orderFlowClear)
+
     #----------------------------------------------------------------------
     def saveSetting(self):
         """保存风控参数"""
@@ -111,6 +290,10 @@ class RmEngine(object):
             
             d['marginRatioLimit'] = self.marginRatioLimit
 
+            d['strategyLimit'] = self.strategyLimitDict
+            d['symbolLimit'] = self.symbolLimitDict
+            d['gatewayLimit'] = self.gatewayLimitDict
+
             # 写入json
             jsonD = json.dumps(d, indent=4)
             f.write(jsonD)
@@ -119,22 +302,58 @@ class RmEngine(object):
     def registerEvent(self):
         """注册事件监听"""
         self.eventEngine.register(EVENT_TRADE, self.updateTrade)
-        self.eventEngine.register(EVENT_TIMER, self.updateTimer)
         self.eventEngine.register(EVENT_ORDER, self.updateOrder)
         self.eventEngine.register(EVENT_ACCOUNT, self.updateAccount)
+        self.eventEngine.register(EVENT_TIMER, self.processTimerEvent)
         
     #----------------------------------------------------------------------
     def updateOrder(self, event):
-        """更新成交数据"""
-        # 只需要统计撤单成功的委托
+        """更新委托数据"""
         order = event.dict_['data']
-        if order.status != STATUS_CANCELLED:
+        finished = order.status in STATUS_FINISHED
+
+        # 已结束委托的重复推送
+        if order.vtOrderID in self.finishedDict:
             return
-        
-        if order.symbol not in self.orderCancelDict:
-            self.orderCancelDict[order.symbol] = 1
-        else:
-            self.orderCancelDict[order.symbol] += 1
+
+        rmOrder = self.orderDict.get(order.vtOrderID, None)
+        if not rmOrder:
+            counterList = self.getCounterList(order.byStrategy, order.vtSymbol, order.gatewayName)
+            if finished:
+                # 未跟踪过的已结束委托，只统计撤单
+                self.finishOrder(order.vtOrderID, counterList)
+                if order.status == STATUS_CANCELLED:
+                    self.countCancel(order.symbol, counterList)
+                return
+
+            # 不是通过主引擎发出的委托（如启动时查询到的委托），从推送开始跟踪
+            rmOrder = self.addOrder(counterList, order.totalVolume, self.getUnitNotional(order.vtSymbol, order.price))
+            self.orderDict[order.vtOrderID] = rmOrder
+
+        # 部分成交减少活动委托金额
+        tradedVolume = order.tradedVolume
+        if tradedVolume > rmOrder.tradedVolume:
+            notional = (tradedVolume - rmOrder.tradedVolume) * rmOrder.unitNotional
+            for counter in rmOrder.counterList:
+                counter.workingNotional -= notional
+            rmOrder.tradedVolume = tradedVolume
+
+        if finished:
+            self.removeOrder(rmOrder)
+            self.finishOrder(order.vtOrderID, rmOrder.counterList)
+            if order.status == STATUS_CANCELLED:
+                self.countCancel(order.symbol, rmOrder.counterList)
+
+    #----------------------------------------------------------------------
+    def finishOrder(self, vtOrderID, counterList):
+        """
+        委托结束后不再跟踪，只保留最近的一部分已结束委托，
+        用于忽略重复推送以及统计委托结束后才到达的成交
+        """
+        self.orderDict.pop(vtOrderID, None)
+        self.finishedDict[vtOrderID] = counterList
+        if len(self.finishedDict) > self.finishedSize:
+            self.finishedDict.popitem(last=False)
 
     #----------------------------------------------------------------------
     def updateTrade(self, event):
@@ -142,15 +361,109 @@ class RmEngine(object):
         trade = event.dict_['data']
         self.tradeCount += trade.volume
 
+        rmOrder = self.orderDict.get(trade.vtOrderID, None)
+        if rmOrder:
+            counterList = rmOrder.counterList
+        else:
+            counterList = self.finishedDict.get(trade.vtOrderID, None)
+            if counterList is None:
+                counterList = self.getCounterList(EMPTY_STRING, trade.vtSymbol, trade.gatewayName)
+
+        if trade.direction == DIRECTION_LONG:
+            volume = trade.volume
+        else:
+            volume = -trade.volume
+
+        for counter in counterList:
+            counter.pos += volume
+
     #----------------------------------------------------------------------
-    def updateTimer(self, event):
-        """更新定时器"""
-        self.orderFlowTimer += 1
+    def countCancel(self, symbol, counterList):
+        """统计撤单次数"""
+        if symbol not in self.orderCancelDict:
+            self.orderCancelDict[symbol] = 1
+        else:
+            self.orderCancelDict[symbol] += 1
 
-        # 如果计时超过了流控清空的时间间隔，则执行清空
-        if self.orderFlowTimer >= self.orderFlowClear:
-            self.orderFlowCount = 0
-            self.orderFlowTimer = 0
+        for counter in counterList:
+            counter.cancelCount += 1
+
+    #----------------------------------------------------------------------
+    def getCounter(self, counterDict, limitDict, name):
+        """获取计数对象，不存在则按配置创建"""
+        counter = counterDict.get(name, None)
+        if not counter:
+            limit = dict(limitDict.get('default', {}))
+            limit.update(limitDict.get(name, {}))
+            counter = RmCounter(name, limit)
+            counterDict[name] = counter
+        return counter
+
+    #----------------------------------------------------------------------
+    def getCounterList(self, strategyName, vtSymbol, gatewayName):
+        """获取委托对应的策略、合约、接口计数对象列表"""
+        counterList = [self.getCounter(self.symbolCounterDict, self.symbolLimitDict, vtSymbol),
+                       self.getCounter(self.gatewayCounterDict, self.gatewayLimitDict, gatewayName)]
+        if strategyName:
+            counterList.append(self.getCounter(self.strategyCounterDict, self.strategyLimitDict, strategyName))
+        return counterList
+
+    #----------------------------------------------------------------------
+    def getUnitNotional(self, vtSymbol, price):
+        """计算每手委托金额"""
+        size = self.sizeDict.get(vtSymbol, None)
+        if size is None:
+            contract = self.mainEngine.getContract(vtSymbol)
+            if not contract:
+                return price
+            size = contract.size or 1
+            self.sizeDict[vtSymbol] = size
+        return price * size
+
+    #----------------------------------------------------------------------
+    def addOrder(self, counterList, volume, unitNotional):
+        """增加活动委托计数"""
+        notional = volume * unitNotional
+        for counter in counterList:
+            counter.workingOrderCount += 1
+            counter.workingNotional += notional
+        self.workingOrderCount += 1
+        return RmOrder(counterList, volume, unitNotional)
+
+    #----------------------------------------------------------------------
+    def removeOrder(self, rmOrder):
+        """委托结束，减少活动委托计数"""
+        notional = (rmOrder.volume - rmOrder.tradedVolume) * rmOrder.unitNotional
+        for counter in rmOrder.counterList:
+            counter.workingOrderCount -= 1
+            counter.workingNotional -= notional
+        self.workingOrderCount -= 1
+        rmOrder.active = False
+
+    #----------------------------------------------------------------------
+    def registerOrder(self, vtOrderID, orderReq, gatewayName):
+        """
+        发单完成后由主引擎调用，将检查时预占的计数绑定到委托号上
+        发单失败（委托号为空）则释放预占的计数
+        """
+        rmOrder = self.pendingDict.pop(orderReq, None)
+
+        if not vtOrderID:
+            if rmOrder:
+                self.removeOrder(rmOrder)
+            return
+
+        if not rmOrder:
+            # 风控未启动时不做预占，在这里开始计数
+            counterList = self.getCounterList(orderReq.byStrategy, orderReq.vtSymbol, gatewayName)
+            rmOrder = self.addOrder(counterList, orderReq.volume,
+                                    self.getUnitNotional(orderReq.vtSymbol, orderReq.price))
+
+        # 委托推送可能先于委托号返回，此时以推送创建的记录为准
+        if vtOrderID in self.orderDict or vtOrderID in self.finishedDict:
+            self.removeOrder(rmOrder)
+        else:
+            self.orderDict[vtOrderID] = rmOrder
 
     #----------------------------------------------------------------------
     def updateAccount(self, event):
@@ -166,79 +479,242 @@ class RmEngine(object):
         self.marginRatioDict[account.gatewayName] = ratio
 
     #----------------------------------------------------------------------
-    def writeRiskLog(self, content):
-        """快速发出日志事件"""
-        # 发出报警提示音
+    def writeRiskLog(self, content, *args):
+        """快速发出日志事件，args不为空时在通过流控后才格式化content % args"""
+        event = createLogEvent(EVENT_LOG, self.name, content, args)
+        if not event:
+            return
 
+        # 发出报警提示音
         if platform.uname() == 'Windows':
             import winsound
             winsound.PlaySound("SystemHand", winsound.SND_ASYNC)
 
         # 发出日志事件
-        log = VtLogData()
-        log.logContent = content
-        log.gatewayName = self.name
-        event = Event(type_=EVENT_LOG)
-        event.dict_['data'] = log
         self.eventEngine.put(event)
 
     #----------------------------------------------------------------------
     def checkRisk(self, orderReq, gatewayName):
-        """检查风险"""
+        """检查风险，在发单线程中直接调用，同时统计检查耗时"""
         # 如果没有启动风控检查，则直接返回成功
         if not self.active:
             return True
 
+        start = perf_counter()
+        result = self.checkOrder(orderReq, gatewayName, start)
+
+        cost = perf_counter() - start
+        self.checkCount += 1
+        self.checkTime += cost
+        if cost > self.checkTimeMax:
+            self.checkTimeMax = cost
+
+        return result
+
+    #----------------------------------------------------------------------
+    def checkOrder(self, orderReq, gatewayName, now):
+        """检查单笔委托"""
         # 检查委托数量
         if orderReq.volume <= 0:
             self.writeRiskLog('委托数量必须大于0')
             return False
         
         if orderReq.volume > self.orderSizeLimit:
-            self.writeRiskLog('单笔委托数量%s，超过限制%s'
-                              %(orderReq.volume, self.orderSizeLimit))
+            self.writeRiskLog('单笔委托数量%s，超过限制%s',
+                              orderReq.volume, self.orderSizeLimit)
             return False
 
         # 检查成交合约量
         if self.tradeCount >= self.tradeLimit:
-            self.writeRiskLog('今日总成交合约数量%s，超过限制%s'
-                              %(self.tradeCount, self.tradeLimit))
+            self.writeRiskLog('今日总成交合约数量%s，超过限制%s',
+                              self.tradeCount, self.tradeLimit)
             return False
 
         # 检查流控
-        if self.orderFlowCount >= self.orderFlowLimit:
-            self.writeRiskLog('委托流数量%s，超过限制每%s秒%s'
-                              %(self.orderFlowCount, self.orderFlowClear, self.orderFlowLimit))
+        if self.orderFlowBucket.refill(now) < 1:
+            self.writeRiskLog('委托流数量超过限制每%s秒%s',
+                              self.orderFlowClear, self.orderFlowLimit)
             return False
 
         # 检查总活动合约
-        workingOrderCount = len(self.mainEngine.getAllWorkingOrders())
-        if workingOrderCount >= self.workingOrderLimit:
-            self.writeRiskLog('当前活动委托数量%s，超过限制%s'
-                              %(workingOrderCount, self.workingOrderLimit))
+        if self.workingOrderCount >= self.workingOrderLimit:
+            self.writeRiskLog('当前活动委托数量%s，超过限制%s',
+                              self.workingOrderCount, self.workingOrderLimit)
             return False
 
         # 检查撤单次数
         if orderReq.symbol in self.orderCancelDict and self.orderCancelDict[orderReq.symbol] >= self.orderCancelLimit:
-            self.writeRiskLog('当日%s撤单次数%s，超过限制%s'
-                              %(orderReq.symbol, self.orderCancelDict[orderReq.symbol], self.orderCancelLimit))
+            self.writeRiskLog('当日%s撤单次数%s，超过限制%s',
+                              orderReq.symbol, self.orderCancelDict[orderReq.symbol], self.orderCancelLimit)
             return False
         
         # 检查保证金比例
         if gatewayName in self.marginRatioDict and self.marginRatioDict[gatewayName] >= self.marginRatioLimit:
-            self.writeRiskLog('%s接口保证金占比%S，超过限制%s'
-                              %(gatewayName, self.marginRatioDict[gatewayName], self.marginRatioLimit))
+            self.writeRiskLog('%s接口保证金占比%s，超过限制%s',
+                              gatewayName, self.marginRatioDict[gatewayName], self.marginRatioLimit)
             return False
+
+        # 检查策略、合约、接口的限制
+        counterList = self.getCounterList(orderReq.byStrategy, orderReq.vtSymbol, gatewayName)
+        unitNotional = self.getUnitNotional(orderReq.vtSymbol, orderReq.price)
+        notional = orderReq.volume * unitNotional
+
+        for counter in counterList:
+            error = counter.checkOrder(orderReq.volume, notional, orderReq.direction, now)
+            if error:
+                self.writeRiskLog(error)
+                return False
         
-        # 对于通过风控的委托，增加流控计数
-        self.orderFlowCount += 1
+        # 对于通过风控的委托，消耗流控令牌，并预占活动委托计数
+        self.orderFlowBucket.consume()
+        for counter in counterList:
+            counter.consumeOrder()
+        self.pendingDict[orderReq] = self.addOrder(counterList, orderReq.volume, unitNotional)
 
         return True
 
+    #----------------------------------------------------------------------
+    def checkRiskList(self, orderReqList, gatewayName):
+        """
+        批量检查风险，返回与orderReqList一一对应的检查结果
+        账户级别的检查只做一次，流控和活动委托数量按整批计算
+        """
+        if not self.active:
+            return [True] * len(orderReqList)
+
+        start = perf_counter()
+        resultList = [False] * len(orderReqList)
+
+        # 账户级别的检查，不通过则整批拒绝
+        if self.tradeCount >= self.tradeLimit:
+            self.writeRiskLog('今日总成交合约数量%s，超过限制%s，拒绝整批%s笔委托'
+                              %(self.tradeCount, self.tradeLimit, len(orderReqList)))
+            return resultList
+
+        if gatewayName in self.marginRatioDict and self.marginRatioDict[gatewayName] >= self.marginRatioLimit:
+            self.writeRiskLog('%s接口保证金占比%s，超过限制%s，拒绝整批%s笔委托'
+                              %(gatewayName, self.marginRatioDict[gatewayName], self.marginRatioLimit, len(orderReqList)))
+            return resultList
+
+        # 本批可以发出的委托数量
+        available = min(int(self.orderFlowBucket.refill(start)),
+                        self.workingOrderLimit - self.workingOrderCount)
+
+        errorList = []
+        for n, orderReq in enumerate(orderReqList):
+            if orderReq.volume <= 0:
+                errorList.append('%s委托数量必须大于0' %orderReq.symbol)
+                continue
+
+            if orderReq.volume > self.orderSizeLimit:
+                errorList.append('%s委托数量%s超过限制%s' %(orderReq.symbol, orderReq.volume, self.orderSizeLimit))
+                continue
+
+            if orderReq.symbol in self.orderCancelDict and self.orderCancelDict[orderReq.symbol] >= self.orderCancelLimit:
+                errorList.append('%s撤单次数%s超过限制%s'
+                                 %(orderReq.symbol, self.orderCancelDict[orderReq.symbol], self.orderCancelLimit))
+                continue
+
+            if available <= 0:
+                errorList.append('%s超过流控或活动委托数量限制' %orderReq.symbol)
+                continue
+
+            # 同一批中前面的委托已经预占计数，后面的委托按累计结果检查
+            counterList = self.getCounterList(orderReq.byStrategy, orderReq.vtSymbol, gatewayName)
+            unitNotional = self.getUnitNotional(orderReq.vtSymbol, orderReq.price)
+            notional = orderReq.volume * unitNotional
+
+            error = EMPTY_STRING
+            for counter in counterList:
+                error = counter.checkOrder(orderReq.volume, notional, orderReq.direction, start)
+                if error:
+                    break
+            if error:
+                errorList.append(error)
+                continue
+
+            resultList[n] = True
+            available -= 1
+            self.orderFlowBucket.consume()
+            for counter in counterList:
+                counter.consumeOrder()
+            self.pendingDict[orderReq] = self.addOrder(counterList, orderReq.volume, unitNotional)
+
+        if errorList:
+            self.writeRiskLog('批量委托%s笔，拒绝%s笔：%s' %(len(orderReqList), len(errorList), '；'.join(errorList)))
+
+        cost = perf_counter() - start
+        self.checkCount += 1
+        self.checkTime += cost
+        if cost > self.checkTimeMax:
+            self.checkTimeMax = cost
+
+        return resultList
+
+    #----------------------------------------------------------------------
+    def checkCancel(self, cancelOrderReq, gatewayName):
+        """检查撤单流控，按委托所属的策略、合约、接口计数"""
+        if not self.active:
+            return True
+
+        now = perf_counter()
+
+        vtOrderID = VN_SEPARATOR.join([gatewayName, cancelOrderReq.orderID])
+        rmOrder = self.orderDict.get(vtOrderID, None)
+        if rmOrder:
+            counterList = rmOrder.counterList
+        else:
+            counterList = self.getCounterList(EMPTY_STRING, cancelOrderReq.vtSymbol, gatewayName)
+
+        for counter in counterList:
+            if counter.checkCancel(now):
+                return False
+
+        for counter in counterList:
+            counter.consumeCancel()
+        return True
+
+    #----------------------------------------------------------------------
+    def deferCancel(self, cancelOrderReq, gatewayName):
+        """超过撤单流控的撤单排队，等待定时器重新发出"""
+        self.cancelQueue.append((cancelOrderReq, gatewayName))
+        self.writeRiskLog(u'撤单超过流控，排队等待重发：%s，当前排队%s笔',
+                          cancelOrderReq.orderID, len(self.cancelQueue))
+
+    #----------------------------------------------------------------------
+    def processTimerEvent(self, event):
+        """重新发出排队的撤单，已结束的委托不再撤单"""
+        for i in range(len(self.cancelQueue)):
+            cancelOrderReq, gatewayName = self.cancelQueue.popleft()
+
+            vtOrderID = VN_SEPARATOR.join([gatewayName, cancelOrderReq.orderID])
+            if vtOrderID in self.finishedDict:
+                continue
+
+            if not self.checkCancel(cancelOrderReq, gatewayName):
+                self.cancelQueue.append((cancelOrderReq, gatewayName))
+                continue
+
+            gateway = self.mainEngine.getGateway(gatewayName)
+            if gateway:
+                gateway.cancelOrder(cancelOrderReq)
+
+    #----------------------------------------------------------------------
+    def getCheckLatency(self):
+        """获取发单检查的次数、平均耗时和最大耗时（微秒）"""
+        if not self.checkCount:
+            return 0, 0, 0
+        return (self.checkCount,
+                self.checkTime / self.checkCount * 1000000,
+                self.checkTimeMax * 1000000)
+
     #----------------------------------------------------------------------
     def clearOrderFlowCount(self):
         """清空流控计数"""
-        self.orderFlowCount = 0
+        self.orderFlowBucket.reset()
+        for counterDict in (self.strategyCounterDict, self.symbolCounterDict, self.gatewayCounterDict):
+            for counter in counterDict.values():
+                counter.resetFlow()
         self.writeRiskLog('清空流控计数')
 
     #----------------------------------------------------------------------
@@ -251,11 +727,13 @@ class RmEngine(object):
     def setOrderFlowLimit(self, n):
         """设置流控限制"""
         self.orderFlowLimit = n
+        self.orderFlowBucket = TokenBucket(self.orderFlowLimit, self.orderFlowClear)
 
     #----------------------------------------------------------------------
     def setOrderFlowClear(self, n):
         """设置流控清空时间"""
         self.orderFlowClear = n
+        self.orderFlowBucket = TokenBucket(self.orderFlowLimit, self.orderFlowClear)
 
     #----------------------------------------------------------------------
     def setOrderSizeLimit(self, n):
@@ -295,5 +773,8 @@ class RmEngine(object):
     #----------------------------------------------------------------------
     def stop(self):
         """停止"""
+        count, average, maximum = self.getCheckLatency()
+        if count:
+            self.writeRiskLog('风控检查%s次，平均耗时%.1f微秒，最大耗时%.1f微秒' %(count, average, maximum))
         self.saveSetting()
         
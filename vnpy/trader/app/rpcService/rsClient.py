@@ -2,8 +2,11 @@
 
 import copy
 
+from vnpy.event import Event
 from vnpy.rpc import RpcClient
 
+from .rsCodec import createCodec
+
 
 ########################################################################
 class ObjectProxy(object):
@@ -56,14 +59,29 @@ class RsClient(RpcClient):
     def callback(self, topic, data):
         """事件推送回调函数"""
         self.eventEngine.put(data)      # 直接放入事件引擎中
+        
+        # 主题为特定事件类型时，还原出特定事件
+        type_ = topic.decode('utf-8')
+        if type_ != data.type_:
+            event = Event(type_)
+            event.dict_ = data.dict_
+            self.eventEngine.put(event)
     
     #----------------------------------------------------------------------
-    def init(self, eventEngine):
-        """初始化"""
+    def init(self, eventEngine, topics=None):
+        """
+        初始化
+        topics：订阅的事件类型列表（按前缀匹配），默认订阅全部事件
+        """
         self.eventEngine = eventEngine  # 绑定事件引擎对象
         
-        self.usePickle()                # 使用cPickle序列化
-        self.subscribeTopic(b'')         # 订阅全部主题推送
+        self.useCodec(createCodec())    # 使用基于数据结构定义的序列化工具
+        
+        if topics is None:
+            topics = ['']               # 订阅全部主题推送
+        for topic in topics:
+            self.subscribeTopic(topic)
+        
         self.start()                    # 启动
 
 
@@ -80,10 +98,20 @@ class MainEngineProxy(object):
         self.client = None
         
     #----------------------------------------------------------------------
-    def init(self, reqAddress, subAddress):
+    def init(self, reqAddress, subAddress, topics=None):
         """初始化"""
         self.client = RsClient(reqAddress, subAddress)
-        self.client.init(self.eventEngine)
+        self.client.init(self.eventEngine, topics)
+    
+    #----------------------------------------------------------------------
+    def subscribeEvent(self, type_):
+        """订阅远端事件推送，例如EVENT_TICK+vtSymbol"""
+        self.client.subscribeTopic(type_)
+    
+    #----------------------------------------------------------------------
+    def unsubscribeEvent(self, type_):
+        """取消订阅远端事件推送"""
+        self.client.unsubscribeTopic(type_)
 
     #----------------------------------------------------------------------
     def __getattr__(self, name):
@@ -0,0 +1,54 @@
+# encoding: UTF-8
+
+from vnpy.event import Event
+from vnpy.rpc import ObjectCodec
+from vnpy.trader.vtEvent import (EVENT_TICK, EVENT_TRADE, EVENT_ORDER,
+                                 EVENT_POSITION, EVENT_ACCOUNT)
+from vnpy.trader.vtObject import (VtTickData, VtBarData, VtOrderData, VtTradeData,
+                                  VtPositionData, VtAccountData, VtLogData,
+                                  VtErrorData, VtContractData, VtTimeData)
+
+
+# 数据结构编号，服务端和客户端必须一致
+SCHEMA_LIST = [
+    (1, Event),
+    (2, VtTickData),
+    (3, VtBarData),
+    (4, VtOrderData),
+    (5, VtTradeData),
+    (6, VtPositionData),
+    (7, VtAccountData),
+    (8, VtLogData),
+    (9, VtErrorData),
+    (10, VtContractData)
+]
+
+# 网关同时推送通用事件和特定事件的事件类型，以及特定事件后缀对应的数据属性
+# RPC服务只广播通用事件，以特定事件类型作为主题，客户端收到后再还原出两个事件
+TOPIC_KEY_DICT = {
+    EVENT_TICK: 'vtSymbol',
+    EVENT_TRADE: 'vtSymbol',
+    EVENT_ORDER: 'vtOrderID',
+    EVENT_POSITION: 'vtSymbol',
+    EVENT_ACCOUNT: 'vtAccountID'
+}
+
+# 按需生成的时间字段，不在数据对象的初始属性中，需要单独加入字段表
+TIME_FIELDS = ['timestamp'] + sorted(VtTimeData.lazyTimeFields.keys())
+
+
+#----------------------------------------------------------------------
+def createCodec():
+    """创建RPC服务使用的序列化工具"""
+    codec = ObjectCodec()
+
+    for code, cls in SCHEMA_LIST:
+        if cls is Event:
+            codec.register(code, cls, ['type_', 'dict_'])
+        elif issubclass(cls, VtTimeData):
+            # 原始数据只在本地使用，不参与传输
+            codec.register(code, cls, exclude=['rawData'], optional=TIME_FIELDS)
+        else:
+            codec.register(code, cls, exclude=['rawData'])
+
+    return codec
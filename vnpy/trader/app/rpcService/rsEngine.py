@@ -7,6 +7,8 @@ from vnpy.trader.vtConstant import EMPTY_STRING
 from vnpy.rpc import RpcServer
 from vnpy.trader.vtFunction import getJsonPath
 
+from .rsCodec import createCodec, TOPIC_KEY_DICT
+
 
 ########################################################################
 class RsEngine(object):
@@ -29,6 +31,10 @@ class RsEngine(object):
         
         self.functionDict = {}              # 调用过的函数对象缓存字典
         
+        self.topicKeyDict = TOPIC_KEY_DICT                  # 通用事件类型:特定事件后缀属性
+        self.specificPrefix = tuple(TOPIC_KEY_DICT.keys())  # 特定事件的类型前缀
+        self.topicDict = {}                                 # 事件类型:主题的缓存
+        
         self.loadSetting()
         self.registerEvent()
         
@@ -42,7 +48,7 @@ class RsEngine(object):
             self.pubAddress = d['pubAddress']
             
             self.server = RpcServer(self.repAddress, self.pubAddress)
-            self.server.usePickle()
+            self.server.useCodec(createCodec())
             self.server.register(self.call)
             self.server.start()
             
@@ -82,8 +88,29 @@ class RsEngine(object):
         
     #----------------------------------------------------------------------
     def processEvent(self, event):
-        """处理事件推送"""
-        self.server.publish(b'', event)
+        """
+        处理事件推送
+        
+        以事件类型作为主题广播，客户端可以只订阅需要的主题（按前缀匹配），
+        例如订阅'eTick.rb1901'只接收该合约的行情。
+        对于网关同时推送的通用事件和特定事件，只广播一次通用事件，
+        主题为对应的特定事件类型，由客户端还原出两个事件。
+        """
+        type_ = event.type_
+        
+        if type_ in self.topicKeyDict:
+            data = event.dict_['data']
+            type_ = type_ + getattr(data, self.topicKeyDict[type_], '')
+        # 特定事件已随通用事件广播
+        elif type_.startswith(self.specificPrefix):
+            return
+        
+        topic = self.topicDict.get(type_, None)
+        if topic is None:
+            topic = type_.encode('utf-8')
+            self.topicDict[type_] = topic
+        
+        self.server.publish(topic, event)
     
     #----------------------------------------------------------------------
     def stop(self):
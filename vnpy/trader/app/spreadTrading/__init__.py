@@ -1,7 +1,15 @@
 # encoding: UTF-8
 
 from .stEngine import StEngine
-from .uiStWidget import StManager
+from .stBacktesting import StBacktestingEngine
+
+
+#----------------------------------------------------------------------
+def StManager(*args, **kwargs):
+    """创建价差交易界面，在这里才导入Qt，回测等无界面程序不需要加载"""
+    from .uiStWidget import StManager
+    return StManager(*args, **kwargs)
+
 
 appName = 'SpreadTrading'
 appDisplayName = '价差交易'
@@ -0,0 +1,670 @@
+# encoding: UTF-8
+
+'''
+价差交易回测引擎
+
+1. 各条腿的Tick数据以numpy数组保存，按时间归并为一条行情流，
+   每个时间点的价差买卖价和可交易数量通过数组运算一次性预先计算
+2. 回放时只逐行推送价差行情和撮合委托，价差行情和算法状态都没有变化的行直接跳过
+3. 算法的函数接口和StAlgoEngine保持一致，同一套算法代码可以用于回测和实盘
+4. 委托在对应腿的下一个Tick撮合，成交数量受对手盘挂单量限制，未成交部分继续挂单
+5. 预计算的价差数据可以在多组参数之间复用，用于优化payup、maxOrderSize等参数
+'''
+
+from __future__ import division
+from __future__ import print_function
+
+from collections import deque, OrderedDict
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from vnpy.trader.vtGlobal import globalSetting
+from vnpy.trader.vtObject import VtOrderData, VtTradeData, VtLogData
+from vnpy.trader.vtConstant import (DIRECTION_LONG, DIRECTION_SHORT,
+                                    OFFSET_OPEN, OFFSET_CLOSE,
+                                    STATUS_NOTTRADED, STATUS_PARTTRADED,
+                                    STATUS_ALLTRADED, STATUS_CANCELLED,
+                                    PRICETYPE_LIMITPRICE)
+
+from .stBase import StLeg, StSpread
+from .stAlgo import SniperAlgo
+
+
+# 每条腿需要的Tick字段
+TICK_FIELDS = ['bidPrice1', 'askPrice1', 'bidVolume1', 'askVolume1']
+
+
+########################################################################
+class StLegData(object):
+    """单条腿的回测数据"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, vtSymbol, data):
+        """
+        data为包含datetime和TICK_FIELDS字段的DataFrame，或者VtTickData列表
+        """
+        self.vtSymbol = vtSymbol
+
+        if not isinstance(data, pd.DataFrame):
+            data = pd.DataFrame([dict((k, getattr(tick, k)) for k in ['datetime'] + TICK_FIELDS)
+                                 for tick in data],
+                                columns=['datetime'] + TICK_FIELDS)
+
+        data = data.sort_values('datetime', kind='mergesort')
+        self.times = pd.to_datetime(data['datetime']).values.astype('datetime64[ns]').astype(np.int64)
+        self.bidPrice = data['bidPrice1'].values.astype(float)
+        self.askPrice = data['askPrice1'].values.astype(float)
+        self.bidVolume = data['bidVolume1'].values.astype(float)
+        self.askVolume = data['askVolume1'].values.astype(float)
+
+
+########################################################################
+class StBacktestingEngine(object):
+    """
+    价差交易回测引擎
+    函数接口和StAlgoEngine保持一样，
+    从而实现同一套算法代码从回测到实盘。
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        """Constructor"""
+        self.spread = None                  # 回测价差
+        self.legDict = OrderedDict()        # vtSymbol:StLeg
+        self.contractDict = {}              # vtSymbol:合约参数字典（size、priceTick、rate）
+        self.legDataDict = OrderedDict()    # vtSymbol:StLegData
+
+        self.algoClass = SniperAlgo
+        self.algoSetting = {}
+        self.algo = None
+
+        self.volumeLimit = True             # 成交数量是否受对手盘挂单量限制
+        self.maxTimerCatchUp = 10           # 行情间隔较长时最多补发的定时器次数
+        self.logActive = False              # 是否记录算法日志
+
+        # 预计算的归并行情
+        self.times = None                   # 每行的时间戳（纳秒）
+        self.source = None                  # 每行由哪条腿的Tick触发
+        self.legIndex = None                # 每行各条腿最新Tick的位置，形状为(腿数, 行数)
+        self.spreadBid = None
+        self.spreadAsk = None
+        self.spreadBidVolume = None
+        self.spreadAskVolume = None
+
+        self.clearBacktestingResult()
+
+    #----------------------------------------------------------------------
+    def output(self, content):
+        """输出内容"""
+        print(str(datetime.now()) + "\t" + content)
+
+    #----------------------------------------------------------------------
+    def clearBacktestingResult(self):
+        """清空回测状态和结果"""
+        self.row = 0                        # 当前回放的行
+
+        self.orderCount = 0
+        self.orderDict = OrderedDict()      # vtOrderID:VtOrderData
+        self.workingOrderDict = {}          # vtSymbol:{vtOrderID:VtOrderData}
+        self.tradeCount = 0
+        self.tradeList = []                 # 成交记录
+
+        self.eventQueue = deque()           # 待处理的回调，模拟事件引擎的异步推送
+        self.stateChanged = True            # 上次推送价差行情后算法状态是否有变化
+        self.logList = []
+
+        for leg in self.legDict.values():
+            leg.longPos = 0
+            leg.shortPos = 0
+            leg.netPos = 0
+        if self.spread:
+            self.spread.calculatePos()
+
+    #----------------------------------------------------------------------
+    # 回测设置
+    #----------------------------------------------------------------------
+    def createSpread(self, setting):
+        """创建价差，setting的格式和ST_setting.json中的单个价差相同"""
+        spread = StSpread()
+        spread.name = setting['name']
+
+        legSettingList = [setting['activeLeg']] + list(setting['passiveLegs'])
+        for n, d in enumerate(legSettingList):
+            leg = StLeg()
+            leg.vtSymbol = str(d['vtSymbol'])
+            leg.ratio = float(d['ratio'])
+            leg.multiplier = float(d['multiplier'])
+            leg.payup = int(d['payup'])
+
+            if n == 0:
+                spread.addActiveLeg(leg)
+            else:
+                spread.addPassiveLeg(leg)
+
+            self.legDict[leg.vtSymbol] = leg
+            self.contractDict.setdefault(leg.vtSymbol, {'size': 1, 'priceTick': 0, 'rate': 0})
+
+        spread.initSpread()
+        self.spread = spread
+
+    #----------------------------------------------------------------------
+    def setContract(self, vtSymbol, size=1, priceTick=0, rate=0):
+        """设置腿的合约大小、最小价格变动和手续费率"""
+        self.contractDict[vtSymbol] = {'size': size, 'priceTick': priceTick, 'rate': rate}
+
+    #----------------------------------------------------------------------
+    def setPayup(self, vtSymbol, payup):
+        """设置腿的超价tick数"""
+        self.legDict[vtSymbol].payup = int(payup)
+
+    #----------------------------------------------------------------------
+    def setAlgo(self, algoClass, setting=None):
+        """设置算法类和参数"""
+        self.algoClass = algoClass
+        self.algoSetting = setting or {}
+
+    #----------------------------------------------------------------------
+    def setVolumeLimit(self, volumeLimit):
+        """设置成交数量是否受对手盘挂单量限制"""
+        self.volumeLimit = volumeLimit
+
+    #----------------------------------------------------------------------
+    def setLog(self, active=False):
+        """设置是否记录算法日志"""
+        self.logActive = active
+
+    #----------------------------------------------------------------------
+    # 数据加载和预计算
+    #----------------------------------------------------------------------
+    def setLegData(self, vtSymbol, data):
+        """设置腿的Tick数据，DataFrame或者VtTickData列表"""
+        self.legDataDict[vtSymbol] = StLegData(vtSymbol, data)
+        self.times = None
+
+    #----------------------------------------------------------------------
+    def loadHistoryData(self, dbName, startDate, endDate):
+        """从MongoDB载入所有腿的Tick数据，数据范围[start:end)"""
+        import pymongo
+        client = pymongo.MongoClient(globalSetting['mongoHost'], globalSetting['mongoPort'])
+        projection = dict((k, 1) for k in ['datetime'] + TICK_FIELDS)
+        projection['_id'] = 0
+
+        for vtSymbol in self.legDict.keys():
+            collection = client[dbName][vtSymbol]
+            flt = {'datetime': {'$gte': startDate, '$lt': endDate}}
+            cursor = collection.find(flt, projection).sort('datetime')
+            data = pd.DataFrame(list(cursor), columns=['datetime'] + TICK_FIELDS)
+            self.setLegData(vtSymbol, data)
+            self.output(u'%s数据载入完成，数据量：%s' % (vtSymbol, len(data)))
+
+        client.close()
+
+    #----------------------------------------------------------------------
+    def prepareData(self):
+        """将各条腿的Tick按时间归并，并计算每行的价差盘口"""
+        legList = list(self.spread.allLegs)
+        dataList = [self.legDataDict[leg.vtSymbol] for leg in legList]
+
+        # 按时间归并，时间相同时按腿的顺序排列
+        times = np.concatenate([data.times for data in dataList])
+        source = np.concatenate([np.full(len(data.times), n, dtype=np.int64)
+                                 for n, data in enumerate(dataList)])
+        order = np.lexsort((source, times))
+        times = times[order]
+        source = source[order]
+
+        # 每行各条腿最新Tick的位置，尚无行情时为-1
+        legIndex = np.empty((len(legList), len(times)), dtype=np.int64)
+        for n in range(len(legList)):
+            legIndex[n] = np.cumsum(source == n) - 1
+
+        # 所有腿都有行情后才开始回放
+        valid = (legIndex >= 0).all(axis=0)
+        times = times[valid]
+        source = source[valid]
+        legIndex = legIndex[:, valid]
+
+        # 向量化计算价差盘口，公式和StSpread.calculatePrice相同
+        spreadBid = np.zeros(len(times))
+        spreadAsk = np.zeros(len(times))
+        spreadBidVolume = None
+        spreadAskVolume = None
+
+        for n, (leg, data) in enumerate(zip(legList, dataList)):
+            index = legIndex[n]
+            bid = data.bidPrice[index]
+            ask = data.askPrice[index]
+            bidVolume = data.bidVolume[index]
+            askVolume = data.askVolume[index]
+
+            if leg.multiplier > 0:
+                spreadBid += bid * leg.multiplier
+                spreadAsk += ask * leg.multiplier
+            else:
+                spreadBid += ask * leg.multiplier
+                spreadAsk += bid * leg.multiplier
+
+            if leg.ratio > 0:
+                legBidVolume = np.floor(bidVolume / leg.ratio)
+                legAskVolume = np.floor(askVolume / leg.ratio)
+            else:
+                legBidVolume = np.floor(askVolume / abs(leg.ratio))
+                legAskVolume = np.floor(bidVolume / abs(leg.ratio))
+
+            if spreadBidVolume is None:
+                spreadBidVolume = legBidVolume
+                spreadAskVolume = legAskVolume
+            else:
+                spreadBidVolume = np.minimum(spreadBidVolume, legBidVolume)
+                spreadAskVolume = np.minimum(spreadAskVolume, legAskVolume)
+
+        self.times = times
+        self.source = source
+        self.legIndex = legIndex
+        self.spreadBid = spreadBid
+        self.spreadAsk = spreadAsk
+        self.spreadBidVolume = spreadBidVolume
+        self.spreadAskVolume = spreadAskVolume
+
+        self.output(u'价差数据计算完成，数据量：%s' % len(times))
+
+    #----------------------------------------------------------------------
+    # 回放
+    #----------------------------------------------------------------------
+    def runBacktesting(self):
+        """运行回测"""
+        if self.times is None:
+            self.prepareData()
+
+        self.clearBacktestingResult()
+
+        self.algo = self.algoClass(self, self.spread)
+        self.algo.setAlgoParams(self.algoSetting)
+        if not self.algo.start():
+            self.output(u'算法启动失败')
+            return
+
+        spread = self.spread
+        legList = list(spread.allLegs)
+
+        # 逐行访问时列表比numpy数组快得多
+        quoteList = []
+        for leg in legList:
+            data = self.legDataDict[leg.vtSymbol]
+            quoteList.append(list(zip(data.bidPrice.tolist(), data.askPrice.tolist(),
+                                      data.bidVolume.tolist(), data.askVolume.tolist())))
+
+        times = self.times
+        source = self.source.tolist()
+        legIndex = self.legIndex.tolist()
+        spreadBid = self.spreadBid.tolist()
+        spreadAsk = self.spreadAsk.tolist()
+        spreadBidVolume = self.spreadBidVolume.tolist()
+        spreadAskVolume = self.spreadAskVolume.tolist()
+        seconds = (times // 1000000000).tolist()
+
+        lastSecond = seconds[0] if seconds else 0
+        lastQuote = None
+
+        for i in range(len(source)):
+            # 定时器，每秒一次
+            second = seconds[i]
+            if second != lastSecond:
+                count = min(second - lastSecond, self.maxTimerCatchUp)
+                for j in range(count):
+                    self.algo.updateTimer()
+                    self.processEvents()
+                lastSecond = second
+                self.stateChanged = True
+
+            # 更新触发行情的腿，并撮合这条腿上的委托
+            n = source[i]
+            leg = legList[n]
+            leg.bidPrice, leg.askPrice, leg.bidVolume, leg.askVolume = quoteList[n][legIndex[n][i]]
+            self.row = i
+
+            if self.workingOrderDict.get(leg.vtSymbol, None):
+                self.crossOrder(leg)
+                self.processEvents()
+
+            # 价差行情和算法状态都没有变化时不需要推送
+            quote = (spreadBid[i], spreadAsk[i], spreadBidVolume[i], spreadAskVolume[i])
+            if quote == lastQuote and not self.stateChanged:
+                continue
+            lastQuote = quote
+
+            spread.bidPrice, spread.askPrice, spread.bidVolume, spread.askVolume = quote
+            self.stateChanged = False
+            self.algo.updateSpreadTick(spread)
+            self.processEvents()
+
+        self.algo.stop()
+        self.processEvents()
+        self.output(u'回放结束，委托数量：%s，成交数量：%s' % (len(self.orderDict), len(self.tradeList)))
+
+    #----------------------------------------------------------------------
+    def processEvents(self):
+        """处理回调队列，模拟事件引擎在算法函数返回后再推送"""
+        queue = self.eventQueue
+        while queue:
+            func, data = queue.popleft()
+            func(data)
+            self.stateChanged = True
+
+    #----------------------------------------------------------------------
+    def getDatetime(self):
+        """当前回放时间"""
+        return pd.Timestamp(int(self.times[self.row])).to_pydatetime()
+
+    #----------------------------------------------------------------------
+    def crossOrder(self, leg):
+        """用腿的最新行情撮合委托"""
+        workingDict = self.workingOrderDict[leg.vtSymbol]
+
+        bidVolume = leg.bidVolume
+        askVolume = leg.askVolume
+
+        for vtOrderID, order in list(workingDict.items()):
+            if order.direction == DIRECTION_LONG:
+                if not leg.askPrice or order.price < leg.askPrice:
+                    continue
+                price = leg.askPrice
+                available = askVolume
+            else:
+                if not leg.bidPrice or order.price > leg.bidPrice:
+                    continue
+                price = leg.bidPrice
+                available = bidVolume
+
+            volume = order.totalVolume - order.tradedVolume
+            if self.volumeLimit:
+                volume = min(volume, available)
+            if volume <= 0:
+                continue
+
+            if order.direction == DIRECTION_LONG:
+                askVolume -= volume
+            else:
+                bidVolume -= volume
+
+            # 成交
+            self.tradeCount += 1
+            trade = VtTradeData()
+            trade.vtSymbol = leg.vtSymbol
+            trade.symbol = leg.vtSymbol
+            trade.tradeID = str(self.tradeCount)
+            trade.vtTradeID = trade.tradeID
+            trade.orderID = order.orderID
+            trade.vtOrderID = vtOrderID
+            trade.direction = order.direction
+            trade.offset = order.offset
+            trade.price = price
+            trade.volume = volume
+            trade.tradeDatetime = self.getDatetime()
+            trade.tradeTime = trade.tradeDatetime.strftime('%H:%M:%S')
+            self.tradeList.append(trade)
+
+            order.tradedVolume += volume
+            order.thisTradedVolume = volume
+            if order.tradedVolume >= order.totalVolume:
+                order.status = STATUS_ALLTRADED
+                del workingDict[vtOrderID]
+            else:
+                order.status = STATUS_PARTTRADED
+
+            self.updateLegPos(leg, trade)
+
+            # 和实盘一样，先推送成交再推送委托
+            self.eventQueue.append((self.algo.updateSpreadPos, self.spread))
+            self.eventQueue.append((self.algo.updateTrade, trade))
+            self.eventQueue.append((self.algo.updateOrder, self.copyOrder(order)))
+
+    #----------------------------------------------------------------------
+    def updateLegPos(self, leg, trade):
+        """更新腿持仓，逻辑和StDataEngine.processTradeEvent相同"""
+        if trade.direction == DIRECTION_LONG:
+            if trade.offset == OFFSET_OPEN:
+                leg.longPos += trade.volume
+            else:
+                leg.shortPos -= trade.volume
+        else:
+            if trade.offset == OFFSET_OPEN:
+                leg.shortPos += trade.volume
+            else:
+                leg.longPos -= trade.volume
+        leg.netPos = leg.longPos - leg.shortPos
+
+        self.spread.calculatePos()
+
+    #----------------------------------------------------------------------
+    def copyOrder(self, order):
+        """复制委托快照，避免推送后状态被修改"""
+        d = VtOrderData()
+        d.__dict__.update(order.__dict__)
+        return d
+
+    #----------------------------------------------------------------------
+    # 算法接口，和StAlgoEngine相同
+    #----------------------------------------------------------------------
+    def sendOrder(self, vtSymbol, direction, offset, price, volume, payup=0):
+        """发单"""
+        contract = self.contractDict[vtSymbol]
+        priceTick = contract['priceTick']
+
+        self.orderCount += 1
+        order = VtOrderData()
+        order.vtSymbol = vtSymbol
+        order.symbol = vtSymbol
+        order.orderID = str(self.orderCount)
+        order.vtOrderID = order.orderID
+        order.direction = direction
+        order.offset = offset
+        order.priceType = PRICETYPE_LIMITPRICE
+        order.totalVolume = int(volume)
+        order.status = STATUS_NOTTRADED
+
+        if direction == DIRECTION_LONG:
+            order.price = price + payup * priceTick
+        else:
+            order.price = price - payup * priceTick
+
+        self.orderDict[order.vtOrderID] = order
+        self.workingOrderDict.setdefault(vtSymbol, OrderedDict())[order.vtOrderID] = order
+        self.stateChanged = True
+
+        return [order.vtOrderID]
+
+    #----------------------------------------------------------------------
+    def cancelOrder(self, vtOrderID):
+        """撤单，撤单回报在算法函数返回后推送"""
+        order = self.orderDict.get(vtOrderID, None)
+        if not order:
+            return
+
+        workingDict = self.workingOrderDict.get(order.vtSymbol, {})
+        if vtOrderID not in workingDict:
+            return
+
+        del workingDict[vtOrderID]
+        order.status = STATUS_CANCELLED
+        self.eventQueue.append((self.algo.updateOrder, self.copyOrder(order)))
+
+    #----------------------------------------------------------------------
+    def buy(self, vtSymbol, price, volume, payup=0):
+        """买入"""
+        return self.sendOrder(vtSymbol, DIRECTION_LONG, OFFSET_OPEN, price, volume, payup)
+
+    #----------------------------------------------------------------------
+    def sell(self, vtSymbol, price, volume, payup=0):
+        """卖出"""
+        return self.sendOrder(vtSymbol, DIRECTION_SHORT, OFFSET_CLOSE, price, volume, payup)
+
+    #----------------------------------------------------------------------
+    def short(self, vtSymbol, price, volume, payup=0):
+        """卖空"""
+        return self.sendOrder(vtSymbol, DIRECTION_SHORT, OFFSET_OPEN, price, volume, payup)
+
+    #----------------------------------------------------------------------
+    def cover(self, vtSymbol, price, volume, payup=0):
+        """平空"""
+        return self.sendOrder(vtSymbol, DIRECTION_LONG, OFFSET_CLOSE, price, volume, payup)
+
+    #----------------------------------------------------------------------
+    def putAlgoEvent(self, algo):
+        """回测中不需要推送算法状态"""
+        pass
+
+    #----------------------------------------------------------------------
+    def writeLog(self, content):
+        """记录日志"""
+        if not self.logActive:
+            return
+
+        log = VtLogData()
+        log.logContent = content
+        if self.times is not None and len(self.times):
+            log.logTime = self.getDatetime().strftime('%Y-%m-%d %H:%M:%S')
+        self.logList.append(log)
+
+    #----------------------------------------------------------------------
+    # 回测结果
+    #----------------------------------------------------------------------
+    def calculateDailyResult(self):
+        """按日计算各条腿的盈亏，按每日最后一个Tick的中间价盯市"""
+        if self.times is None or not len(self.times):
+            return pd.DataFrame()
+
+        dates = pd.to_datetime(self.times).normalize()
+        last = ~pd.Series(dates).duplicated(keep='last').values
+
+        if self.tradeList:
+            tradeDf = pd.DataFrame({
+                'date': pd.to_datetime([t.tradeDatetime for t in self.tradeList]).normalize(),
+                'vtSymbol': [t.vtSymbol for t in self.tradeList],
+                'signedVolume': [t.volume if t.direction == DIRECTION_LONG else -t.volume
+                                 for t in self.tradeList],
+                'price': [t.price for t in self.tradeList]
+            })
+        else:
+            tradeDf = pd.DataFrame(columns=['date', 'vtSymbol', 'signedVolume', 'price'])
+
+        resultList = []
+        for n, leg in enumerate(self.spread.allLegs):
+            data = self.legDataDict[leg.vtSymbol]
+            contract = self.contractDict[leg.vtSymbol]
+            size = contract['size']
+            rate = contract['rate']
+
+            index = self.legIndex[n][last]
+            close = pd.Series((data.bidPrice[index] + data.askPrice[index]) / 2,
+                              index=dates[last])
+
+            legTrades = tradeDf[tradeDf['vtSymbol'] == leg.vtSymbol]
+            turnover = (legTrades['price'] * legTrades['signedVolume'].abs()) * size
+            cost = legTrades['price'] * legTrades['signedVolume']
+            daily = pd.DataFrame({
+                'netVolume': legTrades['signedVolume'].groupby(legTrades['date']).sum(),
+                'cost': cost.groupby(legTrades['date']).sum(),
+                'turnover': turnover.groupby(legTrades['date']).sum(),
+                'tradeCount': legTrades['signedVolume'].groupby(legTrades['date']).count()
+            }).reindex(close.index).fillna(0)
+
+            endPos = daily['netVolume'].cumsum()
+            startPos = endPos.shift(1).fillna(0)
+            preClose = close.shift(1).fillna(close.iloc[0])
+
+            df = pd.DataFrame(index=close.index)
+            df['vtSymbol'] = leg.vtSymbol
+            df['closePrice'] = close
+            df['endPos'] = endPos
+            df['tradeCount'] = daily['tradeCount']
+            df['turnover'] = daily['turnover']
+            df['holdingPnl'] = startPos * (close - preClose) * size
+            df['tradingPnl'] = (daily['netVolume'] * close - daily['cost']) * size
+            df['commission'] = daily['turnover'] * rate
+            df['totalPnl'] = df['holdingPnl'] + df['tradingPnl']
+            df['netPnl'] = df['totalPnl'] - df['commission']
+            resultList.append(df)
+
+        return pd.concat(resultList)
+
+    #----------------------------------------------------------------------
+    def calculateStatistics(self, dailyDf=None):
+        """计算回测统计指标"""
+        if dailyDf is None:
+            dailyDf = self.calculateDailyResult()
+
+        d = OrderedDict()
+        if dailyDf.empty:
+            d['totalNetPnl'] = 0
+            return d
+
+        daily = dailyDf.groupby(level=0)[['netPnl', 'commission', 'turnover', 'tradeCount']].sum()
+        balance = daily['netPnl'].cumsum()
+        drawdown = balance - balance.cummax().clip(lower=0)
+
+        d['totalDays'] = len(daily)
+        d['orderCount'] = len(self.orderDict)
+        d['tradeCount'] = len(self.tradeList)
+        d['totalTurnover'] = daily['turnover'].sum()
+        d['totalCommission'] = daily['commission'].sum()
+        d['totalNetPnl'] = daily['netPnl'].sum()
+        d['maxDrawdown'] = drawdown.min()
+        d['dailyNetPnl'] = daily['netPnl'].mean()
+        d['dailyStd'] = daily['netPnl'].std() if len(daily) > 1 else 0
+        d['finalNetPos'] = self.spread.netPos
+        if d['dailyStd']:
+            d['sharpeRatio'] = d['dailyNetPnl'] / d['dailyStd'] * np.sqrt(240)
+        else:
+            d['sharpeRatio'] = 0
+        return d
+
+    #----------------------------------------------------------------------
+    def showBacktestingResult(self):
+        """显示回测结果"""
+        d = self.calculateStatistics()
+        self.output('-' * 30)
+        for k, v in d.items():
+            self.output(u'%s：\t%s' % (k, v))
+
+    #----------------------------------------------------------------------
+    def runOptimization(self, settingList, targetName='totalNetPnl'):
+        """
+        参数优化，settingList为参数字典列表
+        字典中的payup对所有腿生效，payup:vtSymbol只对该腿生效，其余参数传给算法的setAlgoParams，
+        各组参数复用同一份预计算的价差数据
+        """
+        if self.times is None:
+            self.prepareData()
+
+        baseSetting = self.algoSetting
+        basePayup = dict((vtSymbol, leg.payup) for vtSymbol, leg in self.legDict.items())
+
+        resultList = []
+        for setting in settingList:
+            algoSetting = dict(baseSetting)
+            for vtSymbol, payup in basePayup.items():
+                self.legDict[vtSymbol].payup = payup
+
+            for k, v in setting.items():
+                if k == 'payup':
+                    for leg in self.legDict.values():
+                        leg.payup = int(v)
+                elif k.startswith('payup:'):
+                    self.setPayup(k[len('payup:'):], v)
+                else:
+                    algoSetting[k] = v
+
+            self.algoSetting = algoSetting
+            self.runBacktesting()
+            d = self.calculateStatistics()
+            resultList.append((setting, d.get(targetName, 0), d))
+
+        self.algoSetting = baseSetting
+        for vtSymbol, payup in basePayup.items():
+            self.legDict[vtSymbol].payup = payup
+
+        resultList.sort(reverse=True, key=lambda result: result[1])
+        return resultList
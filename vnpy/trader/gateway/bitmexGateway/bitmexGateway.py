@@ -21,6 +21,7 @@ from vnpy.api.bitmex import BitmexRestApi, BitmexWebsocketApiWithHeartbeat as Bi
 from vnpy.api.bitmex.utils import hmac_new
 from vnpy.trader.vtGateway import *
 from vnpy.trader.vtFunction import getJsonPath, getTempPath
+from vnpy.trader.vtTime import isoToNs
 from vnpy.trader.app.ctaStrategy import CtaTemplate
 
 # 委托状态类型映射
@@ -445,10 +446,7 @@ class WebsocketApi(BitmexWebsocketApi):
         
         tick.lastPrice = d['price']
         
-        date, time = str(d['timestamp']).split('T')
-        tick.date = date.replace('-', '')
-        tick.time = time.replace('Z', '')
-        tick.datetime = datetime.strptime(' '.join([tick.date, tick.time]), '%Y%m%d %H:%M:%S.%f')
+        tick.setTimestamp(isoToNs(str(d['timestamp'])))
         self.gateway.onTick(tick)
 
     #----------------------------------------------------------------------
@@ -469,10 +467,7 @@ class WebsocketApi(BitmexWebsocketApi):
             tick.__setattr__('askPrice%s' %(n+1), price)
             tick.__setattr__('askVolume%s' %(n+1), volume)                
         
-        date, time = str(d['timestamp']).split('T')
-        tick.date = date.replace('-', '')
-        tick.time = time.replace('Z', '')
-        tick.datetime = datetime.strptime(' '.join([tick.date, tick.time]), '%Y%m%d %H:%M:%S.%f')
+        tick.setTimestamp(isoToNs(str(d['timestamp'])))
         
         self.gateway.onTick(tick)
     
@@ -15,6 +15,7 @@ import pandas as pd
 from vnpy.api.ctp import MdApi, TdApi, defineDict
 from vnpy.trader.vtGateway import *
 from vnpy.trader.vtFunction import getJsonPath, getTempPath
+from vnpy.trader.vtTime import timeToNs, dateToNs, parseDateTime, NS_PER_MILLISECOND
 from vnpy.trader.vtConstant import GATEWAYTYPE_FUTURES, VN_SEPARATOR
 from .language import text
 import re
@@ -82,7 +83,7 @@ statusMapReverse = {v:k for k,v in list(statusMap.items())}
 symbolExchangeDict = {}
 
 # 夜盘交易时间段分隔判断
-NIGHT_TRADING = datetime(1900, 1, 1, 20).time()
+NIGHT_TRADING = timeToNs('20:00:00')
 
 
 ########################################################################
@@ -187,7 +188,7 @@ class CtpGateway(VtGateway):
     def onTick(self, tick):
         super(CtpGateway, self).onTick(tick)
         if tick.datetime is None:
-            tick.datetime = datetime.strptime(' '.join([tick.date, tick.time]), '%Y%m%d %H:%M:%S.%f')
+            tick.datetime = parseDateTime(tick.date, tick.time)
         self.update_current_datetime(tick.datetime)
         
     #----------------------------------------------------------------------
@@ -420,7 +421,7 @@ class CtpMdApi(MdApi):
 
         self.tradingDt = None               # 交易日datetime对象
         self.tradingDate = EMPTY_STRING     # 交易日期字符串
-        self.tickTime = None                # 最新行情time对象
+        self.tickTime = None                # 最新行情距零点的纳秒数
         self.lastTickDict = {}
 
     #----------------------------------------------------------------------
@@ -538,9 +539,9 @@ class CtpMdApi(MdApi):
         tick.lastPrice = data['LastPrice']
         tick.volume = data['Volume']
         tick.openInterest = data['OpenInterest']
-        tick.time = '.'.join([data['UpdateTime'], str(data['UpdateMillisec'])])
         # 上期所和郑商所可以直接使用，大商所需要转换
-        tick.date = data['ActionDay']
+        tickDate = data['ActionDay'] or data['TradingDay']
+        tickTime = timeToNs(data['UpdateTime']) + data['UpdateMillisec'] * NS_PER_MILLISECOND
 
         tick.openPrice = data['OpenPrice']
         tick.highPrice = data['HighestPrice']
@@ -558,17 +559,18 @@ class CtpMdApi(MdApi):
 
         # 大商所日期转换
         if tick.exchange is EXCHANGE_DCE:
-            newTime = datetime.strptime(tick.time, '%H:%M:%S.%f').time()    # 最新tick时间戳
-
             # 如果新tick的时间小于夜盘分隔，且上一个tick的时间大于夜盘分隔，则意味着越过了12点
-            if (self.tickTime and
-                newTime < NIGHT_TRADING and
+            if (self.tickTime is not None and
+                tickTime < NIGHT_TRADING and
                 self.tickTime > NIGHT_TRADING):
                 self.tradingDt += timedelta(1)                          # 日期加1
                 self.tradingDate = self.tradingDt.strftime('%Y%m%d')    # 生成新的日期字符串
 
-            tick.date = self.tradingDate    # 使用本地维护的日期
-            self.tickTime = newTime         # 更新上一个tick时间
+            tickDate = self.tradingDate     # 使用本地维护的日期
+            self.tickTime = tickTime        # 更新上一个tick时间
+
+        # date、time、datetime字段在读取时才生成
+        tick.setTimestamp(dateToNs(tickDate) + tickTime)
 
         # 处理tick成交量
         get_tick = self.lastTickDict.get(str(tick.symbol),None)
@@ -222,6 +222,9 @@ class HuobiDataApi(DataApi):
             
             for symbol in self.symbols:
                 self.subscribe(symbol)
+            
+            # 用REST行情快照填充初始行情
+            self.warmStart()
             # 订阅所有之前订阅过的行情
             #for req in self.subscribeDict.values():
             #    self.subscribe(req)
@@ -250,6 +253,48 @@ class HuobiDataApi(DataApi):
         self.subscribeMarketDetail(symbol)
         self.subscribeTradeDetail(symbol)
 
+    #----------------------------------------------------------------------
+    def resubscribe(self):
+        """重连后重新订阅，并用行情快照填充断线期间的行情"""
+        super(HuobiDataApi, self).resubscribe()
+        self.warmStart()
+
+    #----------------------------------------------------------------------
+    def warmStart(self):
+        """查询REST行情快照，策略无需等待websocket推送即可获得最新价格"""
+        self.gateway.tradeApi.getTickers()
+
+    #----------------------------------------------------------------------
+    def onSnapshot(self, data):
+        """行情快照推送
+        [{'open': 6574.72, 'close': 6573.32, 'low': 6528.0, 'high': 6683.55, 'amount': 13112.31, 
+        'vol': 86746600.49, 'count': 182105, 'symbol': 'btcusdt', 
+        'bid': 6573.31, 'bidSize': 0.1, 'ask': 6573.32, 'askSize': 0.5}]
+        """
+        now = datetime.now()
+        for d in data:
+            tick = self.tickDict.get(d['symbol'], None)
+            if not tick:
+                continue
+
+            tick.openPrice = float(d['open'])
+            tick.highPrice = float(d['high'])
+            tick.lowPrice = float(d['low'])
+            tick.lastPrice = float(d['close'])
+            tick.volume = float(d['vol'])
+            if 'bid' in d:
+                tick.bidPrice1 = float(d['bid'])
+                tick.bidVolume1 = float(d['bidSize'])
+                tick.askPrice1 = float(d['ask'])
+                tick.askVolume1 = float(d['askSize'])
+
+            tick.datetime = now
+            tick.date = now.strftime('%Y%m%d')
+            tick.time = now.strftime('%H:%M:%S.%f')
+            tick.localTime = now
+            tick.volumeChange = 0
+            self.gateway.onTick(copy(tick))
+
     #----------------------------------------------------------------------
     def writeLog(self, content):
         """发出日志"""
@@ -586,6 +631,11 @@ class HuobiTradeApi(TradeApi):
         """查询货币回调"""
         pass
 
+    #----------------------------------------------------------------------
+    def onGetTickers(self, data, reqid):
+        """查询行情快照回调"""
+        self.gateway.dataApi.onSnapshot(data)
+
     #----------------------------------------------------------------------
     def onGetTimestamp(self, data, reqid):
         """查询时间回调"""
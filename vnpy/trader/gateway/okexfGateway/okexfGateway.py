@@ -22,15 +22,19 @@ import requests
 from requests import ConnectionError
 
 from vnpy.api.rest import RestClient, Request
-from vnpy.api.websocket import WebsocketClient
+from vnpy.api.websocket import WebsocketClient, SubscribeManager
 from vnpy.trader.vtGateway import *
 from vnpy.trader.vtConstant import *
 from vnpy.trader.vtFunction import getJsonPath, getTempPath
+from vnpy.trader.vtTime import isoToNs, utcToLocalNs, msToLocalNs
 from .text import ERRORCODE
 
 REST_HOST = 'https://www.okex.com'
 WEBSOCKET_HOST = 'wss://real.okex.com:10440/websocket/okexapi?compress=true'
 
+# 批量下单接口每个请求的最大委托数量
+BATCH_ORDER_SIZE = 10
+
 # 委托状态类型映射
 statusMapReverse = {}
 statusMapReverse['0'] = STATUS_NOTTRADED
@@ -91,6 +95,8 @@ class OkexfGateway(VtGateway):
             leverage = int(setting['leverage'])
             sessionCount = int(setting['sessionCount'])
             self.contracts = setting['contracts']
+            subscribeBatchSize = int(setting.get('subscribeBatchSize', 20))
+            subscribeInterval = float(setting.get('subscribeInterval', 0.2))
         except KeyError:
             log = VtLogData()
             log.gatewayName = self.gatewayName
@@ -100,6 +106,7 @@ class OkexfGateway(VtGateway):
 
         # 创建行情和交易接口对象
         self.restApi.connect(apiKey, apiSecret, passphrase, leverage, sessionCount)
+        self.wsApi.setSubscribeRate(subscribeBatchSize, subscribeInterval)
         self.wsApi.connect(apiKey, apiSecret, passphrase)
 
         setQryEnabled = setting.get('setQryEnabled', None)
@@ -121,6 +128,11 @@ class OkexfGateway(VtGateway):
         """发单"""
         return self.restApi.sendOrder(orderReq)
 
+    #----------------------------------------------------------------------
+    def sendOrders(self, orderReqList):
+        """批量发单"""
+        return self.restApi.sendOrders(orderReqList)
+
     #----------------------------------------------------------------------
     def cancelOrder(self, cancelOrderReq):
         """撤单"""
@@ -141,6 +153,7 @@ class OkexfGateway(VtGateway):
         """关闭"""
         self.restApi.stop()
         self.wsApi.stop()
+        self.wsApi.subscribeManager.stop()
     
     #----------------------------------------------------------------------
     def initQuery(self, freq = 60):
@@ -212,6 +225,11 @@ class OkexfGateway(VtGateway):
 
     def qryAllOrders(self,vtSymbol,order_id,status=None):
         pass
+    
+    #----------------------------------------------------------------------
+    def qryOrderList(self, orderList):
+        """按委托号补查委托状态"""
+        self.restApi.queryOrderList(orderList)
 
     def loadHistoryBar(self,vtSymbol,type_,size=None,since=None,end=None):
         return self.loadHistoryBarV1(vtSymbol,type_,size,since,end)
@@ -404,6 +422,65 @@ class OkexfRestApi(RestClient):
     #----------------------------------------------------------------------
     def sendOrder(self, orderReq):# type: (VtOrderReq)->str
         """限速规则：20次/2s"""
+        symbol, data, order = self.createOrder(orderReq)
+        data['instrument_id'] = symbol
+        data['leverage'] = self.leverage
+
+        self.addRequest('POST', '/api/futures/v3/order', 
+                        callback=self.onSendOrder, 
+                        data=data, 
+                        extra=order,
+                        onFailed=self.onSendOrderFailed,
+                        onError=self.onSendOrderError)
+
+        return order.vtOrderID
+
+    #----------------------------------------------------------------------
+    def sendOrders(self, orderReqList):
+        """
+        批量下单，同一合约的委托每10笔合并为一个请求
+        限速规则：10次/2s，只有一笔的合约仍使用单笔下单接口
+        """
+        vtOrderIDList = []
+        symbolDict = OrderedDict()      # symbol:[(data, order)]
+
+        for orderReq in orderReqList:
+            symbol, data, order = self.createOrder(orderReq)
+            symbolDict.setdefault(symbol, []).append((data, order))
+            vtOrderIDList.append(order.vtOrderID)
+
+        for symbol, l in symbolDict.items():
+            if len(l) == 1:
+                data, order = l[0]
+                data['instrument_id'] = symbol
+                data['leverage'] = self.leverage
+                self.addRequest('POST', '/api/futures/v3/order',
+                                callback=self.onSendOrder,
+                                data=data,
+                                extra=order,
+                                onFailed=self.onSendOrderFailed,
+                                onError=self.onSendOrderError)
+                continue
+
+            for i in range(0, len(l), BATCH_ORDER_SIZE):
+                batch = l[i:i+BATCH_ORDER_SIZE]
+                data = {
+                    'instrument_id': symbol,
+                    'orders_data': [d for d, order in batch],
+                    'leverage': self.leverage,
+                }
+                self.addRequest('POST', '/api/futures/v3/orders',
+                                callback=self.onSendOrders,
+                                data=data,
+                                extra=[order for d, order in batch],
+                                onFailed=self.onSendOrdersFailed,
+                                onError=self.onSendOrdersError)
+
+        return vtOrderIDList
+
+    #----------------------------------------------------------------------
+    def createOrder(self, orderReq):
+        """生成委托数据，返回(交易所合约代码, 下单参数, 委托对象)"""
         self.orderID += 1
         orderID = self.getOrderID()
         vtOrderID = VN_SEPARATOR.join([self.gatewayName, orderID])
@@ -416,11 +493,9 @@ class OkexfRestApi(RestClient):
 
         data = {
             'client_oid': orderID,
-            'instrument_id': symbol,
             'type': type_,
             'price': orderReq.price,
             'size': int(orderReq.volume),
-            'leverage': self.leverage,
         }
         
         order = VtOrderData()
@@ -438,14 +513,7 @@ class OkexfRestApi(RestClient):
         self.localRemoteDict[orderID] = orderID
         self.orderDict[orderID] = order
 
-        self.addRequest('POST', '/api/futures/v3/order', 
-                        callback=self.onSendOrder, 
-                        data=data, 
-                        extra=order,
-                        onFailed=self.onSendOrderFailed,
-                        onError=self.onSendOrderError)
-
-        return vtOrderID
+        return symbol, data, order
     
     #----------------------------------------------------------------------
     def cancelOrder(self, cancelOrderReq):
@@ -507,6 +575,12 @@ class OkexfRestApi(RestClient):
         """"""
         self.addRequest('GET', '/api/futures/v3/accounts', 
                         callback=self.onQueryAccount)
+
+    #----------------------------------------------------------------------
+    def queryTicker(self):
+        """查询全部合约的行情快照，用于连接后立即推送初始行情"""
+        self.addRequest('GET', '/api/futures/v3/instruments/ticker',
+                        callback=self.onQueryTicker)
     
     #----------------------------------------------------------------------
     def queryPosition(self):
@@ -539,6 +613,22 @@ class OkexfRestApi(RestClient):
             self.addRequest('GET', path, params=req2,
                             callback=self.onQueryOrder)
 
+    #----------------------------------------------------------------------
+    def queryOrderList(self, orderList):
+        """按委托号逐个查询，客户端委托号和交易所委托号均可"""
+        for order in orderList:
+            symbol = None
+            for key,value in contractMap.items():
+                if value == order.symbol:
+                    symbol = key
+            if not symbol:
+                continue
+            
+            remoteID = self.localRemoteDict.get(order.orderID, order.orderID)
+            path = '/api/futures/v3/orders/%s/%s' %(symbol, remoteID)
+            self.addRequest('GET', path,
+                            callback=self.onQueryOrderInfo)
+
     # ----------------------------------------------------------------------
     def cancelAll(self, symbols=None, orders=None):
         """撤销所有挂单,若交易所支持批量撤单,使用批量撤单接口
@@ -740,7 +830,37 @@ class OkexfRestApi(RestClient):
         self.queryOrder()
         self.queryAccount()
         self.queryPosition()
-        
+        self.queryTicker()
+
+    #----------------------------------------------------------------------
+    def onQueryTicker(self, data, request):
+        """[{'instrument_id': 'EOS-USD-181228', 'last': '3.015', 'best_bid': '3.014', 'best_ask': '3.016', 
+            'high_24h': '3.177', 'low_24h': '2.727', 'volume_24h': '22562738', 
+            'timestamp': '2018-11-28T08:57:40.521Z'}]"""
+        tickDict = self.gateway.wsApi.tickDict
+        for d in data:
+            symbol = contractMap.get(d['instrument_id'], None)
+            tick = tickDict.get(symbol, None)
+            # 只推送已订阅的合约，且只在REST数据比已有的推送（例如断线前websocket的推送）更新时覆盖
+            if not tick:
+                continue
+            timestamp = utcToLocalNs(isoToNs(d['timestamp']))
+            if timestamp <= tick.timestamp:
+                continue
+
+            tick.lastPrice = float(d['last'])
+            tick.bidPrice1 = float(d['best_bid'])
+            tick.askPrice1 = float(d['best_ask'])
+            tick.highPrice = float(d['high_24h'])
+            tick.lowPrice = float(d['low_24h'])
+            tick.volume = float(d['volume_24h'])
+
+            tick.setTimestamp(timestamp)
+            tick.localTime = datetime.now()
+            tick.volumeChange = 0
+
+            self.gateway.onTick(copy(tick))
+
     #----------------------------------------------------------------------
     def onQueryAccount(self, data, request):
         """{'info': {'eos': {'equity': '9.49516783', 'margin': '0.52631594', 'margin_mode': 'crossed', 
@@ -812,6 +932,9 @@ class OkexfRestApi(RestClient):
             #print(d,"or")
 
             order = self.orderDict.get(str(d['order_id']),None)
+            # 发单回报丢失时只能通过客户端委托号找到委托
+            if not order and d.get('client_oid', None):
+                order = self.orderDict.get(d['client_oid'], None)
 
             if not order:
                 order = VtOrderData()
@@ -863,12 +986,17 @@ class OkexfRestApi(RestClient):
                 trade.direction = order.direction
                 trade.offset = order.offset
                 trade.volume = order.thisTradedVolume
-                trade.price = float(data['price_avg'])
+                trade.price = float(d['price_avg'])
                 trade.tradeDatetime = datetime.now()
                 trade.tradeTime = trade.tradeDatetime.strftime('%Y%m%d %H:%M:%S')
                 
                 self.gateway.onTrade(trade)
     
+    #----------------------------------------------------------------------
+    def onQueryOrderInfo(self, data, request):
+        """单个委托的查询回报，格式同onQueryOrder中的order_info元素"""
+        self.onQueryOrder({'order_info': [data]}, request)
+    
     #----------------------------------------------------------------------
     def onSendOrderFailed(self, data, request):
         """
@@ -911,6 +1039,55 @@ class OkexfRestApi(RestClient):
         # print('\nsendorder cancelDict:',self.cancelDict,"\nremotedict:",self.localRemoteDict,
         # "\norderDict:",self.orderDict.keys())
     
+    #----------------------------------------------------------------------
+    def onSendOrders(self, data, request):
+        """{'result': True, 'order_info': [{'error_message': '', 'error_code': 0,
+        'client_oid': '181129173533', 'order_id': '1878377147147264'}, ...]}"""
+        orderDict = dict([(order.orderID, order) for order in request.extra])
+        rejected = []
+
+        for d in data.get('order_info', []):
+            clientOid = d.get('client_oid', '')
+            order = orderDict.pop(clientOid, None)
+            if not order:
+                continue
+
+            if d.get('error_code') and str(d['error_code']) != '0':
+                order.status = STATUS_REJECTED
+                order.rejectedInfo = '%s %s' %(d['error_code'], d.get('error_message', ''))
+                self.gateway.onOrder(order)
+                rejected.append(clientOid)
+                continue
+
+            self.localRemoteDict[clientOid] = d['order_id']
+            self.orderDict[d['order_id']] = order
+
+            if clientOid in self.cancelDict:
+                req = self.cancelDict.pop(clientOid)
+                self.cancelOrder(req)
+
+        # 没有返回结果的委托，等待委托推送或补查确认状态
+        self.writeLog(u'批量下单%s笔，拒单%s笔%s，未返回%s笔'
+                      %(len(request.extra), len(rejected), rejected, len(orderDict)))
+
+    #----------------------------------------------------------------------
+    def onSendOrdersFailed(self, data, request):
+        """批量下单失败回调：服务器明确告知下单失败，整批委托拒单"""
+        self.writeLog("%s onsendordersfailed, %s"%(data,request.response.text))
+        for order in request.extra:
+            order.status = STATUS_REJECTED
+            order.rejectedInfo = request.response.text
+            self.gateway.onOrder(order)
+
+    #----------------------------------------------------------------------
+    def onSendOrdersError(self, exceptionType, exceptionValue, tb, request):
+        """批量下单失败回调：连接错误，整批委托拒单"""
+        self.writeLog("%s onsendorderserror, %s"%(exceptionType,exceptionValue))
+        for order in request.extra:
+            order.status = STATUS_REJECTED
+            order.rejectedInfo = "onSendOrdersError: OKEX server issue"
+            self.gateway.onOrder(order)
+
     #----------------------------------------------------------------------
     def onCancelOrder(self, data, request):
         """1:{'result': True, 'order_id': '1882519016480768', 'instrument_id': 'EOS-USD-181130'} 
@@ -1005,6 +1182,17 @@ class OkexfWebsocketApi(WebsocketClient):
         self.callbackDict = {}
         self.channelSymbolDict = {}
         self.tickDict = {}
+
+        # 行情频道由订阅管理器批量发送，重连后自动重新订阅
+        self.subscribeManager = SubscribeManager(self.sendChannels)
+        self.subscribeManager.onFailed = self.onSubscribeFailed
+        self.callbackDict['addChannel'] = self.onAddChannel
+
+    #----------------------------------------------------------------------
+    def setSubscribeRate(self, batchSize, interval):
+        """设置每帧订阅的频道数和帧间隔"""
+        self.subscribeManager.batchSize = batchSize
+        self.subscribeManager.interval = interval
     
     #----------------------------------------------------------------------
     def unpackData(self, data):
@@ -1019,28 +1207,41 @@ class OkexfWebsocketApi(WebsocketClient):
         self.passphrase = passphrase
         
         self.init(WEBSOCKET_HOST)
+
+        # 配置中的合约先登记到订阅管理器，连接成功后统一批量发送
+        for contract in self.gateway.contracts:
+            self.subscribe(contract)
+
+        self.subscribeManager.start()
         self.start()
     
     #----------------------------------------------------------------------
     def onConnected(self):
         """连接回调"""
         self.writeLog(u'Websocket API连接成功')
+        self.subscribeManager.onConnected()
         self.login()
+
+        # 用REST行情快照填充初始行情，策略无需等待websocket推送
+        if contractMap:
+            self.gateway.restApi.queryTicker()
     
     #----------------------------------------------------------------------
     def onDisconnected(self):
         """连接回调"""
+        self.subscribeManager.onDisconnected()
         self.writeLog(u'Websocket API连接断开')
     
     #----------------------------------------------------------------------
     def onPacket(self, packet):
         """数据回调"""
-        d = packet[0]
-        
-        channel = d['channel']
-        callback = self.callbackDict.get(channel, None)
-        if callback:
-            callback(d)
+        # 批量订阅时一个数据包中可能包含多个频道的数据
+        for d in packet:
+            channel = d['channel']
+            callback = self.callbackDict.get(channel, None)
+            if callback:
+                self.subscribeManager.onAck(channel)
+                callback(d)
     
     #----------------------------------------------------------------------
     def onError(self, exceptionType, exceptionValue, tb):
@@ -1085,44 +1286,13 @@ class OkexfWebsocketApi(WebsocketClient):
     #----------------------------------------------------------------------
     def subscribe(self, symbol):
         """"""
+        if symbol in self.tickDict:
+            return
+
         # V3到V1的代码转换
         #currency, contractType = convertSymbol(subscribeReq.symbol)
         currency, contractType = symbol[:3],symbol[4:]
         
-        # 订阅成交
-        channel1 = 'ok_sub_futureusd_%s_ticker_%s' %(currency, contractType)
-        self.callbackDict[channel1] = self.onTick
-        self.channelSymbolDict[channel1] = symbol
-        
-        req1 = {
-            'event': 'addChannel',
-            'channel': channel1
-        }
-        self.sendPacket(req1)
-        
-        # 订阅深度
-        channel2 = 'ok_sub_futureusd_%s_depth_%s_10' %(currency, contractType)
-        self.callbackDict[channel2] = self.onDepth
-        self.channelSymbolDict[channel2] = symbol
-        
-        req2 = {
-            'event': 'addChannel',
-            'channel': channel2
-        }
-        self.sendPacket(req2)
-
-        # subscribe trade
-        channel3 = 'ok_sub_futureusd_%s_trade_%s' %(currency, contractType)
-        self.callbackDict[channel3] = self.onFuturesTrades
-        self.channelSymbolDict[channel3] = symbol
-
-        req3 = {
-            'event': 'addChannel',
-            'channel': channel3
-        }
-        self.sendPacket(req3)
-
-        
         # 创建Tick对象
         tick = VtTickData()
         tick.gatewayName = self.gatewayName
@@ -1130,6 +1300,40 @@ class OkexfWebsocketApi(WebsocketClient):
         tick.exchange = 'OKEX'
         tick.vtSymbol = VN_SEPARATOR.join([tick.symbol, tick.gatewayName])
         self.tickDict[tick.symbol] = tick
+
+        # 订阅成交、深度和逐笔成交
+        channel1 = 'ok_sub_futureusd_%s_ticker_%s' %(currency, contractType)
+        channel2 = 'ok_sub_futureusd_%s_depth_%s_10' %(currency, contractType)
+        channel3 = 'ok_sub_futureusd_%s_trade_%s' %(currency, contractType)
+
+        self.callbackDict[channel1] = self.onTick
+        self.callbackDict[channel2] = self.onDepth
+        self.callbackDict[channel3] = self.onFuturesTrades
+
+        for channel in (channel1, channel2, channel3):
+            self.channelSymbolDict[channel] = symbol
+
+        # 由订阅管理器合并成批量请求发送
+        self.subscribeManager.subscribe([channel1, channel2, channel3])
+
+    #----------------------------------------------------------------------
+    def sendChannels(self, channels):
+        """在一个数据帧中订阅多个频道"""
+        req = [{'event': 'addChannel', 'channel': channel} for channel in channels]
+        self.sendPacket(req)
+
+    #----------------------------------------------------------------------
+    def onAddChannel(self, d):
+        """{'binary': 0, 'channel': 'addChannel', 'data': {'result': True, 
+            'channel': 'ok_sub_futureusd_eos_ticker_this_week'}}"""
+        data = d['data']
+        if data.get('result', False):
+            self.subscribeManager.onAck(data['channel'])
+
+    #----------------------------------------------------------------------
+    def onSubscribeFailed(self, channels):
+        """订阅多次重试后仍未确认"""
+        self.writeLog(u'订阅频道未收到确认：%s' %','.join(channels))
     
     #----------------------------------------------------------------------
     def onLogin(self, d):
@@ -1139,16 +1343,13 @@ class OkexfWebsocketApi(WebsocketClient):
             return
         
         # 订阅交易相关推送
-        self.sendPacket({'event': 'addChannel', 'channel': 'ok_sub_futureusd_trades'})
-        self.sendPacket({'event': 'addChannel', 'channel': 'ok_sub_futureusd_userinfo'})
-        self.sendPacket({'event': 'addChannel', 'channel': 'ok_sub_futureusd_positions'})
-        
         self.callbackDict['ok_sub_futureusd_trades'] = self.onTrade
         self.callbackDict['ok_sub_futureusd_userinfo'] = self.onAccount
         self.callbackDict['ok_sub_futureusd_positions'] = self.onPosition
 
-        for contract in self.gateway.contracts:
-            self.subscribe(contract)
+        self.sendChannels(['ok_sub_futureusd_trades',
+                           'ok_sub_futureusd_userinfo',
+                           'ok_sub_futureusd_positions'])
 
     #----------------------------------------------------------------------
     def onTick(self, d):
@@ -1208,9 +1409,7 @@ class OkexfWebsocketApi(WebsocketClient):
             tick.__setattr__('askPrice%s' %(10-n), float(price))
             tick.__setattr__('askVolume%s' %(10-n), int(volume))
         
-        tick.datetime = datetime.fromtimestamp(data['timestamp']/1000)
-        tick.date = tick.datetime.strftime('%Y%m%d')
-        tick.time = tick.datetime.strftime('%H:%M:%S.%f')
+        tick.setTimestamp(msToLocalNs(data['timestamp']))
         tick.localTime = datetime.now()
         tick.volumeChange = 0
         
@@ -15,34 +15,63 @@ from vnpy.trader.vtConstant import *
 from vnpy.trader.vtFunction import *
 from vnpy.trader.vtGateway import *
 from vnpy.trader.uiQt import QtGui, QtWidgets, QtCore, BASIC_FONT
+from vnpy.trader.uiTableModel import MonitorModel, MonitorProxyModel, MAX_ROWS, REFRESH_FREQUENCY
 
 
 COLOR_RED = QtGui.QColor('red')
 COLOR_GREEN = QtGui.QColor('green')
+COLOR_BLACK = QtGui.QColor('black')
+COLOR_BID = QtGui.QColor(255,174,201)
+COLOR_ASK = QtGui.QColor(160,255,160)
 
 
 ########################################################################
 class BasicCell(QtWidgets.QTableWidgetItem):
-    """基础的单元格"""
+    """
+    基础的单元格
+    
+    getDisplay、getForeground和BACKGROUND同时供监控表格模型使用，
+    保证单元格和模型的显示效果一致
+    """
+    BACKGROUND = None
 
     #----------------------------------------------------------------------
     def __init__(self, text=None, mainEngine=None):
         """Constructor"""
         super(BasicCell, self).__init__()
         self.data = None
+        self.mainEngine = mainEngine
         
         self.setTextAlignment(QtCore.Qt.AlignCenter)
         
+        if self.BACKGROUND:
+            self.setBackground(self.BACKGROUND)
+        
         if text:
             self.setContent(text)
     
     #----------------------------------------------------------------------
     def setContent(self, text):
         """设置内容"""
+        self.setData(QtCore.Qt.DisplayRole, self.getDisplay(text, self.mainEngine))
+        
+        color = self.getForeground(text)
+        if color:
+            self.setForeground(color)
+    
+    #----------------------------------------------------------------------
+    @classmethod
+    def getDisplay(cls, text, mainEngine=None):
+        """获取显示内容"""
         if text == '0' or text == '0.0':
-            self.setText('')
-        else:
-            self.setText(text)
+            return ''
+        return text
+    
+    #----------------------------------------------------------------------
+    @classmethod
+    def getForeground(cls, text):
+        """获取前景色"""
+        return None
 
 
 ########################################################################
@@ -50,21 +79,16 @@ class NumCell(BasicCell):
     """用来显示数字的单元格"""
 
     #----------------------------------------------------------------------
-    def __init__(self, text=None, mainEngine=None):
-        """Constructor"""
-        super(NumCell, self).__init__(text)
-        
-    #----------------------------------------------------------------------
-    def setContent(self, text):
-        """设置内容"""
+    @classmethod
+    def getDisplay(cls, text, mainEngine=None):
+        """获取显示内容"""
         # 考虑到NumCell主要用来显示OrderID和TradeID之类的整数字段，
         # 这里的数据转化方式使用int类型。但是由于部分交易接口的委托
         # 号和成交号可能不是纯数字的形式，因此补充了一个try...except
         try:
-            num = float(text)
-            self.setData(QtCore.Qt.DisplayRole, num)
+            return float(text)
         except ValueError:
-            self.setText(text)
+            return text
             
 
 ########################################################################
@@ -72,18 +96,20 @@ class DirectionCell(BasicCell):
     """用来显示买卖方向的单元格"""
 
     #----------------------------------------------------------------------
-    def __init__(self, text=None, mainEngine=None):
-        """Constructor"""
-        super(DirectionCell, self).__init__(text)
-        
+    @classmethod
+    def getDisplay(cls, text, mainEngine=None):
+        """获取显示内容"""
+        return text
+    
     #----------------------------------------------------------------------
-    def setContent(self, text):
-        """设置内容"""
+    @classmethod
+    def getForeground(cls, text):
+        """获取前景色"""
         if text == DIRECTION_LONG or text == DIRECTION_NET:
-            self.setForeground(QtGui.QColor('red'))
+            return COLOR_RED
         elif text == DIRECTION_SHORT:
-            self.setForeground(QtGui.QColor('green'))
-        self.setText(text)
+            return COLOR_GREEN
+        return None
 
 
 ########################################################################
@@ -91,62 +117,53 @@ class NameCell(BasicCell):
     """用来显示合约中文的单元格"""
 
     #----------------------------------------------------------------------
-    def __init__(self, text=None, mainEngine=None):
-        """Constructor"""
-        super(NameCell, self).__init__()
-        
-        self.mainEngine = mainEngine
-        self.data = None
-        
-        if text:
-            self.setContent(text)
-        
-    #----------------------------------------------------------------------
-    def setContent(self, text):
-        """设置内容"""
-        if self.mainEngine:
+    @classmethod
+    def getDisplay(cls, text, mainEngine=None):
+        """获取显示内容"""
+        if mainEngine:
             # 首先尝试正常获取合约对象
-            contract = self.mainEngine.getContract(text)
+            contract = mainEngine.getContract(text)
             
             # 如果能读取合约信息
             if contract:
-                self.setText(contract.name)
+                return contract.name
+        return ''
 
 
 ########################################################################
 class BidCell(BasicCell):
     """买价单元格"""
+    BACKGROUND = COLOR_BID
 
     #----------------------------------------------------------------------
-    def __init__(self, text=None, mainEngine=None):
-        """Constructor"""
-        super(BidCell, self).__init__(text)
-        
-        self.setForeground(QtGui.QColor('black'))
-        self.setBackground(QtGui.QColor(255,174,201))
-        
+    @classmethod
+    def getDisplay(cls, text, mainEngine=None):
+        """获取显示内容"""
+        return text
+    
     #----------------------------------------------------------------------
-    def setContent(self, text):
-        """设置内容"""
-        self.setText(text)
+    @classmethod
+    def getForeground(cls, text):
+        """获取前景色"""
+        return COLOR_BLACK
 
 
 ########################################################################
 class AskCell(BasicCell):
     """卖价单元格"""
+    BACKGROUND = COLOR_ASK
 
     #----------------------------------------------------------------------
-    def __init__(self, text=None, mainEngine=None):
-        """Constructor"""
-        super(AskCell, self).__init__(text)
-        
-        self.setForeground(QtGui.QColor('black'))
-        self.setBackground(QtGui.QColor(160,255,160))
-        
+    @classmethod
+    def getDisplay(cls, text, mainEngine=None):
+        """获取显示内容"""
+        return text
+    
     #----------------------------------------------------------------------
-    def setContent(self, text):
-        """设置内容"""
-        self.setText(text)
+    @classmethod
+    def getForeground(cls, text):
+        """获取前景色"""
+        return COLOR_BLACK
 
 
 ########################################################################
@@ -154,41 +171,38 @@ class PnlCell(BasicCell):
     """显示盈亏的单元格"""
 
     #----------------------------------------------------------------------
-    def __init__(self, text=None, mainEngine=None):
-        """Constructor"""
-        super(PnlCell, self).__init__()
-        self.data = None
-        self.color = ''
-        if text:
-            self.setContent(text)
+    @classmethod
+    def getDisplay(cls, text, mainEngine=None):
+        """获取显示内容"""
+        return text
     
     #----------------------------------------------------------------------
-    def setContent(self, text):
-        """设置内容"""
-        self.setText(text)
-
+    @classmethod
+    def getForeground(cls, text):
+        """获取前景色"""
         try:
             value = float(text)
-            if value >= 0 and self.color != 'red':
-                self.color = 'red'
-                self.setForeground(COLOR_RED)
-            elif value < 0 and self.color != 'green':
-                self.color = 'green'
-                self.setForeground(COLOR_GREEN)
         except ValueError:
-            pass
+            return None
+        
+        if value >= 0:
+            return COLOR_RED
+        else:
+            return COLOR_GREEN
 
 
 ########################################################################
-class BasicMonitor(QtWidgets.QTableWidget):
+class BasicMonitor(QtWidgets.QTableView):
     """
     基础监控
     
     headerDict中的值对应的字典格式如下
     {'chinese': u'中文名', 'cellType': BasicCell}
     
+    数据保存在MonitorModel中，事件引擎线程只负责把数据放入模型的缓冲区，
+    界面按固定频率批量刷新，表格行数超过上限后自动淘汰最早的数据。
     """
-    signal = QtCore.Signal(type(Event()))
+    dataDoubleClicked = QtCore.Signal(object)   # 双击表格时发出，参数为该行的数据对象
 
     #----------------------------------------------------------------------
     def __init__(self, mainEngine=None, eventEngine=None, parent=None):
@@ -203,19 +217,15 @@ class BasicMonitor(QtWidgets.QTableWidget):
         self.headerList = []             # 对应self.headerDict.keys()
         
         # 保存相关数据用
-        self.dataDict = {}  # 字典，key是字段对应的数据，value是保存相关单元格的字典
         self.dataKey = ''   # 字典键对应的数据字段
         
         # 监控的事件类型
         self.eventType = ''
         
-        # 列宽调整状态（只在第一次更新数据时调整一次列宽）
-        self.columnResized = False
-        
         # 字体
         self.font = None
         
-        # 保存数据对象到单元格
+        # 保存数据对象（数据对象始终保存在模型中，保留该设置用于兼容）
         self.saveData = False
         
         # 默认不允许根据表头进行排序，需要的组件可以开启
@@ -224,6 +234,14 @@ class BasicMonitor(QtWidgets.QTableWidget):
         # 默认表头可调整
         self.resizeMode = QtWidgets.QHeaderView.Interactive
         
+        # 表格最大行数和刷新频率
+        self.maxRows = MAX_ROWS
+        self.refreshFrequency = REFRESH_FREQUENCY
+        
+        # 数据模型，在initTable中创建
+        self.tableModel = None
+        self.proxy = None
+        
         # 初始化右键菜单
         self.initMenu()
         
@@ -231,7 +249,7 @@ class BasicMonitor(QtWidgets.QTableWidget):
     def setHeaderDict(self, headerDict):
         """设置表头有序字典"""
         self.headerDict = headerDict
-        self.headerList = headerDict.keys()
+        self.headerList = list(headerDict.keys())
         
     #----------------------------------------------------------------------
     def setDataKey(self, dataKey):
@@ -253,16 +271,33 @@ class BasicMonitor(QtWidgets.QTableWidget):
         """设置是否要保存数据到单元格"""
         self.saveData = saveData
         
+    #----------------------------------------------------------------------
+    def setMaxRows(self, maxRows):
+        """设置表格最大行数，0表示不限制"""
+        self.maxRows = maxRows
+        if self.tableModel:
+            self.tableModel.setMaxRows(maxRows)
+    
+    #----------------------------------------------------------------------
+    def setRefreshFrequency(self, frequency):
+        """设置表格刷新频率（Hz）"""
+        self.refreshFrequency = frequency
+        if self.tableModel:
+            self.tableModel.setRefreshFrequency(frequency)
+        
     #----------------------------------------------------------------------
     def initTable(self):
         """初始化表格"""
-        # 设置表格的列数
-        col = len(self.headerDict)
-        self.setColumnCount(col)
+        # 创建数据模型
+        self.tableModel = MonitorModel(self.headerDict, self.dataKey, self.mainEngine, self)
+        self.tableModel.setFont(self.font)
+        self.tableModel.setAlignment(QtCore.Qt.AlignCenter)
+        self.tableModel.setMaxRows(self.maxRows)
+        self.tableModel.setRefreshFrequency(self.refreshFrequency)
         
-        # 设置列表头
-        labels = [d['chinese'] for d in self.headerDict.values()]
-        self.setHorizontalHeaderLabels(labels)
+        self.proxy = MonitorProxyModel(self)
+        self.proxy.setSourceModel(self.tableModel)
+        self.setModel(self.proxy)
         
         # 关闭左边的垂直表头
         self.verticalHeader().setVisible(False)
@@ -278,12 +313,14 @@ class BasicMonitor(QtWidgets.QTableWidget):
         
         # 设为表头拉伸
         self.horizontalHeader().setSectionResizeMode(self.resizeMode)
+        
+        # 双击表格
+        self.doubleClicked.connect(self.onDoubleClicked)
 
     #----------------------------------------------------------------------
     def registerEvent(self):
-        """注册GUI更新相关的事件监听"""
-        self.signal.connect(self.updateEvent)
-        self.eventEngine.register(self.eventType, self.signal.emit)
+        """注册事件监听，数据在事件引擎线程中直接放入模型缓冲区"""
+        self.eventEngine.register(self.eventType, self.updateEvent)
         
     #----------------------------------------------------------------------
     def updateEvent(self, event):
@@ -293,66 +330,15 @@ class BasicMonitor(QtWidgets.QTableWidget):
     
     #----------------------------------------------------------------------
     def updateData(self, data):
-        """将数据更新到表格中"""
-        # 如果允许了排序功能，则插入数据前必须关闭，否则插入新的数据会变乱
-        if self.sorting:
-            self.setSortingEnabled(False)
-        
-        # 如果设置了dataKey，则采用存量更新模式
-        if self.dataKey:
-            key = data.__getattribute__(self.dataKey)
-            # 如果键在数据字典中不存在，则先插入新的一行，并创建对应单元格
-            if key not in self.dataDict:
-                self.insertRow(0)     
-                d = {}
-                for n, header in enumerate(self.headerList):                  
-                    content = safeUnicode(data.__getattribute__(header))
-                    cellType = self.headerDict[header]['cellType']
-                    cell = cellType(content, self.mainEngine)
-                    
-                    if self.font:
-                        cell.setFont(self.font)  # 如果设置了特殊字体，则进行单元格设置
-                    
-                    if self.saveData:            # 如果设置了保存数据对象，则进行对象保存
-                        cell.data = data
-                        
-                    self.setItem(0, n, cell)
-                    d[header] = cell
-                self.dataDict[key] = d
-            # 否则如果已经存在，则直接更新相关单元格
-            else:
-                d = self.dataDict[key]
-                for header in self.headerList:
-                    content = safeUnicode(data.__getattribute__(header))
-                    cell = d[header]
-                    cell.setContent(content)
-                    
-                    if self.saveData:            # 如果设置了保存数据对象，则进行对象保存
-                        cell.data = data                    
-        # 否则采用增量更新模式
-        else:
-            self.insertRow(0)  
-            for n, header in enumerate(self.headerList):
-                content = safeUnicode(data.__getattribute__(header))
-                cellType = self.headerDict[header]['cellType']
-                cell = cellType(content, self.mainEngine)
-                
-                if self.font:
-                    cell.setFont(self.font)
-
-                if self.saveData:
-                    cell.data = data                
-
-                self.setItem(0, n, cell)                        
-                
-        ## 调整列宽
-        #if not self.columnResized:
-            #self.resizeColumns()
-            #self.columnResized = True
-        
-        # 重新打开排序
-        if self.sorting:
-            self.setSortingEnabled(True)
+        """将数据更新到表格中，实际的界面刷新由模型定时批量完成"""
+        self.tableModel.addData(data)
+    
+    #----------------------------------------------------------------------
+    def onDoubleClicked(self, index):
+        """双击表格"""
+        data = self.proxy.data(index, QtCore.Qt.UserRole)
+        if data is not None:
+            self.dataDoubleClicked.emit(data)
     
     #----------------------------------------------------------------------
     def resizeColumns(self):
@@ -389,13 +375,13 @@ class BasicMonitor(QtWidgets.QTableWidget):
                     writer.writerow(headers)
                     
                     # 保存每行内容
-                    for row in range(self.rowCount()):
+                    for row in range(self.proxy.rowCount()):
                         rowdata = []
-                        for column in range(self.columnCount()):
-                            item = self.item(row, column)
-                            if item is not None:
+                        for column in range(self.proxy.columnCount()):
+                            content = self.proxy.index(row, column).data()
+                            if content is not None:
                                 rowdata.append(
-                                    text_type(item.text()).encode('gbk'))
+                                    text_type(content).encode('gbk'))
                             else:
                                 rowdata.append('')
                         writer.writerow(rowdata)     
@@ -462,7 +448,6 @@ class MarketMonitor(BasicMonitor):
 ########################################################################
 class LogMonitor(BasicMonitor):
     """日志监控"""
-    signalError = QtCore.Signal(type(Event()))
 
     #----------------------------------------------------------------------
     def __init__(self, mainEngine, eventEngine, parent=None):
@@ -480,26 +465,21 @@ class LogMonitor(BasicMonitor):
         self.initTable()
         self.registerEvent()
         
-        self.signalError.connect(self.processErrorEvent)
-        self.eventEngine.register(EVENT_ERROR, self.signalError.emit)
+        self.eventEngine.register(EVENT_ERROR, self.processErrorEvent)
         
         self.horizontalHeader().setSectionResizeMode(2, QtWidgets.QHeaderView.Stretch)
         # self.setFixedHeight(200)
     
     #----------------------------------------------------------------------
     def processErrorEvent(self, event):
-        """"""
+        """错误信息转换为日志显示"""
         error = event.dict_['data']
-        logContent = u'发生错误，错误代码:%s，错误信息:%s' %(error.errorID, error.errorMsg)
         
-        self.insertRow(0)
-        cellLogTime = BasicCell(error.errorTime)
-        cellLogContent = BasicCell(logContent)
-        cellGatewayName = BasicCell(error.gatewayName)
-        
-        self.setItem(0, 0, cellGatewayName)
-        self.setItem(0, 1, cellLogTime)
-        self.setItem(0, 2, cellLogContent)
+        log = VtLogData()
+        log.gatewayName = error.gatewayName
+        log.logTime = error.errorTime
+        log.logContent = u'发生错误，错误代码:%s，错误信息:%s' %(error.errorID, error.errorMsg)
+        self.updateData(log)
 
 
 ########################################################################
@@ -576,13 +556,11 @@ class OrderMonitor(BasicMonitor):
     def connectSignal(self):
         """连接信号"""
         # 双击单元格撤单
-        self.itemDoubleClicked.connect(self.cancelOrder) 
+        self.dataDoubleClicked.connect(self.cancelOrder) 
     
     #----------------------------------------------------------------------
-    def cancelOrder(self, cell):
-        """根据单元格的数据撤单"""
-        order = cell.data
-        
+    def cancelOrder(self, order):
+        """根据双击行的委托数据撤单"""
         req = VtCancelOrderReq()
         req.symbol = order.symbol
         req.exchange = order.exchange
@@ -648,22 +626,14 @@ class AccountMonitor(BasicMonitor):
         
         self.initTable()
         self.registerEvent()
+        
+        # 余额为0的账户不显示
+        self.tableModel.setFilterFunc(self.hasBalance)
     
     #----------------------------------------------------------------------
-    def updateData(self, data):
-        """更新数据"""
-        super(AccountMonitor, self).updateData(data)
-
-        # 如果该委托已完成，则隐藏该行
-        vtAccountID = data.vtAccountID
-        cellDict = self.dataDict[vtAccountID]
-        cell = cellDict['balance']
-        row = self.row(cell)
-        
-        if data.balance == 0:    
-            self.hideRow(row)
-        else:
-            self.showRow(row)
+    def hasBalance(self, account):
+        """账户余额是否不为0"""
+        return account.balance != 0
 
 
 ########################################################################
@@ -1091,6 +1061,7 @@ class ContractMonitor(BasicMonitor):
         self.setMinimumSize(800, 800)
         self.setFont(BASIC_FONT)
         self.setResizeMode(QtWidgets.QHeaderView.Stretch)
+        self.setMaxRows(0)      # 合约数量有限，不限制行数
         self.initTable()
         self.addMenuAction()
     
@@ -1102,34 +1073,15 @@ class ContractMonitor(BasicMonitor):
         l2 = list(d.keys())
         l2.sort(reverse=True)
 
-        self.setRowCount(len(l2))
-        row = 0
-        
-        for key in l2:
-            # 如果设置了过滤信息且合约代码中不含过滤信息，则不显示
-            if self.filterContent and self.filterContent not in key:
-                continue
-            
-            contract = d[key]
-            
-            for n, header in enumerate(self.headerList):
-                content = safeUnicode(contract.__getattribute__(header))
-                cellType = self.headerDict[header]['cellType']
-                cell = cellType(content)
-                
-                if self.font:
-                    cell.setFont(self.font)  # 如果设置了特殊字体，则进行单元格设置
-                    
-                self.setItem(row, n, cell)          
-            
-            row = row + 1        
+        # 如果设置了过滤信息且合约代码中不含过滤信息，则不显示
+        dataList = [d[key] for key in l2
+                    if not self.filterContent or self.filterContent in key]
+        self.tableModel.resetData(dataList)
     
     #----------------------------------------------------------------------
     def refresh(self):
         """刷新"""
         self.menu.close()   # 关闭菜单
-        self.clearContents()
-        self.setRowCount(0)
         self.showAllContracts()
     
     #----------------------------------------------------------------------
@@ -1205,18 +1157,13 @@ class WorkingOrderMonitor(OrderMonitor):
         """Constructor"""
         super(WorkingOrderMonitor, self).__init__(mainEngine, eventEngine, parent)
         
+        # 已完成的委托不显示
+        self.tableModel.setFilterFunc(self.isWorking)
+        
     #----------------------------------------------------------------------
-    def updateData(self, data):
-        """更新数据"""
-        super(WorkingOrderMonitor, self).updateData(data)
-
-        # 如果该委托已完成，则隐藏该行
-        if data.status in self.STATUS_COMPLETED:
-            vtOrderID = data.vtOrderID
-            cellDict = self.dataDict[vtOrderID]
-            cell = cellDict['status']
-            row = self.row(cell)
-            self.hideRow(row)    
+    def isWorking(self, order):
+        """委托是否仍为活动状态"""
+        return order.status not in self.STATUS_COMPLETED
     
 
 ########################################################################
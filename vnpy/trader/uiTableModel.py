@@ -0,0 +1,327 @@
+# encoding: UTF-8
+
+"""
+监控表格使用的数据模型
+
+1. 事件引擎线程只把数据放入待更新缓冲区，不直接操作界面
+2. 界面线程的定时器按固定频率（默认5Hz）批量应用缓冲区中的更新，
+   同一个键的多次更新只保留最新的一次，每批只发出一次dataChanged和rowsInserted
+3. 逐个单元格比较原始内容，只重新格式化发生变化的单元格
+4. 表格行数有上限，超出后淘汰最早插入的行
+"""
+
+import threading
+from collections import OrderedDict, deque
+
+from .vtFunction import safeUnicode
+from .uiQt import QtCore
+
+
+# 默认的表格刷新频率（Hz）
+REFRESH_FREQUENCY = 5
+
+# 默认的表格最大行数
+MAX_ROWS = 10000
+
+
+########################################################################
+class MonitorRow(object):
+    """表格中的一行"""
+    __slots__ = ['seq', 'data', 'raw', 'display', 'foreground']
+
+    #----------------------------------------------------------------------
+    def __init__(self, seq, data, size):
+        """Constructor"""
+        self.seq = seq                      # 插入序号
+        self.data = data                    # 数据对象
+        self.raw = [None] * size            # 各列的原始内容
+        self.display = [None] * size        # 各列的显示内容
+        self.foreground = [None] * size     # 各列的前景色
+
+
+########################################################################
+class MonitorModel(QtCore.QAbstractTableModel):
+    """
+    监控表格模型
+
+    headerDict中的cellType需要提供以下类方法和属性：
+    getDisplay(text, mainEngine)：返回显示内容
+    getForeground(text)：返回前景色，不设置时返回None
+    BACKGROUND：背景色，不设置时为None
+
+    最新的数据显示在表格顶部，内部按插入顺序保存（self.rows[0]为最早的行）。
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, headerDict, dataKey='', mainEngine=None, parent=None):
+        """Constructor"""
+        super(MonitorModel, self).__init__(parent)
+
+        self.mainEngine = mainEngine
+        self.dataKey = dataKey
+
+        self.headerList = list(headerDict.keys())
+        self.labelList = [d['chinese'] for d in headerDict.values()]
+        self.cellTypeList = [d['cellType'] for d in headerDict.values()]
+        self.backgroundList = [getattr(cellType, 'BACKGROUND', None) for cellType in self.cellTypeList]
+        self.columnCount_ = len(self.headerList)
+
+        self.font = None
+        self.alignment = None
+        self.maxRows = MAX_ROWS
+        self.filterFunc = None              # 过滤函数，返回False的数据不显示
+
+        self.rows = []                      # 表格数据，按插入顺序保存
+        self.keyDict = {}                   # 数据键:行
+        self.baseSeq = 0                    # self.rows[0]的插入序号
+        self.nextSeq = 0                    # 下一行的插入序号
+
+        # 待更新缓冲区，由事件引擎线程写入，界面线程读取
+        self.lock = threading.Lock()
+        self.pendingDict = OrderedDict()    # 存量更新模式，数据键:最新数据
+        self.pendingQueue = deque(maxlen=self.maxRows or None)   # 增量更新模式
+
+        # 定时批量刷新
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.flush)
+        self.setRefreshFrequency(REFRESH_FREQUENCY)
+        self.timer.start()
+
+    #----------------------------------------------------------------------
+    def setFont(self, font):
+        """设置字体"""
+        self.font = font
+
+    #----------------------------------------------------------------------
+    def setAlignment(self, alignment):
+        """设置单元格对齐方式"""
+        self.alignment = alignment
+
+    #----------------------------------------------------------------------
+    def setMaxRows(self, maxRows):
+        """设置最大行数，0表示不限制"""
+        self.maxRows = maxRows
+        with self.lock:
+            self.pendingQueue = deque(self.pendingQueue, maxlen=maxRows or None)
+
+    #----------------------------------------------------------------------
+    def setRefreshFrequency(self, frequency):
+        """设置刷新频率（Hz）"""
+        self.timer.setInterval(int(1000 / frequency))
+
+    #----------------------------------------------------------------------
+    def setFilterFunc(self, func):
+        """设置过滤函数"""
+        self.filterFunc = func
+
+    #----------------------------------------------------------------------
+    def addData(self, data):
+        """添加待更新的数据，可以在任意线程中调用"""
+        with self.lock:
+            if self.dataKey:
+                self.pendingDict[getattr(data, self.dataKey)] = data
+            else:
+                self.pendingQueue.append(data)
+
+    #----------------------------------------------------------------------
+    def flush(self):
+        """批量应用缓冲区中的更新"""
+        if not self.pendingDict and not self.pendingQueue:
+            return
+
+        with self.lock:
+            if self.dataKey:
+                pending = list(self.pendingDict.values())
+                self.pendingDict.clear()
+            else:
+                pending = list(self.pendingQueue)
+                self.pendingQueue.clear()
+
+        # 先更新已有的行
+        newList = []
+        top = bottom = left = right = None
+
+        for data in pending:
+            row = None
+            if self.dataKey:
+                key = getattr(data, self.dataKey)
+                row = self.keyDict.get(key, None)
+
+            if row is None:
+                newList.append(data)
+                continue
+
+            row.data = data
+            changed = self.updateRow(row, data)
+            if not changed:
+                continue
+
+            n = self.getRowIndex(row)
+            if top is None:
+                top = bottom = n
+                left, right = changed[0], changed[-1]
+            else:
+                top = min(top, n)
+                bottom = max(bottom, n)
+                left = min(left, changed[0])
+                right = max(right, changed[-1])
+
+        if top is not None:
+            self.dataChanged.emit(self.index(top, left), self.index(bottom, right))
+
+        # 再插入新的行
+        if newList:
+            self.insertData(newList)
+
+    #----------------------------------------------------------------------
+    def updateRow(self, row, data):
+        """更新一行的内容，返回发生变化的列"""
+        changed = []
+        for n, header in enumerate(self.headerList):
+            text = safeUnicode(getattr(data, header))
+            if text == row.raw[n]:
+                continue
+
+            cellType = self.cellTypeList[n]
+            row.raw[n] = text
+            row.display[n] = cellType.getDisplay(text, self.mainEngine)
+            row.foreground[n] = cellType.getForeground(text)
+            changed.append(n)
+        return changed
+
+    #----------------------------------------------------------------------
+    def createRow(self, data):
+        """创建新的行"""
+        row = MonitorRow(self.nextSeq, data, self.columnCount_)
+        self.nextSeq += 1
+        self.updateRow(row, data)
+
+        if self.dataKey:
+            self.keyDict[getattr(data, self.dataKey)] = row
+        return row
+
+    #----------------------------------------------------------------------
+    def insertData(self, dataList):
+        """插入新的行到表格顶部，超出最大行数时淘汰最早的行"""
+        # 一批中超出最大行数的部分不需要显示
+        if self.maxRows and len(dataList) > self.maxRows:
+            dataList = dataList[-self.maxRows:]
+
+        self.beginInsertRows(QtCore.QModelIndex(), 0, len(dataList) - 1)
+        self.rows.extend([self.createRow(data) for data in dataList])
+        self.endInsertRows()
+
+        # 淘汰最早的行，即表格底部的行
+        count = len(self.rows)
+        if self.maxRows and count > self.maxRows:
+            n = count - self.maxRows
+            self.beginRemoveRows(QtCore.QModelIndex(), count - n, count - 1)
+            if self.dataKey:
+                for row in self.rows[:n]:
+                    key = getattr(row.data, self.dataKey)
+                    if self.keyDict.get(key, None) is row:
+                        del self.keyDict[key]
+            del self.rows[:n]
+            self.baseSeq += n
+            self.endRemoveRows()
+
+    #----------------------------------------------------------------------
+    def resetData(self, dataList):
+        """用数据列表重置表格，列表中的第一个数据显示在顶部"""
+        with self.lock:
+            self.pendingDict.clear()
+            self.pendingQueue.clear()
+
+        self.beginResetModel()
+        self.rows = []
+        self.keyDict = {}
+        self.baseSeq = self.nextSeq
+        for data in reversed(dataList):
+            self.rows.append(self.createRow(data))
+        self.endResetModel()
+
+    #----------------------------------------------------------------------
+    def clearData(self):
+        """清空表格"""
+        self.resetData([])
+
+    #----------------------------------------------------------------------
+    def getRowIndex(self, row):
+        """获取行在表格中的位置"""
+        return len(self.rows) - 1 - (row.seq - self.baseSeq)
+
+    #----------------------------------------------------------------------
+    def getRow(self, n):
+        """获取表格中第n行"""
+        return self.rows[len(self.rows) - 1 - n]
+
+    #----------------------------------------------------------------------
+    def getData(self, n):
+        """获取表格中第n行的数据对象"""
+        return self.getRow(n).data
+
+    #----------------------------------------------------------------------
+    def filterRow(self, n):
+        """表格中第n行是否显示"""
+        if not self.filterFunc:
+            return True
+        return self.filterFunc(self.getRow(n).data)
+
+    #----------------------------------------------------------------------
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        """行数"""
+        if parent.isValid():
+            return 0
+        return len(self.rows)
+
+    #----------------------------------------------------------------------
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        """列数"""
+        if parent.isValid():
+            return 0
+        return self.columnCount_
+
+    #----------------------------------------------------------------------
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        """单元格数据"""
+        if not index.isValid():
+            return None
+
+        column = index.column()
+
+        if role == QtCore.Qt.DisplayRole:
+            return self.getRow(index.row()).display[column]
+        elif role == QtCore.Qt.ForegroundRole:
+            return self.getRow(index.row()).foreground[column]
+        elif role == QtCore.Qt.BackgroundRole:
+            return self.backgroundList[column]
+        elif role == QtCore.Qt.FontRole:
+            return self.font
+        elif role == QtCore.Qt.TextAlignmentRole:
+            return self.alignment
+        elif role == QtCore.Qt.UserRole:
+            return self.getRow(index.row()).data
+        return None
+
+    #----------------------------------------------------------------------
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        """表头"""
+        if role == QtCore.Qt.DisplayRole and orientation == QtCore.Qt.Horizontal:
+            return self.labelList[section]
+        return None
+
+
+########################################################################
+class MonitorProxyModel(QtCore.QSortFilterProxyModel):
+    """负责监控表格的排序和过滤"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, parent=None):
+        """Constructor"""
+        super(MonitorProxyModel, self).__init__(parent)
+        self.setDynamicSortFilter(True)
+
+    #----------------------------------------------------------------------
+    def filterAcceptsRow(self, sourceRow, sourceParent):
+        """是否显示该行"""
+        return self.sourceModel().filterRow(sourceRow)
@@ -1,209 +1,306 @@
-from bisect import bisect
-from datetime import timedelta
-
-import pandas as pd
-import dateutil.rrule as rrule
-from pandas.tseries.holiday import USFederalHolidayCalendar
-
-from . import Singleton
-
-class TradingDatetimeRRuler(meta_class=Singleton):
-    rruler_map = {
-        "w": "weekly",
-        "d": "daily",
-        "m": "minutely",
-        "h": "hourly",
-        "s": "secondly",
-    }
-    
-    def get_rruler_map(self, freq):
-        return self.rruler_map[freq[-1]]
-
-    def get_rruler(self, freq, dtstart, dtend, count):
-        func = getattr(self, "get_%s_rruler" % self.get_rruler_map(freq))
-        return func(freq, dtstart, dtend, count)
-
-    def get_weekly_rruler(self, freq, dtstart, dtend, count):
-        raise NotImplementedError
-
-    def get_daily_rruler(self, freq, dtstart, dtend, count):
-        raise NotImplementedError
-    
-    def get_minutely_rruler(self, freq, dtstart, dtend, count):
-        raise NotImplementedError
-
-    def get_hourly_rruler(self, dtstart, dtend, count):
-        raise NotImplementedError
-
-    def get_secondly_rruler(self, freq, dtstart, dtend, count):
-        raise NotImplementedError
-
-
-class ContinuousTradingDatetimeRuler(TradingDatetimeRRuler):
-    def get_weekly_rruler(self, freq, dtstart=None, dtend=None, count=None):
-        num = int(freq[:-1])
-        return rrule.rrule(interval=num, freq=rrule.WEEKLY, dtstart=dtstart, until=dtend, count=count)
-
-    def get_daily_rruler(self, freq, dtstart=None, dtend=None, count=None):
-        num = int(freq[:-1])
-        return rrule.rrule(interval=num, freq=rrule.DAILY, dtstart=dtstart, until=dtend, count=count)
-
-    def get_hourly_rruler(self, freq, dtstart=None, dtend=None, count=None):
-        num = int(freq[:-1])
-        return rrule.rrule(interval=num, freq=rrule.HOURLY, dtstart=dtstart, until=dtend, count=count)
-
-    def get_minutely_rruler(self, freq, dtstart, dtend, count):
-        num = int(freq[:-1])
-        return rrule.rrule(interval=num, freq=rrule.MINUTELY, dtstart=dtstart, until=dtend, count=count)
-    
-    def get_second_rruler(self, freq, dtstart, dtend, count):
-        num = int(freq[:-1])
-        return rrule.rrule(interval=num, freq=rrule.SECONDLY, dtstart=dtstart, until=dtend, count=count)
-
-
-class InternationalTradingDatetimeRuler(TradingDatetimeRRuler):
-    byweekday = [0,1,2,3,4]
-
-    def get_holidays(self, dtstart, dtend):
-        cal = USFederalHolidayCalendar()
-        holidays = cal.holidays(start=dtstart, end=dtend).to_pydatetime()
-        return holidays
-
-    def get_weekly_rruler(self, freq, dtstart=None, dtend=None, count=None):
-        rset = rrule.rruleset() 
-        num = int(freq[:-1])
-        rset.rrule(rrule.rrule(interval=num, freq=rrule.WEEKLY, dtstart=dtstart, until=dtend, count=count, byweekday=self.byweekday))
-        delta = num * count * 7 if count else 0
-        if dtstart and dtend:
-            dtstart_ = dtstart
-            dtend_ = dtend
-        elif dtstart:
-            dtstart_ = dtstart
-            dtend_ = dtstart + timedelta(days=2 * delta)
+"""
+交易时段日历
+
+按品种定义每日的交易时段（夜盘、午休、小节休息）和交易的星期，预先生成一段时间内
+每个周期的K线分段数组（开始时间、结束时间、K线时间），时间到K线的映射为一次二分查找。
+
+1. K线时间沿用原先按自然时间对齐的规则（分钟在小时内对齐，小时在日内对齐），
+   跨越休息的K线（例如60分钟K线10:00-10:15和10:30-11:00）由多个分段组成，K线时间相同
+2. 日线和周线按交易日划分，夜盘属于下一个交易日，周五夜盘属于下周一
+3. 交易时段之外的时间（收盘时刻的tick等）归入之前的K线，开盘前pre_open秒以内
+   （集合竞价）归入开盘后的第一根K线，不会因此多生成K线
+4. count和shift按交易时段计算K线数量，用于精确计算历史数据的时间范围
+"""
+
+import re
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+
+from vnpy.trader.vtConstant import VN_SEPARATOR
+from vnpy.trader.utils.datetime import standardize_freq, split_freq
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+DAY_SECONDS = 24 * 60 * 60
+WEEK_SECONDS = 7 * DAY_SECONDS
+
+_unit_seconds = {
+    "s": 1,
+    "m": 60,
+    "h": 60 * 60,
+    "d": DAY_SECONDS,
+    "w": WEEK_SECONDS,
+}
+
+# 按自然时间对齐的周期：秒在分钟内对齐，分钟在小时内对齐，小时在日内对齐
+_align_periods = [60, 60 * 60, DAY_SECONDS]
+
+
+def dt2sec(dt):
+    """datetime转换为整数秒（按UTC换算，不做时区转换）"""
+    return (dt.toordinal() - EPOCH_ORDINAL) * DAY_SECONDS + dt.hour * 3600 + dt.minute * 60 + dt.second
+
+
+def sec2dt(sec):
+    return datetime(1970, 1, 1) + timedelta(seconds=sec)
+
+
+def parse_clock(s):
+    """HH:MM或者HH:MM:SS转换为距当日零点的秒数"""
+    parts = [int(x) for x in s.split(":")]
+    return parts[0] * 3600 + parts[1] * 60 + (parts[2] if len(parts) > 2 else 0)
+
+
+def minutes_to_freq(minutes):
+    """分钟数转换为标准周期"""
+    if minutes % (60 * 24) == 0:
+        return "%dd" % (minutes // (60 * 24))
+    if minutes % 60 == 0:
+        return "%dh" % (minutes // 60)
+    return "%dm" % minutes
+
+
+class SessionCalendar(object):
+    """
+    交易时段日历
+    sessions: list((start, end)), 每日交易时段，HH:MM格式，end小于start表示跨越零点
+    weekdays: 交易时段开始的星期，0为周一
+    holidays: 没有交易的日期，当天开始的交易时段（包括夜盘）都不交易
+    day_boundary: 开始时间不早于该时间的交易时段（夜盘）属于下一个交易日
+    """
+
+    window = 60         # 每次预先生成的天数
+    pre_open = 300      # 开盘前多少秒以内的数据归入开盘后的第一根K线
+
+    def __init__(self, sessions, weekdays=(0, 1, 2, 3, 4), holidays=(), day_boundary="18:00"):
+        self.sessions = []
+        for start, end in sessions:
+            start, end = parse_clock(start), parse_clock(end)
+            if end <= start:
+                end += DAY_SECONDS
+            self.sessions.append((start, end))
+        self.sessions.sort()
+        self.weekdays = frozenset(weekdays)
+        self.holidays = frozenset(holidays)
+        self.day_boundary = parse_clock(day_boundary)
+        self._windows = {}      # 周期：(开始日序号, 结束日序号, starts, ends, labels, ids)
+
+    def is_trading_date(self, day):
+        """day为日期序号(date.toordinal)"""
+        return date.fromordinal(day).weekday() in self.weekdays and date.fromordinal(day) not in self.holidays
+
+    def next_trading_date(self, day):
+        day += 1
+        for _ in range(366):
+            if self.is_trading_date(day):
+                return day
+            day += 1
+        raise ValueError("No trading date after %s" % date.fromordinal(day))
+
+    def trading_date(self, day, start):
+        """day当天start开始的交易时段所属的交易日"""
+        if start >= self.day_boundary:
+            return self.next_trading_date(day)
+        return day
+
+    def _label(self, k, day, start, unit):
+        if unit == "d":
+            return (self.trading_date(day, start) - EPOCH_ORDINAL) * DAY_SECONDS
+        if unit == "w":
+            trading = self.trading_date(day, start)
+            return (trading - date.fromordinal(trading).weekday() - EPOCH_ORDINAL) * DAY_SECONDS
+        return k
+
+    def build(self, freq, first, last):
+        """
+        生成日期序号[first, last)之间开始的交易时段的K线分段
+        return: starts, ends, labels, ids 分段开始时间、结束时间、K线时间（整数秒）和K线序号
+        """
+        mul, unit = split_freq(freq)
+        step = mul * _unit_seconds[unit]
+        if unit in {"d", "w"}:
+            period = None
         else:
-            dtstart_ = dtend - timedelta(days=2 * delta)
-            dtend_ = dtend 
-        holidays = self.get_holidays(dtstart_, dtend_)
-        rset.exdate(holidays)
-        return rset
-
-    def get_daily_rruler(self, freq, dtstart=None, dtend=None, count=None):
-        rset = rrule.rruleset() 
-        num = int(freq[:-1])
-        rset.rrule(rrule.rrule(interval=num, freq=rrule.DAILY, dtstart=dtstart, until=dtend, count=count, byweekday=self.byweekday))
-        delta = num * count if count else 0
-        if dtstart and dtend:
-            dtstart_ = dtstart
-            dtend_ = dtend
-        elif dtstart:
-            dtstart_ = dtstart
-            dtend_ = dtstart + timedelta(days=2 * delta)
-        else:
-            dtstart_ = dtend - timedelta(days=2 * delta)
-            dtend_ = dtend 
-        holidays = self.get_holidays(dtstart_, dtend_)
-        rset.exdate(holidays)
-        return rset
-    
-    def get_hourly_rruler(self, freq, dtstart=None, dtend=None, count=None):
-        rset = rrule.rruleset() 
-        num = int(freq[:-1])
-        rset.rrule(rrule.rrule(interval=num, freq=rrule.HOURLY, dtstart=dtstart, until=dtend, count=count, byweekday=self.byweekday))
-        delta = num * count // 24 + 1 if count else 0
-        if dtstart and dtend:
-            dtstart_ = dtstart
-            dtend_ = dtend
-        elif dtstart:
-            dtstart_ = dtstart
-            dtend_ = dtstart + timedelta(days=2 * delta)
-        else:
-            dtstart_ = dtend - timedelta(days=2 * delta)
-            dtend_ = dtend 
-        holidays = self.get_holidays(dtstart_, dtend_)
-        rset.exdate(holidays)
-        return rset
-
-    def get_minutely_rruler(self, freq, dtstart=None, dtend=None, count=None):
-        rset = rrule.rruleset() 
-        num = int(freq[:-1])
-        rset.rrule(rrule.rrule(interval=num, freq=rrule.DAILY, dtstart=dtstart, until=dtend, count=count, byweekday=self.byweekday))
-        delta = num * count // 24 // 60 + 1 if count else 0
-        if dtstart and dtend:
-            dtstart_ = dtstart
-            dtend_ = dtend
-        elif dtstart:
-            dtstart_ = dtstart
-            dtend_ = dtstart + timedelta(days=2 * delta)
-        else:
-            dtstart_ = dtend - timedelta(days=2 * delta)
-            dtend_ = dtend 
-        holidays = self.get_holidays(dtstart_, dtend_)
-        rset.exdate(holidays)
-        return rset
-
-    def get_second_rruler(self, freq, dtstart=None, dtend=None, count=None):
-        rset = rrule.rruleset() 
-        num = int(freq[:-1])
-        rset.rrule(rrule.rrule(interval=num, freq=rrule.DAILY, dtstart=dtstart, until=dtend, count=count, byweekday=self.byweekday))
-        delta = num * count // 24 // 60 // 60 + 1 if count else 0
-        if dtstart and dtend:
-            dtstart_ = dtstart
-            dtend_ = dtend
-        elif dtstart:
-            dtstart_ = dtstart
-            dtend_ = dtstart + timedelta(days=2 * delta)
-        else:
-            dtstart_ = dtend - timedelta(days=2 * delta)
-            dtend_ = dtend 
-        holidays = self.get_holidays(dtstart_, dtend_)
-        rset.exdate(holidays)
-        return rset
-
-
-class TradingDatetimeSearcher(object):
-    def align(self, dt):
-        raise NotImplementedError
-
-    def next(self, dt):
-        raise NotImplementedError
-
-
-class MovingTradingDatetimeSearcher(TradingDatetimeSearcher):
-    default_size = 10000
-
-    def __init__(self, start, size=None, rruler_cls=ContinuousTradingDatetimeRuler):
-        self._dtstart=start
-        self._size = size or self.default_size
-        self._inited = False
-        self._datetimes = {}
-        self._rruler = rruler_cls()
-
-    def _update(self, freq):
-        self._rruler.get_rruler(freq, start=self._dtstart, count=self._size)
-        if freq not in self._datetimes:
-            self._datetimes[freq] = list(self._rruler.get_rruler(freq, start=self._dtstart, count=self._size))
-        else:
-            new_start = self._datetimes[freq][-1] + timedelta
-            new_dts = list(self._rruler.get_rruler(freq, start=new_start, size=self._size))
-            self._datetimes[freq] = self._datetimes[freq][-self._size:] + new_dts
-
-    def bisect(self, freq, value, side="left"):
-        dts = self._datetimes.get(freq, None)
-        if dts is None or value > dts[-1]:
-            self._update(freq)
-            return self.bisect(freq, value, side=side)
-        return bisect(dts, value, side=side)
+            period = DAY_SECONDS
+            for p in _align_periods:
+                if step <= p:
+                    period = p
+                    break
+        starts, ends, labels = [], [], []
+        for day in range(first, last):
+            if not self.is_trading_date(day):
+                continue
+            base = (day - EPOCH_ORDINAL) * DAY_SECONDS
+            for start, end in self.sessions:
+                a, b = base + start, base + end
+                if period is None:
+                    starts.append(a)
+                    ends.append(b)
+                    labels.append(self._label(None, day, start, unit))
+                    continue
+                p = a // period * period
+                while p < b:
+                    k = p + (max(a, p) - p) // step * step
+                    while k < min(p + period, b):
+                        starts.append(max(k, a))
+                        ends.append(min(k + step, p + period, b))
+                        labels.append(k)
+                        k += step
+                    p += period
+        ids = []
+        n = -1
+        prev = None
+        for label in labels:
+            if label != prev:
+                n += 1
+                prev = label
+            ids.append(n)
+        return starts, ends, labels, ids
+
+    def _window(self, freq, sec):
+        """获取包含sec前后各一天的预生成分段"""
+        day = sec // DAY_SECONDS + EPOCH_ORDINAL
+        w = self._windows.get(freq, None)
+        if w is None or not (w[0] < day < w[1] - 1):
+            first = day - 7
+            last = day + self.window
+            w = (first, last) + self.build(freq, first, last)
+            self._windows[freq] = w
+        return w
+
+    def _index(self, w, sec):
+        """sec所属分段的序号，交易时段之外的时间归入之前的分段，开盘前pre_open秒以内归入之后的分段"""
+        starts, ends = w[2], w[3]
+        i = bisect_right(starts, sec) - 1
+        if i >= 0 and sec < ends[i]:
+            return i
+        j = i + 1
+        if j < len(starts) and (i < 0 or starts[j] - sec <= self.pre_open):
+            return j
+        return i
 
     def align(self, dt, freq):
-        index = self.bisect(freq, dt)
-        return self._datetimes[freq][index]
-
-    def next(self, dt, freq):
-        index = self.bisect(freq, dt, side="right")
-        return self._datetimes[freq][index]
-
-
-class MovingTradingDatetimeSearcherFactory(meta_class=Singleton):
-    def new(self, symbol, start, size=None):
-        rruler_cls = ContinuousTradingDatetimeRuler
-        return MovingTradingDatetimeSearcher(start, size=size, rruler_cls=rruler_cls)
\ No newline at end of file
+        """dt所属K线的时间"""
+        sec = dt2sec(dt)
+        w = self._window(freq, sec)
+        return sec2dt(w[4][self._index(w, sec)])
+
+    def bucket_end(self, dt, freq):
+        """dt所属K线的结束时间，K线跨越休息时为最后一个分段的结束时间"""
+        sec = dt2sec(dt)
+        w = self._window(freq, sec)
+        i = self._index(w, sec)
+        ids, ends = w[5], w[3]
+        while i + 1 < len(ids) and ids[i + 1] == ids[i]:
+            i += 1
+        return sec2dt(ends[i])
+
+    def is_trading(self, dt):
+        """dt是否在交易时段内"""
+        sec = dt2sec(dt)
+        w = self._window("1d", sec)
+        i = bisect_right(w[2], sec) - 1
+        return i >= 0 and sec < w[3][i]
+
+    def trading_day(self, dt):
+        """dt所属的交易日"""
+        return self.align(dt, "1d")
+
+    def count(self, start, end, freq):
+        """[start, end)之间的K线数量"""
+        freq = standardize_freq(freq)
+        s, e = dt2sec(start), dt2sec(end)
+        first = s // DAY_SECONDS + EPOCH_ORDINAL - 1
+        last = e // DAY_SECONDS + EPOCH_ORDINAL + 1
+        starts, ends, labels, ids = self.build(freq, first, last)
+        return len(set(label for a, label in zip(starts, labels) if s <= a < e))
+
+    def shift(self, dt, freq, n):
+        """dt所属K线之前(n<0)或之后(n>0)第abs(n)根K线的时间"""
+        freq = standardize_freq(freq)
+        sec = dt2sec(dt)
+        w = self._window(freq, sec)
+        current = w[4][self._index(w, sec)]
+        mul, unit = split_freq(freq)
+        step = mul * _unit_seconds[unit]
+        days = max(int(abs(n) * step / DAY_SECONDS * 2), 7)
+        while True:
+            day = sec // DAY_SECONDS + EPOCH_ORDINAL
+            if n < 0:
+                labels = self.build(freq, day - days, day + 2)[2]
+                labels = sorted(set(label for label in labels if label <= current))
+                if len(labels) > -n:
+                    return sec2dt(labels[n - 1])
+            else:
+                labels = self.build(freq, day - 1, day + days)[2]
+                labels = sorted(set(label for label in labels if label >= current))
+                if len(labels) > n:
+                    return sec2dt(labels[n])
+            if days > 366 * 50:
+                raise ValueError("Cannot shift %s by %s bars of %s" % (dt, n, freq))
+            days *= 2
+
+
+# 常用的交易时段
+CONTINUOUS_SESSIONS = [("00:00", "24:00")]
+CTP_DAY_SESSIONS = [("09:00", "10:15"), ("10:30", "11:30"), ("13:30", "15:00")]
+CFFEX_INDEX_SESSIONS = [("09:30", "11:30"), ("13:00", "15:00")]
+CFFEX_BOND_SESSIONS = [("09:30", "11:30"), ("13:00", "15:15")]
+
+# 夜盘结束时间：品种
+_ctp_night_products = {
+    "23:00": ["rb", "hc", "bu", "ru", "fu", "sp", "nr", "lu", "br",
+              "a", "b", "m", "y", "p", "c", "cs", "i", "j", "jm", "l", "v", "pp", "eg", "eb", "pg", "rr",
+              "sr", "cf", "rm", "ma", "ta", "oi", "fg", "zc", "sa", "pf", "cy", "px", "sh"],
+    "01:00": ["cu", "al", "zn", "pb", "ni", "sn", "ss", "bc", "ao"],
+    "02:30": ["au", "ag", "sc"],
+}
+_ctp_day_products = ["jd", "lh", "fb", "bb", "wr", "ap", "cj", "ur", "sf", "sm", "pk", "jr", "lr", "pm", "ri",
+                     "rs", "wh", "si", "lc", "ec"]
+
+PRODUCT_SESSIONS = {}
+for _end, _products in _ctp_night_products.items():
+    for _product in _products:
+        PRODUCT_SESSIONS[_product] = [("21:00", _end)] + CTP_DAY_SESSIONS
+for _product in _ctp_day_products:
+    PRODUCT_SESSIONS[_product] = CTP_DAY_SESSIONS
+for _product in ["if", "ih", "ic", "im"]:
+    PRODUCT_SESSIONS[_product] = CFFEX_INDEX_SESSIONS
+for _product in ["t", "tf", "ts", "tl"]:
+    PRODUCT_SESSIONS[_product] = CFFEX_BOND_SESSIONS
+
+# 按品种交易时段的期货接口，其他接口按7*24小时连续交易处理
+# 外汇接口（OANDA）的时间为UTC，一周从周日21:00/22:00（随夏令时变化）开始，跨越两个自然日，
+# 同样按连续交易处理，K线按自然时间对齐，周末没有数据时不会生成K线
+FUTURES_GATEWAYS = {"CTP"}
+
+_calendars = {}
+
+
+def register_product_sessions(product, sessions):
+    """设置或修改品种的交易时段"""
+    PRODUCT_SESSIONS[product.lower()] = sessions
+    _calendars.pop(product.lower(), None)
+
+
+def get_calendar(vtSymbol):
+    """
+    根据vtSymbol获取交易时段日历
+    期货接口的品种不在PRODUCT_SESSIONS中时返回None，由调用方按自然时间处理
+    """
+    symbol, _, gatewayName = vtSymbol.partition(VN_SEPARATOR)
+    if gatewayName.upper() in FUTURES_GATEWAYS:
+        m = re.match("[A-Za-z]+", symbol)
+        if m is None:
+            return None
+        key = m.group(0).lower()
+        if key not in PRODUCT_SESSIONS:
+            return None
+        sessions, weekdays = PRODUCT_SESSIONS[key], (0, 1, 2, 3, 4)
+    else:
+        key, sessions, weekdays = "_continuous", CONTINUOUS_SESSIONS, range(7)
+
+    calendar = _calendars.get(key, None)
+    if calendar is None:
+        calendar = SessionCalendar(sessions, weekdays)
+        _calendars[key] = calendar
+    return calendar
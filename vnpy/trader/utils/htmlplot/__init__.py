@@ -1,16 +1,37 @@
-from datetime import timedelta
-from vnpy.trader.utils.htmlplot.core import MultiPlot, read_transaction_file
+import sys
+from importlib import import_module
 
-import pandas as pd
-import os
+# bokeh在使用时才导入（core模块），回测和优化进程导入htmlplot时不需要加载
 
 
 def showTransaction(engine, frequency=None, filename=None):
+    from vnpy.trader.utils.htmlplot.core import MultiPlot
     mp = MultiPlot.from_engine(engine, frequency, filename=filename)
     mp.show()
 
 
 def getMultiPlot(engine, freq=None, filename=None):
+    from vnpy.trader.utils.htmlplot.core import MultiPlot
     return MultiPlot.from_engine(engine, freq, filename)
 
 
+def read_transaction_file(filename):
+    from vnpy.trader.utils.htmlplot.core import read_transaction_file
+    return read_transaction_file(filename)
+
+
+def __getattr__(name):
+    # Python 3.7以上在访问MultiPlot等属性时才导入core模块
+    if name.startswith('__'):
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+    core = import_module('vnpy.trader.utils.htmlplot.core')
+    try:
+        return getattr(core, name)
+    except AttributeError:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+if sys.version_info < (3, 7):
+    # 旧版本不支持模块级__getattr__，保持原有的导入方式
+    from vnpy.trader.utils.htmlplot.core import MultiPlot
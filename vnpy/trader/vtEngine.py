@@ -3,20 +3,25 @@
 import os
 import shelve
 import logging
+import threading
+import traceback
+import time
 from logging import handlers
-from collections import OrderedDict
+from queue import Queue
+from collections import OrderedDict, defaultdict, deque
 from datetime import datetime
 from copy import copy
 
 # from pymongo import MongoClient, ASCENDING
 # from pymongo.errors import ConnectionFailure
 
-from vnpy.event import Event
+from vnpy.event.eventTrace import tracer, STAGE_SEND_ORDER
 from vnpy.trader.vtGlobal import globalSetting
 from vnpy.trader.vtEvent import *
 from vnpy.trader.vtGateway import *
 from vnpy.trader.language import text
 from vnpy.trader.vtFunction import getTempPath
+from vnpy.trader.vtLog import logLimiter, createLogEvent, AsyncQueueHandler, AsyncQueueListener
 
 
 ########################################################################
@@ -53,6 +58,21 @@ class MainEngine(object):
         # 日志引擎实例
         self.logEngine = None
         self.initLogEngine()
+        
+        # 委托状态核对引擎
+        self.orderReconciler = OrderReconciler(self, self.eventEngine)
+        self.orderReconciler.start()
+
+        # 日志流控，每个来源每秒允许的日志数量和突发数量
+        logLimiter.setLimit(globalSetting.get('logRateLimit', 100),
+                            globalSetting.get('logRateBurst', 500))
+        # 所有策略的writeCtaLog共用CTA_STRATEGY来源，单独设置更高的流控
+        logLimiter.setLimit(globalSetting.get('ctaLogRateLimit', 1000),
+                            globalSetting.get('ctaLogRateBurst', 5000),
+                            source='CTA_STRATEGY')
+
+        # 行情到委托的延迟追踪，每N个行情抽样一个，0表示关闭
+        tracer.setSampleInterval(globalSetting.get('traceSampleInterval', 0))
 
     #----------------------------------------------------------------------
     def addGateway(self, gatewayModule):
@@ -175,24 +195,109 @@ class MainEngine(object):
 
         gateway = self.getGateway(gatewayName)
         if gateway:
-            vtOrderID = gateway.sendOrder(orderReq)
+            trace = tracer.current()
+            if trace is None:
+                vtOrderID = gateway.sendOrder(orderReq)
+            else:
+                vtOrderID = self.sendTracedOrders(gateway.sendOrder, orderReq, trace)
+            if vtOrderID:
+                self.orderReconciler.watchOrder(vtOrderID, orderReq, gatewayName)
             # self.dataEngine.updateOrderReq(orderReq, vtOrderID)     # 更新发出的委托请求到数据引擎中
-            return vtOrderID
         else:
-            return ''
-        
+            vtOrderID = ''
+
+        # 风控引擎根据发单结果绑定或者释放检查时预占的计数
+        if self.rmEngine:
+            self.rmEngine.registerOrder(vtOrderID, orderReq, gatewayName)
+
+        return vtOrderID
+
+    #----------------------------------------------------------------------
+    def sendOrders(self, orderReqList, gatewayName):
+        """
+        对特定接口批量发单，返回与orderReqList一一对应的委托号列表
+        风控未通过或发单失败的委托对应空字符串
+        """
+        vtOrderIDList = [''] * len(orderReqList)
+
+        gateway = self.getGateway(gatewayName)
+        if not gateway:
+            return vtOrderIDList
+
+        # 整批委托一次性进行风控检查
+        if self.rmEngine:
+            checkList = self.rmEngine.checkRiskList(orderReqList, gatewayName)
+        else:
+            checkList = [True] * len(orderReqList)
+
+        indexList = [n for n, passed in enumerate(checkList) if passed]
+        if not indexList:
+            return vtOrderIDList
+
+        reqList = [orderReqList[n] for n in indexList]
+        trace = tracer.current()
+        if trace is None:
+            resultList = gateway.sendOrders(reqList)
+        else:
+            resultList = self.sendTracedOrders(gateway.sendOrders, reqList, trace)
+
+        for n, vtOrderID in zip(indexList, resultList):
+            vtOrderIDList[n] = vtOrderID
+            if vtOrderID:
+                self.orderReconciler.watchOrder(vtOrderID, orderReqList[n], gatewayName)
+            if self.rmEngine:
+                self.rmEngine.registerOrder(vtOrderID, orderReqList[n], gatewayName)
+
+        return vtOrderIDList
+
+    #----------------------------------------------------------------------
+    def sendTracedOrders(self, func, req, trace):
+        """
+        发送抽样追踪中的行情触发的委托（单笔或者批量），
+        每次发单复制一份追踪记录，带入接口的请求并按委托号等待回报
+        """
+        orderTrace = trace.fork()
+        orderTrace.stamp(STAGE_SEND_ORDER)
+
+        tracer.attach(orderTrace)
+        try:
+            result = func(req)
+        finally:
+            tracer.attach(trace)
+
+        # 批量委托共用一份追踪记录，以最先收到的回报为准
+        vtOrderIDList = result if isinstance(result, list) else [result]
+        for vtOrderID in vtOrderIDList:
+            if vtOrderID:
+                tracer.bindOrder(vtOrderID, orderTrace)
+        return result
+
     #----------------------------------------------------------------------
     def cancelOrder(self, cancelOrderReq, gatewayName):
         """对特定接口撤单"""
+        # 撤单流控检查，超过流控的撤单排队等待重发，不会丢弃
+        if self.rmEngine and not self.rmEngine.checkCancel(cancelOrderReq, gatewayName):
+            self.rmEngine.deferCancel(cancelOrderReq, gatewayName)
+            return
+
         gateway = self.getGateway(gatewayName)
         
         if gateway:
             gateway.cancelOrder(cancelOrderReq)   
 
     def batchCancelOrder(self,cancelOrderReqList,gatewayName):
+        if self.rmEngine:
+            passList = []
+            for req in cancelOrderReqList:
+                if self.rmEngine.checkCancel(req, gatewayName):
+                    passList.append(req)
+                else:
+                    self.rmEngine.deferCancel(req, gatewayName)
+            cancelOrderReqList = passList
+
         gateway = self.getGateway(gatewayName)
         
-        if gateway:
+        if gateway and cancelOrderReqList:
             gateway.batchCancelOrder(cancelOrderReqList)  
   
     #----------------------------------------------------------------------
@@ -243,6 +348,9 @@ class MainEngine(object):
     #----------------------------------------------------------------------
     def exit(self):
         """退出程序前调用，保证正常退出"""        
+        # 停止委托状态核对
+        self.orderReconciler.stop()
+        
         # 安全关闭所有接口
         for gateway in list(self.gatewayDict.values()):        
             gateway.close()
@@ -256,16 +364,17 @@ class MainEngine(object):
         
         # 保存数据引擎里的合约数据到硬盘
         self.dataEngine.saveContracts()
+
+        # 写完队列中剩余的日志
+        if self.logEngine:
+            self.logEngine.close()
     
     #----------------------------------------------------------------------
-    def writeLog(self, content):
-        """快速发出日志事件"""
-        log = VtLogData()
-        log.logContent = content
-        log.gatewayName = 'MAIN_ENGINE'
-        event = Event(type_=EVENT_LOG)
-        event.dict_['data'] = log
-        self.eventEngine.put(event)        
+    def writeLog(self, content, *args):
+        """快速发出日志事件，args不为空时在通过流控后才格式化content % args"""
+        event = createLogEvent(EVENT_LOG, 'MAIN_ENGINE', content, args)
+        if event:
+            self.eventEngine.put(event)        
     
     #----------------------------------------------------------------------
     def getContract(self, vtSymbol):
@@ -400,8 +509,10 @@ class DataEngine(object):
         self.tradeDict = {}
         self.accountDict = {}
         self.positionDict= {}
-        self.logList = []
-        self.errorList = []
+        # 日志和错误只保留最近的记录
+        historySize = globalSetting.get('logHistorySize', 10000)
+        self.logList = deque(maxlen=historySize)
+        self.errorList = deque(maxlen=historySize)
         
         # 持仓细节相关
         # self.detailDict = {}                                # vtSymbol:PositionDetail
@@ -619,19 +730,176 @@ class DataEngine(object):
     #----------------------------------------------------------------------
     def getLog(self):
         """获取日志"""
-        return self.logList
+        return list(self.logList)
     
     #----------------------------------------------------------------------
     def getError(self):
         """获取错误"""
-        return self.errorList
+        return list(self.errorList)
     
 
 
 
+# 交易所已确认挂单的委托状态
+STATUS_WORKING = [STATUS_NOTTRADED, STATUS_PARTTRADED]
+
+
+########################################################################
+class OrderReconciler(object):
+    """
+    委托状态核对引擎
+    
+    记录每个活动委托最近一次收到状态推送的时间，超过timeout秒仍未收到推送的委托
+    视为状态可能丢失，由后台线程按接口分组调用gateway.qryOrderList补查。
+    已完成的委托不再跟踪，同一委托两次补查之间至少间隔timeout秒，状态没有变化的推送
+    不重置补查次数，补查maxQueryCount次状态仍未确认的委托放弃跟踪。
+    交易所已确认挂单（未成交、部分成交）的委托按较慢的频率补查，用于发现丢失的成交
+    和撤单推送：补查间隔从workingTimeout秒开始，每次补查后加倍，最长workingMaxInterval秒，
+    挂单一直跟踪到完成为止。
+    
+    相关参数可以在VT_setting.json中通过orderSyncTimeout、orderSyncInterval、
+    orderSyncWorkingTimeout、orderSyncWorkingMaxInterval配置。
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, mainEngine, eventEngine):
+        """Constructor"""
+        self.mainEngine = mainEngine
+        self.eventEngine = eventEngine
+        
+        self.timeout = globalSetting.get('orderSyncTimeout', 30)     # 状态超时（秒）
+        self.interval = globalSetting.get('orderSyncInterval', 5)    # 检查间隔（秒）
+        self.maxQueryCount = 10
+        self.workingTimeout = globalSetting.get('orderSyncWorkingTimeout', 60)            # 挂单的初始补查间隔（秒）
+        self.workingMaxInterval = globalSetting.get('orderSyncWorkingMaxInterval', 600)   # 挂单的最长补查间隔（秒）
+        
+        # vtOrderID:[委托对象, 最近推送时间, 最近补查时间, 补查次数]
+        self.orderDict = {}
+        self.lock = threading.Lock()
+        
+        self.active = False
+        self.stopEvent = threading.Event()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        
+        self.registerEvent()
+        
+    #----------------------------------------------------------------------
+    def registerEvent(self):
+        """注册事件监听"""
+        self.eventEngine.register(EVENT_ORDER, self.processOrderEvent)
+        
+    #----------------------------------------------------------------------
+    def processOrderEvent(self, event):
+        """收到委托推送，刷新确认时间"""
+        order = event.dict_['data']
+        
+        with self.lock:
+            l = self.orderDict.get(order.vtOrderID, None)
+            if order.status in STATUS_FINISHED:
+                self.orderDict.pop(order.vtOrderID, None)
+            elif l is None or l[0].status != order.status:
+                self.orderDict[order.vtOrderID] = [order, time.time(), 0, 0]
+            else:
+                # 状态没有变化（例如补查的回报），保留补查次数
+                l[0] = order
+                l[1] = time.time()
+    
+    #----------------------------------------------------------------------
+    def watchOrder(self, vtOrderID, orderReq, gatewayName):
+        """跟踪新发出的委托，用于发单后一直没有收到任何推送的情况"""
+        order = VtOrderData()
+        order.gatewayName = gatewayName
+        order.symbol = orderReq.symbol
+        order.exchange = orderReq.exchange
+        order.vtSymbol = orderReq.vtSymbol or VN_SEPARATOR.join([orderReq.symbol, gatewayName])
+        order.vtOrderID = vtOrderID
+        order.orderID = vtOrderID.split(VN_SEPARATOR, 1)[-1]
+        order.direction = orderReq.direction
+        order.offset = orderReq.offset
+        order.price = orderReq.price
+        order.totalVolume = orderReq.volume
+        order.status = STATUS_UNKNOWN
+        
+        with self.lock:
+            # 推送可能早于发单函数返回
+            if vtOrderID not in self.orderDict:
+                self.orderDict[vtOrderID] = [order, time.time(), 0, 0]
+    
+    #----------------------------------------------------------------------
+    def start(self):
+        """启动"""
+        self.active = True
+        self.thread.start()
+    
+    #----------------------------------------------------------------------
+    def stop(self):
+        """停止"""
+        if self.active:
+            self.active = False
+            self.stopEvent.set()
+            self.thread.join()
+    
+    #----------------------------------------------------------------------
+    def run(self):
+        """后台线程，定时核对"""
+        while not self.stopEvent.wait(self.interval):
+            try:
+                self.reconcile()
+            except Exception:
+                self.mainEngine.writeLog(traceback.format_exc())
+    
+    #----------------------------------------------------------------------
+    def reconcile(self):
+        """补查状态超时的委托"""
+        now = time.time()
+        queryDict = defaultdict(list)       # gatewayName:委托列表
+        abandonList = []
+        
+        with self.lock:
+            for vtOrderID, l in list(self.orderDict.items()):
+                order, confirmTime, queryTime, count = l
+                if order.status in STATUS_WORKING:
+                    # 挂单按退避的间隔补查，不放弃跟踪
+                    interval = min(self.workingTimeout * 2 ** min(count, 16), self.workingMaxInterval)
+                    if now - confirmTime < interval or now - queryTime < interval:
+                        continue
+                    l[2] = now
+                    l[3] = count + 1
+                    queryDict[order.gatewayName].append(order)
+                    continue
+                
+                if now - confirmTime < self.timeout or now - queryTime < self.timeout:
+                    continue
+                
+                if count >= self.maxQueryCount:
+                    del self.orderDict[vtOrderID]
+                    abandonList.append(vtOrderID)
+                    continue
+                
+                l[2] = now
+                l[3] = count + 1
+                queryDict[order.gatewayName].append(order)
+        
+        if abandonList:
+            self.mainEngine.writeLog(u'委托状态核对：%s笔委托多次补查状态仍未确认，停止跟踪：%s'
+                                     %(len(abandonList), ','.join(abandonList)))
+        
+        for gatewayName, orderList in queryDict.items():
+            gateway = self.mainEngine.getGateway(gatewayName)
+            if not gateway:
+                continue
+            
+            gateway.qryOrderList(orderList)
+            self.mainEngine.writeLog(u'委托状态核对：%s接口补查%s笔委托' %(gatewayName, len(orderList)))
+
+
 ########################################################################
 class LogEngine(object):
-    """日志引擎"""
+    """
+    日志引擎
+    日志事件和logging模块的日志记录都放入队列，由单独的写入线程输出到终端和文件
+    """
     
     # 日志级别
     LEVEL_DEBUG = logging.DEBUG
@@ -642,6 +910,9 @@ class LogEngine(object):
     
     # 单例对象
     instance = None
+
+    # 日志队列长度上限，写入跟不上时丢弃新的日志
+    QUEUE_SIZE = 100000
     
     #----------------------------------------------------------------------
     def __new__(cls, *args, **kwargs):
@@ -663,6 +934,12 @@ class LogEngine(object):
         # 添加NullHandler防止无handler的错误输出
         nullHandler = logging.NullHandler()
         self.logger.addHandler(nullHandler)    
+
+        # 异步输出，添加第一个输出时才启动写入线程
+        self.queue = Queue(self.QUEUE_SIZE)
+        self.queueHandler = AsyncQueueHandler(self.queue)
+        self.listener = None
+        self.handlerList = []
         
         # 日志级别函数映射
         self.levelFunctionDict = {
@@ -686,7 +963,7 @@ class LogEngine(object):
             self.consoleHandler = logging.StreamHandler()
             self.consoleHandler.setLevel(self.level)
             self.consoleHandler.setFormatter(self.formatter)
-            self.logger.addHandler(self.consoleHandler)
+            self.addHandler(self.consoleHandler)
             
     #----------------------------------------------------------------------
     def addFileHandler(self):
@@ -700,7 +977,34 @@ class LogEngine(object):
                 filepath,maxBytes = 20971520,backupCount = 20) 
             self.fileHandler.setLevel(self.level)
             self.fileHandler.setFormatter(self.formatter)
-            self.logger.addHandler(self.fileHandler)
+            self.addHandler(self.fileHandler)
+
+    #----------------------------------------------------------------------
+    def addHandler(self, handler):
+        """添加输出，日志由写入线程输出到各个handler"""
+        self.handlerList.append(handler)
+
+        if not self.listener:
+            self.listener = AsyncQueueListener(self.queue)
+            self.listener.handlers = tuple(self.handlerList)
+            self.listener.start()
+            self.logger.addHandler(self.queueHandler)
+        else:
+            self.listener.handlers = tuple(self.handlerList)
+
+    #----------------------------------------------------------------------
+    def close(self):
+        """停止写入线程，写完队列中剩余的日志"""
+        if self.listener:
+            self.logger.removeHandler(self.queueHandler)
+            self.listener.stop()
+            self.listener = None
+
+            if self.queueHandler.dropCount:
+                for handler in self.handlerList:
+                    handler.handle(self.logger.makeRecord(
+                        self.logger.name, self.LEVEL_WARN, __file__, 0,
+                        u'日志队列已满，共丢弃%s条日志', (self.queueHandler.dropCount,), None))
     
     #----------------------------------------------------------------------
     def debug(self, msg):
@@ -736,6 +1040,8 @@ class LogEngine(object):
     def processLogEvent(self, event):
         """处理日志事件"""
         log = event.dict_['data']
-        function = self.levelFunctionDict[log.logLevel]     # 获取日志级别对应的处理函数
-        msg = '\t'.join([log.gatewayName, log.logContent])
-        function(msg)
\ No newline at end of file
+        if log.logLevel < self.level or not self.listener:
+            return
+
+        # 生成日志记录和格式化都推迟到写入线程进行
+        self.queueHandler.enqueue((log.logLevel, log.gatewayName, log.logContent, time.time()))
\ No newline at end of file
@@ -3,6 +3,8 @@
 import time
 
 from vnpy.event import *
+from vnpy.event.eventTrace import tracer, STAGE_ACK
+from vnpy.trader.vtLog import checkLogLimit
 
 from vnpy.trader.vtEvent import *
 from vnpy.trader.vtConstant import *
@@ -25,6 +27,13 @@ class VtGateway(object):
         # 通用事件
         event1 = Event(type_=EVENT_TICK)
         event1.dict_['data'] = tick
+
+        # 抽样追踪行情到委托的延迟
+        if tracer.active:
+            trace = tracer.begin()
+            if trace is not None:
+                event1.trace = trace
+
         self.eventEngine.put(event1)
         
         # 特定合约代码的事件
@@ -48,6 +57,12 @@ class VtGateway(object):
     #----------------------------------------------------------------------
     def onOrder(self, order):
         """订单变化推送"""
+        # 抽样追踪的委托收到第一个有效状态
+        if tracer.orderDict and order.status != STATUS_UNKNOWN:
+            trace = tracer.popOrder(order.vtOrderID)
+            if trace is not None:
+                trace.stamp(STAGE_ACK)
+
         # 通用事件
         event1 = Event(type_=EVENT_ORDER)
         event1.dict_['data'] = order
@@ -96,6 +111,10 @@ class VtGateway(object):
     #----------------------------------------------------------------------
     def onLog(self, log):
         """日志推送"""
+        # 按接口流控
+        if not checkLogLimit(log):
+            return
+
         # 通用事件
         event1 = Event(type_=EVENT_LOG)
         event1.dict_['data'] = log
@@ -124,6 +143,14 @@ class VtGateway(object):
         """发单"""
         pass
     
+    #----------------------------------------------------------------------
+    def sendOrders(self, orderReqList):
+        """
+        批量发单，返回与orderReqList一一对应的委托号列表
+        默认逐笔调用sendOrder，支持批量下单接口的交易所应当重载
+        """
+        return [self.sendOrder(orderReq) for orderReq in orderReqList]
+    
     #----------------------------------------------------------------------
     def cancelOrder(self, cancelOrderReq):
         """撤单"""
@@ -142,6 +169,20 @@ class VtGateway(object):
     def qryOrder(self):
         """查询特定订单"""
         pass
+    
+    #----------------------------------------------------------------------
+    def qryAllOrders(self, vtSymbol, orderID, status=None):
+        """查询合约的委托"""
+        pass
+    
+    #----------------------------------------------------------------------
+    def qryOrderList(self, orderList):
+        """
+        批量补查委托的最新状态，结果通过onOrder推送
+        默认按合约查询挂单，支持按委托号查询的接口应当重载
+        """
+        for vtSymbol in set([order.vtSymbol for order in orderList]):
+            self.qryAllOrders(vtSymbol, -1, 1)
     #----------------------------------------------------------------------
     def close(self):
         """关闭"""
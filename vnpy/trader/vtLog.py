@@ -0,0 +1,171 @@
+# encoding: UTF-8
+
+"""
+日志的流控和异步输出
+
+1. LogRateLimiter按来源（日志的gatewayName，例如CTA_STRATEGY、MAIN_ENGINE、接口名）
+   使用令牌桶进行流控，超过流控的日志在生成日志事件之前直接丢弃，下一条通过的日志
+   会附带被丢弃的数量。默认流控由全局配置logRateLimit、logRateBurst设置；所有CTA策略的
+   日志共用CTA_STRATEGY来源，由ctaLogRateLimit、ctaLogRateBurst单独设置更高的流控，
+   策略数量较多时需要相应调高
+2. createLogEvent只对通过流控的日志进行格式化（content % args）
+3. 日志事件以(级别, 来源, 内容, 时间)元组直接放入LogEngine的队列，其他logging模块的
+   日志通过AsyncQueueHandler放入同一个队列，放入后立即返回；由AsyncQueueListener写入线程
+   负责生成日志记录、格式化和写文件，事件引擎线程不会被磁盘IO阻塞
+"""
+
+import logging
+import threading
+from time import time
+from logging.handlers import QueueHandler, QueueListener
+from queue import Full
+
+from vnpy.event import Event
+from vnpy.trader.vtObject import VtLogData
+
+
+########################################################################
+class LogRateLimiter(object):
+    """按来源的日志流控"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, rate=0, burst=0):
+        """Constructor"""
+        self.rate = rate            # 每秒允许的日志数量，0表示不限制
+        self.burst = burst          # 允许突发的日志数量
+        self.limitDict = {}         # 来源：(rate, burst)，单独设置的流控
+        self.bucketDict = {}        # 来源：[剩余令牌, 上次更新时间, 丢弃数量]
+        self.lock = threading.Lock()
+
+    #----------------------------------------------------------------------
+    def setLimit(self, rate, burst=0, source=None):
+        """设置流控，不指定来源时设置默认值"""
+        with self.lock:
+            if source is None:
+                self.rate = rate
+                self.burst = burst
+            else:
+                self.limitDict[source] = (rate, burst)
+            self.bucketDict.clear()
+
+    #----------------------------------------------------------------------
+    def check(self, source):
+        """检查日志是否通过流控，返回-1表示丢弃，否则返回此前被丢弃的日志数量"""
+        rate, burst = self.limitDict.get(source, (self.rate, self.burst))
+        if not rate:
+            return 0
+        burst = max(burst, rate)
+
+        with self.lock:
+            now = time()
+            bucket = self.bucketDict.get(source)
+            if bucket is None:
+                bucket = [burst, now, 0]
+                self.bucketDict[source] = bucket
+            else:
+                bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return -1
+
+            bucket[0] -= 1
+            dropped = bucket[2]
+            bucket[2] = 0
+            return dropped
+
+
+# 全局日志流控，由MainEngine根据全局配置设置
+logLimiter = LogRateLimiter()
+
+
+#----------------------------------------------------------------------
+def checkLogLimit(log):
+    """检查日志对象是否通过流控，通过时附加此前被丢弃的数量"""
+    dropped = logLimiter.check(log.gatewayName)
+    if dropped < 0:
+        return False
+    if dropped:
+        log.logContent = u'%s（此前%s条日志因流控被丢弃）' %(log.logContent, dropped)
+    return True
+
+
+#----------------------------------------------------------------------
+def createLogEvent(eventType, source, content, args=None):
+    """生成日志事件，超过流控时返回None，content和args只在通过流控后才格式化"""
+    dropped = logLimiter.check(source)
+    if dropped < 0:
+        return None
+
+    if args:
+        content = content % args
+    if dropped:
+        content = u'%s（此前%s条日志因流控被丢弃）' %(content, dropped)
+
+    log = VtLogData()
+    log.gatewayName = source
+    log.logContent = content
+
+    event = Event(type_=eventType)
+    event.dict_['data'] = log
+    return event
+
+
+########################################################################
+class AsyncQueueHandler(QueueHandler):
+    """
+    非阻塞的队列日志处理器
+    队列满时丢弃日志并计数，不阻塞调用线程；消息的格式化推迟到写入线程
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, queue):
+        """Constructor"""
+        super(AsyncQueueHandler, self).__init__(queue)
+        self.dropCount = 0
+
+    #----------------------------------------------------------------------
+    def enqueue(self, record):
+        """放入队列"""
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropCount += 1
+
+    #----------------------------------------------------------------------
+    def prepare(self, record):
+        """
+        参数都是不可变的基本类型时直接传递日志记录，由写入线程格式化，
+        带有异常信息或者其他类型参数的记录仍然在当前线程格式化
+        """
+        if record.exc_info or record.stack_info:
+            return super(AsyncQueueHandler, self).prepare(record)
+
+        args = record.args
+        if args and not (isinstance(args, tuple) and
+                         all(isinstance(arg, (str, int, float)) for arg in args)):
+            return super(AsyncQueueHandler, self).prepare(record)
+        return record
+
+
+########################################################################
+class AsyncQueueListener(QueueListener):
+    """日志写入线程"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, queue):
+        """Constructor"""
+        super(AsyncQueueListener, self).__init__(queue, respect_handler_level=True)
+
+    #----------------------------------------------------------------------
+    def prepare(self, item):
+        """日志事件的元组在写入线程中转换为日志记录"""
+        if not isinstance(item, tuple):
+            return item
+
+        level, source, content, created = item
+        record = logging.LogRecord('root', level, __file__, 0, '%s\t%s', (source, content), None)
+        record.created = created
+        record.msecs = (created - int(created)) * 1000
+        return record
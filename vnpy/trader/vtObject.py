@@ -5,6 +5,8 @@ from logging import INFO
 
 from vnpy.trader.vtConstant import (EMPTY_STRING, EMPTY_UNICODE, 
                                     EMPTY_FLOAT, EMPTY_INT)
+from vnpy.trader.vtTime import (nsToDate, nsToTime, nsToDatetime,
+                                datetimeToNs, dateTimeToNs)
 
 
 ########################################################################
@@ -19,7 +21,66 @@ class VtBaseData(object):
 
 
 ########################################################################
-class VtTickData(VtBaseData):
+class VtTimeData(VtBaseData):
+    """
+    带有时间字段的数据基础类
+    
+    接口可以只通过setTimestamp设置纳秒时间戳，date、time、datetime字段
+    在第一次读取时才生成并缓存；直接赋值这三个字段的旧用法保持不变。
+    没有设置时间戳时，读取timestamp会根据datetime或者date、time字段计算。
+    """
+    
+    lazyTimeFields = {
+        'date': (nsToDate, EMPTY_STRING),
+        'time': (nsToTime, EMPTY_STRING),
+        'datetime': (nsToDatetime, None)
+    }
+
+    #----------------------------------------------------------------------
+    def __getattr__(self, name):
+        """只在实例上不存在该属性时调用"""
+        d = self.__dict__
+        
+        if name in self.lazyTimeFields:
+            func, default = self.lazyTimeFields[name]
+            timestamp = d.get('timestamp', None)
+            if not timestamp:
+                return default
+            
+            value = func(timestamp)
+            d[name] = value
+            return value
+        
+        if name == 'timestamp':
+            # 根据已有的时间字段计算，不缓存，避免字段更新后结果过期
+            dt = d.get('datetime', None)
+            if dt:
+                return datetimeToNs(dt)
+            if d.get('date', None) and d.get('time', None):
+                return dateTimeToNs(d['date'], d['time'])
+            return EMPTY_INT
+        
+        raise AttributeError(name)
+    
+    #----------------------------------------------------------------------
+    def setTimestamp(self, timestamp):
+        """设置纳秒时间戳，同时清除已经生成的时间字段"""
+        d = self.__dict__
+        d['timestamp'] = timestamp
+        d.pop('date', None)
+        d.pop('time', None)
+        d.pop('datetime', None)
+    
+    #----------------------------------------------------------------------
+    def fillTime(self):
+        """生成全部时间字段，通过__dict__保存数据前调用"""
+        self.date
+        self.time
+        self.datetime
+
+
+########################################################################
+class VtTickData(VtTimeData):
     """Tick行情数据类"""
 
     #----------------------------------------------------------------------
@@ -37,9 +98,8 @@ class VtTickData(VtBaseData):
         self.lastVolume = EMPTY_FLOAT           # 最新成交量
         self.volume = EMPTY_FLOAT               # 今天总成交量
         self.openInterest = EMPTY_INT           # 持仓量
-        self.time = EMPTY_STRING                # 时间 11:20:56.5
-        self.date = EMPTY_STRING                # 日期 20151009
-        self.datetime = None                    # python的datetime时间对象
+        # 时间字段time（11:20:56.5）、date（20151009）、datetime（python的datetime时间对象）
+        # 以及纳秒时间戳timestamp由VtTimeData按需生成
 
         self.type = EMPTY_STRING                # 主动买或主动卖
         self.volumeChange = EMPTY_INT           # 标记tick的更新源
@@ -102,7 +162,7 @@ class VtTickData(VtBaseData):
 
     
 ########################################################################
-class VtBarData(VtBaseData):
+class VtBarData(VtTimeData):
     """K线数据"""
 
     #----------------------------------------------------------------------
@@ -119,9 +179,7 @@ class VtBarData(VtBaseData):
         self.low = EMPTY_FLOAT
         self.close = EMPTY_FLOAT
         
-        self.date = EMPTY_STRING            # bar开始的时间，日期
-        self.time = EMPTY_STRING            # 时间
-        self.datetime = None                # python的datetime时间对象
+        # bar开始的时间：date、time、datetime以及纳秒时间戳timestamp由VtTimeData按需生成
         
         self.volume = EMPTY_FLOAT           # 成交量
         self.openInterest = EMPTY_INT       # 持仓量    
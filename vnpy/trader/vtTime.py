@@ -0,0 +1,140 @@
+# encoding: UTF-8
+
+"""
+统一的时间戳处理
+
+行情和K线对象以timestamp字段保存int64纳秒时间戳，数值为datetime字段（不带时区，
+沿用各接口原有的时区约定）按UTC换算得到的纳秒数，因此各接口的date、time、datetime
+取值与原先保持一致。
+
+日期字符串和当日零点的时间戳按天缓存，时间部分通过整数切片解析，
+替代每个tick上的strptime/strftime调用。
+"""
+
+from datetime import datetime, date
+
+
+NS_PER_MICROSECOND = 1000
+NS_PER_MILLISECOND = 1000 * NS_PER_MICROSECOND
+NS_PER_SECOND = 1000 * NS_PER_MILLISECOND
+NS_PER_HOUR = 3600 * NS_PER_SECOND
+NS_PER_DAY = 24 * NS_PER_HOUR
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+_dayDict = {}           # 天序号：(日期字符串, 年, 月, 日)
+_dateDict = {}          # 日期字符串：当日零点时间戳
+_offsetDict = {}        # 小时序号：本地时区偏移
+
+
+#----------------------------------------------------------------------
+def getDayInfo(day):
+    """获取天序号（距1970-01-01的天数）对应的日期字符串和年月日"""
+    try:
+        return _dayDict[day]
+    except KeyError:
+        d = date.fromordinal(day + EPOCH_ORDINAL)
+        info = ('%04d%02d%02d' % (d.year, d.month, d.day), d.year, d.month, d.day)
+        _dayDict[day] = info
+        return info
+
+
+#----------------------------------------------------------------------
+def dateToNs(dateStr):
+    """日期字符串（20151009或者2015-10-09）转换为当日零点时间戳"""
+    try:
+        return _dateDict[dateStr]
+    except KeyError:
+        s = dateStr.replace('-', '')
+        if len(s) != 8:
+            raise ValueError(u'日期格式错误：%s' % dateStr)
+        d = date(int(s[:4]), int(s[4:6]), int(s[6:8]))
+        ns = (d.toordinal() - EPOCH_ORDINAL) * NS_PER_DAY
+        _dateDict[dateStr] = ns
+        return ns
+
+
+#----------------------------------------------------------------------
+def timeToNs(timeStr):
+    """时间字符串（11:20:56或者11:20:56.5）转换为距当日零点的纳秒数"""
+    if timeStr[2:3] != ':' or timeStr[5:6] != ':':
+        raise ValueError(u'时间格式错误：%s' % timeStr)
+
+    ns = (int(timeStr[:2]) * 3600 + int(timeStr[3:5]) * 60 + int(timeStr[6:8])) * NS_PER_SECOND
+
+    # 小数部分和strptime的%f一致，按位数补齐
+    fraction = timeStr[9:18]
+    if fraction:
+        ns += int(fraction.ljust(9, '0'))
+    return ns
+
+
+#----------------------------------------------------------------------
+def dateTimeToNs(dateStr, timeStr):
+    """日期和时间字符串转换为时间戳"""
+    return dateToNs(dateStr) + timeToNs(timeStr)
+
+
+#----------------------------------------------------------------------
+def isoToNs(isoStr):
+    """ISO8601格式字符串（2018-11-28T08:57:40.521Z）转换为时间戳，不做时区转换"""
+    return dateToNs(isoStr[:10]) + timeToNs(isoStr[11:].rstrip('Z'))
+
+
+#----------------------------------------------------------------------
+def datetimeToNs(dt):
+    """datetime对象转换为时间戳，tzinfo被忽略"""
+    seconds = ((dt.toordinal() - EPOCH_ORDINAL) * 86400
+               + dt.hour * 3600 + dt.minute * 60 + dt.second)
+    return seconds * NS_PER_SECOND + dt.microsecond * NS_PER_MICROSECOND
+
+
+#----------------------------------------------------------------------
+def nsToDatetime(ns):
+    """时间戳转换为datetime对象（精度为微秒）"""
+    day, ns = divmod(ns, NS_PER_DAY)
+    info = getDayInfo(day)
+    seconds, ns = divmod(ns, NS_PER_SECOND)
+    hour, seconds = divmod(seconds, 3600)
+    minute, second = divmod(seconds, 60)
+    return datetime(info[1], info[2], info[3], hour, minute, second, ns // NS_PER_MICROSECOND)
+
+
+#----------------------------------------------------------------------
+def nsToDate(ns):
+    """时间戳转换为日期字符串，格式和strftime('%Y%m%d')一致"""
+    return getDayInfo(ns // NS_PER_DAY)[0]
+
+
+#----------------------------------------------------------------------
+def nsToTime(ns):
+    """时间戳转换为时间字符串，格式和strftime('%H:%M:%S.%f')一致"""
+    seconds, us = divmod(ns % NS_PER_DAY // NS_PER_MICROSECOND, 1000000)
+    hour, seconds = divmod(seconds, 3600)
+    minute, second = divmod(seconds, 60)
+    return '%02d:%02d:%02d.%06d' % (hour, minute, second, us)
+
+
+#----------------------------------------------------------------------
+def parseDateTime(dateStr, timeStr):
+    """日期和时间字符串直接转换为datetime对象，用于替代strptime"""
+    return nsToDatetime(dateTimeToNs(dateStr, timeStr))
+
+
+#----------------------------------------------------------------------
+def utcToLocalNs(ns):
+    """UTC时间戳转换为本地时间的时间戳，时区偏移按小时缓存"""
+    hour = ns // NS_PER_HOUR
+    try:
+        offset = _offsetDict[hour]
+    except KeyError:
+        seconds = hour * 3600
+        offset = datetimeToNs(datetime.fromtimestamp(seconds)) - seconds * NS_PER_SECOND
+        _offsetDict[hour] = offset
+    return ns + offset
+
+
+#----------------------------------------------------------------------
+def msToLocalNs(ms):
+    """毫秒时间戳（UTC）转换为本地时间的时间戳，结果和datetime.fromtimestamp一致"""
+    return utcToLocalNs(int(ms) * NS_PER_MILLISECOND)
@@ -6,14 +6,20 @@ import pandas as  pd
 from datetime import datetime, time, timedelta
 
 from vnpy.trader.vtObject import VtBarData
+from vnpy.trader.utils.canlendar import minutes_to_freq
 class BarGenerator(object):
     """
     K线合成器，支持：
     1. 基于Tick合成1分钟K线
     2. 基于1分钟K线合成X分钟K线（X可以是2、3、5、10、15、30、60）
+
+    传入交易时段日历calendar（vnpy.trader.utils.canlendar.SessionCalendar）时，
+    sharp对齐的X分钟K线和日K线按日历划分，在每根K线的最后一分钟（包括休息和收盘前）
+    立即推送，不再使用marketClose
     """
     # ----------------------------------------------------------------------
-    def __init__(self, onBar, xmin=0, onXminBar=None, xSecond = 0, alignment='sharp', marketClose = (23,59)):
+    def __init__(self, onBar, xmin=0, onXminBar=None, xSecond = 0, alignment='sharp', marketClose = (23,59),
+                 calendar=None):
         """Constructor"""
         self.bar = None  # 1分钟K线对象
         self.onBar = onBar  # 1分钟K线回调函数
@@ -40,6 +46,8 @@ class BarGenerator(object):
 
         self.marketClose = marketClose
         self.alignment = alignment
+        self.calendar = calendar
+        self.xminFreq = minutes_to_freq(xmin) if xmin else None
 
     # ----------------------------------------------------------------------
     def updateTick(self, tick):
@@ -144,6 +152,39 @@ class BarGenerator(object):
                 self.onXminBar(self.xminBar)
                 self.xminBar = None
 
+        elif self.alignment == 'sharp' and self.calendar:
+            # 按交易时段日历对齐
+            # 上一根K线的最后一分钟缺失时，收到下一根K线的数据后先推送
+            if self.xminBar and bar.datetime >= self.BarDone:
+                self.onXminBar(self.xminBar)
+                self.xminBar = None
+
+            if not self.xminBar:
+                self.xminBar = VtBarData()
+                self.xminBar.vtSymbol = bar.vtSymbol
+                self.xminBar.symbol = bar.symbol
+                self.xminBar.exchange = bar.exchange
+
+                self.xminBar.open = bar.open
+                self.xminBar.high = bar.high
+                self.xminBar.low = bar.low
+                self.xminBar.datetime = self.calendar.align(bar.datetime, self.xminFreq)
+                self.xminBar.date = self.xminBar.datetime.strftime('%Y%m%d')
+                self.xminBar.time = self.xminBar.datetime.strftime('%H:%M:%S.%f')
+                self.BarDone = self.calendar.bucket_end(bar.datetime, self.xminFreq)
+
+            self.xminBar.high = max(self.xminBar.high, bar.high)
+            self.xminBar.low = min(self.xminBar.low, bar.low)
+            self.xminBar.close = bar.close
+            self.xminBar.openInterest = bar.openInterest
+            self.xminBar.volume += bar.volume
+
+            # K线的最后一分钟，立即推送
+            if bar.datetime + timedelta(minutes=1) >= self.BarDone:
+                self.onXminBar(self.xminBar)
+                self.xminBar = None
+            return
+
         elif self.alignment == 'sharp':
             # X分钟已经走完
             if self.xminBar and self.BarDone:
@@ -210,7 +251,11 @@ class BarGenerator(object):
         self.Candle.volume += bar.volume
 
         # 推送
-        if (bar.datetime.hour,bar.datetime.minute) == self.marketClose:  # 强制收盘切断
+        if self.calendar:
+            closed = bar.datetime + timedelta(minutes=1) >= self.calendar.bucket_end(bar.datetime, '1d')
+        else:
+            closed = (bar.datetime.hour,bar.datetime.minute) == self.marketClose   # 强制收盘切断
+        if closed:
             if self.Candle:
                 self.onCandle(self.Candle)
                 # 清空老K线缓存对象
@@ -355,6 +400,52 @@ class ArrayManager(object):
             self.array['volume'][0:self.size - 1] = self.array['volume'][1:self.size]
             self.array['volume'][-1] = float(bar.volume)
 
+    # ----------------------------------------------------------------------
+    def updateArrays(self, datetimes, open, high, low, close, volume):
+        """
+        批量更新K线，结果和逐根调用updateBar一致
+        datetimes为datetime对象序列，其余参数为等长的数值序列，缓存数组只整体移动一次
+        """
+        n = len(datetimes)
+        if not n:
+            return
+
+        start = 0
+        if not self.finished:
+            # 和updateBar一致，第一根K线用于结束未完成的K线
+            self.finished = True
+            start = 1
+            n -= 1
+            if not n:
+                return
+
+        self.count += n
+        if not self.inited and self.count >= self.size:
+            self.inited = True
+
+        m = min(n, self.size)
+        start = start + n - m
+        if m < self.size:
+            self.array[:self.size - m] = self.array[m:]
+
+        self.array['datetime'][-m:] = [dt.strftime(self.DATETIME_FORMAT) for dt in datetimes[start:]]
+        self.array['open'][-m:] = open[start:]
+        self.array['high'][-m:] = high[start:]
+        self.array['low'][-m:] = low[start:]
+        self.array['close'][-m:] = close[start:]
+        self.array['volume'][-m:] = volume[start:]
+
+    # ----------------------------------------------------------------------
+    def updateBars(self, bars):
+        """批量更新K线列表"""
+        bars = [bar for bar in bars if bar]
+        self.updateArrays([bar.datetime for bar in bars],
+                          [float(bar.open) for bar in bars],
+                          [float(bar.high) for bar in bars],
+                          [float(bar.low) for bar in bars],
+                          [float(bar.close) for bar in bars],
+                          [float(bar.volume) for bar in bars])
+
     # ----------------------------------------------------------------------
     def updateArray(self, bar):
         if bar:  # 如果是实盘K线